@@ -0,0 +1,134 @@
+"""
+Benchmark de los backends de caché de respuestas.
+
+Compara la huella en disco y la latencia de get/set de `SimpleCache` (JSON
+indentado, el formato original) con las variantes compacta/comprimida y con
+`SQLiteCache`, sobre un corpus sintético de respuestas tipo `analyze-project`.
+
+Con `--expiry` mide en cambio el coste de `set` (que purga un lote acotado de
+entradas expiradas) a medida que crece la caché SQLite.
+
+Uso (con el paquete instalado, p. ej. `pip install -e .`):
+    python benchmarks/bench_cache.py [--entries 300]
+    python benchmarks/bench_cache.py --expiry
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from hooperits_agent.cache import SQLiteCache
+from hooperits_agent.utils import SimpleCache, format_file_size
+
+SECTIONS = ["Propósito Principal", "Tecnologías y Lenguajes Clave", "Estructura General",
+            "Puntos de Partida o Interés"]
+VOCAB = ("componente servicio módulo API REST endpoint React TypeScript Python FastAPI "
+         "base de datos PostgreSQL autenticación middleware ruteo estado Redux hooks "
+         "pruebas integración despliegue Docker configuración variables entorno caché "
+         "controlador repositorio modelo vista esquema migración cola eventos").split()
+
+
+def build_corpus(entries: int, seed: int = 42):
+    """Genera respuestas Markdown de 2-12KB con la forma de un análisis de proyecto."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(entries):
+        parts = []
+        for section in SECTIONS:
+            parts.append(f"## {section}\n")
+            for _ in range(rng.randint(2, 8)):
+                words = " ".join(rng.choice(VOCAB) for _ in range(rng.randint(12, 40)))
+                parts.append(f"- **{rng.choice(VOCAB).capitalize()}**: {words}.\n")
+            parts.append(f"\n```\nsrc/{rng.choice(VOCAB)}/{rng.choice(VOCAB)}.ts\n```\n\n")
+        corpus.append((f"prompt {i} " + " ".join(rng.choice(VOCAB) for _ in range(200)),
+                       "".join(parts)))
+    return corpus
+
+
+def dir_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.iterdir() if f.is_file())
+
+
+def run_case(name, factory, corpus):
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = factory(Path(tmp))
+        set_times = []
+        for prompt, response in corpus:
+            start = time.perf_counter()
+            cache.set(prompt, "models/bench", response)
+            set_times.append(time.perf_counter() - start)
+        get_times = []
+        for prompt, response in corpus:
+            start = time.perf_counter()
+            assert cache.get(prompt, "models/bench") == response
+            get_times.append(time.perf_counter() - start)
+        if hasattr(cache, "close"):
+            cache.close()
+        footprint = dir_size(Path(tmp))
+    print(f"{name:<28} {format_file_size(footprint):>10} "
+          f"{statistics.median(set_times) * 1000:>10.3f} {statistics.median(get_times) * 1000:>10.3f}")
+
+
+def run_expiry(sizes=(10_000, 100_000, 400_000), sets=150):
+    """
+    Llena la caché con N entradas (la mitad expiradas) y mide `set` y `cleanup_expired`.
+
+    `sets` * `_PURGE_BATCH` es menor que el número de expiradas del caso más pequeño,
+    así que todas las escrituras medidas tienen trabajo de purga pendiente.
+    """
+    print(f"{'entradas':>10} {'set p50 ms':>11} {'set p99 ms':>11} {'cleanup ms':>11}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = SQLiteCache(Path(tmp), 3600, compression="raw")
+            now = time.time()
+            with cache._transaction() as conn:
+                conn.executemany(
+                    "INSERT INTO entries (key, model, response, created_at, expires_at, "
+                    "size_bytes, last_access) VALUES (?, 'models/bench', 'x', ?, ?, 1, ?)",
+                    ((f"k{i}", now - 7200, now + (3600 if i % 2 else -3600) + i * 1e-3, now)
+                     for i in range(size)),
+                )
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            set_times = []
+            for i in range(sets):
+                start = time.perf_counter()
+                cache.set(f"bench prompt {i}", "models/bench", "respuesta")
+                set_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            cache.cleanup_expired()
+            cleanup = time.perf_counter() - start
+            cache.close()
+        set_times.sort()
+        print(f"{size:>10} {statistics.median(set_times) * 1000:>11.3f} "
+              f"{set_times[int(len(set_times) * 0.99)] * 1000:>11.3f} {cleanup * 1000:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, default=300)
+    parser.add_argument("--expiry", action="store_true", help="Medir la expiración incremental")
+    args = parser.parse_args()
+
+    if args.expiry:
+        run_expiry()
+        return
+
+    corpus = build_corpus(args.entries)
+    raw_total = sum(len(r.encode("utf-8")) for _, r in corpus)
+    print(f"{args.entries} respuestas, {format_file_size(raw_total)} de texto\n")
+    print(f"{'backend':<28} {'disco':>10} {'set p50 ms':>10} {'get p50 ms':>10}")
+    cases = [
+        ("json indentado (original)", lambda d: SimpleCache(d, 3600)),
+        ("json compacto + zlib", lambda d: SimpleCache(d, 3600, compression="zlib", pretty=False)),
+        ("sqlite raw", lambda d: SQLiteCache(d, 3600, compression="raw")),
+        ("sqlite zlib", lambda d: SQLiteCache(d, 3600, compression="zlib")),
+        ("sqlite lzma", lambda d: SQLiteCache(d, 3600, compression="lzma")),
+    ]
+    for name, factory in cases:
+        run_case(name, factory, corpus)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark del escaneo de archivos de `analyze-project`.
+
+Compara el recorrido anterior (`rglob('*')` y filtrado posterior, que entra en
+cada `node_modules`, `.git` y `dist`) con `_scan_candidate_files`, que poda
+esos directorios antes de descender, sobre un árbol sintético con la forma de
+un monorepo frontend: la mayoría de los archivos en dependencias y artefactos
+de build, y unos pocos miles de archivos de código propios.
+
+Uso (con el paquete instalado, p. ej. `pip install -e .`):
+    python benchmarks/bench_scan.py [--files 500000] [--dir /ruta/existente]
+
+Con `--dir` se reutiliza (o se crea la primera vez) el árbol en esa ruta, para
+no regenerarlo entre ejecuciones.
+
+Después mide el índice incremental (`FileIndex`): construirlo, ponerlo al día
+sin cambios, y obtener los candidatos ordenados frente a escanear y ordenar.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from hooperits_agent.file_index import FileIndex
+from hooperits_agent.project_analyzer import (
+    BINARY_EXTENSIONS, EXCLUDE_DIRS, EXCLUDE_EXTENSIONS, MAX_CONTENT_LENGTH_PER_FILE, _scan_candidate_files,
+    refresh_file_index,
+)
+
+FILES_PER_DIR = 25
+# Reparto de archivos del árbol sintético (el resto es código del proyecto)
+LAYOUT = (("node_modules", 0.82, ("index.js", "package.json", "README.md", "index.d.ts")),
+          (".git/objects", 0.08, ("pack",)),
+          ("dist", 0.05, ("chunk.js", "chunk.js.map")))
+SOURCE_DIRS = ("src/pages", "src/components", "src/lib", "backend/api", "public")
+SOURCE_NAMES = ("tsx", "ts", "py", "css", "json", "png")
+
+
+def build_tree(root: Path, files: int) -> None:
+    """Crea `files` archivos pequeños repartidos según LAYOUT."""
+    def write_dir(directory: Path, count: int, names) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        for i in range(count):
+            with open(directory / f"f{i}.{names[i % len(names)].split('.', 1)[-1]}", "wb") as f:
+                f.write(b"x\n")
+
+    remaining = files
+    for top, share, names in LAYOUT:
+        count = int(files * share)
+        remaining -= count
+        for n in range(0, count, FILES_PER_DIR):
+            # Paquetes anidados como en node_modules/@scope/pkg/dist/...
+            write_dir(root / top / f"pkg{n // (FILES_PER_DIR * 40)}" / f"sub{n // FILES_PER_DIR}",
+                      min(FILES_PER_DIR, count - n), names)
+    for n in range(0, remaining, FILES_PER_DIR):
+        write_dir(root / SOURCE_DIRS[(n // FILES_PER_DIR) % len(SOURCE_DIRS)] / f"m{n // FILES_PER_DIR}",
+                  min(FILES_PER_DIR, remaining - n), SOURCE_NAMES)
+
+
+def legacy_scan(path_to_scan: Path, repo_root_path: Path):
+    """El recorrido anterior: `rglob('*')` y exclusión de directorios parte por parte."""
+    found = []
+    for item in path_to_scan.rglob('*'):
+        is_excluded_dir = False
+        for part in item.parts:
+            if part.lower() in [d.lower() for d in EXCLUDE_DIRS]:
+                is_excluded_dir = True
+                break
+        if is_excluded_dir:
+            continue
+        if item.is_file():
+            relative = item.relative_to(repo_root_path)
+            ext = item.suffix.lower().lstrip('.')
+            if ext in EXCLUDE_EXTENSIONS or ext in BINARY_EXTENSIONS:
+                continue
+            if item.name.startswith('.'):
+                continue
+            if ("public" in [p.lower() for p in relative.parts[:-1]]
+                    and ext not in ['html', 'js', 'css', 'ts', 'tsx', 'jsx']):
+                continue
+            size = item.stat().st_size
+            if 0 < size <= MAX_CONTENT_LENGTH_PER_FILE * 10:
+                found.append(str(relative).replace('\\', '/'))
+    return found
+
+
+def timed(label: str, scan):
+    start = time.perf_counter()
+    found = scan()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<34} {elapsed:>9.3f} s {len(found):>10}")
+    return elapsed, set(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--files", type=int, default=500_000)
+    parser.add_argument("--dir", type=Path, help="Directorio donde crear o reutilizar el árbol")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.dir or Path(tmp) / "repo"
+        if not root.exists():
+            start = time.perf_counter()
+            build_tree(root, args.files)
+            print(f"Árbol de {args.files} archivos creado en {time.perf_counter() - start:.1f} s\n")
+
+        print(f"{'recorrido':<34} {'tiempo':>11} {'candidatos':>10}")
+        old_time, old_found = timed("rglob + filtro (anterior)", lambda: legacy_scan(root, root))
+        new_time, new_found = timed("scandir con poda", lambda: [
+            item["path_str"] for item in _scan_candidate_files(root, root)])
+        print(f"\nAceleración: {old_time / new_time:.1f}x")
+        assert old_found == new_found, "los recorridos no encuentran los mismos candidatos"
+
+        file_index = FileIndex(root, index_path=Path(tmp) / "bench.index.sqlite3")
+        print(f"\n{'índice incremental':<34} {'tiempo':>11} {'candidatos':>10}")
+        timed("construcción", lambda: [None] * refresh_file_index(file_index, full=True)["files"])
+        refresh_time, _ = timed("actualización sin cambios", lambda: [None] * refresh_file_index(file_index)["files"])
+        scan_sort_time, ordered = timed("escaneo + orden (sin índice)", lambda: [
+            item["path_str"] for item in sorted(_scan_candidate_files(root, root),
+                                                key=lambda x: (x["priority"], x["size"], x["path_str"]))])
+        index_time, indexed = timed("actualización + candidatos", lambda: (
+            refresh_file_index(file_index) and [item["path_str"] for item in file_index.candidates()]))
+        print(f"\nAceleración frente a escanear y ordenar: {scan_sort_time / index_time:.1f}x "
+              f"(solo la actualización: {refresh_time:.3f} s)")
+        assert indexed == new_found, "el índice no tiene los mismos candidatos que el recorrido"
+        file_index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+# hooperits_agent/__main__.py
+"""`python -m hooperits_agent`: igual que el comando `hooperits-agent` (usa el demonio si está activo)."""
+from .client import main
+
+main()
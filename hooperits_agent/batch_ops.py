@@ -0,0 +1,116 @@
+# hooperits_agent/batch_ops.py
+"""
+Ejecución concurrente de muchos prompts (comando `batch`).
+
+Lee prompts de un archivo JSONL, los envía con `send_prompt_async` con un
+límite de llamadas simultáneas y escribe cada resultado en NDJSON en cuanto
+termina, de modo que un lote interrumpido conserva lo ya procesado.
+"""
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from . import gemini_ops
+
+logger = logging.getLogger("hooperits_agent.batch_ops")
+
+# Tareas por cupo de concurrencia: las respuestas en caché no ocupan cupo y no deben esperar
+_WORKERS_PER_SLOT = 4
+
+
+def load_batch_prompts(path: Union[str, Path]) -> List[Dict[str, Any]]:
+    """
+    Lee un archivo JSONL de prompts.
+
+    Cada línea es un objeto con `prompt` (obligatorio) e `id` (opcional; por
+    defecto el número de línea). Las líneas vacías se ignoran.
+
+    Args:
+        path: Archivo JSONL
+
+    Returns:
+        Lista de diccionarios con `id` y `prompt`
+
+    Raises:
+        ValueError: Si una línea no es JSON válido o no tiene `prompt`
+    """
+    items = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Línea {line_number}: JSON inválido ({e})") from e
+            if not isinstance(data, dict) or not isinstance(data.get("prompt"), str) or not data["prompt"]:
+                raise ValueError(f"Línea {line_number}: falta el campo 'prompt'")
+            items.append({"id": data.get("id", line_number), "prompt": data["prompt"]})
+    return items
+
+
+async def run_batch(items: List[Dict[str, Any]], output_path: Union[str, Path],
+                    concurrency: int = 8,
+                    on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Procesa un lote de prompts y escribe los resultados en NDJSON según terminan.
+
+    Args:
+        items: Prompts de `load_batch_prompts`
+        output_path: Archivo NDJSON de salida (se sobrescribe)
+        concurrency: Máximo de llamadas simultáneas al modelo
+        on_result: Se llama con cada registro escrito (p. ej. para una barra de progreso)
+
+    Returns:
+        Resumen con `total`, `ok`, `errors`, `cached`, `cost_usd` y `elapsed_s`
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+    summary: Dict[str, Any] = {"total": len(items), "ok": 0, "errors": 0, "cached": 0, "cost_usd": 0.0}
+    start = time.perf_counter()
+    # Una sola inicialización (bloqueante) para todo el lote, fuera del bucle de eventos
+    model_instance, model_name = await asyncio.get_running_loop().run_in_executor(
+        None, gemini_ops.prepare_batch_model)
+
+    with open(output_path, 'w', encoding='utf-8') as output:
+        async def worker():
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                item_start = time.perf_counter()
+                result = await gemini_ops.send_prompt_async(item["prompt"], model_instance, model_name,
+                                                            semaphore=semaphore)
+                record = {"id": item["id"], **result, "elapsed_s": round(time.perf_counter() - item_start, 3)}
+                if record["error"] is None:
+                    del record["error"]
+                    summary["ok"] += 1
+                else:
+                    del record["text"]
+                    summary["errors"] += 1
+                summary["cached"] += int(result["cached"])
+                summary["cost_usd"] += result["cost_usd"] or 0.0
+                # Un registro por línea, visible en disco en cuanto termina cada prompt
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                if on_result is not None:
+                    on_result(record)
+
+        workers = min(len(items), max(1, concurrency) * _WORKERS_PER_SLOT)
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+    summary["elapsed_s"] = round(time.perf_counter() - start, 3)
+    logger.info(f"Lote terminado: {summary}")
+    return summary
+
+
+__all__ = [
+    'load_batch_prompts',
+    'run_batch',
+]
@@ -0,0 +1,1158 @@
+# hooperits_agent/cache.py
+"""
+Backends de caché persistente para las respuestas de Gemini.
+
+El backend por defecto guarda cada entrada como una fila de SQLite indexada por
+su clave, de modo que una consulta o una escritura no necesitan cargar ni
+reescribir el resto de la caché.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import lzma
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Protocol, Tuple, Union
+
+from .remote_cache import DEFAULT_KEY_PREFIX, FallbackCache, RedisCache
+from .utils import (
+    SimpleCache,
+    atomic_write_bytes,
+    build_cache_key,
+    compress_text,
+    decompress_text,
+    file_lock,
+)
+
+logger = logging.getLogger("hooperits_agent.cache")
+
+CACHE_DB_FILENAME = "gemini_responses.sqlite3"
+LEGACY_CACHE_FILENAME = "gemini_responses.json"
+
+# Paquetes portables de caché (`cache export` / `cache import`)
+BUNDLE_MAGIC = b"HOOPERITS-CACHE-BUNDLE\n"
+BUNDLE_FORMAT_VERSION = 1
+
+
+class CacheBackend(Protocol):
+    """
+    Interfaz común de los backends de caché de respuestas.
+
+    `SimpleCache` (JSON), `SQLiteCache`, `TieredCache`, `RedisCache` y
+    `FallbackCache` la cumplen sin heredar de ella. Las capacidades extra
+    (`stats`, `iter_entries`, `get_many`...) se detectan con `hasattr`.
+    """
+
+    @property
+    def expiration_seconds(self) -> int:
+        ...
+
+    def get(self, prompt: str, model: str) -> Optional[str]:
+        ...
+
+    def set(self, prompt: str, model: str, response: str,
+            prompt_tokens: int = 0, response_tokens: int = 0) -> None:
+        ...
+
+    def clear(self) -> None:
+        ...
+
+    def cleanup_expired(self) -> None:
+        ...
+
+
+class CacheBundleError(ValueError):
+    """El paquete de caché está dañado, es de otra versión o no es un paquete."""
+
+
+def _migrate_v1(conn: sqlite3.Connection) -> None:
+    """Esquema inicial: una fila por entrada, indexada por clave."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            response TEXT NOT NULL,
+            created TEXT NOT NULL,
+            expiration TEXT NOT NULL
+        )
+        """
+    )
+
+
+def _create_entry_triggers(conn: sqlite3.Connection, bump_generation: bool = False) -> None:
+    bump = ", generation = generation + 1" if bump_generation else ""
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS entries_after_insert AFTER INSERT ON entries BEGIN "
+        f"UPDATE cache_totals SET entries = entries + 1, bytes = bytes + NEW.size_bytes{bump} "
+        "WHERE id = 0; END"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS entries_after_delete AFTER DELETE ON entries BEGIN "
+        f"UPDATE cache_totals SET entries = entries - 1, bytes = bytes - OLD.size_bytes{bump} "
+        "WHERE id = 0; END"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS entries_after_update AFTER UPDATE OF size_bytes ON entries "
+        f"BEGIN UPDATE cache_totals SET bytes = bytes - OLD.size_bytes + NEW.size_bytes{bump} "
+        "WHERE id = 0; END"
+    )
+
+
+def _migrate_v2(conn: sqlite3.Connection) -> None:
+    """Metadatos para LRU (tamaño, último acceso, tokens) y estadísticas de uso."""
+    conn.execute("ALTER TABLE entries ADD COLUMN size_bytes INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE entries ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE entries ADD COLUMN prompt_tokens INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE entries ADD COLUMN response_tokens INTEGER NOT NULL DEFAULT 0")
+    conn.execute(
+        "UPDATE entries SET size_bytes = length(CAST(response AS BLOB)), "
+        "last_access = (julianday(created, 'utc') - 2440587.5) * 86400.0"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access)")
+
+    # Totales mantenidos por triggers para no recorrer la tabla en cada escritura
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cache_totals ("
+        "id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL, bytes INTEGER NOT NULL)"
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO cache_totals (id, entries, bytes) "
+        "SELECT 0, COUNT(*), COALESCE(SUM(size_bytes), 0) FROM entries"
+    )
+    _create_entry_triggers(conn)
+
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cache_stats (
+            model TEXT PRIMARY KEY,
+            hits INTEGER NOT NULL DEFAULT 0,
+            misses INTEGER NOT NULL DEFAULT 0,
+            bytes_saved INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens_saved INTEGER NOT NULL DEFAULT 0,
+            response_tokens_saved INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+
+
+def _migrate_v3(conn: sqlite3.Connection) -> None:
+    """Códec por entrada; las filas existentes quedan como texto sin comprimir."""
+    conn.execute("ALTER TABLE entries ADD COLUMN codec TEXT NOT NULL DEFAULT 'raw'")
+
+
+def _migrate_v4(conn: sqlite3.Connection) -> None:
+    """Fechas como epoch numérico e índice de expiración (reconstruye la tabla)."""
+    conn.execute(
+        """
+        CREATE TABLE entries_v4 (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            response BLOB NOT NULL,
+            codec TEXT NOT NULL DEFAULT 'raw',
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            size_bytes INTEGER NOT NULL DEFAULT 0,
+            last_access REAL NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            response_tokens INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    # Las fechas ISO antiguas están en hora local; 'utc' las lleva a epoch real
+    conn.execute(
+        "INSERT INTO entries_v4 (key, model, response, codec, created_at, expires_at, size_bytes, "
+        "last_access, prompt_tokens, response_tokens) "
+        "SELECT key, model, response, codec, "
+        "(julianday(created, 'utc') - 2440587.5) * 86400.0, "
+        "(julianday(expiration, 'utc') - 2440587.5) * 86400.0, "
+        "size_bytes, last_access, prompt_tokens, response_tokens FROM entries"
+    )
+    conn.execute("DROP TABLE entries")
+    conn.execute("ALTER TABLE entries_v4 RENAME TO entries")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_expires_at ON entries (expires_at)")
+    _create_entry_triggers(conn)
+
+
+def _migrate_v5(conn: sqlite3.Connection) -> None:
+    """
+    Contador de generación que solo cambia cuando cambia el contenido.
+
+    Lo incrementan los triggers de alta, baja y reescritura de entradas (set,
+    clear, fusión, importación, expiración y desalojo); actualizar `last_access`
+    o las estadísticas no lo toca.
+    """
+    conn.execute("ALTER TABLE cache_totals ADD COLUMN generation INTEGER NOT NULL DEFAULT 0")
+    for trigger in ("entries_after_insert", "entries_after_delete", "entries_after_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    _create_entry_triggers(conn, bump_generation=True)
+
+
+# Cada migración lleva el esquema de la versión N-1 a la N (PRAGMA user_version).
+_SCHEMA_MIGRATIONS: Tuple[Callable[[sqlite3.Connection], None], ...] = (
+    _migrate_v1,
+    _migrate_v2,
+    _migrate_v3,
+    _migrate_v4,
+    _migrate_v5,
+)
+
+
+class SQLiteCache:
+    """Caché de respuestas basada en SQLite con búsquedas por clave y desalojo LRU."""
+
+    # Lote de filas candidatas que se examina en cada ronda de desalojo
+    _EVICTION_BATCH = 64
+    # Máximo de entradas expiradas que purga cada `set` (coste acotado por escritura)
+    _PURGE_BATCH = 32
+    # Búsquedas acumuladas en memoria antes de volcar sus accesos y estadísticas
+    _PENDING_LOOKUPS_FLUSH = 256
+
+    def __init__(self, cache_dir: Optional[Path] = None, expiration_seconds: int = 3600,
+                 migrate_legacy: bool = True, max_entries: int = 0, max_bytes: int = 0,
+                 compression: str = "zlib"):
+        """
+        Inicializa la caché SQLite.
+
+        Args:
+            cache_dir: Directorio para almacenar la base de datos
+            expiration_seconds: Tiempo de expiración en segundos
+            migrate_legacy: Importar `gemini_responses.json` si existe
+            max_entries: Máximo de entradas antes de desalojar (0 = sin límite)
+            max_bytes: Máximo de bytes almacenados antes de desalojar (0 = sin límite)
+            compression: Códec para las respuestas nuevas ("raw", "zlib" o "lzma")
+        """
+        self.cache_dir = cache_dir or Path.home() / ".hooperits_cache"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.expiration_seconds = expiration_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.db_path = self.cache_dir / CACHE_DB_FILENAME
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        # Las lecturas no escriben: último acceso por clave y contadores por modelo
+        # (hits, misses, bytes, tokens de prompt, tokens de respuesta) esperan aquí
+        # a la siguiente transacción de escritura, a `flush` o a la salida del proceso
+        self._pending_access: Dict[str, float] = {}
+        self._pending_stats: Dict[str, List[int]] = {}
+        self._pending_lookups = 0
+        self._pending_pid = os.getpid()
+        # Incrementos de generación que provienen de las escrituras de esta instancia
+        self._own_generation = 0
+        # Última generación leída y el `data_version` de la conexión en ese momento:
+        # mientras ninguna otra conexión confirme cambios no hace falta releerla
+        self._seen_data_version: Optional[int] = None
+        self._seen_generation = 0
+        atexit.register(self.flush)
+
+        if migrate_legacy:
+            legacy_file = self.cache_dir / LEGACY_CACHE_FILENAME
+            if legacy_file.exists():
+                self.migrate_from_json(legacy_file)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Abre (una vez por proceso) la conexión y aplica las migraciones pendientes."""
+        if self._conn is not None and self._conn_pid != os.getpid():
+            # Conexión heredada por fork: SQLite no permite compartirla entre procesos
+            self._conn = None
+        if self._conn is None:
+            conn = sqlite3.connect(
+                str(self.db_path), timeout=30, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._apply_migrations(conn)
+            self._conn = conn
+            self._conn_pid = os.getpid()
+            self._seen_data_version = None  # `data_version` es propio de cada conexión
+        return self._conn
+
+    def close(self) -> None:
+        """Cierra la conexión (se reabre sola en el siguiente uso)."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def _apply_migrations(conn: sqlite3.Connection) -> None:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= len(_SCHEMA_MIGRATIONS):
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Releer dentro de la transacción: otro proceso pudo migrar antes
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for target_version in range(version + 1, len(_SCHEMA_MIGRATIONS) + 1):
+                _SCHEMA_MIGRATIONS[target_version - 1](conn)
+                conn.execute(f"PRAGMA user_version = {target_version}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Transacción de escritura; toma el bloqueo de escritura desde el inicio y
+        aplica de paso los accesos y estadísticas pendientes.
+        """
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                generation_before = self._read_generation(conn)
+                self._write_pending(conn)
+                yield conn
+                bumped = self._read_generation(conn) - generation_before
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            self._own_generation += bumped
+
+    @staticmethod
+    def _read_generation(conn: sqlite3.Connection) -> int:
+        return int(conn.execute("SELECT generation FROM cache_totals WHERE id = 0").fetchone()[0])
+
+    def _get_cache_key(self, prompt: str, model: str) -> str:
+        """Genera una clave única para el prompt y modelo."""
+        return build_cache_key(prompt, model)
+
+    def _encode_response(self, response: str) -> Tuple[Union[str, bytes], str]:
+        """Devuelve el valor a almacenar y su códec. El texto sin comprimir se guarda como TEXT."""
+        if self.compression == "raw":
+            return response, "raw"
+        return compress_text(response, self.compression), self.compression
+
+    @staticmethod
+    def _decode_response(stored: Union[str, bytes], codec: str) -> str:
+        if codec == "raw":
+            return stored if isinstance(stored, str) else stored.decode('utf-8')
+        if isinstance(stored, str):
+            raise ValueError(f"entrada '{codec}' guardada como texto")
+        return decompress_text(stored, codec)
+
+    @staticmethod
+    def _stored_size(stored: Union[str, bytes]) -> int:
+        return len(stored) if isinstance(stored, bytes) else len(stored.encode('utf-8'))
+
+    def _record_lookup(self, model: str, hit: bool, key: str = "", accessed_at: float = 0.0,
+                       size_bytes: int = 0, prompt_tokens: int = 0, response_tokens: int = 0) -> bool:
+        """
+        Anota una búsqueda en memoria (sin escribir en la base).
+
+        Returns:
+            True si hay suficientes búsquedas pendientes como para volcarlas
+        """
+        with self._lock:
+            if self._pending_pid != os.getpid():
+                # Pendientes heredados por fork: los vuelca el proceso que los anotó
+                self._discard_pending()
+            counters = self._pending_stats.setdefault(model, [0, 0, 0, 0, 0])
+            if hit:
+                counters[0] += 1
+                counters[2] += size_bytes
+                counters[3] += prompt_tokens
+                counters[4] += response_tokens
+                self._pending_access[key] = max(accessed_at, self._pending_access.get(key, 0.0))
+            else:
+                counters[1] += 1
+            self._pending_lookups += 1
+            return self._pending_lookups >= self._PENDING_LOOKUPS_FLUSH
+
+    def _discard_pending(self) -> None:
+        self._pending_access = {}
+        self._pending_stats = {}
+        self._pending_lookups = 0
+        self._pending_pid = os.getpid()
+
+    def _write_pending(self, conn: sqlite3.Connection) -> None:
+        """Aplica los accesos y estadísticas pendientes dentro de la transacción en curso."""
+        if self._pending_pid != os.getpid():
+            self._discard_pending()
+        if not self._pending_lookups:
+            return
+        conn.executemany(
+            "UPDATE entries SET last_access = MAX(last_access, ?) WHERE key = ?",
+            [(accessed_at, key) for key, accessed_at in self._pending_access.items()],
+        )
+        conn.executemany(
+            "INSERT INTO cache_stats (model, hits, misses, bytes_saved, prompt_tokens_saved, "
+            "response_tokens_saved) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(model) DO UPDATE SET hits = hits + excluded.hits, "
+            "misses = misses + excluded.misses, bytes_saved = bytes_saved + excluded.bytes_saved, "
+            "prompt_tokens_saved = prompt_tokens_saved + excluded.prompt_tokens_saved, "
+            "response_tokens_saved = response_tokens_saved + excluded.response_tokens_saved",
+            [(model, *counters) for model, counters in self._pending_stats.items()],
+        )
+        self._discard_pending()
+
+    def flush(self) -> None:
+        """Vuelca los accesos y estadísticas pendientes en una sola transacción."""
+        with self._lock:
+            if self._pending_pid != os.getpid():
+                self._discard_pending()
+            if not self._pending_lookups:
+                return
+            try:
+                with self._transaction():
+                    pass
+            except sqlite3.Error as e:
+                logger.warning(f"No se pudieron guardar las estadísticas de la caché SQLite: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, keep_key: str) -> int:
+        """Desaloja entradas expiradas y luego las menos usadas hasta cumplir los límites."""
+        if not self.max_entries and not self.max_bytes:
+            return 0
+        entries, total_bytes = conn.execute(
+            "SELECT entries, bytes FROM cache_totals WHERE id = 0"
+        ).fetchone()
+        if not self._over_budget(entries, total_bytes):
+            return 0
+
+        evicted = 0
+        while self._over_budget(entries, total_bytes):
+            purged = self._purge_expired(conn, self._EVICTION_BATCH)
+            if not purged:
+                break
+            evicted += purged
+            entries, total_bytes = conn.execute(
+                "SELECT entries, bytes FROM cache_totals WHERE id = 0"
+            ).fetchone()
+
+        while self._over_budget(entries, total_bytes):
+            victims = conn.execute(
+                "SELECT key, size_bytes FROM entries WHERE key != ? ORDER BY last_access LIMIT ?",
+                (keep_key, self._EVICTION_BATCH),
+            ).fetchall()
+            if not victims:
+                break
+            doomed = []
+            for key, size_bytes in victims:
+                if not self._over_budget(entries, total_bytes):
+                    break
+                doomed.append((key,))
+                entries -= 1
+                total_bytes -= size_bytes
+            conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+            evicted += len(doomed)
+
+        if evicted:
+            logger.debug(f"Caché: {evicted} entradas desalojadas para respetar los límites")
+        return evicted
+
+    @staticmethod
+    def _purge_expired(conn: sqlite3.Connection, limit: int) -> int:
+        """Borra hasta `limit` entradas expiradas, las más antiguas primero (usa el índice)."""
+        return conn.execute(
+            "DELETE FROM entries WHERE key IN ("
+            "SELECT key FROM entries WHERE expires_at < ? ORDER BY expires_at LIMIT ?)",
+            (time.time(), limit),
+        ).rowcount
+
+    def _over_budget(self, entries: int, total_bytes: int) -> bool:
+        return bool((self.max_entries and entries > self.max_entries)
+                    or (self.max_bytes and total_bytes > self.max_bytes))
+
+    def get(self, prompt: str, model: str) -> Optional[str]:
+        """
+        Obtiene una respuesta del caché si existe y no ha expirado.
+
+        Args:
+            prompt: El prompt original
+            model: El modelo usado
+
+        Returns:
+            La respuesta cacheada o None si no existe/expiró
+        """
+        entry = self.get_entry(prompt, model)
+        return entry["response"] if entry else None
+
+    def get_entry(self, prompt: str, model: str) -> Optional[Dict[str, Any]]:
+        """
+        Como `get`, pero devuelve la entrada completa con sus metadatos.
+
+        Returns:
+            Diccionario con `key`, `model`, `response`, `expires_at` (epoch),
+            `size_bytes` (de la respuesta sin comprimir), `prompt_tokens` y
+            `response_tokens`, o None
+        """
+        key = self._get_cache_key(prompt, model)
+        try:
+            # Solo lectura: no toma el bloqueo de escritura de SQLite
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT response, codec, expires_at, prompt_tokens, response_tokens "
+                    "FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+            now = time.time()
+            if row is None or now > row[2]:
+                if self._record_lookup(model, hit=False):
+                    self.flush()
+                return None
+            stored, codec, expires_at, prompt_tokens, response_tokens = row
+            response = self._decode_response(stored, codec)
+            size_bytes = len(response.encode('utf-8'))
+            if self._record_lookup(model, True, key, now, size_bytes, prompt_tokens, response_tokens):
+                self.flush()
+        except sqlite3.Error as e:
+            logger.warning(f"No se pudo leer la caché SQLite: {e}")
+            return None
+        except (ValueError, LookupError, zlib.error, lzma.LZMAError) as e:
+            logger.warning(f"Entrada de caché ilegible ({key[:12]}...): {e}")
+            return None
+        return {
+            "key": key,
+            "model": model,
+            "response": response,
+            "expires_at": expires_at,
+            "size_bytes": size_bytes,
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+        }
+
+    def record_hits(self, entries: List[Dict[str, Any]]) -> None:
+        """
+        Registra en bloque aciertos servidos fuera de SQLite (p. ej. desde memoria).
+
+        Se acumulan con el resto de búsquedas pendientes (ver `flush`).
+
+        Args:
+            entries: Entradas tal como las devuelve `get_entry`, una por acierto
+        """
+        now = time.time()
+        should_flush = False
+        for entry in entries:
+            should_flush = self._record_lookup(entry["model"], True, entry["key"], now, entry["size_bytes"],
+                                               entry["prompt_tokens"], entry["response_tokens"])
+        if should_flush:
+            self.flush()
+
+    def generation(self) -> int:
+        """
+        Contador que cambia cuando otra conexión (u otro proceso) modifica las entradas.
+
+        Las escrituras hechas por esta misma instancia no lo alteran, ni tampoco
+        las lecturas ajenas: el volcado de accesos y estadísticas no cuenta.
+        Solo se relee de la base de datos si `PRAGMA data_version` indica que
+        otra conexión confirmó algo desde la última vez.
+        """
+        with self._lock:
+            conn = self._connection()
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._seen_data_version:
+                self._seen_generation = self._read_generation(conn) - self._own_generation
+                self._seen_data_version = data_version
+            return self._seen_generation
+
+    def set(self, prompt: str, model: str, response: str,
+            prompt_tokens: int = 0, response_tokens: int = 0):
+        """
+        Guarda una respuesta en el caché.
+
+        Args:
+            prompt: El prompt original
+            model: El modelo usado
+            response: La respuesta a cachear
+            prompt_tokens: Tokens de entrada que costó la respuesta (para estadísticas)
+            response_tokens: Tokens de salida que costó la respuesta (para estadísticas)
+        """
+        key = self._get_cache_key(prompt, model)
+        stored, codec = self._encode_response(response)
+        size_bytes = self._stored_size(stored)
+        if self.max_bytes and size_bytes > self.max_bytes:
+            logger.debug(f"Respuesta de {size_bytes} bytes excede CACHE_MAX_BYTES; no se cachea")
+            return
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT INTO entries (key, model, response, codec, created_at, expires_at, "
+                    "size_bytes, last_access, prompt_tokens, response_tokens) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET model = excluded.model, "
+                    "response = excluded.response, codec = excluded.codec, "
+                    "created_at = excluded.created_at, "
+                    "expires_at = excluded.expires_at, size_bytes = excluded.size_bytes, "
+                    "last_access = excluded.last_access, prompt_tokens = excluded.prompt_tokens, "
+                    "response_tokens = excluded.response_tokens",
+                    (key, model, stored, codec, now, now + self.expiration_seconds, size_bytes,
+                     now, prompt_tokens, response_tokens),
+                )
+                # Expiración incremental: cada escritura retira un lote acotado de caducadas
+                self._purge_expired(conn, self._PURGE_BATCH)
+                self._evict(conn, keep_key=key)
+        except sqlite3.Error as e:
+            logger.warning(f"No se pudo escribir en la caché SQLite: {e}")
+
+    def clear(self):
+        """Limpia todo el caché (las estadísticas acumuladas se conservan)."""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM entries")
+
+    def cleanup_expired(self):
+        """
+        Elimina todas las entradas expiradas del caché.
+
+        Recorre solo el rango expirado del índice, en lotes y con una transacción
+        corta por lote para no bloquear a otros escritores. Normalmente no hace
+        falta: cada `set` ya purga un lote acotado.
+        """
+        while True:
+            with self._transaction() as conn:
+                if not self._purge_expired(conn, self._EVICTION_BATCH * 16):
+                    break
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Devuelve la ocupación actual y las estadísticas de aciertos por modelo.
+
+        Returns:
+            Diccionario con `entries`, `bytes`, los límites configurados y una
+            lista `models` con hits, misses, bytes y tokens ahorrados por modelo
+        """
+        self.flush()
+        with self._lock:
+            conn = self._connection()
+            entries, total_bytes = conn.execute(
+                "SELECT entries, bytes FROM cache_totals WHERE id = 0"
+            ).fetchone()
+            rows = conn.execute(
+                "SELECT model, hits, misses, bytes_saved, prompt_tokens_saved, "
+                "response_tokens_saved FROM cache_stats ORDER BY hits DESC, model"
+            ).fetchall()
+        return {
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "models": [
+                {
+                    "model": model,
+                    "hits": hits,
+                    "misses": misses,
+                    "bytes_saved": bytes_saved,
+                    "prompt_tokens_saved": prompt_tokens_saved,
+                    "response_tokens_saved": response_tokens_saved,
+                }
+                for model, hits, misses, bytes_saved, prompt_tokens_saved, response_tokens_saved
+                in rows
+            ],
+        }
+
+    def iter_entries(self, model: Optional[str] = None,
+                     max_age_seconds: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Recorre las entradas vigentes con la respuesta ya descomprimida.
+
+        Args:
+            model: Solo entradas de este modelo
+            max_age_seconds: Solo entradas creadas hace menos de estos segundos
+
+        Yields:
+            Diccionarios con `key`, `model`, `response`, `created_at`,
+            `expires_at`, `prompt_tokens` y `response_tokens`
+        """
+        now = time.time()
+        query = ("SELECT key, model, response, codec, created_at, expires_at, prompt_tokens, "
+                 "response_tokens FROM entries WHERE expires_at >= ?")
+        params: List[Any] = [now]
+        if model:
+            query += " AND model = ?"
+            params.append(model)
+        if max_age_seconds is not None:
+            query += " AND created_at >= ?"
+            params.append(now - max_age_seconds)
+        with self._lock:
+            rows = self._connection().execute(query + " ORDER BY key", params).fetchall()
+        for key, entry_model, stored, codec, created_at, expires_at, prompt_tokens, response_tokens in rows:
+            try:
+                response = self._decode_response(stored, codec)
+            except (ValueError, LookupError, zlib.error, lzma.LZMAError) as e:
+                logger.warning(f"Entrada de caché ilegible ({key[:12]}...), se omite: {e}")
+                continue
+            yield {
+                "key": key,
+                "model": entry_model,
+                "response": response,
+                "created_at": created_at,
+                "expires_at": expires_at,
+                "prompt_tokens": prompt_tokens,
+                "response_tokens": response_tokens,
+            }
+
+    def merge_entries(self, entries: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        Fusiona entradas externas; ante una clave repetida gana la de expiración más tardía.
+
+        Las entradas ya expiradas se descartan. Todo se aplica en una sola
+        transacción y después se desaloja lo necesario para respetar los límites.
+
+        Args:
+            entries: Entradas con el formato de `iter_entries`
+
+        Returns:
+            Tupla (entradas escritas, entradas descartadas)
+        """
+        now = time.time()
+        written = 0
+        with self._transaction() as conn:
+            for entry in entries:
+                if entry["expires_at"] < now:
+                    continue
+                stored, codec = self._encode_response(entry["response"])
+                written += conn.execute(
+                    "INSERT INTO entries (key, model, response, codec, created_at, expires_at, "
+                    "size_bytes, last_access, prompt_tokens, response_tokens) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET model = excluded.model, "
+                    "response = excluded.response, codec = excluded.codec, "
+                    "created_at = excluded.created_at, expires_at = excluded.expires_at, "
+                    "size_bytes = excluded.size_bytes, prompt_tokens = excluded.prompt_tokens, "
+                    "response_tokens = excluded.response_tokens "
+                    "WHERE excluded.expires_at > entries.expires_at",
+                    (entry["key"], entry["model"], stored, codec, entry["created_at"],
+                     entry["expires_at"], self._stored_size(stored), entry["created_at"],
+                     entry["prompt_tokens"], entry["response_tokens"]),
+                ).rowcount
+            if written:
+                self._evict(conn, keep_key="")
+        return written, len(entries) - written
+
+    def migrate_from_json(self, json_path: Union[str, Path]) -> int:
+        """
+        Importa las entradas vigentes de una caché JSON de `SimpleCache`.
+
+        Tras importarlo, el archivo se renombra a `*.migrated` para no volver a
+        procesarlo en el siguiente arranque.
+
+        Args:
+            json_path: Ruta al archivo `gemini_responses.json`
+
+        Returns:
+            Número de entradas importadas
+        """
+        json_path = Path(json_path)
+        # Mismo bloqueo que usa SimpleCache para escribir el archivo
+        with file_lock(json_path):
+            return self._import_json_file(json_path)
+
+    def _import_json_file(self, json_path: Path) -> int:
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                legacy_data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (json.JSONDecodeError, IOError) as e:
+            logger.warning(f"No se pudo migrar la caché JSON {json_path}: {e}")
+            return 0
+
+        now = time.time()
+        rows = []
+        for key, entry in legacy_data.items() if isinstance(legacy_data, dict) else []:
+            try:
+                expires_at = SimpleCache.entry_expires_at(entry)
+                created_at = datetime.fromisoformat(
+                    entry.get('created', entry['expiration'])).timestamp()
+                if expires_at < now:
+                    continue
+                stored, codec = self._encode_response(SimpleCache.decode_response(entry))
+                rows.append((key, entry['model'], stored, codec, created_at, expires_at,
+                             self._stored_size(stored), created_at,
+                             int(entry.get('prompt_tokens', 0)),
+                             int(entry.get('response_tokens', 0))))
+            except (KeyError, TypeError, ValueError, zlib.error, lzma.LZMAError):
+                continue
+
+        with self._transaction() as conn:
+            # Las entradas ya presentes en SQLite son más recientes: no se pisan
+            conn.executemany(
+                "INSERT OR IGNORE INTO entries (key, model, response, codec, created_at, expires_at, "
+                "size_bytes, last_access, prompt_tokens, response_tokens) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            if rows:
+                self._evict(conn, keep_key="")
+
+        try:
+            json_path.rename(json_path.with_name(json_path.name + ".migrated"))
+        except OSError:
+            # Otro proceso pudo completar la migración al mismo tiempo
+            pass
+        logger.info(f"Migradas {len(rows)} entradas de {json_path} a {self.db_path}")
+        return len(rows)
+
+
+class MemoryCache:
+    """Caché LRU en la memoria del proceso, acotada por entradas y bytes."""
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 32 * 1024 * 1024):
+        """
+        Inicializa el nivel en memoria.
+
+        Args:
+            max_entries: Máximo de entradas retenidas
+            max_bytes: Máximo de bytes de respuestas retenidos
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Devuelve la entrada vigente para `key` y la marca como usada recientemente."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() > entry["expires_at"]:
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, entry: Dict[str, Any]) -> None:
+        """Guarda una entrada (con el formato de `SQLiteCache.get_entry`)."""
+        if entry["size_bytes"] > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(entry["key"])
+            self._entries[entry["key"]] = entry
+            self._bytes += entry["size_bytes"]
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._pop(oldest_key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _pop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry["size_bytes"]
+
+
+class TieredCache:
+    """
+    Caché de dos niveles: memoria del proceso delante del backend persistente.
+
+    Las escrituras van a ambos niveles (write-through). Las lecturas consultan
+    el contador de generación del backend como mucho cada
+    `generation_check_interval` segundos (sin otras escrituras, basta un
+    `PRAGMA data_version`); si otro proceso escribió, el nivel en memoria se
+    descarta completo. Un acierto en memoria puede, por tanto, ir por detrás de
+    lo que otro proceso sobrescribió durante ese intervalo.
+    """
+
+    # Aciertos en memoria acumulados antes de volcarlos a las estadísticas persistentes
+    _PENDING_HITS_FLUSH = 64
+
+    def __init__(self, backend: SQLiteCache, memory: MemoryCache, generation_check_interval: float = 0.05):
+        """
+        Inicializa la caché de dos niveles.
+
+        Args:
+            backend: Nivel persistente
+            memory: Nivel en memoria
+            generation_check_interval: Segundos durante los que las lecturas no
+                vuelven a consultar la generación del backend (0 = en cada lectura)
+        """
+        self.backend = backend
+        self.memory = memory
+        self.generation_check_interval = generation_check_interval
+        self._generation: Optional[int] = None
+        self._generation_checked_at = float("-inf")
+        self._pending_hits: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    @property
+    def expiration_seconds(self) -> int:
+        return self.backend.expiration_seconds
+
+    def _sync_generation(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._generation_checked_at < self.generation_check_interval:
+            return
+        self._generation_checked_at = now
+        try:
+            generation = self.backend.generation()
+        except sqlite3.Error:
+            generation = None
+        if generation is None or generation != self._generation:
+            self.memory.clear()
+            self._generation = generation
+
+    def get(self, prompt: str, model: str) -> Optional[str]:
+        """Obtiene una respuesta, primero de memoria y luego del backend."""
+        key = build_cache_key(prompt, model)
+        self._sync_generation()
+        entry = self.memory.get(key)
+        if entry is not None:
+            with self._lock:
+                self._pending_hits.append(entry)
+                should_flush = len(self._pending_hits) >= self._PENDING_HITS_FLUSH
+            if should_flush:
+                self.flush()
+        else:
+            entry = self.backend.get_entry(prompt, model)
+            if entry is None:
+                return None
+            self.memory.put(entry)
+        response: str = entry["response"]
+        return response
+
+    def set(self, prompt: str, model: str, response: str,
+            prompt_tokens: int = 0, response_tokens: int = 0):
+        """Guarda la respuesta en el backend y en memoria."""
+        self._sync_generation(force=True)
+        self.backend.set(prompt, model, response,
+                         prompt_tokens=prompt_tokens, response_tokens=response_tokens)
+        self.memory.put({
+            "key": build_cache_key(prompt, model),
+            "model": model,
+            "response": response,
+            "expires_at": time.time() + self.backend.expiration_seconds,
+            "size_bytes": len(response.encode('utf-8')),
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+        })
+        self.flush()
+
+    def flush(self) -> None:
+        """Vuelca al backend los aciertos servidos desde memoria."""
+        with self._lock:
+            pending, self._pending_hits = self._pending_hits, []
+        self.backend.record_hits(pending)
+
+    def clear(self):
+        """Limpia ambos niveles."""
+        self.memory.clear()
+        with self._lock:
+            self._pending_hits = []
+        self.backend.clear()
+
+    def cleanup_expired(self):
+        """Elimina entradas expiradas del backend (la memoria expira al leer)."""
+        self.backend.cleanup_expired()
+
+    def iter_entries(self, model: Optional[str] = None,
+                     max_age_seconds: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Recorre las entradas del backend (ver `SQLiteCache.iter_entries`)."""
+        return self.backend.iter_entries(model=model, max_age_seconds=max_age_seconds)
+
+    def merge_entries(self, entries: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """Fusiona en el backend y descarta la memoria, que puede haber quedado obsoleta."""
+        result = self.backend.merge_entries(entries)
+        self.memory.clear()
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Estadísticas del backend más la ocupación del nivel en memoria."""
+        self.flush()
+        stats = self.backend.stats()
+        stats["memory_entries"] = len(self.memory)
+        return stats
+
+
+def export_bundle(cache, path: Union[str, Path], model: Optional[str] = None,
+                  max_age_seconds: Optional[float] = None) -> int:
+    """
+    Empaqueta las entradas vigentes de la caché en un único archivo portable.
+
+    El archivo contiene una cabecera JSON (versión de formato, número de
+    entradas, tamaño y SHA-256 del contenido) seguida de las entradas en NDJSON
+    comprimidas con zlib como un único flujo, lo que aprovecha el texto que se
+    repite entre respuestas.
+
+    Args:
+        cache: Caché con `iter_entries` (SQLite, con o sin nivel en memoria)
+        path: Archivo de salida (se escribe de forma atómica)
+        model: Solo entradas de este modelo
+        max_age_seconds: Solo entradas creadas hace menos de estos segundos
+
+    Returns:
+        Número de entradas exportadas
+    """
+    compressor = zlib.compressobj(9)
+    chunks = []
+    count = 0
+    for entry in cache.iter_entries(model=model, max_age_seconds=max_age_seconds):
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n"
+        chunks.append(compressor.compress(line.encode('utf-8')))
+        count += 1
+    chunks.append(compressor.flush())
+    payload = b"".join(chunks)
+    header = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "created_at": time.time(),
+        "entries": count,
+        "payload_codec": "zlib",
+        "payload_bytes": len(payload),
+        "payload_sha256": hashlib.sha256(payload).hexdigest(),
+    }
+    atomic_write_bytes(path, BUNDLE_MAGIC + json.dumps(header).encode('utf-8') + b"\n" + payload)
+    return count
+
+
+def read_bundle(path: Union[str, Path]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Lee y valida un paquete de caché sin tocar ninguna caché.
+
+    Args:
+        path: Archivo generado por `export_bundle`
+
+    Returns:
+        Tupla (cabecera, entradas)
+
+    Raises:
+        CacheBundleError: Si el archivo no es un paquete, es de una versión no
+            soportada, está truncado o su suma de verificación no coincide
+    """
+    data = Path(path).read_bytes()
+    if not data.startswith(BUNDLE_MAGIC):
+        raise CacheBundleError("el archivo no es un paquete de caché")
+    header_end = data.find(b"\n", len(BUNDLE_MAGIC))
+    if header_end < 0:
+        raise CacheBundleError("falta la cabecera del paquete")
+    try:
+        header = json.loads(data[len(BUNDLE_MAGIC):header_end].decode('utf-8'))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise CacheBundleError(f"cabecera ilegible: {e}") from e
+    if not isinstance(header, dict) or header.get("format_version") != BUNDLE_FORMAT_VERSION:
+        version = header.get("format_version") if isinstance(header, dict) else None
+        raise CacheBundleError(f"versión de formato no soportada: {version}")
+
+    payload = data[header_end + 1:]
+    if (len(payload) != header.get("payload_bytes")
+            or hashlib.sha256(payload).hexdigest() != header.get("payload_sha256")):
+        raise CacheBundleError("la suma de verificación no coincide (archivo dañado o truncado)")
+
+    try:
+        lines = zlib.decompress(payload).decode('utf-8').splitlines()
+        entries = [json.loads(line) for line in lines if line]
+        for entry in entries:
+            if not (isinstance(entry["key"], str) and isinstance(entry["model"], str)
+                    and isinstance(entry["response"], str)):
+                raise TypeError("campos de texto inválidos")
+            entry["created_at"] = float(entry["created_at"])
+            entry["expires_at"] = float(entry["expires_at"])
+            entry["prompt_tokens"] = int(entry.get("prompt_tokens", 0))
+            entry["response_tokens"] = int(entry.get("response_tokens", 0))
+    except (zlib.error, UnicodeDecodeError, ValueError, KeyError, TypeError) as e:
+        raise CacheBundleError(f"contenido inválido: {e}") from e
+    if len(entries) != header.get("entries"):
+        raise CacheBundleError("el número de entradas no coincide con la cabecera")
+    return header, entries
+
+
+def import_bundle(cache, path: Union[str, Path]) -> Tuple[int, int]:
+    """
+    Fusiona un paquete en la caché; ante claves repetidas gana la expiración más tardía.
+
+    El paquete se valida completo antes de escribir nada, así que uno dañado
+    no deja la caché a medio importar.
+
+    Args:
+        cache: Caché con `merge_entries` (SQLite, con o sin nivel en memoria)
+        path: Archivo generado por `export_bundle`
+
+    Returns:
+        Tupla (entradas escritas, entradas descartadas por expiradas o más antiguas)
+
+    Raises:
+        CacheBundleError: Si el paquete no es válido
+    """
+    _, entries = read_bundle(path)
+    result: Tuple[int, int] = cache.merge_entries(entries)
+    return result
+
+
+def create_cache(backend: str, cache_dir: Path, expiration_seconds: int,
+                 max_entries: int = 0, max_bytes: int = 0,
+                 memory_max_entries: int = 0, memory_max_bytes: int = 0,
+                 compression: str = "zlib", json_pretty: bool = True,
+                 redis_url: str = "", redis_pool_size: int = 4, redis_timeout: float = 1.0,
+                 redis_key_prefix: str = DEFAULT_KEY_PREFIX) -> CacheBackend:
+    """
+    Crea el backend de caché configurado.
+
+    Args:
+        backend: Nombre del backend ("sqlite", "json" o "redis")
+        cache_dir: Directorio de la caché
+        expiration_seconds: Tiempo de expiración en segundos (TTL en "redis")
+        max_entries: Máximo de entradas (0 = sin límite; solo SQLite)
+        max_bytes: Máximo de bytes de respuestas (0 = sin límite; solo SQLite)
+        memory_max_entries: Entradas del nivel en memoria (0 = sin nivel en memoria)
+        memory_max_bytes: Bytes del nivel en memoria
+        compression: Códec para las respuestas nuevas ("raw", "zlib" o "lzma")
+        json_pretty: Indentar el archivo del backend "json"
+        redis_url: URL del servidor para el backend "redis"
+        redis_pool_size: Conexiones reutilizables hacia el servidor
+        redis_timeout: Tiempo máximo por operación de red, en segundos
+        redis_key_prefix: Prefijo de las claves en el servidor
+
+    Returns:
+        Instancia de caché con la API get/set/clear/cleanup_expired
+    """
+    backend = (backend or "sqlite").lower()
+    if backend == "json":
+        return SimpleCache(cache_dir, expiration_seconds, compression=compression, pretty=json_pretty)
+    if backend == "redis":
+        local_cache = create_cache(
+            "sqlite", cache_dir, expiration_seconds, max_entries=max_entries, max_bytes=max_bytes,
+            memory_max_entries=memory_max_entries, memory_max_bytes=memory_max_bytes,
+            compression=compression,
+        )
+        if not redis_url:
+            logger.warning("CACHE_BACKEND=redis sin CACHE_REDIS_URL; se usará la caché local")
+            return local_cache
+        try:
+            remote_cache = RedisCache(redis_url, expiration_seconds, pool_size=redis_pool_size,
+                                      timeout=redis_timeout, key_prefix=redis_key_prefix,
+                                      compression=compression)
+        except ValueError as e:
+            logger.warning(f"{e}; se usará la caché local")
+            return local_cache
+        return FallbackCache(remote_cache, local_cache)
+    if backend != "sqlite":
+        logger.warning(f"Backend de caché desconocido '{backend}', se usará 'sqlite'")
+    sqlite_cache = SQLiteCache(cache_dir, expiration_seconds, max_entries=max_entries,
+                               max_bytes=max_bytes, compression=compression)
+    if memory_max_entries > 0 and memory_max_bytes > 0:
+        return TieredCache(sqlite_cache, MemoryCache(memory_max_entries, memory_max_bytes))
+    return sqlite_cache
+
+
+__all__ = [
+    'CacheBackend',
+    'SQLiteCache',
+    'MemoryCache',
+    'TieredCache',
+    'create_cache',
+    'export_bundle',
+    'import_bundle',
+    'read_bundle',
+    'CacheBundleError',
+    'CACHE_DB_FILENAME',
+    'LEGACY_CACHE_FILENAME',
+]
@@ -0,0 +1,100 @@
+# hooperits_agent/client.py
+"""
+Punto de entrada ligero del CLI (`hooperits-agent`).
+
+Si hay un demonio en marcha (`hooperits-agent daemon start`), le reenvía el
+comando junto con los descriptores de la terminal y devuelve su código de
+salida, sin importar Typer, Rich ni `google.generativeai`. Si no lo hay, no
+responde o se arrancó con otra configuración (variables de entorno, `.env` o
+versión del código), ejecuta el comando en el propio proceso como siempre.
+"""
+import os
+import signal
+import socket
+import sys
+from typing import List, Optional
+
+from .daemon import (
+    FORWARDED_ENV,
+    MessageReader,
+    daemon_supported,
+    environment_fingerprint,
+    resolve_socket_path,
+    send_message,
+)
+
+# Comandos que siempre se ejecutan en el proceso (gestionan el propio demonio)
+_LOCAL_COMMANDS = ("daemon",)
+
+
+def forward_to_daemon(argv: List[str], socket_path: Optional[str] = None) -> Optional[int]:
+    """
+    Ejecuta el comando en el demonio.
+
+    Args:
+        argv: Argumentos del CLI (sin el nombre del programa)
+        socket_path: Ruta del socket (por defecto la de `resolve_socket_path`)
+
+    Returns:
+        Código de salida del comando, o None si no hay demonio disponible
+        (el llamador debe ejecutarlo en el proceso)
+    """
+    path = resolve_socket_path(socket_path)
+    if not daemon_supported() or not path.exists():
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with sock:
+        try:
+            sock.connect(str(path))
+            send_message(sock, {
+                "op": "run",
+                "argv": argv,
+                "cwd": os.getcwd(),
+                "env": {name: os.environ[name] for name in FORWARDED_ENV if name in os.environ},
+                "fingerprint": environment_fingerprint(),
+                "encoding": getattr(sys.stdout, "encoding", None) or "utf-8",
+            }, fds=[0, 1, 2])
+            reader = MessageReader(sock)
+            started, _ = reader.read()
+        except (OSError, ValueError):
+            # Socket huérfano o demonio caído antes de aceptar el comando: se ejecuta aquí
+            return None
+        if not started or "pid" not in started:
+            # Sin demonio útil, o con otra configuración (`stale`): se ejecuta aquí
+            return None
+
+        while True:
+            try:
+                finished, _ = reader.read()
+                break
+            except KeyboardInterrupt:
+                # La terminal envía Ctrl+C al cliente: se reenvía al proceso que ejecuta el comando
+                try:
+                    os.kill(started["pid"], signal.SIGINT)
+                except ProcessLookupError:
+                    pass
+            except (OSError, ValueError):
+                finished = None
+                break
+    if finished is None:
+        # El comando ya empezó en el demonio: repetirlo aquí podría duplicar costos
+        print("Se perdió la conexión con el demonio de HOOPERITS durante el comando.", file=sys.stderr)
+        return 1
+    return int(finished.get("exit_code", 1))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Punto de entrada de consola: demonio si está disponible, si no, en el proceso."""
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] not in _LOCAL_COMMANDS:
+        exit_code = forward_to_daemon(argv)
+        if exit_code is not None:
+            sys.exit(exit_code)
+    from .main import app
+    app(args=argv, prog_name="hooperits-agent")
+
+
+__all__ = [
+    'forward_to_daemon',
+    'main',
+]
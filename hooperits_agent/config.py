@@ -30,14 +30,87 @@ DEFAULT_GEMINI_MODEL = os.getenv("DEFAULT_GEMINI_MODEL", "")
 # Límites para análisis
 MAX_FILE_SIZE_FOR_ANALYSIS = int(os.getenv("MAX_FILE_SIZE_FOR_ANALYSIS", "1048576"))  # 1MB por defecto
 
+# Mostrar las respuestas de Gemini a medida que llegan (los comandos aceptan --stream/--no-stream)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+
+# Llamadas simultáneas al modelo en el comando `batch` (se puede cambiar con --concurrency)
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Límites de tasa por modelo (`rate_limits` de model_tiers.json): "free" o "paid" según tu cuenta
+GEMINI_RATE_LIMIT_TIER = os.getenv("GEMINI_RATE_LIMIT_TIER", "free").lower()
+# Techo de llamadas simultáneas por modelo; se reduce a la mitad con cada 429/503 y se recupera poco a poco
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))
+# Reintentos ante throttling: intentos totales y backoff exponencial con jitter (segundos)
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "5"))
+GEMINI_RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "1.0"))
+GEMINI_RETRY_MAX_DELAY = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "60.0"))
+
 # Configuración de caché
 ENABLE_GEMINI_CACHE = os.getenv("ENABLE_GEMINI_CACHE", "true").lower() == "true"
 CACHE_EXPIRATION_SECONDS = int(os.getenv("CACHE_EXPIRATION_SECONDS", "3600"))  # 1 hora por defecto
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite").lower()  # "sqlite" (indexado), "json" (legado) o "redis" (compartido)
+# Presupuestos del backend SQLite; al superarlos se desalojan las entradas menos usadas (0 = sin límite)
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(200 * 1024 * 1024)))  # 200MB por defecto
+# Compresión de las respuestas nuevas: "zlib", "lzma" o "raw" (las entradas guardan su propio códec)
+CACHE_COMPRESSION = os.getenv("CACHE_COMPRESSION", "zlib").lower()
+# Indentar el archivo del backend "json" (false lo guarda compacto)
+CACHE_JSON_PRETTY = os.getenv("CACHE_JSON_PRETTY", "true").lower() == "true"
+# Nivel en memoria del proceso delante de la caché SQLite (0 lo desactiva)
+CACHE_MEMORY_MAX_ENTRIES = int(os.getenv("CACHE_MEMORY_MAX_ENTRIES", "256"))
+CACHE_MEMORY_MAX_BYTES = int(os.getenv("CACHE_MEMORY_MAX_BYTES", str(32 * 1024 * 1024)))  # 32MB
+# Backend "redis": servidor compartido (protocolo RESP); si no responde se usa la caché local
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "")  # p. ej. redis://:clave@cache.interno:6379/0
+CACHE_REDIS_POOL_SIZE = int(os.getenv("CACHE_REDIS_POOL_SIZE", "4"))
+CACHE_REDIS_TIMEOUT = float(os.getenv("CACHE_REDIS_TIMEOUT", "1.0"))  # segundos por operación
+CACHE_REDIS_KEY_PREFIX = os.getenv("CACHE_REDIS_KEY_PREFIX", "hooperits:cache:")
+# Memoria persistente de conteos de tokens (evita repetir `count_tokens` antes de llamadas de pago)
+ENABLE_TOKEN_COUNT_CACHE = os.getenv("ENABLE_TOKEN_COUNT_CACHE", "true").lower() == "true"
+TOKEN_COUNT_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_COUNT_CACHE_MAX_ENTRIES", "20000"))
+# Estimador local calibrado: evita el `count_tokens` remoto cuando el tramo de precio ya está claro
+ENABLE_LOCAL_TOKEN_ESTIMATE = os.getenv("ENABLE_LOCAL_TOKEN_ESTIMATE", "true").lower() == "true"
+TOKEN_ESTIMATE_MIN_SAMPLES = int(os.getenv("TOKEN_ESTIMATE_MIN_SAMPLES", "5"))
+
+# Coalescer consultas idénticas simultáneas (hilos y procesos de la máquina): solo una llama a la API
+ENABLE_SINGLE_FLIGHT = os.getenv("ENABLE_SINGLE_FLIGHT", "true").lower() == "true"
+# Segundos máximos que una consulta espera a la idéntica en curso antes de llamar por su cuenta
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "600"))
+
+# Registrar cada consulta (modelo, tokens, latencia, caché, costo, comando) en .cache/usage.ledger
+ENABLE_USAGE_LEDGER = os.getenv("ENABLE_USAGE_LEDGER", "true").lower() == "true"
+
+# Recordar la codificación detectada de cada archivo por (ruta, tamaño, mtime) en .cache/encodings.sqlite3
+ENABLE_ENCODING_CACHE = os.getenv("ENABLE_ENCODING_CACHE", "true").lower() == "true"
+ENCODING_CACHE_MAX_ENTRIES = int(os.getenv("ENCODING_CACHE_MAX_ENTRIES", "200000"))
 
-# Directorio de caché
-CACHE_DIR = project_root / ".cache"
+# Mantener un índice incremental de los archivos de cada repo (`.<repo>.index.sqlite3` junto a él)
+# para que `analyze-project` no recorra el árbol entero en cada ejecución
+ENABLE_FILE_INDEX = os.getenv("ENABLE_FILE_INDEX", "true").lower() == "true"
+
+# En repos Git, tomar los archivos de `analyze-project` del índice de git y de los no versionados
+# que `.gitignore` no ignora (opcional: si se activa, sustituye a ENABLE_FILE_INDEX en esos repos)
+ENABLE_GIT_FILE_ENUMERATION = os.getenv("ENABLE_GIT_FILE_ENUMERATION", "false").lower() == "true"
+
+# Compactar los archivos de `analyze-project` antes de enviarlos (licencias, espacios, literales largos)
+ENABLE_PROMPT_COMPACTION = os.getenv("ENABLE_PROMPT_COMPACTION", "false").lower() == "true"
+# Con la compactación, quitar también comentarios y docstrings
+PROMPT_COMPACTION_DROP_COMMENTS = os.getenv("PROMPT_COMPACTION_DROP_COMMENTS", "false").lower() == "true"
+# Caracteres a partir de los cuales se recorta un literal de texto (0 = no recortar)
+PROMPT_COMPACTION_MAX_LITERAL = int(os.getenv("PROMPT_COMPACTION_MAX_LITERAL", "200"))
+
+# Segundos que el catálogo de modelos en disco se usa sin consultar `list_models()`;
+# pasado ese tiempo se sigue usando mientras se refresca en segundo plano
+MODEL_CATALOG_TTL_SECONDS = int(os.getenv("MODEL_CATALOG_TTL_SECONDS", "86400"))
+
+# Directorio de caché (bases de datos, registro de uso, log del demonio...)
+CACHE_DIR = Path(os.getenv("CACHE_DIR", str(project_root / ".cache")))
 CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
+# Demonio opcional (`daemon start`): socket Unix (vacío = .cache/agent.sock) y segundos
+# de inactividad antes de terminar (0 = nunca)
+DAEMON_SOCKET = os.getenv("DAEMON_SOCKET", "")
+DAEMON_IDLE_TIMEOUT = float(os.getenv("DAEMON_IDLE_TIMEOUT", "3600"))
+
 # Archivo de estado
 STATE_FILE = project_root / ".hooperits_state.json"
 
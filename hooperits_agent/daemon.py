@@ -0,0 +1,469 @@
+# hooperits_agent/daemon.py
+"""
+Demonio opcional que mantiene el agente "caliente" entre invocaciones del CLI.
+
+El demonio importa una sola vez Typer, Rich y `google.generativeai`, carga
+`model_tiers.json`, el estado y las cachés, y crea la instancia del modelo.
+Escucha en un socket Unix; por cada comando se bifurca (fork) un proceso hijo
+que hereda todo ese estado ya preparado, recibe los descriptores de la
+terminal del cliente (stdin/stdout/stderr, por SCM_RIGHTS) y ejecuta el
+comando Typer como si fuera el propio cliente: colores, confirmaciones de
+costo y streaming funcionan igual que en el modo normal.
+
+Este módulo solo importa la biblioteca estándar y `config` a nivel de módulo,
+para que el cliente ligero (`client.py`) arranque rápido.
+"""
+import argparse
+import array
+import hashlib
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .config import (
+    API_KEY,
+    CACHE_DIR,
+    DAEMON_IDLE_TIMEOUT,
+    DAEMON_SOCKET,
+    dotenv_path,
+    project_root,
+)
+
+logger = logging.getLogger("hooperits_agent.daemon")
+
+DAEMON_LOG_FILENAME = "daemon.log"
+# Variables de la terminal del cliente que afectan a la salida (colores, ancho)
+FORWARDED_ENV = ("TERM", "COLORTERM", "COLUMNS", "LINES", "NO_COLOR", "FORCE_COLOR", "TERM_PROGRAM")
+# Variables que lee la configuración: el demonio las fijó al arrancar, así que un
+# cliente con otros valores no puede reutilizarlo
+FINGERPRINT_ENV = (
+    "GOOGLE_API_KEY", "DEFAULT_GEMINI_MODEL", "GEMINI_RATE_LIMIT_TIER", "GEMINI_MAX_ATTEMPTS",
+    "GEMINI_MAX_CONCURRENCY", "GEMINI_RETRY_BASE_DELAY", "GEMINI_RETRY_MAX_DELAY", "BATCH_CONCURRENCY",
+    "STREAM_RESPONSES", "REPOS_BASE_DIRECTORY_NAME", "LOG_FILE", "LOG_LEVEL", "MAX_FILE_SIZE_FOR_ANALYSIS",
+    "MODEL_CATALOG_TTL_SECONDS", "CACHE_DIR", "ENABLE_GEMINI_CACHE", "CACHE_BACKEND", "CACHE_COMPRESSION",
+    "CACHE_EXPIRATION_SECONDS", "CACHE_JSON_PRETTY", "CACHE_MAX_BYTES", "CACHE_MAX_ENTRIES",
+    "CACHE_MEMORY_MAX_BYTES", "CACHE_MEMORY_MAX_ENTRIES", "CACHE_REDIS_URL", "CACHE_REDIS_KEY_PREFIX",
+    "CACHE_REDIS_POOL_SIZE", "CACHE_REDIS_TIMEOUT", "ENABLE_ENCODING_CACHE", "ENCODING_CACHE_MAX_ENTRIES",
+    "ENABLE_FILE_INDEX", "ENABLE_GIT_FILE_ENUMERATION", "ENABLE_LOCAL_TOKEN_ESTIMATE",
+    "TOKEN_ESTIMATE_MIN_SAMPLES", "ENABLE_TOKEN_COUNT_CACHE", "TOKEN_COUNT_CACHE_MAX_ENTRIES",
+    "ENABLE_PROMPT_COMPACTION", "PROMPT_COMPACTION_DROP_COMMENTS", "PROMPT_COMPACTION_MAX_LITERAL",
+    "ENABLE_SINGLE_FLIGHT", "SINGLE_FLIGHT_TIMEOUT", "ENABLE_USAGE_LEDGER",
+    "DAEMON_IDLE_TIMEOUT", "DAEMON_SOCKET",
+)
+
+_MAX_MESSAGE_BYTES = 1 << 20
+# Límite habitual de la ruta de un socket Unix (sun_path) con margen
+_MAX_SOCKET_PATH = 100
+
+
+def daemon_supported() -> bool:
+    """Indica si la plataforma tiene sockets Unix con paso de descriptores."""
+    return hasattr(socket, "AF_UNIX") and hasattr(socket.socket, "sendmsg") and hasattr(os, "fork")
+
+
+def resolve_socket_path(socket_path: Optional[str] = None) -> Path:
+    """
+    Ruta del socket del demonio.
+
+    Args:
+        socket_path: Ruta explícita; por defecto `DAEMON_SOCKET` o `.cache/agent.sock`
+
+    Returns:
+        La ruta; si la de `.cache` es demasiado larga para un socket Unix, una
+        equivalente en el directorio temporal, única por usuario y proyecto
+    """
+    if socket_path or DAEMON_SOCKET:
+        return Path(socket_path or DAEMON_SOCKET)
+    path = CACHE_DIR / "agent.sock"
+    if len(str(path)) <= _MAX_SOCKET_PATH:
+        return path
+    digest = hashlib.sha256(str(CACHE_DIR).encode("utf-8")).hexdigest()[:12]
+    return Path(tempfile.gettempdir()) / f"hooperits-agent-{os.getuid()}-{digest}.sock"
+
+
+def install_fingerprint() -> str:
+    """
+    Huella de lo que el demonio cargó de disco: `.env` y los módulos del paquete.
+
+    Una actualización del paquete reescribe sus módulos, así que su tamaño y
+    mtime bastan para detectarla sin consultar los metadatos de instalación.
+    """
+    parts = []
+    for path in [dotenv_path, *sorted(Path(__file__).parent.glob("*.py"))]:
+        try:
+            stat_result = path.stat()
+            parts.append(f"{path.name}:{stat_result.st_size}:{stat_result.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{path.name}:-")
+    return "|".join(parts)
+
+
+def environment_fingerprint(install: Optional[str] = None) -> str:
+    """
+    Huella de la configuración efectiva del proceso.
+
+    Args:
+        install: Resultado de `install_fingerprint` si ya se calculó
+
+    Returns:
+        Resumen SHA-256 de las variables de `FINGERPRINT_ENV` (con `.env` ya
+        cargado) y de `install_fingerprint`
+    """
+    digest = hashlib.sha256()
+    for name in FINGERPRINT_ENV:
+        digest.update(f"{name}={os.environ.get(name)}\0".encode("utf-8", "surrogateescape"))
+    digest.update((install if install is not None else install_fingerprint()).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def send_message(sock: socket.socket, message: Dict[str, Any], fds: Sequence[int] = ()) -> None:
+    """Envía un mensaje JSON terminado en salto de línea, opcionalmente con descriptores."""
+    data = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+    if fds:
+        # Los descriptores viajan con el primer byte; el resto va por sendall
+        sock.sendmsg([data[:1]], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))])
+        data = data[1:]
+    sock.sendall(data)
+
+
+class MessageReader:
+    """Lee mensajes JSON por línea de un socket, recogiendo los descriptores recibidos."""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._buffer = b""
+
+    def read(self) -> Tuple[Optional[Dict[str, Any]], List[int]]:
+        """
+        Lee el siguiente mensaje.
+
+        Returns:
+            Tupla (mensaje o None si el otro extremo cerró, descriptores recibidos)
+
+        Raises:
+            ValueError: Si el mensaje supera el tamaño máximo o no es JSON
+        """
+        fds: List[int] = []
+        fd_size = array.array("i").itemsize
+        while b"\n" not in self._buffer:
+            data, ancdata, _, _ = self.sock.recvmsg(65536, socket.CMSG_SPACE(3 * fd_size))
+            for level, kind, cdata in ancdata:
+                if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                    received = array.array("i")
+                    received.frombytes(cdata[:len(cdata) - len(cdata) % fd_size])
+                    fds.extend(received)
+            if not data:
+                return None, fds
+            self._buffer += data
+            if len(self._buffer) > _MAX_MESSAGE_BYTES:
+                raise ValueError("Mensaje del socket demasiado grande")
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return json.loads(line.decode("utf-8")), fds
+
+
+def request(message: Dict[str, Any], socket_path: Optional[str] = None,
+            timeout: float = 2.0) -> Optional[Dict[str, Any]]:
+    """
+    Envía una petición de control (`ping`, `stop`) al demonio.
+
+    Returns:
+        La respuesta, o None si no hay un demonio escuchando
+    """
+    path = resolve_socket_path(socket_path)
+    if not daemon_supported() or not path.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(path))
+            send_message(sock, message)
+            reply, _ = MessageReader(sock).read()
+            return reply
+    except (OSError, ValueError):
+        return None
+
+
+def ping(socket_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Estado del demonio (`pid`, `uptime_s`, `requests`), o None si no está activo."""
+    return request({"op": "ping"}, socket_path)
+
+
+def stop(socket_path: Optional[str] = None, timeout: float = 10.0) -> bool:
+    """
+    Detiene el demonio y espera a que libere el socket.
+
+    Returns:
+        True si había un demonio y se detuvo
+    """
+    if request({"op": "stop"}, socket_path) is None:
+        return False
+    path = resolve_socket_path(socket_path)
+    deadline = time.monotonic() + timeout
+    while path.exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return not path.exists()
+
+
+def start_background(socket_path: Optional[str] = None, timeout: float = 30.0,
+                     log_path: Optional[Path] = None) -> int:
+    """
+    Arranca el demonio en segundo plano y espera a que responda.
+
+    Args:
+        socket_path: Socket Unix (por defecto, el de la configuración)
+        timeout: Segundos de espera hasta que responda
+        log_path: Archivo donde va su salida (por defecto, `.cache/daemon.log`)
+
+    Returns:
+        PID del demonio
+
+    Raises:
+        RuntimeError: Si el demonio termina o no responde a tiempo (ver `.cache/daemon.log`)
+    """
+    path = resolve_socket_path(socket_path)
+    log_path = log_path or CACHE_DIR / DAEMON_LOG_FILENAME
+    with open(log_path, "ab") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "hooperits_agent.daemon", "--socket", str(path)],
+            stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+            cwd=str(project_root), start_new_session=True,
+        )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = ping(str(path))
+        if status is not None:
+            return int(status["pid"])
+        if process.poll() is not None:
+            raise RuntimeError(f"El demonio terminó al arrancar (código {process.returncode}); revisa {log_path}")
+        time.sleep(0.1)
+    raise RuntimeError(f"El demonio no respondió en {timeout:.0f}s; revisa {log_path}")
+
+
+def warm_up() -> None:
+    """Carga en memoria lo que cada invocación del CLI repetiría."""
+    from . import main  # noqa: F401  (Typer, Rich, google.generativeai y todos los módulos)
+    from . import gemini_ops
+    from .state_manager import _load_state
+
+    gemini_ops._load_model_tier_info()
+    if gemini_ops.token_estimator is not None:
+        gemini_ops.token_estimator.calibration
+    # Solo si ya hay un modelo elegido: la autoselección consultaría la red desde
+    # el proceso padre, y los canales de red no deben heredarse por fork
+    if API_KEY and _load_state().get("selected_gemini_model"):
+        gemini_ops._initialize_and_get_gemini_model_instance()
+
+
+def _prepare_child(request_message: Dict[str, Any], fds: List[int]) -> None:
+    """Convierte el hijo bifurcado en "el cliente": su terminal, su directorio y su entorno."""
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    encoding = request_message.get("encoding") or "utf-8"
+    sys.stdin = open(0, "r", encoding=encoding, errors="replace", closefd=False)
+    sys.stdout = open(1, "w", encoding=encoding, errors="replace", buffering=1, closefd=False)
+    sys.stderr = open(2, "w", encoding=encoding, errors="replace", buffering=1, closefd=False)
+    for name in FORWARDED_ENV:
+        value = request_message.get("env", {}).get(name)
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+    try:
+        os.chdir(request_message.get("cwd") or str(project_root))
+    except OSError:
+        pass
+
+    # Las consolas de Rich detectan colores y ancho al crearse: se rehacen para la nueva terminal
+    from rich.console import Console
+    for name, module in list(sys.modules.items()):
+        if (name == "hooperits_agent" or name.startswith("hooperits_agent.")) \
+                and isinstance(getattr(module, "console", None), Console):
+            setattr(module, "console", Console())
+
+    # Los clientes de red de genai no se comparten con el padre
+    from . import gemini_ops
+    if API_KEY:
+        gemini_ops.genai.configure(api_key=API_KEY)
+
+
+def _flush_response_cache() -> None:
+    """
+    Vuelca las estadísticas pendientes de la caché de respuestas: los hijos
+    bifurcados terminan con `os._exit`, que no ejecuta los `atexit`.
+    """
+    from . import gemini_ops
+    for cache in (gemini_ops.cache, getattr(gemini_ops.cache, "fallback", None)):
+        flush = getattr(cache, "flush", None)
+        if callable(flush):
+            flush()
+
+
+def run_cli(argv: List[str]) -> int:
+    """Ejecuta el CLI con `argv` y devuelve su código de salida."""
+    from .main import app
+    try:
+        app(args=argv, prog_name="hooperits-agent")
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """Atiende una conexión; con `ForkingMixIn` se ejecuta en el proceso hijo."""
+
+    server: "_AgentServer"
+
+    def handle(self) -> None:
+        reader = MessageReader(self.request)
+        fds: List[int] = []
+        try:
+            received, fds = reader.read()
+            message = received or {}
+            op = message.get("op")
+            if op == "ping":
+                send_message(self.request, {"ok": True, "pid": os.getppid(),
+                                            "uptime_s": round(time.time() - self.server.started_at, 1),
+                                            "requests": self.server.requests_served})
+            elif op == "stop":
+                send_message(self.request, {"ok": True})
+                os.kill(os.getppid(), signal.SIGTERM)
+            elif op == "run" and len(fds) == 3 and message.get("fingerprint") != self.server.fingerprint:
+                # Otra configuración (variables, `.env`) u otra versión del código: el
+                # cliente ejecuta el comando en su propio proceso
+                send_message(self.request, {"stale": True})
+                if install_fingerprint() != self.server.install:
+                    logger.info("El código o el .env cambiaron desde el arranque; el demonio termina")
+                    os.kill(os.getppid(), signal.SIGTERM)
+            elif op == "run" and len(fds) == 3:
+                send_message(self.request, {"pid": os.getpid()})
+                _prepare_child(message, fds)
+                fds = []
+                exit_code = run_cli(list(message.get("argv") or []))
+                _flush_response_cache()
+                for stream in (sys.stdout, sys.stderr):
+                    stream.flush()
+                send_message(self.request, {"exit_code": exit_code})
+            else:
+                send_message(self.request, {"error": f"Petición no válida: {op}"})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Conexión del demonio fallida: {e}")
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+
+class _AgentServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    """Servidor del socket Unix; cada conexión se atiende en un hijo bifurcado."""
+
+    def __init__(self, path: str, install: str):
+        super().__init__(path, _RequestHandler)
+        self.install = install
+        self.fingerprint = environment_fingerprint(install)
+        self.started_at = time.time()
+        self.last_activity = time.monotonic()
+        self.requests_served = 0
+
+    def process_request(self, request, client_address) -> None:
+        self.last_activity = time.monotonic()
+        self.requests_served += 1
+        super().process_request(request, client_address)
+
+
+def serve(socket_path: Optional[str] = None, idle_timeout: Optional[float] = None) -> None:
+    """
+    Prepara el agente y atiende peticiones hasta recibir SIGTERM/SIGINT o quedar inactivo.
+
+    Args:
+        socket_path: Ruta del socket (ver `resolve_socket_path`)
+        idle_timeout: Segundos sin peticiones antes de terminar (0 = nunca;
+            por defecto `DAEMON_IDLE_TIMEOUT`)
+
+    Raises:
+        RuntimeError: Si ya hay un demonio escuchando en el socket
+    """
+    path = resolve_socket_path(socket_path)
+    idle_timeout = DAEMON_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+    if ping(str(path)) is not None:
+        raise RuntimeError(f"Ya hay un demonio escuchando en {path}")
+    if path.exists():
+        path.unlink()  # socket huérfano de un demonio que no terminó limpiamente
+
+    start = time.perf_counter()
+    # Antes de cargar nada: un cambio posterior en disco deja al demonio desfasado
+    install = install_fingerprint()
+    warm_up()
+    old_umask = os.umask(0o177)  # socket accesible solo por el usuario
+    try:
+        server = _AgentServer(str(path), install)
+    finally:
+        os.umask(old_umask)
+    server.timeout = 1.0
+    logger.info(f"Demonio listo en {path} (pid {os.getpid()}, preparado en {time.perf_counter() - start:.2f}s)")
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+    try:
+        while not stopping:
+            server.handle_request()
+            server.service_actions()  # recoge los hijos terminados
+            idle = time.monotonic() - server.last_activity
+            if idle_timeout and idle > idle_timeout and not server.active_children:
+                logger.info(f"Demonio inactivo durante {idle:.0f}s; terminando")
+                break
+    finally:
+        server.server_close()
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        logger.info("Demonio detenido")
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m hooperits_agent.daemon",
+                                     description="Demonio de HOOPERITS AI CODE AGENT")
+    parser.add_argument("--socket", help="Ruta del socket Unix")
+    parser.add_argument("--idle-timeout", type=float, help="Segundos de inactividad antes de terminar (0 = nunca)")
+    return parser.parse_args(argv)
+
+
+__all__ = [
+    'daemon_supported',
+    'resolve_socket_path',
+    'send_message',
+    'MessageReader',
+    'ping',
+    'stop',
+    'start_background',
+    'serve',
+    'run_cli',
+    'environment_fingerprint',
+    'install_fingerprint',
+    'FINGERPRINT_ENV',
+    'FORWARDED_ENV',
+]
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    serve(args.socket, args.idle_timeout)
@@ -0,0 +1,127 @@
+# hooperits_agent/encoding_cache.py
+"""
+Memoria persistente de la codificación detectada de cada archivo.
+
+Detectar la codificación de un archivo que no es UTF-8 exige `chardet`, lento
+y en Python puro. Como el resultado solo cambia si cambia el archivo, se
+guarda por (ruta, tamaño, mtime): un archivo sin modificar no se vuelve a
+analizar, y uno marcado como binario ni siquiera se vuelve a abrir.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger("hooperits_agent.encoding_cache")
+
+ENCODING_CACHE_FILENAME = "encodings.sqlite3"
+
+# (ruta absoluta, tamaño en bytes, mtime en nanosegundos)
+FileKey = Tuple[str, int, int]
+
+
+class EncodingCache:
+    """Codificaciones por (ruta, tamaño, mtime) en SQLite; al llenarse se olvidan las más antiguas."""
+
+    def __init__(self, cache_dir: Path, max_entries: int = 200000):
+        """
+        Inicializa la memoria de codificaciones.
+
+        Args:
+            cache_dir: Directorio donde guardar la base de datos
+            max_entries: Máximo de archivos retenidos (0 = sin límite)
+        """
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = cache_dir / ENCODING_CACHE_FILENAME
+        self.max_entries = max_entries
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        # Detecciones nuevas pendientes de guardar (se escriben juntas en `flush`)
+        self._pending: List[Tuple[str, int, int, str]] = []
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is not None and self._conn_pid != os.getpid():
+            self._conn = None
+        if self._conn is None:
+            conn = sqlite3.connect(
+                str(self.db_path), timeout=30, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS encodings ("
+                "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+                "encoding TEXT NOT NULL, last_used REAL NOT NULL) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_encodings_last_used ON encodings (last_used)")
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def get(self, key: FileKey) -> Optional[str]:
+        """
+        Codificación memorizada de un archivo.
+
+        Args:
+            key: (ruta, tamaño, mtime_ns) del archivo
+
+        Returns:
+            La codificación, o None si no está memorizada o el archivo cambió
+        """
+        path, size, mtime_ns = key
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT encoding FROM encodings WHERE path = ? AND size = ? AND mtime_ns = ?",
+                    (path, size, mtime_ns),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"No se pudo leer la memoria de codificaciones: {e}")
+            return None
+        return row[0] if row else None
+
+    def put(self, key: FileKey, encoding: str) -> None:
+        """Memoriza la codificación de un archivo (se guarda en el próximo `flush`)."""
+        with self._lock:
+            self._pending.append((key[0], key[1], key[2], encoding))
+
+    def flush(self) -> None:
+        """Guarda las codificaciones pendientes en una sola transacción."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+            now = time.time()
+            try:
+                conn = self._connection()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO encodings (path, size, mtime_ns, encoding, last_used) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [(path, size, mtime_ns, encoding, now) for path, size, mtime_ns, encoding in pending],
+                    )
+                    if self.max_entries:
+                        total = conn.execute("SELECT COUNT(*) FROM encodings").fetchone()[0]
+                        if total > self.max_entries:
+                            conn.execute(
+                                "DELETE FROM encodings WHERE path IN ("
+                                "SELECT path FROM encodings ORDER BY last_used LIMIT ?)",
+                                (total - self.max_entries,),
+                            )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error as e:
+                logger.warning(f"No se pudo escribir en la memoria de codificaciones: {e}")
+
+
+__all__ = [
+    'EncodingCache',
+    'ENCODING_CACHE_FILENAME',
+]
@@ -0,0 +1,341 @@
+# hooperits_agent/file_index.py
+"""
+Índice persistente de archivos candidatos de cada repositorio gestionado.
+
+Cada `analyze-project` recorría y hacía `stat` del árbol entero y recalculaba
+las prioridades. El índice guarda, junto al repositorio (en `REPOS_BASE_PATH`,
+como `.<repo>.index.sqlite3`), los archivos que pasan los filtros del
+analizador con su tamaño, mtime, prioridad y, cuando ya se leyeron, su
+codificación, hash de contenido y tokens estimados; y los directorios
+recorridos con su mtime.
+
+La actualización es incremental: crear, borrar o renombrar una entrada cambia
+el mtime de su directorio, así que basta un `stat` por directorio indexado y
+volver a listar solo los que cambiaron (y recorrer los subdirectorios nuevos).
+Editar un archivo sin cambiar su directorio no se detecta aquí: el analizador
+compara tamaño y mtime al leerlo y actualiza su fila. Por eso se indexan
+también los archivos vacíos o demasiado grandes (la consulta de candidatos
+los filtra por tamaño) y cada actualización vuelve a hacer `stat` de ellos,
+que suelen ser pocos: un archivo creado vacío y guardado después en el mismo
+sitio entra así en la selección. La selección de candidatos es una consulta
+ordenada por (prioridad, tamaño, ruta) que se lee por páginas, sin tocar el
+sistema de archivos.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("hooperits_agent.file_index")
+
+FILE_INDEX_FORMAT_VERSION = 1
+
+# Lista un directorio sin recursión: (ruta absoluta, ruta relativa, ¿en public/assets?)
+# -> (candidatos con path_str/size/mtime_ns/priority, subdirectorios en la misma forma)
+ScanDirectory = Callable[[str, str, bool], Tuple[List[Dict[str, Any]], List[Tuple[str, str, bool]]]]
+
+_PAGE_SIZE = 256
+
+
+def file_index_path(repo_root_path: Path) -> Path:
+    """Ruta del índice de un repositorio: un archivo oculto a su lado."""
+    return repo_root_path.parent / f".{repo_root_path.name}.index.sqlite3"
+
+
+def _subtree_bounds(rel_dir: str) -> Tuple[str, str]:
+    """Rango [desde, hasta) de las rutas dentro de `rel_dir` ('0' es el carácter siguiente a '/')."""
+    return f"{rel_dir}/", f"{rel_dir}0"
+
+
+class FileIndex:
+    """Archivos candidatos y directorios de un repositorio, en SQLite."""
+
+    def __init__(self, repo_root_path: Path, index_path: Optional[Path] = None):
+        """
+        Inicializa el índice (la base de datos se crea al primer uso).
+
+        Args:
+            repo_root_path: Raíz del repositorio
+            index_path: Ruta del índice (por defecto, `file_index_path`)
+        """
+        self.repo_root_path = repo_root_path
+        self.path = index_path or file_index_path(repo_root_path)
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is not None and self._conn_pid != os.getpid():
+            self._conn = None
+        if self._conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            version = conn.execute("SELECT value FROM meta WHERE key = 'format_version'").fetchone()
+            if version is not None and version[0] != str(FILE_INDEX_FORMAT_VERSION):
+                logger.info(f"Índice {self.path.name} de otra versión de formato: se reconstruirá")
+                conn.execute("DROP TABLE IF EXISTS files")
+                conn.execute("DROP TABLE IF EXISTS dirs")
+                conn.execute("DELETE FROM meta")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, dir TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+                "priority INTEGER NOT NULL, encoding TEXT, content_hash TEXT, tokens INTEGER) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_order ON files (priority, size, path)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_dir ON files (dir)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS dirs ("
+                "path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, in_assets INTEGER NOT NULL) WITHOUT ROWID"
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('format_version', ?)",
+                         (str(FILE_INDEX_FORMAT_VERSION),))
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def close(self) -> None:
+        """Cierra la conexión (se reabre si se vuelve a usar)."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def is_built(self) -> bool:
+        """Indica si el índice ya tiene un recorrido completo."""
+        with self._lock:
+            return self._connection().execute("SELECT 1 FROM meta WHERE key = 'built_at'").fetchone() is not None
+
+    def update(self, scan_directory: ScanDirectory, full: bool = False,
+               max_size: Optional[int] = None) -> Dict[str, int]:
+        """
+        Pone el índice al día con el sistema de archivos.
+
+        Args:
+            scan_directory: Función que lista un directorio con los filtros del analizador
+            full: Descartar el índice y recorrer el repositorio entero
+            max_size: Tamaño máximo de un candidato: los archivos indexados
+                vacíos o más grandes se vuelven a comprobar en disco
+
+        Returns:
+            Contadores `dirs_checked`, `dirs_rescanned`, `files_added`,
+            `files_removed`, `files_rechecked` y `files` (total indexado)
+        """
+        root = str(self.repo_root_path)
+        stats = {"dirs_checked": 0, "dirs_rescanned": 0, "files_added": 0, "files_removed": 0,
+                 "files_rechecked": 0}
+        with self._lock:
+            conn = self._connection()
+            full = full or not self.is_built()
+            known: Dict[str, Tuple[int, bool]] = {} if full else {
+                path: (mtime_ns, bool(in_assets))
+                for path, mtime_ns, in_assets in conn.execute("SELECT path, mtime_ns, in_assets FROM dirs")
+            }
+            children: Dict[str, List[str]] = {}
+            for rel_dir in known:
+                if rel_dir:
+                    children.setdefault(rel_dir.rpartition('/')[0], []).append(rel_dir)
+
+            # Cambios a aplicar en una sola transacción
+            upserts: List[Dict[str, Any]] = []
+            dir_rows: List[Tuple[str, int, int]] = []
+            listed_dirs: List[Tuple[str, List[str]]] = []  # (directorio, archivos que contiene ahora)
+            removed_dirs: List[str] = []
+            to_walk: List[Tuple[str, str, bool]] = [(root, "", False)] if full else []
+
+            for rel_dir, (mtime_ns, in_assets) in known.items():
+                stats["dirs_checked"] += 1
+                abs_dir = os.path.join(root, rel_dir) if rel_dir else root
+                try:
+                    current_mtime_ns = os.stat(abs_dir).st_mtime_ns
+                except OSError:
+                    removed_dirs.append(rel_dir)
+                    continue
+                if current_mtime_ns == mtime_ns:
+                    continue
+                stats["dirs_rescanned"] += 1
+                files, subdirs = scan_directory(abs_dir, rel_dir, in_assets)
+                upserts.extend(files)
+                listed_dirs.append((rel_dir, [f["path_str"] for f in files]))
+                dir_rows.append((rel_dir, current_mtime_ns, int(in_assets)))
+                current_subdirs = {rel for _, rel, _ in subdirs}
+                removed_dirs.extend(child for child in children.get(rel_dir, []) if child not in current_subdirs)
+                to_walk.extend(subdir for subdir in subdirs if subdir[1] not in known)
+
+            # Subárboles nuevos (o todo el repositorio): recorrido completo
+            while to_walk:
+                abs_dir, rel_dir, in_assets = to_walk.pop()
+                try:
+                    # El mtime se toma antes de listar: un cambio durante el listado se verá la próxima vez
+                    mtime_ns = os.stat(abs_dir).st_mtime_ns
+                except OSError:
+                    continue
+                files, subdirs = scan_directory(abs_dir, rel_dir, in_assets)
+                upserts.extend(files)
+                listed_dirs.append((rel_dir, [f["path_str"] for f in files]))
+                dir_rows.append((rel_dir, mtime_ns, int(in_assets)))
+                to_walk.extend(subdirs)
+
+            # Archivos fuera del filtro de tamaño en directorios sin cambios: pudieron editarse en su sitio
+            resized: List[Tuple[int, int, str]] = []
+            if max_size is not None and not full:
+                relisted = {f["path_str"] for f in upserts}
+                for path, size, mtime_ns in conn.execute(
+                        "SELECT path, size, mtime_ns FROM files WHERE size = 0 OR size > ?", (max_size,)).fetchall():
+                    if path in relisted:
+                        continue
+                    stats["files_rechecked"] += 1
+                    try:
+                        stat_result = os.stat(os.path.join(root, path))
+                    except OSError:
+                        continue  # borrado: su directorio cambió y ya se volvió a listar
+                    if (stat_result.st_size, stat_result.st_mtime_ns) != (size, mtime_ns):
+                        resized.append((stat_result.st_size, stat_result.st_mtime_ns, path))
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if full:
+                    conn.execute("DELETE FROM files")
+                    conn.execute("DELETE FROM dirs")
+                for rel_dir in removed_dirs:
+                    if not rel_dir:
+                        # Desapareció la raíz: no queda nada indexado
+                        stats["files_removed"] += conn.execute("DELETE FROM files").rowcount
+                        conn.execute("DELETE FROM dirs")
+                        continue
+                    low, high = _subtree_bounds(rel_dir)
+                    stats["files_removed"] += conn.execute(
+                        "DELETE FROM files WHERE dir = ? OR (path >= ? AND path < ?)", (rel_dir, low, high)).rowcount
+                    conn.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (rel_dir, low, high))
+                for rel_dir, present in listed_dirs:
+                    present_set = set(present)
+                    gone = [path for (path,) in conn.execute("SELECT path FROM files WHERE dir = ?", (rel_dir,))
+                            if path not in present_set]
+                    conn.executemany("DELETE FROM files WHERE path = ?", [(path,) for path in gone])
+                    stats["files_removed"] += len(gone)
+                conn.executemany(
+                    "UPDATE files SET size = ?, mtime_ns = ?, encoding = NULL, content_hash = NULL, tokens = NULL "
+                    "WHERE path = ?", resized)
+                before = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+                # Lo ya conocido de un archivo (codificación, hash, tokens) se conserva si no cambió
+                conn.executemany(
+                    "INSERT INTO files (path, dir, size, mtime_ns, priority) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (path) DO UPDATE SET "
+                    "encoding = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns THEN encoding END, "
+                    "content_hash = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns "
+                    "THEN content_hash END, "
+                    "tokens = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns THEN tokens END, "
+                    "size = excluded.size, mtime_ns = excluded.mtime_ns, priority = excluded.priority",
+                    [(f["path_str"], f["path_str"].rpartition('/')[0], f["size"], f["mtime_ns"], f["priority"])
+                     for f in upserts],
+                )
+                stats["files"] = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+                stats["files_added"] = stats["files"] - before
+                conn.executemany("INSERT OR REPLACE INTO dirs (path, mtime_ns, in_assets) VALUES (?, ?, ?)",
+                                 dir_rows)
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('updated_at', ?)", (str(time.time()),))
+                if full:
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('built_at', ?)",
+                                 (str(time.time()),))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return stats
+
+    def candidates(self, sub_path: str = "", max_size: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Archivos candidatos en orden de (prioridad, tamaño, ruta), leídos por páginas.
+
+        Args:
+            sub_path: Limitar a este subdirectorio (relativo a la raíz, con '/')
+            max_size: Omitir los archivos vacíos y los de más de estos bytes
+
+        Returns:
+            Iterador de `{"path_obj", "path_str", "priority", "size", "mtime_ns",
+            "encoding", "content_hash", "tokens"}`
+        """
+        sub_path = sub_path.strip('/')
+        where = "path >= ? AND path < ? AND " if sub_path else ""
+        params: List[Any] = list(_subtree_bounds(sub_path)) if sub_path else []
+        if max_size is not None:
+            where += "size > 0 AND size <= ? AND "
+            params.append(max_size)
+        last: Optional[Tuple[int, int, str]] = None
+        while True:
+            page_where = where + ("(priority, size, path) > (?, ?, ?)" if last else "1")
+            with self._lock:
+                rows = self._connection().execute(
+                    f"SELECT path, priority, size, mtime_ns, encoding, content_hash, tokens FROM files "
+                    f"WHERE {page_where} ORDER BY priority, size, path LIMIT {_PAGE_SIZE}",
+                    params + (list(last) if last else []),
+                ).fetchall()
+            for path, priority, size, mtime_ns, encoding, content_hash, tokens in rows:
+                yield {
+                    "path_obj": self.repo_root_path / path, "path_str": path, "priority": priority,
+                    "size": size, "mtime_ns": mtime_ns, "encoding": encoding,
+                    "content_hash": content_hash, "tokens": tokens,
+                }
+            if len(rows) < _PAGE_SIZE:
+                return
+            last = (rows[-1][1], rows[-1][2], rows[-1][0])
+
+    def record_reads(self, files: Sequence[Dict[str, Any]]) -> None:
+        """
+        Guarda lo aprendido al leer archivos: tamaño y mtime actuales,
+        codificación, hash y tokens; los que ya no son candidatos se quitan.
+
+        Args:
+            files: Candidatos leídos (con `excluded` si dejaron de pasar los filtros)
+        """
+        if not files:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany("DELETE FROM files WHERE path = ?",
+                                 [(f["path_str"],) for f in files if f.get("excluded")])
+                conn.executemany(
+                    "UPDATE files SET size = ?, mtime_ns = ?, encoding = ?, content_hash = ?, tokens = ? "
+                    "WHERE path = ?",
+                    [(f["size"], f["mtime_ns"], f.get("encoding"), f.get("content_hash"), f.get("tokens"),
+                      f["path_str"]) for f in files if not f.get("excluded")],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Resumen del índice.
+
+        Returns:
+            Diccionario con `files`, `dirs`, `tokens` (suma de los conocidos),
+            `files_with_tokens`, `built_at`, `updated_at` (epoch o None) y
+            `size_bytes` del archivo
+        """
+        with self._lock:
+            conn = self._connection()
+            files, tokens, with_tokens = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(tokens), 0), COUNT(tokens) FROM files").fetchone()
+            dirs = conn.execute("SELECT COUNT(*) FROM dirs").fetchone()[0]
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+        return {
+            "files": files, "dirs": dirs, "tokens": tokens, "files_with_tokens": with_tokens,
+            "built_at": float(meta["built_at"]) if "built_at" in meta else None,
+            "updated_at": float(meta["updated_at"]) if "updated_at" in meta else None,
+            "size_bytes": self.path.stat().st_size if self.path.exists() else 0,
+        }
+
+
+__all__ = [
+    'FileIndex',
+    'FILE_INDEX_FORMAT_VERSION',
+    'file_index_path',
+]
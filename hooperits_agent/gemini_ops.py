@@ -1,18 +1,41 @@
 # hooperits_agent/gemini_ops.py
+import asyncio
 import json
+import threading
+import time
 from pathlib import Path
-from typing import Optional, List, Dict, Any 
+from typing import Awaitable, Callable, Optional, List, Dict, Any, Tuple
 import typer 
 from rich.console import Console
 from rich.table import Table
 from rich.text import Text # Importar Text
 from .config import (
     API_KEY, project_root, ENABLE_GEMINI_CACHE, 
-    CACHE_EXPIRATION_SECONDS, CACHE_DIR, DEFAULT_GEMINI_MODEL,
+    CACHE_EXPIRATION_SECONDS, CACHE_DIR, CACHE_BACKEND, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES,
+    CACHE_MEMORY_MAX_ENTRIES, CACHE_MEMORY_MAX_BYTES, CACHE_COMPRESSION, CACHE_JSON_PRETTY,
+    CACHE_REDIS_URL, CACHE_REDIS_POOL_SIZE, CACHE_REDIS_TIMEOUT, CACHE_REDIS_KEY_PREFIX,
+    ENABLE_TOKEN_COUNT_CACHE, TOKEN_COUNT_CACHE_MAX_ENTRIES,
+    ENABLE_LOCAL_TOKEN_ESTIMATE, TOKEN_ESTIMATE_MIN_SAMPLES,
+    GEMINI_RATE_LIMIT_TIER, GEMINI_MAX_CONCURRENCY,
+    GEMINI_MAX_ATTEMPTS, GEMINI_RETRY_BASE_DELAY, GEMINI_RETRY_MAX_DELAY,
+    ENABLE_SINGLE_FLIGHT, SINGLE_FLIGHT_TIMEOUT, MODEL_CATALOG_TTL_SECONDS,
+    ENABLE_USAGE_LEDGER,
+    DEFAULT_GEMINI_MODEL,
     LOG_LEVEL, LOG_FILE
 )
-from .state_manager import _load_state, _save_state
-from .utils import setup_logging, SimpleCache, format_cost
+from .state_manager import _load_state, _update_state
+from .utils import setup_logging, format_cost, build_cache_key, count_tokens_estimate
+from .cache import create_cache
+from .single_flight import SingleFlight
+from .model_catalog import ModelCatalog
+from .token_counts import TokenCountCache, count_tokens_cached
+from .token_estimator import TokenEstimator
+from .pricing import PricingTable
+from .usage_ledger import UsageLedger
+from .profiler import span
+from .rate_limiter import (
+    ModelRateLimiter, RetryPolicy, call_with_retry, call_with_retry_async, parse_rate_limits
+)
 import traceback
 import google.generativeai as genai
 
@@ -20,11 +43,46 @@ console = Console()
 logger = setup_logging(LOG_LEVEL, LOG_FILE)
 
 # Inicializar caché si está habilitado
-cache = SimpleCache(CACHE_DIR, CACHE_EXPIRATION_SECONDS) if ENABLE_GEMINI_CACHE else None
+cache = create_cache(
+    CACHE_BACKEND, CACHE_DIR, CACHE_EXPIRATION_SECONDS,
+    max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES,
+    memory_max_entries=CACHE_MEMORY_MAX_ENTRIES, memory_max_bytes=CACHE_MEMORY_MAX_BYTES,
+    compression=CACHE_COMPRESSION, json_pretty=CACHE_JSON_PRETTY,
+    redis_url=CACHE_REDIS_URL, redis_pool_size=CACHE_REDIS_POOL_SIZE,
+    redis_timeout=CACHE_REDIS_TIMEOUT, redis_key_prefix=CACHE_REDIS_KEY_PREFIX
+) if ENABLE_GEMINI_CACHE else None
+
+# Conteos de tokens memorizados por (modelo, hash del texto)
+token_count_cache = TokenCountCache(
+    CACHE_DIR, max_entries=TOKEN_COUNT_CACHE_MAX_ENTRIES
+) if ENABLE_TOKEN_COUNT_CACHE else None
+
+# Estimador local calibrado con el uso real de cada modelo
+token_estimator = TokenEstimator(
+    CACHE_DIR, min_samples=TOKEN_ESTIMATE_MIN_SAMPLES
+) if ENABLE_LOCAL_TOKEN_ESTIMATE else None
+
+# Consultas idénticas en curso comparten una llamada; entre procesos solo si hay caché donde dejarla
+single_flight = SingleFlight(
+    CACHE_DIR / "inflight" if cache is not None else None, timeout=SINGLE_FLIGHT_TIMEOUT
+) if ENABLE_SINGLE_FLIGHT else None
+
+# Registro local de cada consulta para `usage report`; `usage_command` lo fija el CLI
+usage_ledger = UsageLedger(CACHE_DIR) if ENABLE_USAGE_LEDGER else None
+usage_command = ""
+
+# Modelos de `list_models()` persistidos en disco con TTL
+model_catalog = ModelCatalog(CACHE_DIR, ttl_seconds=MODEL_CATALOG_TTL_SECONDS)
+
+# Reintentos ante 429/503 y un limitador (RPM/TPM + concurrencia AIMD) por modelo
+retry_policy = RetryPolicy(GEMINI_MAX_ATTEMPTS, GEMINI_RETRY_BASE_DELAY, GEMINI_RETRY_MAX_DELAY)
+_rate_limiters: Dict[str, ModelRateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
 
 _genai_model_instance = None
 _selected_model_name = None 
 _model_tier_info_cache: Optional[Dict[str, Any]] = None 
+_pricing_table: Optional[PricingTable] = None
 
 def _load_model_tier_info() -> Dict[str, Any]:
     global _model_tier_info_cache
@@ -46,41 +104,97 @@ def _load_model_tier_info() -> Dict[str, Any]:
             _model_tier_info_cache = {}
     return _model_tier_info_cache
 
+def get_pricing_table() -> PricingTable:
+    """Tarifas de `model_tiers.json` compiladas (una vez por proceso), con los alias resueltos."""
+    global _pricing_table
+    if _pricing_table is None:
+        _pricing_table = PricingTable(_load_model_tier_info())
+    return _pricing_table
+
 def get_model_pricing_details(model_name: str) -> Dict[str, Any]:
     all_tier_info = _load_model_tier_info()
     return all_tier_info.get(model_name, {})
 
-def get_available_gemini_models() -> List[Dict[str, Any]]:
+def _resolve_model_tier_info(model_name: str) -> Dict[str, Any]:
+    """Entrada de `model_tiers.json` del modelo, siguiendo `alias_of` con la tabla de tarifas."""
+    return get_model_pricing_details(get_pricing_table().resolve(model_name))
+
+def get_rate_limiter(model_name: str) -> ModelRateLimiter:
+    """
+    Limitador compartido del modelo, creado con sus `rate_limits` de `model_tiers.json`.
+
+    Los modelos sin límites declarados solo tienen la concurrencia adaptativa.
+    """
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(model_name)
+        if limiter is None:
+            rpm, tpm = parse_rate_limits(_resolve_model_tier_info(model_name), GEMINI_RATE_LIMIT_TIER)
+            logger.debug(f"Límites de {model_name} ({GEMINI_RATE_LIMIT_TIER}): rpm={rpm}, tpm={tpm}")
+            limiter = ModelRateLimiter(rpm=rpm, tpm=tpm, max_concurrency=GEMINI_MAX_CONCURRENCY)
+            _rate_limiters[model_name] = limiter
+        return limiter
+
+def _estimated_prompt_tokens(model_name: str, prompt: str) -> int:
+    """Tokens aproximados del prompt para el límite TPM (sin llamadas remotas)."""
+    if token_estimator is not None:
+        return token_estimator.estimate(model_name, [prompt]).tokens
+    return len(prompt) // 4
+
+def estimate_text_tokens(text: str) -> int:
+    """
+    Tokens aproximados de un texto para el modelo actual, sin llamadas remotas.
+
+    Usa el estimador local (calibrado con conteos reales si los hay) y, si no
+    está habilitado o no hay modelo elegido, la estimación por caracteres.
+    """
+    model_name = _selected_model_name or get_current_gemini_model_name()
+    if model_name:
+        return _estimated_prompt_tokens(model_name, text)
+    return count_tokens_estimate(text)
+
+def _fetch_api_models() -> List[Dict[str, Any]]:
+    """Consulta `genai.list_models()` y devuelve los modelos de texto (nombre y nombre visible)."""
     if not API_KEY:
+        raise ValueError("API Key de Gemini no configurada.")
+    genai.configure(api_key=API_KEY)
+    return [
+        {"name": m.name, "display_name": getattr(m, 'display_name', m.name)}
+        for m in genai.list_models()
+        if 'generateContent' in m.supported_generation_methods and "vision" not in m.name
+    ]
+
+def get_available_gemini_models(refresh: bool = False) -> List[Dict[str, Any]]:
+    """
+    Modelos de texto disponibles, combinados con la información de tiers.
+
+    Args:
+        refresh: Consultar la API aunque el catálogo en disco esté vigente
+
+    Returns:
+        Lista de modelos ordenada (gratuitos primero), o lista vacía si hay error
+    """
+    if not API_KEY and (refresh or model_catalog.load() is None):
         console.print("[bold red]Error: API Key de Gemini no configurada.[/bold red]")
         return []
     try:
-        genai.configure(api_key=API_KEY)
-        all_api_models_raw = list(genai.list_models())
-        
-        models_list: List[Dict[str, Any]] = []
-        if not all_api_models_raw:
-            console.print("[yellow]Advertencia: La API de Gemini no devolvió ningún modelo.[/yellow]")
+        api_models = model_catalog.get(_fetch_api_models, refresh=refresh)
+        if not api_models:
+            console.print("[yellow]Advertencia: La API de Gemini no devolvió modelos con 'generateContent' que no sean de visión.[/yellow]")
             return []
 
         tier_info_map = _load_model_tier_info()
-
-        for m in all_api_models_raw: 
-            if 'generateContent' in m.supported_generation_methods and "vision" not in m.name:
-                model_data = {
-                    "name": m.name,
-                    "display_name": getattr(m, 'display_name', m.name) 
-                }
-                tier_data_for_model = tier_info_map.get(m.name, {})
-                model_data["tier"] = tier_data_for_model.get("tier", "unknown")
-                model_data["notes"] = tier_data_for_model.get("notes", "Info no disponible.")
-                model_data["pricing_details"] = tier_data_for_model 
-                
-                models_list.append(model_data)
-        
-        if not models_list:
-            console.print("[yellow]Advertencia: No quedaron modelos después de filtrar por 'generateContent' y no ser de visión.[/yellow]")
-            return []
+        models_list: List[Dict[str, Any]] = []
+        for m in api_models:
+            model_data = {
+                "name": m["name"],
+                "display_name": m.get("display_name", m["name"])
+            }
+            tier_data_for_model = tier_info_map.get(m["name"], {})
+            model_data["tier"] = tier_data_for_model.get("tier", "unknown")
+            model_data["notes"] = tier_data_for_model.get("notes", "Info no disponible.")
+            model_data["pricing_details"] = tier_data_for_model 
+            
+            models_list.append(model_data)
 
         models_list.sort(key=lambda x: (
             x.get('tier', 'zzz') == 'paid_preview_only',
@@ -96,6 +210,26 @@ def get_available_gemini_models() -> List[Dict[str, Any]]:
         console.print(f"[dim]{traceback.format_exc()}[/dim]")
         return []
 
+def is_model_available(model_name: str, refresh: bool = False) -> bool:
+    """
+    Indica si `model_name` está en el catálogo de modelos.
+
+    Un nombre desconocido para el catálogo en disco puede ser un modelo recién
+    publicado: antes de rechazarlo se consulta la API una vez.
+
+    Args:
+        model_name: Nombre completo del modelo (p. ej. 'models/gemini-1.5-flash-latest')
+        refresh: Consultar la API aunque el catálogo esté vigente
+
+    Returns:
+        True si el modelo existe
+    """
+    if any(m['name'] == model_name for m in get_available_gemini_models(refresh=refresh)):
+        return True
+    if refresh or model_catalog.fetched_this_process:
+        return False
+    return any(m['name'] == model_name for m in get_available_gemini_models(refresh=True))
+
 def _initialize_and_get_gemini_model_instance():
     global _genai_model_instance, _selected_model_name
     state_check = _load_state()
@@ -126,8 +260,7 @@ def _initialize_and_get_gemini_model_instance():
                 
                 if model_to_use:
                     console.print(f"[bold green]Modelo seleccionado automáticamente: {model_to_use}[/bold green]")
-                    state["selected_gemini_model"] = model_to_use
-                    _save_state(state)
+                    _update_state(lambda s: s.update(selected_gemini_model=model_to_use))
                 else:
                     console.print("[bold red]Fallo en la selección automática: No se encontraron modelos adecuados.[/bold red]")
                     return None
@@ -148,113 +281,190 @@ def _initialize_and_get_gemini_model_instance():
         return None
 
 def _calculate_cost_for_call(model_api_name: str, input_tokens: int, output_tokens: int) -> Optional[float]:
-    model_pricing_data = get_model_pricing_details(model_api_name)
-    paid_tier_info = model_pricing_data.get("paid_tier")
+    cost = get_pricing_table().cost(model_api_name, input_tokens, output_tokens)
+    return cost if cost else None
 
-    if not isinstance(paid_tier_info, dict):
-        return None 
 
-    cost = 0.0
-    tokens_1M = 1_000_000.0
-    
-    # --- Lógica de Costo de Entrada ---
-    # Esto necesitará ser mucho más robusto para manejar todos los casos de tu model_tiers.json
-    # Ejemplo muy simplificado:
-    if input_tokens > 0:
-        # Intentar con claves más específicas primero
-        if "input_per_1M_tokens_usd_le_128k" in paid_tier_info and input_tokens <= 128000:
-            cost += (input_tokens / tokens_1M) * paid_tier_info["input_per_1M_tokens_usd_le_128k"]
-        elif "input_per_1M_tokens_usd_gt_128k" in paid_tier_info and input_tokens > 128000:
-            cost += (input_tokens / tokens_1M) * paid_tier_info["input_per_1M_tokens_usd_gt_128k"]
-        elif "input_per_1M_tokens_usd_le_200k" in paid_tier_info and input_tokens <= 200000: # Para modelos como 2.5 Pro Preview
-            cost += (input_tokens / tokens_1M) * paid_tier_info["input_per_1M_tokens_usd_le_200k"]
-        elif "input_per_1M_tokens_usd_gt_200k" in paid_tier_info and input_tokens > 200000:
-            cost += (input_tokens / tokens_1M) * paid_tier_info["input_per_1M_tokens_usd_gt_200k"]
-        elif "input_text_img_vid_per_1M_tokens_usd" in paid_tier_info:
-             cost += (input_tokens / tokens_1M) * paid_tier_info["input_text_img_vid_per_1M_tokens_usd"]
-        elif "input_per_1M_tokens_usd" in paid_tier_info: # Genérico
-             cost += (input_tokens / tokens_1M) * paid_tier_info["input_per_1M_tokens_usd"]
-        # Podrías añadir lógica para 'input_audio_per_1M_tokens_usd' si tu agente maneja audio
-
-    # --- Lógica de Costo de Salida ---
-    if output_tokens > 0:
-        # Similar a la entrada, intentar con claves específicas primero
-        if "output_per_1M_tokens_usd_le_128k" in paid_tier_info: # Asumiendo que el umbral del prompt aplica
-            cost += (output_tokens / tokens_1M) * paid_tier_info["output_per_1M_tokens_usd_le_128k"]
-        elif "output_per_1M_tokens_usd_gt_128k" in paid_tier_info:
-             cost += (output_tokens / tokens_1M) * paid_tier_info["output_per_1M_tokens_usd_gt_128k"]
-        elif "output_per_1M_tokens_usd_le_200k" in paid_tier_info: # Para 2.5 Pro Preview
-            cost += (output_tokens / tokens_1M) * paid_tier_info["output_per_1M_tokens_usd_le_200k"]
-        elif "output_per_1M_tokens_usd_gt_200k" in paid_tier_info:
-             cost += (output_tokens / tokens_1M) * paid_tier_info["output_per_1M_tokens_usd_gt_200k"]
-        elif "output_no_thought_per_1M_tokens_usd" in paid_tier_info: # Para Flash 2.5 Preview
-            cost += (output_tokens / tokens_1M) * paid_tier_info["output_no_thought_per_1M_tokens_usd"]
-            # Aquí podrías necesitar una forma de saber si es "con pensamiento" o no
-        elif "output_per_1M_tokens_usd" in paid_tier_info: # Genérico
-            cost += (output_tokens / tokens_1M) * paid_tier_info["output_per_1M_tokens_usd"]
-            
-    return cost if cost > 0.0 else None
+def count_prompt_tokens(model_instance, model_name: str, prompt: str,
+                        prompt_segments: Optional[List[str]] = None) -> Tuple[int, int]:
+    """
+    Cuenta los tokens de un prompt, reutilizando conteos memorizados.
 
+    Args:
+        model_instance: Instancia de `GenerativeModel` usada para contar en remoto
+        model_name: Nombre del modelo
+        prompt: Prompt completo
+        prompt_segments: Fragmentos del prompt (p. ej. uno por archivo) que se
+            cuentan y memorizan por separado
 
-def send_prompt_to_gemini(prompt: str, confirm_paid_model_use: bool = True) -> str | None:
-    model_instance = _initialize_and_get_gemini_model_instance()
-    if not model_instance:
-        logger.error("El motor de Gemini no pudo ser inicializado")
-        return "[ERROR_GEMINI] El motor de Gemini no pudo ser inicializado."
+    Returns:
+        Tupla (tokens, llamadas remotas a `count_tokens` realizadas)
+    """
+    return count_tokens_cached(
+        lambda text: model_instance.count_tokens(text).total_tokens,
+        model_name, prompt, segments=prompt_segments, memo=token_count_cache,
+    )
 
-    current_model_being_used = _selected_model_name 
-    if not current_model_being_used:
-        logger.error("No se pudo determinar el modelo a usar tras la inicialización")
-        return "[ERROR_GEMINI] No se pudo determinar el modelo a usar tras la inicialización."
-    
-    # Verificar caché si está habilitado
-    if cache:
-        logger.debug(f"Verificando caché para modelo {current_model_being_used}")
-        cached_response = cache.get(prompt, current_model_being_used)
-        if cached_response:
-            logger.info("Respuesta encontrada en caché")
-            console.print("[dim italic]💾 Respuesta obtenida del caché[/dim italic]")
-            return cached_response
 
-    model_pricing_info = get_model_pricing_details(current_model_being_used)
-    tier = model_pricing_info.get("tier", "unknown")
-    is_potentially_paid = not (tier.startswith("free") or "gemma" in tier) or "paid" in tier 
+def preflight_prompt_tokens(model_instance, model_name: str, prompt: str,
+                            prompt_segments: Optional[List[str]] = None) -> Tuple[int, str]:
+    """
+    Tokens del prompt para la advertencia de costo, evitando la red cuando es posible.
 
-    if is_potentially_paid and confirm_paid_model_use:
-        console.print(f"\n[bold yellow]⚠️  ADVERTENCIA DE COSTO POTENCIAL[/bold yellow]")
-        # Corrección de la etiqueta de Rich Markup
-        console.print(f"   Modelo a usar: [cyan][u]{current_model_being_used}[/u][/cyan]") 
-        console.print(f"   Tier       : [bold]{tier}[/bold]")
-        if model_pricing_info.get("notes"):
-            console.print(f"   Notas      : {model_pricing_info['notes']}")
-        
-        paid_details = model_pricing_info.get("paid_tier")
-        if isinstance(paid_details, dict):
-            console.print("   Detalles de Precios (si aplican, USD por 1M de tokens o por unidad):")
-            for key, value in paid_details.items():
-                display_key = key.replace('_per_1M_tokens_usd', ' (1M tok)').replace('_usd_per_image', '/img').replace('_', ' ').capitalize()
-                console.print(f"     - {display_key}: ${value}")
-        try:
-            if model_instance: # Asegurarse que model_instance existe
-                prompt_token_count_obj = model_instance.count_tokens(prompt)
-                prompt_tokens = prompt_token_count_obj.total_tokens
-                console.print(f"   Tokens estimados para tu prompt: [bold cyan]{prompt_tokens}[/bold cyan]")
-                
-                cost_estimate_input_only = _calculate_cost_for_call(current_model_being_used, prompt_tokens, 0)
-                if cost_estimate_input_only is not None:
-                    console.print(f"   Costo MÍNIMO estimado (solo por la entrada de este prompt): [bold red]${cost_estimate_input_only:.6f}[/bold red]")
-            else:
-                console.print("[yellow]  No se pudo contar tokens: instancia del modelo no disponible.[/yellow]")
-        except Exception as e:
-            console.print(f"   [yellow]No se pudo estimar el conteo de tokens del prompt: {e}[/yellow]")
+    Orden: conteo memorizado del prompt completo, estimación local calibrada si
+    su intervalo no cruza ningún umbral de precio del modelo, y por último
+    `count_tokens` remoto (memorizado por fragmento).
 
-        if not typer.confirm("¿Deseas continuar y potencialmente incurrir en costos?", default=False): 
-            console.print("[bold red]Operación cancelada por el usuario.[/bold red]")
-            return "[INFO_USER] Operación cancelada para evitar costos."
-    
+    Args:
+        model_instance: Instancia de `GenerativeModel` usada para contar en remoto
+        model_name: Nombre del modelo
+        prompt: Prompt completo
+        prompt_segments: Fragmentos del prompt (p. ej. uno por archivo)
+
+    Returns:
+        Tupla (tokens, origen del dato para mostrar; vacío si es un conteo remoto nuevo)
+    """
+    if token_count_cache is not None:
+        memorized = token_count_cache.get(model_name, prompt)
+        if memorized is not None:
+            return memorized, "memorizado"
+    if token_estimator is not None:
+        estimate = token_estimator.estimate(model_name, prompt_segments or [prompt])
+        thresholds = get_pricing_table().thresholds(model_name)
+        if token_estimator.is_decisive(estimate, thresholds):
+            logger.debug(f"Conteo remoto omitido: estimación {estimate} lejos de los umbrales {thresholds}")
+            return estimate.tokens, f"estimación local, {estimate.lower}-{estimate.upper}"
+    tokens, remote_counts = count_prompt_tokens(model_instance, model_name, prompt, prompt_segments)
+    return tokens, "" if remote_counts else "memorizado"
+
+
+def is_potentially_paid_model(model_name: str) -> bool:
+    """Indica si el modelo puede generar costos según su tier en `model_tiers.json`."""
+    tier = get_model_pricing_details(model_name).get("tier", "unknown")
+    return not (tier.startswith("free") or "gemma" in tier) or "paid" in tier
+
+
+def _usage_counts(response) -> Tuple[int, int]:
+    """Tokens (prompt, respuesta) de `usage_metadata`, o (0, 0) si no son enteros."""
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', 0) if usage else 0
+    response_tokens = getattr(usage, 'candidates_token_count', 0) if usage else 0
+    return (prompt_tokens if isinstance(prompt_tokens, int) else 0,
+            response_tokens if isinstance(response_tokens, int) else 0)
+
+
+def _record_prompt_usage(model_name: str, prompt: str, prompt_tokens: int) -> None:
+    """El conteo real calibra el estimador local y sirve como conteo memorizado."""
+    if prompt_tokens <= 0:
+        return
+    if token_estimator is not None:
+        token_estimator.observe(model_name, prompt, prompt_tokens)
+    if token_count_cache is not None:
+        token_count_cache.put(model_name, prompt, prompt_tokens)
+
+
+def _record_call_usage(model_name: str, latency_seconds: float, prompt_tokens: int = 0,
+                       response_tokens: int = 0, cost_usd: Optional[float] = None,
+                       cache_hit: bool = False, error: bool = False) -> None:
+    """Anota la consulta en el registro de uso; un fallo del registro no interrumpe la consulta."""
+    if usage_ledger is None:
+        return
+    try:
+        usage_ledger.append(
+            model_name, prompt_tokens=prompt_tokens, response_tokens=response_tokens,
+            latency_seconds=latency_seconds, cache_hit=cache_hit, error=error, cost_usd=cost_usd,
+            command=usage_command, repo=_load_state().get("active_repo") or "",
+        )
+    except Exception as e:
+        logger.warning(f"No se pudo anotar la consulta en el registro de uso: {e}")
+
+
+def _chunk_text(chunk) -> str:
+    """Texto de una respuesta o fragmento; los fragmentos sin partes de texto devuelven ''."""
+    try:
+        return chunk.text or ""
+    except (ValueError, AttributeError):
+        parts = getattr(chunk, 'parts', None) or []
+        return "".join(part.text for part in parts if getattr(part, 'text', None))
+
+
+def _print_retry_notice(attempt: int, delay: float, error: Exception) -> None:
+    console.print(f"[yellow]⏳ Gemini limitó la tasa ({error}). "
+                  f"Reintento {attempt + 1}/{retry_policy.max_attempts} en {delay:.1f}s...[/yellow]")
+
+
+def _generate_with_retry(model_instance, model_name: str, prompt: str, **kwargs):
+    """`generate_content` bajo el limitador del modelo, reintentando ante 429/503."""
+    return call_with_retry(
+        lambda: model_instance.generate_content(prompt, **kwargs),
+        limiter=get_rate_limiter(model_name), policy=retry_policy,
+        tokens=_estimated_prompt_tokens(model_name, prompt), on_retry=_print_retry_notice,
+    )
+
+
+def _consume_stream(model_instance, model_name: str, prompt: str, stream_renderer) -> Tuple[Any, str]:
+    """
+    Genera la respuesta en modo streaming, pasando cada fragmento al renderizador.
+
+    Args:
+        model_instance: Instancia de `GenerativeModel`
+        model_name: Nombre del modelo (para su limitador de tasa)
+        prompt: Prompt a enviar
+        stream_renderer: Objeto con `update(texto)` (un fragmento nuevo) y `close()`
+
+    Returns:
+        Tupla (respuesta del SDK ya consumida, texto completo ensamblado)
+    """
+    start = time.perf_counter()
+    first_chunk_at = None
+    chunks: List[str] = []
+    try:
+        response = _generate_with_retry(model_instance, model_name, prompt, stream=True)
+        for chunk in response:
+            text = _chunk_text(chunk)
+            if not text:
+                continue
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter() - start
+                logger.info(f"Primer fragmento de la respuesta en {first_chunk_at:.2f}s")
+            chunks.append(text)
+            stream_renderer.update(text)
+    finally:
+        stream_renderer.close()
+    if first_chunk_at is not None:
+        console.print(f"[dim]⏱  Primer fragmento en {first_chunk_at:.2f}s, "
+                      f"respuesta completa en {time.perf_counter() - start:.2f}s[/dim]")
+    return response, "".join(chunks)
+
+
+def _generate_and_cache(model_instance, current_model_being_used: str, prompt: str,
+                        is_potentially_paid: bool, stream_renderer=None) -> str:
+    """
+    Llama al modelo, muestra el uso de tokens y guarda la respuesta en caché.
+
+    Args:
+        model_instance: Instancia de `GenerativeModel`
+        current_model_being_used: Nombre del modelo
+        prompt: Prompt completo
+        is_potentially_paid: Mostrar el costo real de la llamada
+        stream_renderer: Renderizador del modo streaming (ver `send_prompt_to_gemini`)
+
+    Returns:
+        Texto de la respuesta, o un mensaje `[ERROR_GEMINI]`
+    """
     console.print("\n[blue i]Tu Agente HOOPERITS está consultando a Gemini...[/blue i]")
+    started = time.perf_counter()
+    prompt_t_usage = 0
+    candidates_t_usage = 0
+    succeeded = False
     try:
-        response = model_instance.generate_content(prompt)
+        with span("generación"):
+            if stream_renderer is not None:
+                response, streamed_text = _consume_stream(model_instance, current_model_being_used,
+                                                          prompt, stream_renderer)
+            else:
+                response = _generate_with_retry(model_instance, current_model_being_used, prompt)
+                streamed_text = None
         
         if response.prompt_feedback and response.prompt_feedback.block_reason:
             reason_name = response.prompt_feedback.block_reason.name if hasattr(response.prompt_feedback.block_reason, 'name') else str(response.prompt_feedback.block_reason)
@@ -264,7 +474,10 @@ def send_prompt_to_gemini(prompt: str, confirm_paid_model_use: bool = True) -> s
             return f"[ERROR_GEMINI] {error_message}"
 
         response_text = ""
-        if hasattr(response, 'text') and response.text: 
+        if streamed_text is not None:
+            # Mismo texto que se cachea en modo normal: la concatenación de los fragmentos
+            response_text = streamed_text
+        elif hasattr(response, 'text') and response.text: 
             response_text = response.text
         elif hasattr(response, 'parts') and response.parts: 
             response_text = " ".join([part.text for part in response.parts if hasattr(part, 'text') and part.text])
@@ -280,6 +493,9 @@ def send_prompt_to_gemini(prompt: str, confirm_paid_model_use: bool = True) -> s
             console.print(f"  - Tokens de Respuesta: {candidates_t_usage}")
             console.print(f"  - Tokens Totales     : {total_t_usage}")
 
+            if isinstance(prompt_t_usage, int):
+                _record_prompt_usage(current_model_being_used, prompt, prompt_t_usage)
+
             if is_potentially_paid:
                 if isinstance(prompt_t_usage, int) and isinstance(candidates_t_usage, int):
                     estimated_cost_this_call = _calculate_cost_for_call(current_model_being_used, prompt_t_usage, candidates_t_usage)
@@ -302,18 +518,309 @@ def send_prompt_to_gemini(prompt: str, confirm_paid_model_use: bool = True) -> s
         # Guardar en caché si está habilitado
         if cache and response_text:
             logger.debug("Guardando respuesta en caché")
-            cache.set(prompt, current_model_being_used, response_text)
+            with span("caché"):
+                cache.set(
+                    prompt, current_model_being_used, response_text,
+                    prompt_tokens=prompt_t_usage if isinstance(prompt_t_usage, int) else 0,
+                    response_tokens=candidates_t_usage if isinstance(candidates_t_usage, int) else 0,
+                )
             
+        succeeded = True
         return response_text
     except Exception as e:
         console.print(f"[bold red]¡Rayos! Hubo un problema en la comunicación con Gemini: {e}[/bold red]")
         console.print(f"[dim]{traceback.format_exc()}[/dim]")
         return f"[ERROR_GEMINI] Error de comunicación: {str(e)}"
+    finally:
+        prompt_count = prompt_t_usage if isinstance(prompt_t_usage, int) else 0
+        response_count = candidates_t_usage if isinstance(candidates_t_usage, int) else 0
+        _record_call_usage(
+            current_model_being_used, time.perf_counter() - started, prompt_count, response_count,
+            cost_usd=_calculate_cost_for_call(current_model_being_used, prompt_count, response_count)
+            if is_potentially_paid else None,
+            error=not succeeded,
+        )
+
+
+def send_prompt_to_gemini(prompt: str, confirm_paid_model_use: bool = True,
+                          prompt_segments: Optional[List[str]] = None,
+                          stream_renderer=None) -> str | None:
+    """
+    Envía un prompt al modelo seleccionado, usando la caché de respuestas si está habilitada.
+
+    Args:
+        prompt: Prompt completo
+        confirm_paid_model_use: Pedir confirmación antes de usar un modelo de pago
+        prompt_segments: Fragmentos cuya concatenación es `prompt`; permiten
+            reutilizar los conteos de tokens de cada fragmento
+        stream_renderer: Si se indica, la respuesta se pide en streaming y cada
+            fragmento se pasa a `stream_renderer.update(texto)`; al terminar se
+            llama a `close()`. Las respuestas servidas desde caché no pasan por él
+
+    Returns:
+        Texto de la respuesta, o un mensaje `[ERROR_GEMINI]`/`[INFO_USER]`
+    """
+    with span("inicialización del modelo"):
+        model_instance = _initialize_and_get_gemini_model_instance()
+    if not model_instance:
+        logger.error("El motor de Gemini no pudo ser inicializado")
+        return "[ERROR_GEMINI] El motor de Gemini no pudo ser inicializado."
+
+    current_model_being_used = _selected_model_name 
+    if not current_model_being_used:
+        logger.error("No se pudo determinar el modelo a usar tras la inicialización")
+        return "[ERROR_GEMINI] No se pudo determinar el modelo a usar tras la inicialización."
+    
+    # Verificar caché si está habilitado
+    if cache:
+        logger.debug(f"Verificando caché para modelo {current_model_being_used}")
+        lookup_started = time.perf_counter()
+        with span("caché"):
+            cached_response = cache.get(prompt, current_model_being_used)
+        if cached_response:
+            logger.info("Respuesta encontrada en caché")
+            console.print("[dim italic]💾 Respuesta obtenida del caché[/dim italic]")
+            _record_call_usage(current_model_being_used, time.perf_counter() - lookup_started, cache_hit=True)
+            return cached_response
+
+    model_pricing_info = get_model_pricing_details(current_model_being_used)
+    tier = model_pricing_info.get("tier", "unknown")
+    is_potentially_paid = is_potentially_paid_model(current_model_being_used)
+
+    if is_potentially_paid and confirm_paid_model_use:
+        console.print(f"\n[bold yellow]⚠️  ADVERTENCIA DE COSTO POTENCIAL[/bold yellow]")
+        # Corrección de la etiqueta de Rich Markup
+        console.print(f"   Modelo a usar: [cyan][u]{current_model_being_used}[/u][/cyan]") 
+        console.print(f"   Tier       : [bold]{tier}[/bold]")
+        if model_pricing_info.get("notes"):
+            console.print(f"   Notas      : {model_pricing_info['notes']}")
+        
+        paid_details = model_pricing_info.get("paid_tier")
+        if isinstance(paid_details, dict):
+            console.print("   Detalles de Precios (si aplican, USD por 1M de tokens o por unidad):")
+            for key, value in paid_details.items():
+                display_key = key.replace('_per_1M_tokens_usd', ' (1M tok)').replace('_usd_per_image', '/img').replace('_', ' ').capitalize()
+                console.print(f"     - {display_key}: ${value}")
+        try:
+            if model_instance: # Asegurarse que model_instance existe
+                with span("conteo de tokens"):
+                    prompt_tokens, token_source = preflight_prompt_tokens(
+                        model_instance, current_model_being_used, prompt, prompt_segments)
+                source_note = f" [dim]({token_source})[/dim]" if token_source else ""
+                console.print(f"   Tokens estimados para tu prompt: [bold cyan]{prompt_tokens}[/bold cyan]{source_note}")
+                
+                cost_estimate_input_only = _calculate_cost_for_call(current_model_being_used, prompt_tokens, 0)
+                if cost_estimate_input_only is not None:
+                    console.print(f"   Costo MÍNIMO estimado (solo por la entrada de este prompt): [bold red]${cost_estimate_input_only:.6f}[/bold red]")
+            else:
+                console.print("[yellow]  No se pudo contar tokens: instancia del modelo no disponible.[/yellow]")
+        except Exception as e:
+            console.print(f"   [yellow]No se pudo estimar el conteo de tokens del prompt: {e}[/yellow]")
+
+        with span("confirmación del usuario"):
+            confirmed = typer.confirm("¿Deseas continuar y potencialmente incurrir en costos?", default=False)
+        if not confirmed: 
+            console.print("[bold red]Operación cancelada por el usuario.[/bold red]")
+            return "[INFO_USER] Operación cancelada para evitar costos."
+    
+    def generate() -> str:
+        return _generate_and_cache(model_instance, current_model_being_used, prompt,
+                                   is_potentially_paid, stream_renderer)
+
+    if single_flight is None:
+        return generate()
+    # Consultas idénticas simultáneas (otros hilos o procesos) comparten una sola llamada
+    wait_started = time.perf_counter()
+    response_text, shared = single_flight.do(
+        build_cache_key(prompt, current_model_being_used), generate,
+        recheck=(lambda: cache.get(prompt, current_model_being_used)) if cache else None,
+    )
+    if shared:
+        console.print("[dim italic]🔗 Respuesta compartida por una consulta idéntica en curso[/dim italic]")
+        _record_call_usage(current_model_being_used, time.perf_counter() - wait_started, cache_hit=True,
+                           error=response_text.startswith("[ERROR_GEMINI]"))
+    return response_text
+
+
+def confirm_paid_model_for_batch(prompt_count: int) -> bool:
+    """
+    Pide una sola confirmación de costo para un lote de prompts.
+
+    Args:
+        prompt_count: Número de prompts del lote
+
+    Returns:
+        True si el modelo es gratuito o el usuario acepta; False si cancela
+        o el modelo no se pudo inicializar
+    """
+    if not _initialize_and_get_gemini_model_instance() or not _selected_model_name:
+        return False
+    if not is_potentially_paid_model(_selected_model_name):
+        return True
+    model_pricing_info = get_model_pricing_details(_selected_model_name)
+    console.print("\n[bold yellow]⚠️  ADVERTENCIA DE COSTO POTENCIAL[/bold yellow]")
+    console.print(f"   Modelo a usar: [cyan][u]{_selected_model_name}[/u][/cyan]")
+    console.print(f"   Tier       : [bold]{model_pricing_info.get('tier', 'unknown')}[/bold]")
+    console.print(f"   Prompts del lote: [bold]{prompt_count}[/bold] (los que estén en caché no generan costo)")
+    return typer.confirm("¿Deseas continuar con el lote y potencialmente incurrir en costos?", default=False)
+
+
+def prepare_batch_model() -> Tuple[Any, Optional[str]]:
+    """
+    Inicializa el modelo una sola vez para todo un lote.
+
+    Es bloqueante (y puede imprimir al autoseleccionar un modelo): se llama
+    antes de lanzar las tareas, fuera del bucle de eventos.
+
+    Returns:
+        Tupla (instancia del modelo, nombre del modelo); ambos None si no se
+        pudo inicializar
+    """
+    model_instance = _initialize_and_get_gemini_model_instance()
+    if not model_instance or not _selected_model_name:
+        return None, None
+    return model_instance, _selected_model_name
+
+
+async def _generate_async(model_instance, prompt: str, semaphore: Optional[asyncio.Semaphore]):
+    if semaphore is None:
+        return await model_instance.generate_content_async(prompt)
+    async with semaphore:
+        return await model_instance.generate_content_async(prompt)
+
+
+async def send_prompt_async(prompt: str, model_instance: Any, model_name: Optional[str],
+                            semaphore: Optional[asyncio.Semaphore] = None) -> Dict[str, Any]:
+    """
+    Versión asíncrona y silenciosa de `send_prompt_to_gemini` para lotes.
+
+    No pide confirmación de costo (ver `confirm_paid_model_for_batch`) ni
+    imprime en consola. Usa la misma caché de respuestas y la misma
+    contabilidad de tokens y costo.
+
+    Args:
+        prompt: Prompt a enviar
+        model_instance: Modelo ya inicializado (ver `prepare_batch_model`)
+        model_name: Nombre del modelo
+        semaphore: Limita las llamadas simultáneas al modelo (las consultas a
+            caché no ocupan un cupo). Además rige el limitador del modelo, y
+            los 429/503 se reintentan con backoff
+
+    Returns:
+        Diccionario con `model`, `text`, `cached`, `prompt_tokens`,
+        `response_tokens`, `cost_usd` y `error` (None si todo fue bien).
+        Una respuesta compartida con una consulta idéntica en curso se
+        marca como `cached`, sin tokens ni costo
+    """
+    started = time.perf_counter()
+    result = await _send_prompt_async(prompt, model_instance, model_name, semaphore)
+    if result["model"]:
+        await asyncio.get_running_loop().run_in_executor(None, lambda: _record_call_usage(
+            result["model"], time.perf_counter() - started, result["prompt_tokens"],
+            result["response_tokens"], cost_usd=result["cost_usd"],
+            cache_hit=result["cached"], error=result["error"] is not None))
+    return result
+
+
+async def _send_prompt_async(prompt: str, model_instance: Any, model_name: Optional[str],
+                             semaphore: Optional[asyncio.Semaphore]) -> Dict[str, Any]:
+    """Cuerpo de `send_prompt_async` (sin el registro de uso)."""
+    result: Dict[str, Any] = {
+        "model": model_name, "text": None, "cached": False,
+        "prompt_tokens": 0, "response_tokens": 0, "cost_usd": None, "error": None,
+    }
+    if not model_instance or not model_name:
+        result["error"] = "El motor de Gemini no pudo ser inicializado."
+        return result
+
+    loop = asyncio.get_running_loop()
+    response_cache = cache
+    # La caché es bloqueante (SQLite/red): se consulta fuera del bucle de eventos
+    if response_cache:
+        cached_response = await loop.run_in_executor(None, response_cache.get, prompt, model_name)
+        if cached_response:
+            result.update(text=cached_response, cached=True)
+            return result
+
+    if single_flight is None:
+        return await _generate_and_cache_async(model_instance, model_name, prompt, semaphore, result)
+
+    recheck: Optional[Callable[[], Awaitable[Optional[Dict[str, Any]]]]] = None
+    if response_cache:
+        async def recheck_cache() -> Optional[Dict[str, Any]]:
+            cached_response = await loop.run_in_executor(None, response_cache.get, prompt, model_name)
+            return {**result, "text": cached_response} if cached_response else None
+        recheck = recheck_cache
+
+    outcome, shared = await single_flight.do_async(
+        build_cache_key(prompt, model_name),
+        lambda: _generate_and_cache_async(model_instance, model_name, prompt, semaphore, dict(result)),
+        recheck=recheck,
+    )
+    if not shared:
+        return outcome
+    # Servida por la llamada de otra consulta: sin tokens ni costo propios
+    result.update(text=outcome["text"], error=outcome["error"], cached=outcome["error"] is None)
+    return result
+
+
+async def _generate_and_cache_async(model_instance, model_name: str, prompt: str,
+                                    semaphore: Optional[asyncio.Semaphore],
+                                    result: Dict[str, Any]) -> Dict[str, Any]:
+    """Llamada real de `send_prompt_async`: completa `result` y guarda la respuesta en caché."""
+    loop = asyncio.get_running_loop()
+    try:
+        response = await call_with_retry_async(
+            lambda: _generate_async(model_instance, prompt, semaphore),
+            limiter=get_rate_limiter(model_name), policy=retry_policy,
+            tokens=_estimated_prompt_tokens(model_name, prompt),
+        )
+    except Exception as e:
+        logger.warning(f"Error de comunicación con Gemini en lote: {e}")
+        result["error"] = f"Error de comunicación: {e}"
+        return result
+
+    feedback = getattr(response, 'prompt_feedback', None)
+    if feedback and feedback.block_reason:
+        reason = getattr(feedback.block_reason, 'name', str(feedback.block_reason))
+        result["error"] = f"Solicitud bloqueada por Gemini. Razón: {reason}"
+        return result
+
+    response_text = _chunk_text(response)
+    prompt_tokens, response_tokens = _usage_counts(response)
+    result.update(prompt_tokens=prompt_tokens, response_tokens=response_tokens)
+    if is_potentially_paid_model(model_name):
+        result["cost_usd"] = _calculate_cost_for_call(model_name, prompt_tokens, response_tokens)
+    await loop.run_in_executor(None, _record_prompt_usage, model_name, prompt, prompt_tokens)
+
+    if not response_text.strip():
+        result["error"] = "Respuesta vacía o no textual de Gemini."
+        return result
+    result["text"] = response_text
+    if cache:
+        await loop.run_in_executor(
+            None, lambda: cache.set(prompt, model_name, response_text,
+                                    prompt_tokens=prompt_tokens, response_tokens=response_tokens))
+    return result
+
+
+def estimate_cache_savings(model_stats: Dict[str, Any]) -> Optional[float]:
+    """
+    Estima los dólares ahorrados por los aciertos de caché de un modelo.
+
+    Los tokens acumulados se reparten en llamadas promedio antes de tarificar, para
+    que los umbrales por tamaño de prompt (≤128k, ≤200k...) se apliquen por llamada.
+    """
+    hits = model_stats.get("hits", 0)
+    if not hits:
+        return None
+    avg_prompt_tokens = round(model_stats.get("prompt_tokens_saved", 0) / hits)
+    avg_response_tokens = round(model_stats.get("response_tokens_saved", 0) / hits)
+    cost_per_call = _calculate_cost_for_call(model_stats["model"], avg_prompt_tokens, avg_response_tokens)
+    return cost_per_call * hits if cost_per_call is not None else None
 
 def set_default_gemini_model(model_name: str) -> bool:
-    state = _load_state()
-    state["selected_gemini_model"] = model_name
-    _save_state(state)
+    _update_state(lambda state: state.update(selected_gemini_model=model_name))
     
     global _genai_model_instance, _selected_model_name
     _genai_model_instance = None 
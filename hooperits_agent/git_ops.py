@@ -2,12 +2,13 @@
 """
 Operaciones Git para gestión de repositorios.
 """
+import stat
 import git
 from pathlib import Path
 from rich.console import Console
 from .config import REPOS_BASE_PATH, LOG_LEVEL, LOG_FILE
 from .utils import setup_logging, validate_repo_name, show_progress
-from typing import List, Optional
+from typing import Iterator, List, Optional, Tuple
 
 console = Console()
 logger = setup_logging(LOG_LEVEL, LOG_FILE)
@@ -102,3 +103,70 @@ def list_local_repos() -> List[str]:
     
     logger.info(f"Se encontraron {len(local_repos)} repositorios")
     return sorted(local_repos)
+
+
+def is_git_work_tree(path: Path) -> bool:
+    """Indica si `path` es la raíz de un árbol de trabajo Git (tiene `.git`)."""
+    return (path / ".git").exists()
+
+
+def _in_sub_path(rel_path: str, sub_path: str) -> bool:
+    return not sub_path or rel_path == sub_path or rel_path.startswith(sub_path + "/")
+
+
+def iter_tracked_files(repo_path: Path, sub_path: str = "") -> Iterator[Tuple[str, int, int]]:
+    """
+    Archivos versionados según el índice de Git, sin tocar el árbol de trabajo.
+
+    Se leen las entradas del índice con GitPython. El tamaño y el mtime son los
+    que el índice registró la última vez que git actualizó la entrada: si el
+    archivo se editó después pueden estar desfasados. Los enlaces simbólicos y
+    los submódulos se omiten; los archivos en conflicto se entregan una sola
+    vez con tamaño 0 (sin datos fiables de `stat`).
+
+    Args:
+        repo_path: Raíz del repositorio
+        sub_path: Limitar a este subdirectorio (relativo a la raíz, con '/')
+
+    Returns:
+        Iterador de (ruta relativa con '/', tamaño, mtime en nanosegundos)
+
+    Raises:
+        git.GitError: Si el directorio no es un repositorio Git
+        OSError, ValueError: Si no se pudo leer el índice
+    """
+    conflicted = set()
+    for entry in git.Repo(str(repo_path)).index.entries.values():
+        rel_path = str(entry.path)
+        if not _in_sub_path(rel_path, sub_path) or not stat.S_ISREG(entry.mode):
+            continue
+        if entry.stage:
+            if rel_path not in conflicted:
+                conflicted.add(rel_path)
+                yield rel_path, 0, 0
+            continue
+        mtime_s, mtime_ns = entry.mtime
+        yield rel_path, entry.size, mtime_s * 1_000_000_000 + mtime_ns
+
+
+def iter_untracked_files(repo_path: Path, sub_path: str = "") -> Iterator[str]:
+    """
+    Archivos sin versionar que `.gitignore` (y `.git/info/exclude`) no ignoran.
+
+    Args:
+        repo_path: Raíz del repositorio
+        sub_path: Limitar a este subdirectorio (relativo a la raíz, con '/')
+
+    Returns:
+        Iterador de rutas relativas con '/'
+
+    Raises:
+        git.GitError: Si no se pudo ejecutar `git ls-files`
+    """
+    repo_git = git.Git(str(repo_path))
+    # La ruta del subdirectorio es literal, no un patrón
+    with repo_git.custom_environment(GIT_LITERAL_PATHSPECS="1"):
+        output = repo_git.ls_files("-z", "--others", "--exclude-standard", "--", *([sub_path] if sub_path else []))
+    for rel_path in output.split("\0"):
+        if rel_path:
+            yield rel_path
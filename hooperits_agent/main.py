@@ -1,19 +1,30 @@
 # hooperits_agent/main.py
 import typer
 from typing_extensions import Annotated 
-from typing import Optional 
+from typing import Any, Dict, List, Optional 
 from rich.console import Console
 from rich.table import Table
 from pathlib import Path 
 from rich.markdown import Markdown 
 from rich.panel import Panel 
 from rich.text import Text 
+from rich.live import Live
+from rich.progress import Progress
+import asyncio
+import time
 
 from . import git_ops 
 from . import config  
 from . import state_manager 
 from . import gemini_ops 
 from . import project_analyzer 
+from . import batch_ops
+from . import daemon
+from .cache import CacheBundleError, export_bundle, import_bundle
+from .file_index import FileIndex
+from .profiler import profiler, span
+from .usage_ledger import GROUP_BY_FIELDS, summarize_usage
+from .utils import format_file_size, format_duration, format_cost
 
 app = typer.Typer(
     name="hooperits-agent", 
@@ -24,10 +35,117 @@ repo_app = typer.Typer(name="repo", help="Gestionar repositorios de código.")
 app.add_typer(repo_app)
 model_app = typer.Typer(name="model", help="Gestionar y seleccionar modelos de IA de Gemini.")
 app.add_typer(model_app)
+cache_app = typer.Typer(name="cache", help="Inspeccionar la caché de respuestas de Gemini.")
+app.add_typer(cache_app)
+daemon_app = typer.Typer(name="daemon", help="Demonio opcional que mantiene el agente en memoria entre comandos.")
+app.add_typer(daemon_app)
+usage_app = typer.Typer(name="usage", help="Analizar el registro local de consultas a Gemini.")
+app.add_typer(usage_app)
+index_app = typer.Typer(name="index", help="Gestionar el índice de archivos de los repositorios.")
+app.add_typer(index_app)
 console = Console()
 
+
+class LiveResponsePanel:
+    """
+    Muestra una respuesta en streaming dentro del mismo Panel(Markdown) que el modo normal.
+
+    El `Live` se abre con el primer fragmento (después de cualquier confirmación de
+    costo) y el Markdown se vuelve a construir como mucho `refresh_per_second` veces
+    por segundo, no con cada fragmento.
+    """
+
+    def __init__(self, title: str, refresh_per_second: int = 8):
+        self.title = title
+        self.refresh_per_second = refresh_per_second
+        self.rendered = False
+        self._chunks: List[str] = []
+        self._live: Optional[Live] = None
+        self._last_render = 0.0
+
+    def _panel(self) -> Panel:
+        return Panel(Markdown("".join(self._chunks)), title=self.title, border_style="dim cyan",
+                     expand=False, padding=(1, 2))
+
+    def update(self, chunk: str) -> None:
+        self._chunks.append(chunk)
+        now = time.monotonic()
+        if self._live is None:
+            with span("renderizado"):
+                self._live = Live(self._panel(), console=console, refresh_per_second=self.refresh_per_second,
+                                  vertical_overflow="visible")
+                self._live.start()
+            self.rendered = True
+            self._last_render = now
+        elif now - self._last_render >= 1 / self.refresh_per_second:
+            with span("renderizado"):
+                self._live.update(self._panel())
+            self._last_render = now
+
+    def close(self) -> None:
+        if self._live is not None:
+            with span("renderizado"):
+                self._live.update(self._panel(), refresh=True)
+                self._live.stop()
+            self._live = None
+
+def _print_profile_report(command: str, trace_path: Optional[Path]) -> None:
+    """Detiene el perfilador y muestra el desglose por fases (y guarda el trace si se pidió)."""
+    wall_seconds = profiler.stop()
+    table = Table(title=f"Perfil de `{command or 'hooperits-agent'}` ({wall_seconds:.3f}s)",
+                  show_header=True, header_style="bold magenta")
+    table.add_column("Fase", style="cyan")
+    table.add_column("Llamadas", justify="right")
+    table.add_column("Total", justify="right")
+    table.add_column("Propio", justify="right")
+    table.add_column("% propio", justify="right")
+    for row in profiler.summary():
+        table.add_row(row["name"], str(row["calls"]), f"{row['total_s']:.3f}s", f"{row['self_s']:.3f}s",
+                      f"{row['self_s'] / wall_seconds:.1%}" if wall_seconds else "-")
+    unattributed = profiler.unattributed_seconds()
+    table.add_row("[dim]sin fase[/dim]", "", "", f"{unattributed:.3f}s",
+                  f"{unattributed / wall_seconds:.1%}" if wall_seconds else "-")
+    console.print()
+    console.print(table)
+    if profiler.peak_memory_bytes is not None:
+        console.print(f"[dim]Pico de memoria (tracemalloc): {format_file_size(profiler.peak_memory_bytes)}[/dim]")
+    if trace_path is not None:
+        try:
+            profiler.write_chrome_trace(trace_path, metadata={"command": command})
+            console.print(f"[dim]Trace de Chrome guardado en {trace_path} (ábrelo en chrome://tracing o ui.perfetto.dev).[/dim]")
+        except OSError as e:
+            console.print(f"[bold red]Error al guardar el trace en '{trace_path}': {e}[/bold red]")
+
+def _print_compaction_report(selected_contents: List[Dict[str, Any]]) -> None:
+    """Muestra los tokens de cada archivo antes y después de compactarlo."""
+    compacted = [item for item in selected_contents if "compaction" in item]
+    if not compacted:
+        return
+    table = Table(title="Compactación del prompt (tokens estimados)", show_header=True, header_style="bold magenta")
+    table.add_column("Archivo", style="cyan")
+    table.add_column("Antes", justify="right")
+    table.add_column("Después", justify="right")
+    table.add_column("Ahorro", justify="right")
+    total_before = total_after = 0
+    for item in compacted:
+        before, after = item["compaction"]["before"], item["compaction"]["after"]
+        total_before += before
+        total_after += after
+        table.add_row(item["path"], str(before), str(after), f"{1 - after / before:.0%}" if before else "-")
+    table.add_row("[bold]Total[/bold]", str(total_before), str(total_after),
+                  f"{1 - total_after / total_before:.0%}" if total_before else "-")
+    console.print(table)
+
 @app.callback(invoke_without_command=True)
-def main_callback(ctx: typer.Context):
+def main_callback(
+    ctx: typer.Context,
+    profile: Annotated[bool, typer.Option("--profile", help="Mostrar el tiempo de cada fase del comando y el pico de memoria.")] = False,
+    profile_trace: Annotated[Optional[Path], typer.Option("--profile-trace", help="Guardar además un trace de Chrome (JSON) en esta ruta. Implica --profile.")] = None
+):
+    gemini_ops.usage_command = ctx.invoked_subcommand or ""
+    if profile or profile_trace is not None:
+        profiler.start()
+        ctx.call_on_close(lambda: _print_profile_report(ctx.invoked_subcommand or "", profile_trace))
     if not config.API_KEY:
         console.print("[bold red]ADVERTENCIA: GOOGLE_API_KEY no está configurada en tu .env[/bold red]")
         console.print("Algunas funcionalidades (como el chat con IA) no funcionarán.")
@@ -112,10 +230,12 @@ def repo_unselect():
     console.print("[bold yellow]Repositorio activo desactivado.[/bold yellow]")
 
 @model_app.command("list")
-def model_list_command():
+def model_list_command(
+    refresh: Annotated[bool, typer.Option("--refresh", "-r", help="Consultar la API aunque el catálogo en caché esté vigente.")] = False
+):
     """Lista los modelos de Gemini disponibles y su información de tier."""
     console.print("\n[bold cyan]Consultando modelos de Gemini y tiers...[/bold cyan]")
-    models_with_tier_info = gemini_ops.get_available_gemini_models() 
+    models_with_tier_info = gemini_ops.get_available_gemini_models(refresh=refresh)
     if not models_with_tier_info:
         console.print("  [yellow]No se encontraron modelos o hubo un error.[/yellow]")
         return
@@ -140,6 +260,9 @@ def model_list_command():
             if "Precios:" not in notes: notes += notes_suffix
         table.add_row(model_info['name'], Text.from_markup(tier_styled), notes)
     console.print(table)
+    catalog_age = gemini_ops.model_catalog.age_seconds()
+    if catalog_age is not None and not gemini_ops.model_catalog.fetched_this_process:
+        console.print(f"[dim]Catálogo en caché de hace {format_duration(catalog_age)} (usa --refresh para consultar la API).[/dim]")
     current_model = gemini_ops.get_current_gemini_model_name()
     if current_model:
         current_model_details = gemini_ops.get_model_pricing_details(current_model)
@@ -151,20 +274,265 @@ def model_list_command():
 
 @model_app.command("select")
 def model_select_command( 
-    model_name: Annotated[str, typer.Argument(help="Nombre API del modelo (ej. 'models/gemini-1.5-flash-latest').")]
+    model_name: Annotated[str, typer.Argument(help="Nombre API del modelo (ej. 'models/gemini-1.5-flash-latest').")],
+    refresh: Annotated[bool, typer.Option("--refresh", "-r", help="Consultar la API aunque el catálogo en caché esté vigente.")] = False
 ):
     """Selecciona un modelo de Gemini por defecto."""
-    available_models = gemini_ops.get_available_gemini_models()
-    if not any(m['name'] == model_name for m in available_models):
+    if not gemini_ops.is_model_available(model_name, refresh=refresh):
         console.print(f"[bold red]Error: Modelo '{model_name}' no encontrado en la lista.[/bold red]")
         raise typer.Exit(code=1)
     gemini_ops.set_default_gemini_model(model_name)
 
+@cache_app.command("stats")
+def cache_stats_command():
+    """Muestra ocupación, tasa de aciertos y ahorro estimado de la caché."""
+    cache = gemini_ops.cache
+    if cache is None:
+        console.print("[yellow]La caché de respuestas está deshabilitada (ENABLE_GEMINI_CACHE=false).[/yellow]")
+        return
+    if not hasattr(cache, "stats"):
+        console.print("[yellow]El backend de caché actual no registra estadísticas. Usa CACHE_BACKEND=sqlite.[/yellow]")
+        return
+    stats = cache.stats()
+
+    max_entries_display = stats["max_entries"] or "sin límite"
+    max_bytes_display = format_file_size(stats["max_bytes"]) if stats["max_bytes"] else "sin límite"
+    console.print("\n[bold cyan]Caché de respuestas de Gemini[/bold cyan]")
+    console.print(f"  Entradas: [bold]{stats['entries']}[/bold] / {max_entries_display}")
+    console.print(f"  Tamaño  : [bold]{format_file_size(stats['bytes'])}[/bold] / {max_bytes_display}")
+    if "memory_entries" in stats:
+        console.print(f"  En memoria (este proceso): {stats['memory_entries']} entradas")
+
+    if not stats["models"]:
+        console.print("  [dim]Aún no hay consultas registradas.[/dim]")
+        return
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("Modelo", style="cyan", overflow="fold")
+    table.add_column("Aciertos", justify="right")
+    table.add_column("Fallos", justify="right")
+    table.add_column("Tasa", justify="right")
+    table.add_column("Bytes ahorrados", justify="right")
+    table.add_column("Tokens ahorrados", justify="right")
+    table.add_column("USD ahorrados (est.)", justify="right")
+    totals = {"hits": 0, "misses": 0, "bytes": 0, "tokens": 0, "usd": 0.0}
+    for model_stats in stats["models"]:
+        lookups = model_stats["hits"] + model_stats["misses"]
+        tokens_saved = model_stats["prompt_tokens_saved"] + model_stats["response_tokens_saved"]
+        usd_saved = gemini_ops.estimate_cache_savings(model_stats)
+        totals["hits"] += model_stats["hits"]
+        totals["misses"] += model_stats["misses"]
+        totals["bytes"] += model_stats["bytes_saved"]
+        totals["tokens"] += tokens_saved
+        totals["usd"] += usd_saved or 0.0
+        table.add_row(
+            model_stats["model"], str(model_stats["hits"]), str(model_stats["misses"]),
+            f"{model_stats['hits'] / lookups:.1%}" if lookups else "-",
+            format_file_size(model_stats["bytes_saved"]), str(tokens_saved),
+            format_cost(usd_saved) if usd_saved is not None else "N/A",
+        )
+    total_lookups = totals["hits"] + totals["misses"]
+    table.add_row(
+        "[bold]Total[/bold]", str(totals["hits"]), str(totals["misses"]),
+        f"{totals['hits'] / total_lookups:.1%}" if total_lookups else "-",
+        format_file_size(totals["bytes"]), str(totals["tokens"]), format_cost(totals["usd"]),
+    )
+    console.print(table)
+
+def _bundle_capable_cache():
+    """Devuelve la caché activa si admite paquetes portables; si no, termina con error."""
+    cache = gemini_ops.cache
+    if cache is None:
+        console.print("[bold red]Error: La caché de respuestas está deshabilitada (ENABLE_GEMINI_CACHE=false).[/bold red]")
+        raise typer.Exit(code=1)
+    if not hasattr(cache, "iter_entries"):
+        console.print("[bold red]Error: El backend de caché actual no admite paquetes. Usa CACHE_BACKEND=sqlite.[/bold red]")
+        raise typer.Exit(code=1)
+    return cache
+
+@cache_app.command("export")
+def cache_export_command(
+    output: Annotated[Path, typer.Argument(help="Archivo de paquete a generar.")],
+    model: Annotated[Optional[str], typer.Option("--model", "-m", help="Exportar solo las entradas de este modelo.")] = None,
+    max_age_hours: Annotated[Optional[float], typer.Option("--max-age", help="Exportar solo entradas creadas en las últimas N horas.")] = None
+):
+    """Empaqueta las entradas vigentes de la caché en un único archivo portable."""
+    cache = _bundle_capable_cache()
+    max_age_seconds = max_age_hours * 3600 if max_age_hours is not None else None
+    count = export_bundle(cache, output, model=model, max_age_seconds=max_age_seconds)
+    console.print(f"[green]Exportadas {count} entradas a '{output}' ({format_file_size(output.stat().st_size)}).[/green]")
+
+@cache_app.command("import")
+def cache_import_command(
+    bundle: Annotated[Path, typer.Argument(help="Paquete generado por `cache export`.")]
+):
+    """Fusiona un paquete en la caché; ante claves repetidas gana la expiración más tardía."""
+    cache = _bundle_capable_cache()
+    if not bundle.is_file():
+        console.print(f"[bold red]Error: El archivo '{bundle}' no existe.[/bold red]")
+        raise typer.Exit(code=1)
+    try:
+        written, skipped = import_bundle(cache, bundle)
+    except CacheBundleError as e:
+        console.print(f"[bold red]Error: Paquete rechazado: {e}[/bold red]")
+        raise typer.Exit(code=1)
+    console.print(f"[green]Importadas {written} entradas[/green] ({skipped} omitidas por expiradas o más antiguas).")
+
+@daemon_app.command("start")
+def daemon_start_command(
+    foreground: Annotated[bool, typer.Option("--foreground", help="Ejecutar en primer plano (Ctrl+C para detener).")] = False
+):
+    """Arranca el demonio: los siguientes comandos se ejecutan en él, sin arranque en frío."""
+    if not daemon.daemon_supported():
+        console.print("[bold red]Error: El demonio requiere sockets Unix (no disponible en esta plataforma).[/bold red]")
+        raise typer.Exit(code=1)
+    status = daemon.ping()
+    if status is not None:
+        console.print(f"[yellow]El demonio ya está en marcha (pid {status['pid']}).[/yellow]")
+        return
+    if foreground:
+        console.print(f"[green]Demonio escuchando en {daemon.resolve_socket_path()}[/green] (Ctrl+C para detener)")
+        daemon.serve()
+        return
+    try:
+        pid = daemon.start_background()
+    except RuntimeError as e:
+        console.print(f"[bold red]Error: {e}[/bold red]")
+        raise typer.Exit(code=1)
+    console.print(f"[green]Demonio en marcha (pid {pid}) en {daemon.resolve_socket_path()}.[/green]")
+
+@daemon_app.command("stop")
+def daemon_stop_command():
+    """Detiene el demonio; los comandos vuelven a ejecutarse en el propio proceso."""
+    if daemon.stop():
+        console.print("[green]Demonio detenido.[/green]")
+    else:
+        console.print("[yellow]No hay ningún demonio en marcha.[/yellow]")
+
+@daemon_app.command("status")
+def daemon_status_command():
+    """Muestra si el demonio está en marcha."""
+    status = daemon.ping()
+    if status is None:
+        console.print("Demonio: [yellow]detenido[/yellow] (los comandos se ejecutan en el propio proceso)")
+        return
+    console.print(f"Demonio: [bold green]en marcha[/bold green] (pid {status['pid']}, "
+                  f"activo hace {status['uptime_s']:.0f}s, {status['requests']} peticiones)")
+    console.print(f"Socket: [dim]{daemon.resolve_socket_path()}[/dim]")
+
+@usage_app.command("report")
+def usage_report_command(
+    by: Annotated[str, typer.Option("--by", "-b", help=f"Campos de agrupación separados por comas ({', '.join(GROUP_BY_FIELDS)}).")] = "day,model,repo",
+    days: Annotated[int, typer.Option("--days", "-d", help="Solo los últimos N días (0 = todo el registro).")] = 30
+):
+    """Agrega el registro de uso: llamadas, caché, tokens, costo y percentiles de latencia."""
+    ledger = gemini_ops.usage_ledger
+    if ledger is None:
+        console.print("[yellow]El registro de uso está deshabilitado (ENABLE_USAGE_LEDGER=false).[/yellow]")
+        return
+    group_by = [field.strip() for field in by.split(",") if field.strip()]
+    if not group_by:
+        console.print("[bold red]Error: Indica al menos un campo de agrupación en --by.[/bold red]")
+        raise typer.Exit(code=1)
+    since = time.time() - days * 86400 if days > 0 else None
+    try:
+        summary = summarize_usage(ledger.read_columns(), ledger.strings(), group_by, since=since)
+    except ValueError as e:
+        console.print(f"[bold red]Error: {e}[/bold red]")
+        raise typer.Exit(code=1)
+
+    period = f"últimos {days} días" if days > 0 else "todo el registro"
+    console.print(f"\n[bold cyan]Uso de Gemini ({period})[/bold cyan]")
+    if not summary:
+        console.print("  [dim]Aún no hay consultas registradas.[/dim]")
+        return
+    table = Table(show_header=True, header_style="bold magenta")
+    titles = {"day": "Día", "model": "Modelo", "repo": "Repositorio", "command": "Comando"}
+    for field in group_by:
+        table.add_column(titles[field], style="cyan", overflow="fold")
+    for title in ("Llamadas", "Caché", "Errores", "Tokens ent./sal.", "Latencia p50/p95",
+                  "Tokens/llamada p50/p95", "USD (est.)"):
+        table.add_column(title, justify="right")
+    totals = {"calls": 0, "cache_hits": 0, "errors": 0, "prompt_tokens": 0, "response_tokens": 0, "cost_usd": 0.0}
+    for row in summary:
+        for key in totals:
+            totals[key] += row[key]
+        table.add_row(
+            *[row[field] or "-" for field in group_by],
+            str(row["calls"]), str(row["cache_hits"]), str(row["errors"]),
+            f"{row['prompt_tokens']}/{row['response_tokens']}",
+            f"{row['latency_p50_ms'] / 1000:.2f}s/{row['latency_p95_ms'] / 1000:.2f}s",
+            f"{row['tokens_p50']}/{row['tokens_p95']}", format_cost(row["cost_usd"]),
+        )
+    table.add_row(
+        "[bold]Total[/bold]", *[""] * (len(group_by) - 1),
+        str(totals["calls"]), str(totals["cache_hits"]), str(totals["errors"]),
+        f"{totals['prompt_tokens']}/{totals['response_tokens']}", "", "", format_cost(totals["cost_usd"]),
+    )
+    console.print(table)
+    console.print("[dim]Percentiles calculados sobre las llamadas que llegaron a la API (sin caché ni errores).[/dim]")
+
+def _resolve_index_repo(repo_name: Optional[str]) -> Path:
+    """Repo para los comandos `index`: el indicado con --repo o el activo."""
+    if repo_name:
+        repo_path = config.REPOS_BASE_PATH / repo_name
+        if not repo_path.is_dir():
+            console.print(f"[bold red]Error: Repo '{repo_name}' no encontrado.[/bold red]")
+            raise typer.Exit(code=1)
+        return repo_path
+    active_repo_path = state_manager.get_active_repo_path()
+    if not active_repo_path:
+        console.print("[bold red]Error: No hay repo activo. Usa `repo select` o --repo.[/bold red]")
+        raise typer.Exit(code=1)
+    return active_repo_path
+
+@index_app.command("rebuild")
+def index_rebuild_command(
+    repo_name: Annotated[Optional[str], typer.Option("--repo", "-r", help="Repo cuyo índice reconstruir (usa activo si se omite).")] = None
+):
+    """Reconstruye desde cero el índice de archivos de un repositorio."""
+    repo_path = _resolve_index_repo(repo_name)
+    file_index = FileIndex(repo_path)
+    start = time.perf_counter()
+    console.print(f"[dim]Indexando '{repo_path.name}'...[/dim]")
+    result = project_analyzer.refresh_file_index(file_index, full=True)
+    elapsed = time.perf_counter() - start
+    dirs = file_index.stats()["dirs"]
+    file_index.close()
+    console.print(f"[green]Índice de '{repo_path.name}' reconstruido: {result['files']} archivos candidatos "
+                  f"en {dirs} directorios ({format_duration(elapsed)}).[/green]")
+
+@index_app.command("status")
+def index_status_command(
+    repo_name: Annotated[Optional[str], typer.Option("--repo", "-r", help="Repo cuyo índice mostrar (usa activo si se omite).")] = None
+):
+    """Muestra el contenido y la antigüedad del índice de archivos de un repositorio."""
+    repo_path = _resolve_index_repo(repo_name)
+    file_index = FileIndex(repo_path)
+    if not file_index.is_built():
+        console.print(f"[yellow]'{repo_path.name}' aún no tiene índice: se creará en el próximo "
+                      f"`analyze-project` o con `index rebuild`.[/yellow]")
+        file_index.close()
+        return
+    stats = file_index.stats()
+    file_index.close()
+    now = time.time()
+    if config.ENABLE_GIT_FILE_ENUMERATION and git_ops.is_git_work_tree(repo_path):
+        console.print("[dim]Es un repo Git: `analyze-project` toma los archivos del índice de git "
+                      "(ENABLE_GIT_FILE_ENUMERATION) y no usa este índice.[/dim]")
+    console.print(f"\n[bold cyan]Índice de archivos de '{repo_path.name}'[/bold cyan]")
+    console.print(f"  Archivo     : {file_index.path} ({format_file_size(stats['size_bytes'])})")
+    console.print(f"  Candidatos  : [bold]{stats['files']}[/bold] en {stats['dirs']} directorios")
+    console.print(f"  Tokens      : {stats['tokens']} estimados en {stats['files_with_tokens']} archivos ya leídos")
+    console.print(f"  Construido  : hace {format_duration(now - stats['built_at'])}")
+    if stats["updated_at"] is not None:
+        console.print(f"  Actualizado : hace {format_duration(now - stats['updated_at'])}")
+
 @app.command("chat")
 def chat_with_gemini_command( # Renombrado para evitar conflicto
     message: Annotated[str, typer.Argument(help="Mensaje o pregunta para Gemini.")],
     file_path_str: Annotated[Optional[str], typer.Option("--file", "-f", help="Ruta relativa a un archivo en el repo activo para contexto.")] = None,
-    no_confirm_cost: Annotated[bool, typer.Option("--yes", "-y", help="Saltar confirmación para modelos de pago.")] = False
+    no_confirm_cost: Annotated[bool, typer.Option("--yes", "-y", help="Saltar confirmación para modelos de pago.")] = False,
+    stream: Annotated[Optional[bool], typer.Option("--stream/--no-stream", help="Mostrar la respuesta a medida que llega (por defecto: STREAM_RESPONSES).")] = None
 ):
     """Envía un mensaje a Gemini, opcionalmente con contexto de archivo."""
     final_prompt = message
@@ -195,9 +563,13 @@ def chat_with_gemini_command( # Renombrado para evitar conflicto
             console.print(f"[bold red]Error al leer '{full_file_path}': {e}[/bold red]")
             raise typer.Exit(code=1)
     
-    response_text = gemini_ops.send_prompt_to_gemini(final_prompt, confirm_paid_model_use=not no_confirm_cost)
+    title_text = "Respuesta de Gemini"
+    renderer = LiveResponsePanel(title_text) if (config.STREAM_RESPONSES if stream is None else stream) else None
+    response_text = gemini_ops.send_prompt_to_gemini(final_prompt, confirm_paid_model_use=not no_confirm_cost,
+                                                     stream_renderer=renderer)
+    if response_text and renderer and renderer.rendered and not response_text.startswith(("[ERROR_GEMINI]", "[INFO_USER]")):
+        return # Ya se mostró en vivo
     if response_text:
-        title_text = "Respuesta de Gemini"
         border_s = "dim cyan"
         text_style = ""
         if response_text.startswith(("[ERROR_GEMINI]", "[INFO_USER]")):
@@ -210,8 +582,9 @@ def chat_with_gemini_command( # Renombrado para evitar conflicto
         else:
             content_to_render = Markdown(response_text)
         
-        console.print(Panel(content_to_render, title=title_text, border_style=border_s, expand=False,
-                            padding=(1,2) if not response_text.startswith(("[ERROR_GEMINI]", "[INFO_USER]")) else 0 ))
+        with span("renderizado"):
+            console.print(Panel(content_to_render, title=title_text, border_style=border_s, expand=False,
+                                padding=(1,2) if not response_text.startswith(("[ERROR_GEMINI]", "[INFO_USER]")) else 0 ))
     else:
         console.print("[bold yellow]No se recibió respuesta de Gemini o hubo un error.[/bold yellow]")
 
@@ -219,7 +592,10 @@ def chat_with_gemini_command( # Renombrado para evitar conflicto
 def analyze_project_command_func( # Renombrado para evitar conflicto
     repo_name: Annotated[Optional[str], typer.Option("--repo", "-r", help="Repo local a analizar (usa activo si se omite).")] = None,
     sub_path_str: Annotated[Optional[str], typer.Option("--path", "-p", help="Subdirectorio relativo para enfocar el análisis.")] = None,
-    no_confirm_cost: Annotated[bool, typer.Option("--yes", "-y", help="Saltar confirmación para modelos de pago.")] = False
+    no_confirm_cost: Annotated[bool, typer.Option("--yes", "-y", help="Saltar confirmación para modelos de pago.")] = False,
+    stream: Annotated[Optional[bool], typer.Option("--stream/--no-stream", help="Mostrar la respuesta a medida que llega (por defecto: STREAM_RESPONSES).")] = None,
+    compact: Annotated[Optional[bool], typer.Option("--compact/--no-compact", help="Compactar los archivos antes de enviarlos: licencias, espacios y literales largos (por defecto: ENABLE_PROMPT_COMPACTION).")] = None,
+    strip_comments: Annotated[Optional[bool], typer.Option("--strip-comments/--keep-comments", help="Al compactar, quitar también comentarios y docstrings (por defecto: PROMPT_COMPACTION_DROP_COMMENTS).")] = None
 ):
     """Realiza un análisis inicial del proyecto/subdirectorio usando Gemini."""
     root_repo_path = None
@@ -249,29 +625,43 @@ def analyze_project_command_func( # Renombrado para evitar conflicto
     
     console.print(f"\n[bold blue]Iniciando análisis de {focus_area_for_prompt}[/bold blue]")
     # La función ahora espera path_to_scan y repo_root_path
-    selected_contents = project_analyzer.get_project_files_for_analysis(path_to_scan=path_to_analyze, repo_root_path=root_repo_path)
+    compact = config.ENABLE_PROMPT_COMPACTION if compact is None else compact
+    with span("selección de archivos"):
+        selected_contents = project_analyzer.get_project_files_for_analysis(
+            path_to_scan=path_to_analyze, repo_root_path=root_repo_path, compact=compact,
+            drop_comments=config.PROMPT_COMPACTION_DROP_COMMENTS if strip_comments is None else strip_comments,
+            max_literal=config.PROMPT_COMPACTION_MAX_LITERAL, token_counter=gemini_ops.estimate_text_tokens,
+            file_index=FileIndex(root_repo_path) if config.ENABLE_FILE_INDEX else None,
+            use_git=config.ENABLE_GIT_FILE_ENUMERATION)
 
     if not selected_contents:
         console.print("[bold yellow]No se pudo obtener contenido de archivos para enviar a Gemini.[/bold yellow]")
         raise typer.Exit(code=1)
 
-    prompt_parts = [f"Actúa como un arquitecto de software experimentado revisando {focus_area_for_prompt}.\n"
-                    "Basado en el contenido de los siguientes archivos clave de esta área, proporciona un análisis estructurado usando Markdown con los siguientes encabezados:\n\n"
-                    "## Propósito Principal\n(Resumen conciso en 1-2 frases).\n\n"
-                    "## Tecnologías y Lenguajes Clave\n(Lista).\n\n"
-                    "## Estructura General\n(Describe brevemente organización y arquitectura, 2-4 frases).\n\n"
-                    "## Puntos de Partida o Interés\n(Opcional: 1-2 archivos/directorios clave para un nuevo desarrollador).\n\n"
-                    "Sé claro, conciso y técnico.\n\n"
-                    "--- CONTENIDO DE ARCHIVOS PROPORCIONADOS ---\n"]
-    for item in selected_contents:
-        prompt_parts.append(f"\n--- Archivo: {item['path']} ---\n{item['content']}\n--- Fin Archivo: {item['path']} ---")
-    final_prompt = "".join(prompt_parts)
+    with span("armado del prompt"):
+        prompt_parts = [f"Actúa como un arquitecto de software experimentado revisando {focus_area_for_prompt}.\n"
+                        "Basado en el contenido de los siguientes archivos clave de esta área, proporciona un análisis estructurado usando Markdown con los siguientes encabezados:\n\n"
+                        "## Propósito Principal\n(Resumen conciso en 1-2 frases).\n\n"
+                        "## Tecnologías y Lenguajes Clave\n(Lista).\n\n"
+                        "## Estructura General\n(Describe brevemente organización y arquitectura, 2-4 frases).\n\n"
+                        "## Puntos de Partida o Interés\n(Opcional: 1-2 archivos/directorios clave para un nuevo desarrollador).\n\n"
+                        "Sé claro, conciso y técnico.\n\n"
+                        "--- CONTENIDO DE ARCHIVOS PROPORCIONADOS ---\n"]
+        for item in selected_contents:
+            prompt_parts.append(f"\n--- Archivo: {item['path']} ---\n{item['content']}\n--- Fin Archivo: {item['path']} ---")
+        final_prompt = "".join(prompt_parts)
+    _print_compaction_report(selected_contents)
     
     console.print(f"\n[magenta]Enviando {len(selected_contents)} archivos a Gemini para análisis...[/magenta]")
-    response_text = gemini_ops.send_prompt_to_gemini(final_prompt, confirm_paid_model_use=not no_confirm_cost)
+    # Cada archivo es un fragmento: su conteo de tokens se memoriza y se reutiliza en otros análisis
+    title_text = f"Análisis de {focus_area_for_prompt} por Gemini"
+    renderer = LiveResponsePanel(title_text) if (config.STREAM_RESPONSES if stream is None else stream) else None
+    response_text = gemini_ops.send_prompt_to_gemini(final_prompt, confirm_paid_model_use=not no_confirm_cost,
+                                                     prompt_segments=prompt_parts, stream_renderer=renderer)
+    if response_text and renderer and renderer.rendered and not response_text.startswith(("[ERROR_GEMINI]", "[INFO_USER]")):
+        return # Ya se mostró en vivo
 
     if response_text: # Reutilizar la lógica de formato de panel del comando chat
-        title_text = f"Análisis de {focus_area_for_prompt} por Gemini"
         border_s = "dim cyan"
         text_style = ""
         if response_text.startswith(("[ERROR_GEMINI]", "[INFO_USER]")):
@@ -284,10 +674,56 @@ def analyze_project_command_func( # Renombrado para evitar conflicto
         else:
             content_to_render = Markdown(response_text)
         
-        console.print(Panel(content_to_render, title=title_text, border_style=border_s, expand=False,
-                            padding=(1,2) if not response_text.startswith(("[ERROR_GEMINI]", "[INFO_USER]")) else 0 ))
+        with span("renderizado"):
+            console.print(Panel(content_to_render, title=title_text, border_style=border_s, expand=False,
+                                padding=(1,2) if not response_text.startswith(("[ERROR_GEMINI]", "[INFO_USER]")) else 0 ))
     else:
         console.print("[bold yellow]No se recibió un análisis del proyecto de Gemini.[/bold yellow]")
 
+@app.command("batch")
+def batch_command(
+    input_file: Annotated[Path, typer.Argument(help="Archivo JSONL con un objeto {\"id\": ..., \"prompt\": ...} por línea.")],
+    output: Annotated[Optional[Path], typer.Option("--output", "-o", help="Archivo NDJSON de resultados (por defecto: <entrada>.results.ndjson).")] = None,
+    concurrency: Annotated[int, typer.Option("--concurrency", "-c", min=1, help="Máximo de llamadas simultáneas a Gemini (por defecto: BATCH_CONCURRENCY).")] = config.BATCH_CONCURRENCY,
+    no_confirm_cost: Annotated[bool, typer.Option("--yes", "-y", help="Saltar confirmación para modelos de pago.")] = False
+):
+    """Ejecuta muchos prompts de forma concurrente y guarda los resultados en NDJSON según terminan."""
+    if not input_file.is_file():
+        console.print(f"[bold red]Error: El archivo '{input_file}' no existe.[/bold red]")
+        raise typer.Exit(code=1)
+    try:
+        items = batch_ops.load_batch_prompts(input_file)
+    except ValueError as e:
+        console.print(f"[bold red]Error en '{input_file}': {e}[/bold red]")
+        raise typer.Exit(code=1)
+    if not items:
+        console.print("[yellow]El archivo no contiene prompts.[/yellow]")
+        return
+
+    if no_confirm_cost:
+        ready = gemini_ops._initialize_and_get_gemini_model_instance() is not None
+    else:
+        ready = gemini_ops.confirm_paid_model_for_batch(len(items))
+    if not ready:
+        console.print("[bold red]Lote cancelado.[/bold red]")
+        raise typer.Exit(code=1)
+
+    output_path = output or input_file.with_suffix(".results.ndjson")
+    console.print(f"\n[magenta]Procesando {len(items)} prompts con hasta {concurrency} llamadas simultáneas...[/magenta]")
+    with Progress(console=console, transient=True) as progress:
+        task = progress.add_task("Lote", total=len(items))
+        summary = asyncio.run(batch_ops.run_batch(
+            items, output_path, concurrency=concurrency,
+            on_result=lambda record: progress.advance(task),
+        ))
+
+    console.print(f"[green]Resultados en '{output_path}'.[/green]")
+    console.print(f"  Correctos: [bold]{summary['ok']}[/bold]  Errores: [bold]{summary['errors']}[/bold]  "
+                  f"Desde caché: [bold]{summary['cached']}[/bold]")
+    console.print(f"  Costo estimado: {format_cost(summary['cost_usd'])}  "
+                  f"Tiempo: {summary['elapsed_s']:.1f}s ({summary['total'] / max(summary['elapsed_s'], 1e-9):.1f} prompts/s)")
+    if summary["errors"]:
+        raise typer.Exit(code=1)
+
 if __name__ == "__main__":
     app()
\ No newline at end of file
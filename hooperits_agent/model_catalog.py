@@ -0,0 +1,155 @@
+# hooperits_agent/model_catalog.py
+"""
+Catálogo de modelos de Gemini persistido en disco.
+
+`genai.list_models()` cuesta una ida y vuelta de red en cada `model list`,
+`model select` y autoselección de modelo. El catálogo guarda la lista de
+modelos de texto con la fecha de consulta: mientras no supere su TTL se usa
+sin tocar la red; cuando caduca se sigue usando y se actualiza en segundo
+plano. La información de tiers y precios no se guarda aquí: se combina al
+leer con `model_tiers.json`, de modo que editar ese archivo no exige refrescar.
+"""
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .utils import atomic_write_json
+
+logger = logging.getLogger("hooperits_agent.model_catalog")
+
+MODEL_CATALOG_FILENAME = "model_catalog.json"
+MODEL_CATALOG_FORMAT_VERSION = 1
+
+FetchModels = Callable[[], List[Dict[str, Any]]]
+
+
+class ModelCatalog:
+    """Lista de modelos de la API con TTL y refresco en segundo plano."""
+
+    def __init__(self, cache_dir: Path, ttl_seconds: int = 86400):
+        """
+        Inicializa el catálogo.
+
+        Args:
+            cache_dir: Directorio donde guardar el catálogo
+            ttl_seconds: Antigüedad máxima antes de refrescar (en segundo plano)
+        """
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = cache_dir / MODEL_CATALOG_FILENAME
+        self.ttl_seconds = ttl_seconds
+        # True si este proceso ya consultó la API (no tiene sentido repetirlo enseguida)
+        self.fetched_this_process = False
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """
+        Lee el catálogo del disco.
+
+        Returns:
+            Diccionario con `fetched_at` (epoch) y `models`, o None si no existe,
+            está dañado o es de otra versión de formato
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Catálogo de modelos ilegible, se volverá a consultar: {e}")
+            return None
+        if (not isinstance(data, dict) or data.get("format_version") != MODEL_CATALOG_FORMAT_VERSION
+                or not isinstance(data.get("models"), list)
+                or not isinstance(data.get("fetched_at"), (int, float))):
+            return None
+        return data
+
+    def is_fresh(self, catalog: Dict[str, Any]) -> bool:
+        """Indica si el catálogo no ha superado su TTL."""
+        return 0 <= time.time() - float(catalog["fetched_at"]) < self.ttl_seconds
+
+    def refresh(self, fetch: FetchModels) -> Dict[str, Any]:
+        """
+        Consulta la API y guarda el resultado (si no está vacío).
+
+        Args:
+            fetch: Función que devuelve la lista de modelos de la API
+
+        Returns:
+            El catálogo nuevo
+        """
+        models = fetch()
+        self.fetched_this_process = True
+        catalog = {"format_version": MODEL_CATALOG_FORMAT_VERSION, "fetched_at": time.time(), "models": models}
+        if models:
+            atomic_write_json(self.path, catalog, indent=2)
+            logger.info(f"Catálogo de modelos actualizado: {len(models)} modelos")
+        return catalog
+
+    def refresh_in_background(self, fetch: FetchModels) -> bool:
+        """
+        Refresca el catálogo en un hilo, si no hay ya un refresco en curso.
+
+        El hilo no es de tipo daemon: un proceso del CLI que termina antes espera
+        a que se guarde el catálogo, ya mostrada la salida del comando.
+
+        Returns:
+            True si se inició un refresco
+        """
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return False
+            self._refresh_thread = threading.Thread(
+                target=self._background_refresh, args=(fetch,), name="model-catalog-refresh")
+            self._refresh_thread.start()
+            return True
+
+    def _background_refresh(self, fetch: FetchModels) -> None:
+        try:
+            self.refresh(fetch)
+        except Exception as e:
+            logger.warning(f"No se pudo refrescar el catálogo de modelos: {e}")
+
+    def wait_for_refresh(self, timeout: Optional[float] = None) -> None:
+        """Espera a que termine el refresco en segundo plano, si lo hay."""
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def get(self, fetch: FetchModels, refresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        Modelos del catálogo, consultando la API solo si hace falta.
+
+        Args:
+            fetch: Función que devuelve la lista de modelos de la API
+            refresh: Consultar la API aunque el catálogo esté vigente
+
+        Returns:
+            Lista de modelos: del disco si existe (refrescándolo en segundo
+            plano si caducó) o de una consulta síncrona si no existe
+
+        Raises:
+            La excepción de `fetch` cuando la consulta es síncrona
+        """
+        catalog = None if refresh else self.load()
+        if catalog is None:
+            catalog = self.refresh(fetch)
+        elif not self.is_fresh(catalog):
+            self.refresh_in_background(fetch)
+        models: List[Dict[str, Any]] = catalog["models"]
+        return models
+
+    def age_seconds(self) -> Optional[float]:
+        """Antigüedad del catálogo en disco, o None si no hay."""
+        catalog = self.load()
+        return time.time() - catalog["fetched_at"] if catalog is not None else None
+
+
+__all__ = [
+    'ModelCatalog',
+    'MODEL_CATALOG_FILENAME',
+    'MODEL_CATALOG_FORMAT_VERSION',
+]
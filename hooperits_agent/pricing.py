@@ -0,0 +1,254 @@
+# hooperits_agent/pricing.py
+"""
+Motor de precios compilado a partir de `model_tiers.json`.
+
+Cada modelo se compila una sola vez en una `ModelPricing`: las tarifas por
+token de entrada y de salida de cada tramo de tamaño de prompt (≤128k, >128k,
+≤200k...) quedan en tuplas, y los alias (`alias_of`) apuntan a la tarifa del
+modelo real. Tarificar una llamada es buscar el tramo y hacer dos productos;
+`PricingTable.cost_many` tarifica miles de pares (entrada, salida) de un golpe
+para los informes de uso.
+"""
+import re
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+_TOKENS_PER_MILLION = 1_000_000.0
+_MAX_ALIAS_DEPTH = 5
+
+# `input_per_1M_tokens_usd_le_128k`, `output_per_1M_tokens_usd_gt_200k`...
+_TIERED_KEY_PATTERN = re.compile(r"^(input|output)_per_1M_tokens_usd_(le|gt)_(\d+)k$")
+
+# Tarifas sin tramos, por orden de preferencia
+_FLAT_INPUT_KEYS = ("input_text_img_vid_per_1M_tokens_usd", "input_per_1M_tokens_usd")
+_FLAT_OUTPUT_KEYS = ("output_per_1M_tokens_usd", "output_no_thought_per_1M_tokens_usd")
+
+
+class ModelPricing:
+    """Tarifas por token de un modelo, por tramo de tamaño del prompt."""
+
+    __slots__ = ("model", "thresholds", "input_rates", "output_rates")
+
+    def __init__(self, model: str, thresholds: Sequence[int],
+                 input_rates: Sequence[float], output_rates: Sequence[float]):
+        """
+        Inicializa las tarifas.
+
+        Args:
+            model: Modelo cuyas tarifas son (el destino del alias, si lo hay)
+            thresholds: Umbrales de tokens del prompt, ordenados (p. ej. [128000])
+            input_rates: USD por token de entrada de cada tramo (len(thresholds) + 1)
+            output_rates: USD por token de salida de cada tramo
+        """
+        self.model = model
+        self.thresholds: Tuple[int, ...] = tuple(thresholds)
+        self.input_rates: Tuple[float, ...] = tuple(input_rates)
+        self.output_rates: Tuple[float, ...] = tuple(output_rates)
+
+    def tier_index(self, prompt_tokens: int) -> int:
+        """Tramo de precio de un prompt: 0 si cabe en el primer umbral (≤), etc."""
+        return bisect_left(self.thresholds, prompt_tokens)
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        """
+        Costo en USD de una llamada.
+
+        El tramo lo decide el tamaño del prompt y se aplica tanto a la entrada
+        como a la salida, como en la tarifa publicada.
+        """
+        tier = bisect_left(self.thresholds, input_tokens) if self.thresholds else 0
+        return input_tokens * self.input_rates[tier] + output_tokens * self.output_rates[tier]
+
+    def cost_many(self, input_tokens: Sequence[int], output_tokens: Sequence[int]) -> List[float]:
+        """
+        Costo en USD de muchas llamadas.
+
+        Args:
+            input_tokens: Tokens de entrada de cada llamada
+            output_tokens: Tokens de salida de cada llamada (misma longitud)
+
+        Returns:
+            Lista de costos, en el mismo orden
+        """
+        if len(input_tokens) != len(output_tokens):
+            raise ValueError("input_tokens y output_tokens deben tener la misma longitud")
+        if not self.thresholds:
+            in_rate, out_rate = self.input_rates[0], self.output_rates[0]
+            return [i * in_rate + o * out_rate for i, o in zip(input_tokens, output_tokens)]
+        if len(self.thresholds) == 1:
+            # Caso habitual (un solo umbral): sin búsqueda binaria por fila
+            limit = self.thresholds[0]
+            in_low, in_high = self.input_rates
+            out_low, out_high = self.output_rates
+            return [i * in_low + o * out_low if i <= limit else i * in_high + o * out_high
+                    for i, o in zip(input_tokens, output_tokens)]
+        thresholds, in_rates, out_rates = self.thresholds, self.input_rates, self.output_rates
+        costs = []
+        for i, o in zip(input_tokens, output_tokens):
+            tier = bisect_left(thresholds, i)
+            costs.append(i * in_rates[tier] + o * out_rates[tier])
+        return costs
+
+    def __repr__(self) -> str:
+        return (f"ModelPricing({self.model!r}, thresholds={self.thresholds}, "
+                f"input_rates={self.input_rates}, output_rates={self.output_rates})")
+
+
+def _tiered_rates(paid_tier: Dict[str, Any], direction: str,
+                  thresholds: Sequence[int], flat: Optional[float]) -> Optional[List[float]]:
+    """Tarifa por tramo de una dirección (entrada o salida), o None si no hay ninguna."""
+    le_rates: Dict[int, float] = {}
+    gt_rates: Dict[int, float] = {}
+    for key, value in paid_tier.items():
+        match = _TIERED_KEY_PATTERN.match(key)
+        if match and match.group(1) == direction and isinstance(value, (int, float)):
+            bound = int(match.group(3)) * 1000
+            (le_rates if match.group(2) == "le" else gt_rates)[bound] = float(value)
+    if not le_rates and not gt_rates and flat is None:
+        return None
+
+    rates = []
+    for band in range(len(thresholds) + 1):
+        if band < len(thresholds):
+            # Prompts de hasta thresholds[band] tokens: su `le`, o el `gt` del umbral anterior
+            rate = le_rates.get(thresholds[band])
+            if rate is None and band > 0:
+                rate = gt_rates.get(thresholds[band - 1])
+        else:
+            rate = gt_rates.get(thresholds[-1]) if thresholds else None
+        rates.append(flat if rate is None else rate)
+    # Tramos sin tarifa propia ni plana: la del tramo más cercano que sí la tenga
+    known = [rate for rate in rates if rate is not None]
+    filled, last = [], known[0] if known else 0.0
+    for rate in rates:
+        last = last if rate is None else rate
+        filled.append(last)
+    return filled
+
+
+def _first_number(paid_tier: Dict[str, Any], keys: Sequence[str]) -> Optional[float]:
+    for key in keys:
+        value = paid_tier.get(key)
+        if isinstance(value, (int, float)):
+            return float(value)
+    return None
+
+
+def compile_model_pricing(model: str, paid_tier: Any) -> Optional[ModelPricing]:
+    """
+    Compila la sección `paid_tier` de un modelo.
+
+    Args:
+        model: Nombre del modelo
+        paid_tier: Sección `paid_tier` de `model_tiers.json`
+
+    Returns:
+        Tarifas del modelo, o None si no tiene precios por token (gratuito,
+        "No disponible", solo por imagen...)
+    """
+    if not isinstance(paid_tier, dict):
+        return None
+    thresholds = sorted({
+        int(match.group(3)) * 1000
+        for match in map(_TIERED_KEY_PATTERN.match, paid_tier) if match
+    })
+    input_rates = _tiered_rates(paid_tier, "input", thresholds, _first_number(paid_tier, _FLAT_INPUT_KEYS))
+    output_rates = _tiered_rates(paid_tier, "output", thresholds, _first_number(paid_tier, _FLAT_OUTPUT_KEYS))
+    if input_rates is None and output_rates is None:
+        return None
+    no_rates = [0.0] * (len(thresholds) + 1)
+    return ModelPricing(model, thresholds,
+                        [rate / _TOKENS_PER_MILLION for rate in input_rates or no_rates],
+                        [rate / _TOKENS_PER_MILLION for rate in output_rates or no_rates])
+
+
+class PricingTable:
+    """Tarifas de todos los modelos de `model_tiers.json`, compiladas una vez."""
+
+    def __init__(self, tier_info: Dict[str, Any]):
+        """
+        Compila la tabla.
+
+        Args:
+            tier_info: Contenido de `model_tiers.json`
+        """
+        self._aliases: Dict[str, str] = {}
+        self._pricing: Dict[str, Optional[ModelPricing]] = {}
+        for model in tier_info:
+            target = self._follow_aliases(tier_info, model)
+            self._aliases[model] = target
+            if target not in self._pricing:
+                entry = tier_info.get(target)
+                self._pricing[target] = compile_model_pricing(
+                    target, entry.get("paid_tier") if isinstance(entry, dict) else None)
+
+    @staticmethod
+    def _follow_aliases(tier_info: Dict[str, Any], model: str) -> str:
+        for _ in range(_MAX_ALIAS_DEPTH):
+            entry = tier_info.get(model)
+            target = entry.get("alias_of") if isinstance(entry, dict) else None
+            if not target or target not in tier_info:
+                break
+            model = target
+        return model
+
+    def resolve(self, model: str) -> str:
+        """Modelo real de un alias (o el propio nombre)."""
+        return self._aliases.get(model, model)
+
+    def get(self, model: str) -> Optional[ModelPricing]:
+        """Tarifas del modelo (siguiendo alias), o None si no tiene precios."""
+        return self._pricing.get(self.resolve(model))
+
+    def thresholds(self, model: str) -> List[int]:
+        """Umbrales de tamaño de prompt que cambian el precio del modelo."""
+        pricing = self.get(model)
+        return list(pricing.thresholds) if pricing else []
+
+    def cost(self, model: str, input_tokens: int, output_tokens: int) -> Optional[float]:
+        """Costo en USD de una llamada, o None si el modelo no tiene precios."""
+        pricing = self.get(model)
+        return pricing.cost(input_tokens, output_tokens) if pricing else None
+
+    def cost_many(self, models: Union[str, Sequence[str]], input_tokens: Sequence[int],
+                  output_tokens: Sequence[int]) -> List[Optional[float]]:
+        """
+        Costo en USD de muchas llamadas.
+
+        Args:
+            models: Un modelo para todas las llamadas, o uno por llamada
+            input_tokens: Tokens de entrada de cada llamada
+            output_tokens: Tokens de salida de cada llamada
+
+        Returns:
+            Lista de costos en el mismo orden (None para modelos sin precios)
+        """
+        if isinstance(models, str):
+            pricing = self.get(models)
+            if pricing is None:
+                return [None] * len(input_tokens)
+            single_model_costs: List[Optional[float]] = list(pricing.cost_many(input_tokens, output_tokens))
+            return single_model_costs
+        if not len(models) == len(input_tokens) == len(output_tokens):
+            raise ValueError("models, input_tokens y output_tokens deben tener la misma longitud")
+
+        # Agrupar las filas por modelo y tarificar cada grupo de una vez
+        rows_by_model: Dict[str, List[int]] = {}
+        for row, model in enumerate(models):
+            rows_by_model.setdefault(model, []).append(row)
+        costs: List[Optional[float]] = [None] * len(models)
+        for model, rows in rows_by_model.items():
+            pricing = self.get(model)
+            if pricing is None:
+                continue
+            group_costs = pricing.cost_many([input_tokens[r] for r in rows], [output_tokens[r] for r in rows])
+            for row, cost in zip(rows, group_costs):
+                costs[row] = cost
+        return costs
+
+
+__all__ = [
+    'ModelPricing',
+    'PricingTable',
+    'compile_model_pricing',
+]
@@ -0,0 +1,210 @@
+# hooperits_agent/profiler.py
+"""
+Perfilado ligero por fases para `--profile`.
+
+Las fases del agente (escaneo de archivos, detección de codificación, lectura,
+armado del prompt, conteo de tokens, generación, renderizado...) se envuelven
+en `with span("nombre"):`. Con el perfilador apagado, `span` devuelve un
+contexto nulo compartido y el costo es una llamada a función. Encendido,
+cada span registra inicio, duración y tiempo propio (sin sus spans hijos)
+por hilo, y `tracemalloc` mide el pico de memoria.
+
+Los spans se anidan por hilo: no deben abrirse a través de un `await`, porque
+las tareas de un mismo bucle se intercalan en el mismo hilo.
+"""
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .utils import atomic_write_json
+
+_NULL_SPAN = nullcontext()
+
+
+class _Span:
+    """Contexto de un span activo."""
+
+    __slots__ = ("profiler", "name", "category", "start_ns", "child_ns")
+
+    def __init__(self, profiler: "Profiler", name: str, category: str):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.start_ns = 0
+        self.child_ns = 0
+
+    def __enter__(self) -> "_Span":
+        self.profiler._stack().append(self)
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        duration_ns = time.perf_counter_ns() - self.start_ns
+        stack = self.profiler._stack()
+        stack.pop()
+        if stack:
+            stack[-1].child_ns += duration_ns
+        self.profiler._record(self, duration_ns, len(stack))
+
+
+class Profiler:
+    """Recolector de spans y del pico de memoria de un comando."""
+
+    def __init__(self):
+        self.enabled = False
+        # (nombre, categoría, inicio_ns, duración_ns, propio_ns, hilo, profundidad)
+        self._events: List[Tuple[str, str, int, int, int, int, int]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_ns = 0
+        self._stopped_ns = 0
+        self._owns_tracemalloc = False
+        self.peak_memory_bytes: Optional[int] = None
+
+    def start(self, trace_memory: bool = True) -> None:
+        """
+        Empieza a registrar spans.
+
+        Args:
+            trace_memory: Medir el pico de memoria con `tracemalloc` (hace más
+                lentas las asignaciones mientras está activo)
+        """
+        self._events = []
+        self.peak_memory_bytes = None
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._owns_tracemalloc = True
+        self._started_ns = time.perf_counter_ns()
+        self._stopped_ns = 0
+        self.enabled = True
+
+    def stop(self) -> float:
+        """
+        Deja de registrar spans.
+
+        Returns:
+            Segundos transcurridos desde `start`
+        """
+        if self.enabled:
+            self._stopped_ns = time.perf_counter_ns()
+            self.enabled = False
+            if tracemalloc.is_tracing():
+                self.peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+                if self._owns_tracemalloc:
+                    tracemalloc.stop()
+                    self._owns_tracemalloc = False
+        return self.wall_seconds
+
+    @property
+    def wall_seconds(self) -> float:
+        """Duración total perfilada (hasta ahora si sigue activo)."""
+        end_ns = self._stopped_ns or time.perf_counter_ns()
+        return (end_ns - self._started_ns) / 1e9 if self._started_ns else 0.0
+
+    def _stack(self) -> List[_Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, active: _Span, duration_ns: int, depth: int) -> None:
+        with self._lock:
+            self._events.append((active.name, active.category, active.start_ns, duration_ns,
+                                 duration_ns - active.child_ns, threading.get_ident(), depth))
+
+    def span(self, name: str, category: str = "fase") -> Union[_Span, nullcontext]:
+        """
+        Contexto que mide una fase.
+
+        Args:
+            name: Nombre de la fase (los spans con el mismo nombre se suman)
+            category: Categoría para el trace de Chrome
+
+        Returns:
+            Un span si el perfilador está activo; si no, un contexto nulo
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, category)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        Tiempos agregados por fase.
+
+        Returns:
+            Filas con `name`, `calls`, `total_s` (incluye fases anidadas) y
+            `self_s` (sin ellas), de mayor a menor tiempo propio
+        """
+        totals: Dict[str, List[float]] = {}
+        with self._lock:
+            events = list(self._events)
+        for name, _, _, duration_ns, self_ns, _, _ in events:
+            row = totals.setdefault(name, [0, 0, 0])
+            row[0] += 1
+            row[1] += duration_ns
+            row[2] += self_ns
+        rows: List[Dict[str, Any]] = [
+            {"name": name, "calls": calls, "total_s": total_ns / 1e9, "self_s": self_ns / 1e9}
+            for name, (calls, total_ns, self_ns) in totals.items()
+        ]
+        rows.sort(key=lambda row: row["self_s"], reverse=True)
+        return rows
+
+    def unattributed_seconds(self) -> float:
+        """Tiempo del hilo principal que no cae en ninguna fase."""
+        main_thread = threading.main_thread().ident
+        with self._lock:
+            covered_ns = sum(event[3] for event in self._events if event[5] == main_thread and event[6] == 0)
+        return max(0.0, self.wall_seconds - covered_ns / 1e9)
+
+    def chrome_trace(self, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Spans en formato Trace Event de Chrome (chrome://tracing, Perfetto).
+
+        Args:
+            metadata: Datos adicionales para `otherData` (comando, versión...)
+
+        Returns:
+            Diccionario serializable a JSON
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self._events)
+        thread_ids = {tid: index for index, tid in enumerate(sorted({event[5] for event in events}))}
+        trace_events: List[Dict[str, Any]] = [
+            {"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "hooperits-agent"}},
+        ]
+        for name, category, start_ns, duration_ns, _, tid, _ in sorted(events, key=lambda event: event[2]):
+            trace_events.append({
+                "name": name, "cat": category, "ph": "X", "pid": pid, "tid": thread_ids[tid],
+                "ts": (start_ns - self._started_ns) / 1000, "dur": duration_ns / 1000,
+            })
+        other_data: Dict[str, Any] = {"wall_seconds": self.wall_seconds}
+        if self.peak_memory_bytes is not None:
+            other_data["peak_memory_bytes"] = self.peak_memory_bytes
+        other_data.update(metadata or {})
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms", "otherData": other_data}
+
+    def write_chrome_trace(self, path: Union[str, Path], metadata: Optional[Dict[str, Any]] = None) -> None:
+        """Escribe `chrome_trace` en `path`."""
+        atomic_write_json(path, self.chrome_trace(metadata), indent=None)
+
+
+# Perfilador del proceso, activado por `--profile`
+profiler = Profiler()
+
+
+def span(name: str, category: str = "fase") -> Union[_Span, nullcontext]:
+    """Atajo de `profiler.span` para envolver una fase del agente."""
+    return profiler.span(name, category)
+
+
+__all__ = [
+    'Profiler',
+    'profiler',
+    'span',
+]
@@ -1,8 +1,25 @@
 # hooperits_agent/project_analyzer.py
+import codecs
+import hashlib
+import itertools
+import os
+import sqlite3
+import stat
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Callable, Deque, Generator, Iterable, Iterator, Optional
 from rich.console import Console
 import chardet 
+import git
+
+from . import git_ops
+from .config import CACHE_DIR, ENABLE_ENCODING_CACHE, ENCODING_CACHE_MAX_ENTRIES
+from .encoding_cache import EncodingCache
+from .file_index import FileIndex
+from .profiler import span
+from .prompt_compaction import compact_source
+from .utils import count_tokens_estimate
 
 console = Console()
 
@@ -58,19 +75,401 @@ BINARY_EXTENSIONS = ['png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'pdf', 'doc', '
 MAX_FILES_TO_CONSIDER_FOR_PROMPT = 10  
 MAX_CONTENT_LENGTH_PER_FILE = 7000   
 MAX_TOTAL_CONTENT_LENGTH = 60000   
+MAX_FILE_SIZE_BYTES = MAX_CONTENT_LENGTH_PER_FILE * 10 # Archivos más grandes no se consideran
+ENCODING_SAMPLE_BYTES = 10240 # Bytes que se pasan a chardet
+FILE_READ_WORKERS = 8 # Hilos que leen y decodifican candidatos en paralelo
+FILE_READ_LOOKAHEAD = 16 # Lecturas en curso por delante del bucle de selección
+BINARY_ENCODING = 'binary' # "Codificación" de los archivos con bytes NUL
+
+# Marcas BOM (UTF-32 antes que UTF-16: la de UTF-32 LE empieza como la de UTF-16 LE)
+_BOMS = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'),
+         (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+
+# Codificaciones ya detectadas por (ruta, tamaño, mtime)
+encoding_cache = EncodingCache(CACHE_DIR, ENCODING_CACHE_MAX_ENTRIES) if ENABLE_ENCODING_CACHE else None
+
+# Conjuntos de exclusión precompilados (en minúsculas) para el recorrido
+_EXCLUDED_DIR_NAMES = frozenset(d.lower() for d in EXCLUDE_DIRS if '/' not in d)
+_EXCLUDED_REL_PATHS = frozenset(d.lower() for d in EXCLUDE_DIRS if '/' in d)  # p. ej. 'public/mockserviceworker.js'
+_EXCLUDED_EXTENSIONS = frozenset(e.lower() for e in EXCLUDE_EXTENSIONS + BINARY_EXTENSIONS if '.' not in e)
+_EXCLUDED_COMPOUND_SUFFIXES = tuple(f".{e.lower()}" for e in EXCLUDE_EXTENSIONS if '.' in e)  # 'min.js'...
+_ALLOWED_HIDDEN_FILES = frozenset(['.gitignore', '.env', '.dockerignore', '.npmrc', '.yarnrc', '.prettierrc', '.eslintrc.cjs'])
+_ASSET_DIR_NAMES = frozenset(['public', 'assets'])
+_ASSET_ALLOWED_EXTENSIONS = frozenset(['html', 'js', 'css', 'ts', 'tsx', 'jsx'])  # Permitir HTML/JS/CSS en public/assets
+
+def _file_priority(file_name_lower: str, file_ext_lower: str, path_str_lower_for_priority: str) -> int:
+    priority = KEY_FILES_PREFERENCES.get(file_name_lower, KEY_FILES_PREFERENCES.get(file_ext_lower, 99))
+
+    if path_str_lower_for_priority.startswith(("frontend/src/pages/", "src/pages/")):
+        priority = max(1, priority - 3) # Mayor prioridad
+    elif path_str_lower_for_priority.startswith(("frontend/src/components/", "src/components/", "frontend/src/layouts/", "src/layouts/")):
+        priority = max(1, priority - 2) 
+    elif path_str_lower_for_priority.startswith(("frontend/src/core/", "src/core/", "frontend/src/lib/", "src/lib/", "frontend/src/hooks/", "src/hooks/")):
+        priority = max(1, priority - 1)
+    elif path_str_lower_for_priority.startswith(("backend/", "server/", "api/")): # Rutas comunes de backend
+         priority = max(1, priority - 2) 
+    elif file_name_lower in ("app.tsx", "app.jsx", "main.tsx", "main.jsx", "_app.tsx", "_app.jsx", "index.ts", "index.js"): # Archivos raíz de frontend
+        if path_str_lower_for_priority.startswith(("frontend/src/", "src/")):
+            priority = max(1, priority-1)
+    return priority
+
+def _filter_file(name: str, rel_path: str, in_assets: bool) -> Optional[Tuple[str, str, str]]:
+    """
+    Filtros por nombre de un archivo (extensión, ocultos, assets, rutas excluidas).
+
+    Returns:
+        (nombre, extensión, ruta relativa) en minúsculas para `_file_priority`,
+        o None si el archivo queda excluido
+    """
+    name_lower = name.lower()
+    dot = name_lower.rfind('.')
+    file_ext_lower = name_lower[dot + 1:] if dot > 0 else ''
+    if file_ext_lower in _EXCLUDED_EXTENSIONS or name_lower.endswith(_EXCLUDED_COMPOUND_SUFFIXES):
+        return None
+    # Excluir archivos ocultos más genéricamente, pero permitir algunos conocidos
+    if name.startswith('.') and name_lower not in _ALLOWED_HIDDEN_FILES:
+        return None
+    # También excluir archivos de assets que pueden estar en `public` o `assets`
+    if in_assets and file_ext_lower not in _ASSET_ALLOWED_EXTENSIONS:
+        return None
+    rel_path_lower = rel_path.lower()
+    if rel_path_lower in _EXCLUDED_REL_PATHS:
+        return None
+    return name_lower, file_ext_lower, rel_path_lower
+
+def _scan_directory(dir_path: str, rel_dir: str, in_assets: bool) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str, bool]]]:
+    """
+    Lista un directorio (sin recursión) aplicando los filtros del analizador
+    por nombre. El filtro de tamaño se aplica después (al recorrer, al pedir
+    candidatos al índice y al leer): así el índice guarda también los archivos
+    vacíos o demasiado grandes y los recupera si cambian sin tocar su directorio.
+
+    Args:
+        dir_path: Ruta absoluta del directorio
+        rel_dir: Ruta relativa a la raíz del repositorio, con '/' ("" para la raíz)
+        in_assets: Si el directorio está dentro de `public/` o `assets/`
+
+    Returns:
+        Tupla (candidatos `{"path_obj", "path_str", "priority", "size", "mtime_ns"}`,
+        subdirectorios a recorrer `(ruta absoluta, ruta relativa, in_assets)`)
+    """
+    files: List[Dict[str, Any]] = []
+    subdirs: List[Tuple[str, str, bool]] = []
+    try:
+        with os.scandir(dir_path) as it:
+            listed = list(it)
+    except OSError:
+        return files, subdirs
+    rel_prefix = f"{rel_dir}/" if rel_dir else ""
+    for entry in listed:
+        name = entry.name
+        name_lower = name.lower()
+        rel_path = rel_prefix + name
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if name_lower not in _EXCLUDED_DIR_NAMES and rel_path.lower() not in _EXCLUDED_REL_PATHS:
+                    subdirs.append((entry.path, rel_path, in_assets or name_lower in _ASSET_DIR_NAMES))
+                continue
+            if not entry.is_file():
+                continue
+        except OSError:
+            continue
+
+        filtered = _filter_file(name, rel_path, in_assets)
+        if filtered is None:
+            continue
+        try:
+            stat_result = entry.stat()
+        except OSError:
+            continue
+        files.append({
+            "path_obj": Path(entry.path), 
+            "path_str": rel_path,
+            "priority": _file_priority(*filtered), 
+            "size": stat_result.st_size,
+            "mtime_ns": stat_result.st_mtime_ns
+        })
+    return files, subdirs
+
+def _scan_root(path_to_scan: Path, repo_root_path: Path) -> Optional[Tuple[str, bool]]:
+    """
+    Ruta relativa (con '/') e `in_assets` de `path_to_scan`, o None si está
+    dentro de un directorio excluido (p. ej. node_modules) y no hay nada que analizar.
+    """
+    try:
+        parts = path_to_scan.relative_to(repo_root_path).parts
+    except ValueError: # path_to_scan fuera de la raíz (p. ej. un enlace simbólico)
+        parts = ()
+    lowered = [part.lower() for part in parts]
+    if any(part in _EXCLUDED_DIR_NAMES for part in lowered):
+        return None
+    return "/".join(parts), any(part in _ASSET_DIR_NAMES for part in lowered)
+
+def _scan_candidate_files(path_to_scan: Path, repo_root_path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre `path_to_scan` con `os.scandir` y produce los archivos candidatos.
+
+    Los directorios excluidos se podan antes de descender en ellos (no se
+    recorre ningún `node_modules` ni `.git`), los filtros usan conjuntos
+    precompilados y solo se hace `stat` de los archivos que pasan los filtros
+    por nombre. Los enlaces simbólicos a directorios no se siguen.
+
+    Args:
+        path_to_scan: Directorio a recorrer
+        repo_root_path: Raíz del repositorio (rutas y exclusiones relativas a ella)
+
+    Returns:
+        Iterador de `{"path_obj", "path_str", "priority", "size", "mtime_ns"}`
+    """
+    scan_root = _scan_root(path_to_scan, repo_root_path)
+    if scan_root is None:
+        return
+    # (ruta absoluta, ruta relativa a la raíz con '/', ¿dentro de public/ o assets/?)
+    pending: List[Tuple[str, str, bool]] = [(str(path_to_scan), scan_root[0], scan_root[1])]
+    while pending:
+        files, subdirs = _scan_directory(*pending.pop())
+        yield from (f for f in files if 0 < f["size"] <= MAX_FILE_SIZE_BYTES)
+        pending.extend(subdirs)
+
+def _git_candidate_files(path_to_scan: Path, repo_root_path: Path) -> Optional[List[Dict[str, Any]]]:
+    """
+    Archivos candidatos según Git: los versionados salen de las entradas del
+    índice del repositorio (con el tamaño y el mtime que guarda) sin recorrer
+    el árbol, y los no versionados que `.gitignore` no ignora, de
+    `git ls-files --others` con un `stat` por archivo. Sobre ambos se aplican además los filtros del
+    analizador (p. ej. un `node_modules` versionado sigue excluido).
+
+    Args:
+        path_to_scan: Directorio a analizar
+        repo_root_path: Raíz del repositorio
+
+    Returns:
+        Candidatos como los de `_scan_candidate_files`, o None si el
+        repositorio no es un árbol de trabajo Git o git no está disponible
+    """
+    if not git_ops.is_git_work_tree(repo_root_path):
+        return None
+    scan_root = _scan_root(path_to_scan, repo_root_path)
+    if scan_root is None:
+        return []
+    sub_path = scan_root[0]
+    # Directorio -> None si está excluido; si no, si está dentro de public/ o assets/
+    dir_states: Dict[str, Optional[bool]] = {"": False}
+
+    def dir_state(rel_dir: str) -> Optional[bool]:
+        if rel_dir in dir_states:
+            return dir_states[rel_dir]
+        parent, _, name = rel_dir.rpartition('/')
+        parent_state = dir_state(parent)
+        name_lower = name.lower()
+        if parent_state is None or name_lower in _EXCLUDED_DIR_NAMES or rel_dir.lower() in _EXCLUDED_REL_PATHS:
+            state = None
+        else:
+            state = parent_state or name_lower in _ASSET_DIR_NAMES
+        dir_states[rel_dir] = state
+        return state
+
+    def candidate(rel_path: str, size: int, mtime_ns: int) -> Optional[Dict[str, Any]]:
+        rel_dir, _, name = rel_path.rpartition('/')
+        in_assets = dir_state(rel_dir)
+        if in_assets is None or not 0 < size <= MAX_FILE_SIZE_BYTES:
+            return None
+        filtered = _filter_file(name, rel_path, in_assets)
+        if filtered is None:
+            return None
+        return {"path_obj": repo_root_path / rel_path, "path_str": rel_path, "priority": _file_priority(*filtered),
+                "size": size, "mtime_ns": mtime_ns}
+
+    def stat_candidate(rel_path: str) -> Optional[Dict[str, Any]]:
+        if dir_state(rel_path.rpartition('/')[0]) is None:
+            return None
+        try:
+            stat_result = os.stat(repo_root_path / rel_path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(stat_result.st_mode):
+            return None
+        return candidate(rel_path, stat_result.st_size, stat_result.st_mtime_ns)
+
+    files: List[Dict[str, Any]] = []
+    try:
+        for rel_path, size, mtime_ns in git_ops.iter_tracked_files(repo_root_path, sub_path):
+            # Tamaño 0 en el índice: archivo vacío, en conflicto, o entrada sin datos de
+            # `stat` (p. ej. añadida con GitPython); se comprueba en disco
+            file_info = candidate(rel_path, size, mtime_ns) if size else stat_candidate(rel_path)
+            if file_info is not None:
+                files.append(file_info)
+        for rel_path in git_ops.iter_untracked_files(repo_root_path, sub_path):
+            file_info = stat_candidate(rel_path)
+            if file_info is not None:
+                files.append(file_info)
+    except (git.GitError, OSError, ValueError) as e:
+        console.print(f"[yellow]No se pudo listar los archivos con git ({e}); se recorrerá el repositorio.[/yellow]")
+        return None
+    return files
+
+def _detect_encoding_from_bytes(raw_data: bytes, complete: bool = True) -> str:
+    """
+    Codificación de un archivo a partir de sus primeros bytes.
+
+    Casi todo es UTF-8 o ASCII: se prueba primero la marca BOM y una
+    decodificación UTF-8 estricta, y solo si fallan se recurre a `chardet`.
+
+    Args:
+        raw_data: Bytes leídos del archivo
+        complete: Si `raw_data` es el archivo entero (si no, puede terminar a
+            mitad de un carácter multibyte)
+
+    Returns:
+        Nombre de la codificación, o BINARY_ENCODING si hay bytes NUL
+    """
+    if not raw_data: # Archivo vacío
+        return 'utf-8'
+    for bom, encoding in _BOMS:
+        if raw_data.startswith(bom):
+            return encoding
+    sample = raw_data[:ENCODING_SAMPLE_BYTES]
+    if b'\x00' in sample:
+        return BINARY_ENCODING
+    try:
+        codecs.getincrementaldecoder('utf-8')('strict').decode(raw_data, final=complete)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    result = chardet.detect(sample)
+    return result['encoding'] if result and result['encoding'] and result.get('confidence', 0) > 0.5 else 'utf-8'
 
 def _detect_encoding(file_path: Path) -> str:
     try:
         with open(file_path, 'rb') as f:
-            raw_data = f.read(10240) 
-            if not raw_data: # Archivo vacío
-                return 'utf-8'
-            result = chardet.detect(raw_data)
-            return result['encoding'] if result and result['encoding'] and result.get('confidence', 0) > 0.5 else 'utf-8'
+            raw_data = f.read(ENCODING_SAMPLE_BYTES)
+        encoding = _detect_encoding_from_bytes(raw_data, complete=len(raw_data) < ENCODING_SAMPLE_BYTES)
+        return 'utf-8' if encoding == BINARY_ENCODING else encoding
     except Exception:
         return 'utf-8' 
 
-def get_project_files_for_analysis(path_to_scan: Path, repo_root_path: Path) -> List[Dict[str, str]]:
+def _read_candidate(file_info: Dict[str, Any]) -> str:
+    """
+    Lee un archivo candidato una sola vez: detecta la codificación sobre los
+    bytes ya leídos (o la toma del índice o de `encoding_cache`) y los
+    decodifica, con saltos de línea universales como `open`.
+
+    Actualiza `file_info` con lo observado: tamaño y mtime actuales (si el
+    archivo cambió desde el escaneo o la indexación, se descarta lo que se
+    sabía de él), `encoding`, `content_hash` y `excluded` si ya no existe o
+    no es un archivo regular. Si ya no pasa el filtro de tamaño no se lee.
+
+    Args:
+        file_info: Candidato de `_scan_candidate_files` o de `FileIndex.candidates`
+
+    Returns:
+        Contenido completo decodificado ("" si el archivo es binario, no pasa el filtro de tamaño o quedó excluido)
+    """
+    path = file_info["path_obj"]
+    try:
+        with span("lectura de archivos"):
+            stat_result = os.stat(path)
+    except FileNotFoundError: # Borrado desde el escaneo (o versionado pero ya no en disco)
+        file_info["excluded"] = True
+        return ''
+    if not stat.S_ISREG(stat_result.st_mode):
+        file_info["excluded"] = True
+        return ''
+    if (stat_result.st_size, stat_result.st_mtime_ns) != (file_info["size"], file_info["mtime_ns"]):
+        file_info.update(size=stat_result.st_size, mtime_ns=stat_result.st_mtime_ns,
+                         encoding=None, content_hash=None, tokens=None)
+    if not 0 < file_info["size"] <= MAX_FILE_SIZE_BYTES:
+        # Sigue indexado con su tamaño actual: vuelve a ser candidato si cambia
+        return ''
+    key = (str(path), file_info["size"], file_info["mtime_ns"])
+    cached_encoding = file_info.get("encoding")
+    if cached_encoding is None and encoding_cache is not None:
+        cached_encoding = encoding_cache.get(key)
+    if cached_encoding == BINARY_ENCODING:
+        file_info["encoding"] = BINARY_ENCODING
+        return ''
+    with span("lectura de archivos"), open(path, 'rb') as f:
+        # El filtro de tamaño acota la lectura: el archivo entero salvo que haya crecido
+        raw_data = f.read(MAX_FILE_SIZE_BYTES + 1)
+    encoding = cached_encoding
+    if encoding is None:
+        with span("detección de codificación"):
+            encoding = _detect_encoding_from_bytes(raw_data, complete=len(raw_data) <= MAX_FILE_SIZE_BYTES)
+        if encoding_cache is not None:
+            encoding_cache.put(key, encoding)
+    file_info["encoding"] = encoding
+    file_info["content_hash"] = hashlib.sha256(raw_data).hexdigest()
+    if encoding == BINARY_ENCODING:
+        return ''
+    text = raw_data.decode(encoding, errors='replace')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+def _read_candidates_ahead(candidates: Iterable[Dict[str, Any]],
+                           executor: ThreadPoolExecutor
+                           ) -> Generator[Tuple[Dict[str, Any], "Future[str]"], None, None]:
+    """
+    Lee los candidatos en el pool con hasta FILE_READ_LOOKAHEAD lecturas por
+    delante del consumidor, y los entrega en el mismo orden (el de prioridad).
+
+    Al cerrar el generador (el bucle de selección alcanzó un límite) se
+    cancelan las lecturas que aún no empezaron.
+    """
+    pending: Deque[Tuple[Dict[str, Any], "Future[str]"]] = deque()
+    remaining = iter(candidates)
+    try:
+        for file_info in itertools.islice(remaining, FILE_READ_LOOKAHEAD):
+            pending.append((file_info, executor.submit(_read_candidate, file_info)))
+        while pending:
+            yield pending.popleft()
+            for file_info in itertools.islice(remaining, 1):
+                pending.append((file_info, executor.submit(_read_candidate, file_info)))
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+def refresh_file_index(file_index: FileIndex, full: bool = False) -> Dict[str, int]:
+    """
+    Pone al día el índice de archivos de un repositorio con los filtros del analizador.
+
+    Args:
+        file_index: Índice del repositorio
+        full: Reconstruirlo recorriendo el repositorio entero
+
+    Returns:
+        Contadores de `FileIndex.update`
+    """
+    return file_index.update(_scan_directory, full=full, max_size=MAX_FILE_SIZE_BYTES)
+
+def get_project_files_for_analysis(path_to_scan: Path, repo_root_path: Path, compact: bool = False,
+                                   drop_comments: bool = False, max_literal: int = 200,
+                                   token_counter: Optional[Callable[[str], int]] = None,
+                                   file_index: Optional[FileIndex] = None,
+                                   use_git: bool = False) -> List[Dict[str, Any]]:
+    """
+    Selecciona y lee los archivos más relevantes de un repositorio para el prompt.
+
+    Args:
+        path_to_scan: Directorio a escanear
+        repo_root_path: Raíz del repositorio (las rutas se devuelven relativas a ella)
+        compact: Compactar cada archivo (licencias, espacios, literales largos)
+            antes de aplicar los límites de contenido
+        drop_comments: Con `compact`, quitar también comentarios y docstrings
+        max_literal: Con `compact`, longitud a partir de la cual se recortan literales
+        token_counter: Función para contar tokens (informe de compactación e
+            índice); por defecto, la estimación de `utils`
+        file_index: Índice persistente del repositorio: se actualiza de forma
+            incremental y los candidatos salen de él en lugar de recorrer el árbol
+        use_git: En un repositorio Git, tomar los candidatos de su índice y de
+            los archivos no ignorados (respeta `.gitignore`); tiene precedencia
+            sobre `file_index`, y si git falla se usa el índice o el recorrido
+
+    Returns:
+        Lista de `{"path", "content"}`; con `compact`, cada elemento incluye
+        además `"compaction": {"before", "after"}` con los tokens del archivo
+        antes y después de compactarlo
+    """
     if not path_to_scan or not path_to_scan.is_dir():
         console.print(f"[bold red]Error: La ruta a escanear '{path_to_scan}' no es válida.[/bold red]")
         return []
@@ -78,82 +477,73 @@ def get_project_files_for_analysis(path_to_scan: Path, repo_root_path: Path) ->
     display_scan_path = path_to_scan.relative_to(repo_root_path) if path_to_scan != repo_root_path else repo_root_path.name
     console.print(f"\n[dim]Escaneando archivos en [cyan]{display_scan_path}[/cyan] para análisis (relativo a la raíz del repo)...[/dim]")
     
-    potential_files: List[Dict[str, Any]] = []
-    for item in path_to_scan.rglob('*'):
-        # Comprobar si alguna parte de la ruta absoluta contiene directorios excluidos
-        # Esto es para evitar descender en directorios como node_modules incluso si el path_to_scan está dentro de uno.
-        # La comprobación original también es útil si path_to_scan es la raíz.
-        try:
-            # relative_to_root_for_exclusion_check = item.absolute().relative_to(repo_root_path.absolute())
-            # if any(excluded_dir.lower() in part.lower() for part in relative_to_root_for_exclusion_check.parts for excluded_dir in EXCLUDE_DIRS):
-            #     continue
-            # Simplificando la comprobación de exclusión de directorios:
-            is_excluded_dir = False
-            for part in item.parts:
-                if part.lower() in [d.lower() for d in EXCLUDE_DIRS]:
-                    is_excluded_dir = True
-                    break
-            if is_excluded_dir:
-                continue
-
-        except ValueError: # item podría no estar dentro de repo_root_path si path_to_scan es un enlace simbólico fuera.
-            pass # Continuar con la siguiente comprobación si esto falla.
-
-        if item.is_file():
-            relative_path_from_repo_root = item.relative_to(repo_root_path) # Siempre relativo a la raíz
-            
-            file_name_lower = item.name.lower()
-            file_ext_lower = item.suffix.lower().lstrip('.')
+    git_files: Optional[List[Dict[str, Any]]] = None
+    if use_git:
+        with span("escaneo de archivos"):
+            git_files = _git_candidate_files(path_to_scan, repo_root_path)
+        if git_files is not None:
+            file_index = None
 
-            if file_ext_lower in EXCLUDE_EXTENSIONS or file_ext_lower in BINARY_EXTENSIONS:
-                continue
-            # Excluir archivos ocultos más genéricamente, pero permitir algunos conocidos
-            # También excluir archivos de assets que pueden estar en `public` o `assets`
-            if item.name.startswith('.') and item.name.lower() not in ['.gitignore', '.env', '.dockerignore', '.npmrc', '.yarnrc', '.prettierrc', '.eslintrc.cjs']:
-                continue
-            if "public" in [p.lower() for p in relative_path_from_repo_root.parts[:-1]] or \
-               "assets" in [p.lower() for p in relative_path_from_repo_root.parts[:-1]]:
-                if file_ext_lower not in ['html', 'js', 'css', 'ts', 'tsx', 'jsx']: # Permitir HTML/JS/CSS en public/assets
-                    continue
+    if file_index is not None:
+        try:
+            with span("actualización del índice"):
+                refresh_file_index(file_index)
+        except (sqlite3.Error, OSError) as e:
+            console.print(f"[yellow]No se pudo usar el índice de archivos ({e}); se recorrerá el repositorio.[/yellow]")
+            file_index = None
 
+    candidates: Iterable[Dict[str, Any]]
+    if git_files is not None:
+        git_files.sort(key=lambda x: (x["priority"], x["size"], x["path_str"]))
+        candidates = git_files
+    elif file_index is not None:
+        scan_root = _scan_root(path_to_scan, repo_root_path)
+        # Ya ordenados por (prioridad, tamaño, ruta) y leídos por páginas según se consumen
+        candidates = file_index.candidates(scan_root[0], max_size=MAX_FILE_SIZE_BYTES) if scan_root is not None else []
+    else:
+        potential_files: List[Dict[str, Any]] = []
+        with span("escaneo de archivos"):
+            potential_files.extend(_scan_candidate_files(path_to_scan, repo_root_path))
+        # La ruta desempata: el orden no depende del orden de listado del sistema de archivos
+        potential_files.sort(key=lambda x: (x["priority"], x["size"], x["path_str"]))
+        candidates = potential_files
 
-            priority = KEY_FILES_PREFERENCES.get(file_name_lower, KEY_FILES_PREFERENCES.get(file_ext_lower, 99))
-            
-            path_str_lower_for_priority = str(relative_path_from_repo_root).lower().replace('\\', '/')
-            
-            if path_str_lower_for_priority.startswith(("frontend/src/pages/", "src/pages/")):
-                priority = max(1, priority - 3) # Mayor prioridad
-            elif path_str_lower_for_priority.startswith(("frontend/src/components/", "src/components/", "frontend/src/layouts/", "src/layouts/")):
-                priority = max(1, priority - 2) 
-            elif path_str_lower_for_priority.startswith(("frontend/src/core/", "src/core/", "frontend/src/lib/", "src/lib/", "frontend/src/hooks/", "src/hooks/")):
-                priority = max(1, priority - 1)
-            elif path_str_lower_for_priority.startswith(("backend/", "server/", "api/")): # Rutas comunes de backend
-                 priority = max(1, priority - 2) 
-            elif file_name_lower in ("app.tsx", "app.jsx", "main.tsx", "main.jsx", "_app.tsx", "_app.jsx", "index.ts", "index.js"): # Archivos raíz de frontend
-                if path_str_lower_for_priority.startswith(("frontend/src/", "src/")):
-                    priority = max(1, priority-1)
-
-
-            try:
-                file_size = item.stat().st_size
-                if file_size == 0 or file_size > (MAX_CONTENT_LENGTH_PER_FILE * 10): 
-                    continue
-                potential_files.append({
-                    "path_obj": item, 
-                    "path_str": str(relative_path_from_repo_root).replace('\\', '/'),
-                    "priority": priority, 
-                    "size": file_size
-                })
-            except OSError:
-                continue 
+    count_tokens = token_counter or count_tokens_estimate
+    selected_files_content: List[Dict[str, Any]] = []
+    read_files: List[Dict[str, Any]] = []
 
-    potential_files.sort(key=lambda x: (x["priority"], x["size"]))
+    with ThreadPoolExecutor(max_workers=FILE_READ_WORKERS, thread_name_prefix="analyzer-read") as executor:
+        reads = _read_candidates_ahead(candidates, executor)
+        try:
+            _select_files(reads, selected_files_content, read_files, compact, drop_comments, max_literal,
+                          count_tokens if compact or file_index is not None else None)
+        finally:
+            reads.close()
+    if encoding_cache is not None:
+        encoding_cache.flush()
+    if file_index is not None:
+        try:
+            file_index.record_reads(read_files)
+        except sqlite3.Error as e:
+            console.print(f"[yellow]No se pudo actualizar el índice de archivos: {e}[/yellow]")
+    
+    if not selected_files_content:
+        console.print("[yellow]No se seleccionaron archivos para el análisis.[/yellow]")
+    
+    return selected_files_content
 
-    selected_files_content: List[Dict[str, str]] = []
+def _select_files(reads: Iterator[Tuple[Dict[str, Any], "Future[str]"]], selected_files_content: List[Dict[str, Any]],
+                  read_files: List[Dict[str, Any]], compact: bool, drop_comments: bool, max_literal: int,
+                  count_tokens: Optional[Callable[[str], int]]) -> None:
+    """
+    Bucle de selección: recorre las lecturas en orden de prioridad hasta agotar
+    los límites, y deja en `read_files` los candidatos leídos (con sus tokens
+    estimados si se indica `count_tokens`).
+    """
     current_total_length = 0
     files_added_count = 0
 
-    for file_info in potential_files:
+    for file_info, read in reads:
         if files_added_count >= MAX_FILES_TO_CONSIDER_FOR_PROMPT:
             console.print(f"[yellow]Límite de {MAX_FILES_TO_CONSIDER_FOR_PROMPT} archivos para prompt alcanzado.[/yellow]")
             break
@@ -162,19 +552,34 @@ def get_project_files_for_analysis(path_to_scan: Path, repo_root_path: Path) ->
             break
 
         try:
-            encoding = _detect_encoding(file_info["path_obj"])
-            with open(file_info["path_obj"], 'r', encoding=encoding, errors='replace') as f:
-                content = f.read(MAX_CONTENT_LENGTH_PER_FILE)
+            with span("espera de lectura"):
+                content = read.result()
+            read_files.append(file_info)
+            if content and count_tokens is not None and file_info.get("tokens") is None:
+                file_info["tokens"] = count_tokens(content)
             
             if len(content) == 0 and file_info["size"] > 0 : 
                 # console.print(f"  [yellow]~[/yellow] Omitiendo [dim]{file_info['path_str']}[/dim] (no se pudo leer como texto o está vacío después de leer).")
                 continue
 
+            compaction = None
+            if compact:
+                assert count_tokens is not None  # se indica siempre que se compacta
+                with span("compactación"):
+                    compacted = compact_source(content, file_info["path_str"], drop_comments=drop_comments,
+                                               max_literal=max_literal)
+                    compaction = {"before": file_info["tokens"], "after": count_tokens(compacted)}
+                content = compacted
+            content = content[:MAX_CONTENT_LENGTH_PER_FILE]
+
             if current_total_length + len(content) <= MAX_TOTAL_CONTENT_LENGTH:
-                selected_files_content.append({
+                selected_file: Dict[str, Any] = {
                     "path": file_info["path_str"],
                     "content": content
-                })
+                }
+                if compaction is not None:
+                    selected_file["compaction"] = compaction
+                selected_files_content.append(selected_file)
                 current_total_length += len(content)
                 files_added_count += 1
                 console.print(f"  [green]✓[/green] Incluyendo [dim]{file_info['path_str']}[/dim] (prioridad: {file_info['priority']}, tamaño: {file_info['size'] // 1024}KB, {len(content)} chars)")
@@ -183,8 +588,3 @@ def get_project_files_for_analysis(path_to_scan: Path, repo_root_path: Path) ->
                 continue 
         except Exception as e:
             console.print(f"  [red]✗[/red] No se pudo leer o procesar [dim]{file_info['path_str']}[/dim]: {e}")
-    
-    if not selected_files_content:
-        console.print("[yellow]No se seleccionaron archivos para el análisis.[/yellow]")
-    
-    return selected_files_content
\ No newline at end of file
@@ -0,0 +1,302 @@
+# hooperits_agent/prompt_compaction.py
+"""
+Compactación del contenido de archivos antes de enviarlo en un prompt.
+
+El texto resultante solo lo lee el modelo, no se ejecuta: se prioriza ahorrar
+tokens conservando lo que explica el código. Siempre se quitan las cabeceras
+de licencia, los espacios al final de línea y las líneas en blanco repetidas;
+opcionalmente, los comentarios (y docstrings en Python) y se acortan los
+literales de texto y las líneas de datos muy largas.
+
+El tratamiento depende del lenguaje, deducido de la extensión: Python se
+procesa con `tokenize`; los lenguajes con sintaxis de C (`//`, `/* */`) y CSS
+con un recorrido que respeta las cadenas; los de comentarios con `#` y el
+marcado (`<!-- -->`) por líneas.
+"""
+import io
+import re
+import tokenize
+from pathlib import PurePosixPath
+from typing import List, Optional, Tuple
+
+# Frases que delatan una cabecera de licencia al principio del archivo. "license" o
+# "licencia" a secas no bastan: aparecen en comentarios y docstrings que explican el código
+LICENSE_MARKERS = (
+    "copyright", "spdx-license-identifier", "all rights reserved", "permission is hereby granted",
+    "todos los derechos reservados", "gnu general public license",
+)
+
+_C_LIKE_EXTENSIONS = {
+    "js", "jsx", "mjs", "cjs", "ts", "tsx", "java", "go", "c", "h", "cc", "cpp", "hpp", "cs",
+    "swift", "kt", "kts", "rs", "scala", "php", "dart", "jsonc",
+}
+_CSS_EXTENSIONS = {"css", "scss", "less", "pcss"}
+_HASH_EXTENSIONS = {
+    "rb", "sh", "bash", "zsh", "yml", "yaml", "toml", "r", "pl", "cfg", "conf", "ini", "env", "tf",
+}
+_HASH_FILENAMES = {"dockerfile", "makefile", ".env", ".env.example", ".gitignore", ".dockerignore",
+                   "requirements.txt"}
+_MARKUP_EXTENSIONS = {"html", "htm", "xml", "vue", "svelte"}
+
+# Sin literales que acortar, las líneas de datos (minificados, base64...) se cortan aquí
+_MAX_LINE_FACTOR = 2
+_MIN_MAX_LINE_LENGTH = 300
+
+_C_LIKE_SCAN = re.compile(r"""["'`/]""")
+_CSS_SCAN = re.compile(r"""["'/]""")
+_HTML_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+_PY_STRING_PREFIX = re.compile(r"^[rRbBuUfF]*")
+
+
+def detect_language(path: str) -> str:
+    """
+    Familia de sintaxis de un archivo.
+
+    Args:
+        path: Ruta o nombre del archivo
+
+    Returns:
+        'python', 'c', 'css', 'hash', 'markup' o 'text'
+    """
+    name = PurePosixPath(path.replace("\\", "/")).name.lower()
+    extension = name.rsplit(".", 1)[-1] if "." in name.lstrip(".") else ""
+    if extension in ("py", "pyi"):
+        return "python"
+    if extension in _C_LIKE_EXTENSIONS:
+        return "c"
+    if extension in _CSS_EXTENSIONS:
+        return "css"
+    if extension in _HASH_EXTENSIONS or name in _HASH_FILENAMES:
+        return "hash"
+    if extension in _MARKUP_EXTENSIONS:
+        return "markup"
+    return "text"
+
+
+def _shorten_literal(literal: str, max_literal: int, closing: str) -> str:
+    """Recorta un literal largo conservando su inicio y su cierre."""
+    if not max_literal or len(literal) <= max_literal:
+        return literal
+    keep = max(max_literal // 2, 1)
+    return f"{literal[:keep]}…(+{len(literal) - keep} caracteres){closing}"
+
+
+def _is_license_block(block: str) -> bool:
+    lowered = block.lower()
+    return any(marker in lowered for marker in LICENSE_MARKERS)
+
+
+def _strip_license_header(text: str, language: str) -> str:
+    """Quita el primer bloque de comentarios del archivo si es una licencia."""
+    lines = text.split("\n")
+    start = 0
+    # Shebang, línea de codificación y líneas en blanco iniciales se conservan
+    while start < len(lines) and (not lines[start].strip() or (start == 0 and lines[0].startswith("#!"))
+                                  or re.match(r"^#.*coding[:=]", lines[start])):
+        start += 1
+    if start >= len(lines):
+        return text
+    first = lines[start].lstrip()
+    end = start
+    if language in ("python", "hash") and first.startswith("#"):
+        while end < len(lines) and lines[end].lstrip().startswith("#"):
+            end += 1
+    elif language == "c" and first.startswith("//"):
+        while end < len(lines) and lines[end].lstrip().startswith("//"):
+            end += 1
+    elif language in ("c", "css") and first.startswith("/*"):
+        while end < len(lines) and "*/" not in lines[end]:
+            end += 1
+        end += 1
+    elif language == "markup" and first.startswith("<!--"):
+        while end < len(lines) and "-->" not in lines[end]:
+            end += 1
+        end += 1
+    elif language == "python" and first.startswith(('"""', "'''")):
+        quote = first[:3]
+        end = start + 1
+        if quote not in first[3:]:
+            # El cierre está en una línea posterior
+            while end < len(lines) and quote not in lines[end]:
+                end += 1
+            end += 1
+    else:
+        return text
+    end = min(end, len(lines))
+    if end == start or not _is_license_block("\n".join(lines[start:end])):
+        return text
+    return "\n".join(lines[:start] + lines[end:])
+
+
+def _next_significant(tokens: List[tokenize.TokenInfo], start: int) -> Optional[int]:
+    """Índice del siguiente token que no es comentario ni salto de línea sin significado."""
+    for index in range(start, len(tokens)):
+        if tokens[index].type not in (tokenize.COMMENT, tokenize.NL):
+            return index
+    return None
+
+
+def _compact_python(text: str, drop_comments: bool, max_literal: int) -> Optional[str]:
+    """Comentarios, docstrings y literales de Python con `tokenize` (None si no se puede tokenizar)."""
+    line_offsets = [0]
+    for line in text.splitlines(True):
+        line_offsets.append(line_offsets[-1] + len(line))
+
+    def offset(position: Tuple[int, int]) -> int:
+        return line_offsets[position[0] - 1] + position[1]
+
+    edits: List[Tuple[int, int, str]] = []
+    previous_type = tokenize.NEWLINE
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO(text).readline))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return None
+    for index, token in enumerate(tokens):
+        if token.type == tokenize.COMMENT:
+            if drop_comments and not token.string.startswith("#!"):
+                edits.append((offset(token.start), offset(token.end), ""))
+        elif token.type == tokenize.STRING:
+            following_index = _next_significant(tokens, index + 1)
+            following = tokens[following_index] if following_index is not None else None
+            is_docstring = (previous_type in (tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT, tokenize.ENCODING)
+                            and (following is None or following.type in (tokenize.NEWLINE, tokenize.ENDMARKER)))
+            if drop_comments and is_docstring:
+                # Un cuerpo que solo tenía el docstring se queda con `...` para seguir siendo válido
+                after_index = _next_significant(tokens, following_index + 1) if following_index is not None else None
+                after = tokens[after_index] if after_index is not None else None
+                sole_body = previous_type == tokenize.INDENT and (after is None or after.type == tokenize.DEDENT)
+                edits.append((offset(token.start), offset(token.end), "..." if sole_body else ""))
+            elif max_literal and len(token.string) > max_literal:
+                prefix_match = _PY_STRING_PREFIX.match(token.string)
+                prefix = prefix_match.group(0) if prefix_match else ""
+                if "f" not in prefix.lower():  # las f-strings contienen código: se dejan enteras
+                    body = token.string[len(prefix):]
+                    closing = body[:3] if body[:3] in ('"""', "'''") else body[:1]
+                    edits.append((offset(token.start), offset(token.end),
+                                  _shorten_literal(token.string, max_literal, closing)))
+        if token.type not in (tokenize.COMMENT, tokenize.NL):
+            previous_type = token.type
+
+    parts: List[str] = []
+    position = 0
+    for start, end, replacement in edits:
+        parts.append(text[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(text[position:])
+    return "".join(parts)
+
+
+def _compact_c_like(text: str, drop_comments: bool, max_literal: int, line_comments: bool) -> str:
+    """Comentarios y literales de lenguajes con sintaxis de C (o CSS, sin comentarios `//`)."""
+    scan = _C_LIKE_SCAN if line_comments else _CSS_SCAN
+    parts: List[str] = []
+    position = 0
+    length = len(text)
+    while True:
+        match = scan.search(text, position)
+        if match is None:
+            parts.append(text[position:])
+            break
+        index = match.start()
+        parts.append(text[position:index])
+        char = text[index]
+        if char in "\"'`":
+            end = index + 1
+            while end < length:
+                current = text[end]
+                if current == "\\":
+                    end += 2
+                    continue
+                if current == char:
+                    end += 1
+                    break
+                if current == "\n" and char != "`":
+                    break  # literal sin cerrar (o apóstrofo, p. ej. lifetimes de Rust)
+                end += 1
+            literal = text[index:min(end, length)]
+            closing = char if literal.endswith(char) and len(literal) > 1 else ""
+            parts.append(_shorten_literal(literal, max_literal, closing))
+            position = min(end, length)
+        elif text.startswith("/*", index):
+            end = text.find("*/", index + 2)
+            end = length if end == -1 else end + 2
+            if not drop_comments:
+                parts.append(text[index:end])
+            position = end
+        elif line_comments and text.startswith("//", index):
+            end = text.find("\n", index)
+            end = length if end == -1 else end
+            if not drop_comments:
+                parts.append(text[index:end])
+            position = end
+        else:
+            parts.append(char)
+            position = index + 1
+    return "".join(parts)
+
+
+def _drop_hash_comments(text: str) -> str:
+    """Quita las líneas que solo tienen un comentario `#` (los comentarios en línea se conservan)."""
+    return "\n".join(line for line in text.split("\n")
+                     if not line.lstrip().startswith("#") or line.startswith("#!"))
+
+
+def _normalize_whitespace(text: str, max_line_length: int) -> str:
+    """Quita espacios finales, deja como mucho una línea en blanco seguida y corta líneas enormes."""
+    lines: List[str] = []
+    blank = False
+    for line in text.split("\n"):
+        line = line.rstrip()
+        if not line:
+            if blank or not lines:
+                continue
+            blank = True
+        else:
+            blank = False
+            if max_line_length and len(line) > max_line_length:
+                line = f"{line[:max_line_length]}…(línea recortada, {len(line)} caracteres)"
+        lines.append(line)
+    while lines and not lines[-1]:
+        lines.pop()
+    return "\n".join(lines)
+
+
+def compact_source(text: str, path: str, drop_comments: bool = False, max_literal: int = 200) -> str:
+    """
+    Compacta el contenido de un archivo para un prompt.
+
+    Args:
+        text: Contenido del archivo
+        path: Ruta del archivo (para deducir el lenguaje)
+        drop_comments: Quitar también comentarios y docstrings
+        max_literal: Longitud a partir de la cual se recortan literales de
+            texto (y, al doble, las líneas); 0 los deja intactos
+
+    Returns:
+        Texto compactado
+    """
+    language = detect_language(path)
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _strip_license_header(text, language)
+    if language == "python":
+        compacted = _compact_python(text, drop_comments, max_literal)
+        if compacted is None:
+            # Fragmento truncado o con errores de sintaxis: al menos los comentarios de línea
+            compacted = _drop_hash_comments(text) if drop_comments else text
+        text = compacted
+    elif language in ("c", "css"):
+        text = _compact_c_like(text, drop_comments, max_literal, line_comments=language == "c")
+    elif language == "hash" and drop_comments:
+        text = _drop_hash_comments(text)
+    elif language == "markup" and drop_comments:
+        text = _HTML_COMMENT.sub("", text)
+    max_line_length = max(max_literal * _MAX_LINE_FACTOR, _MIN_MAX_LINE_LENGTH) if max_literal else 0
+    return _normalize_whitespace(text, max_line_length)
+
+
+__all__ = [
+    'LICENSE_MARKERS',
+    'compact_source',
+    'detect_language',
+]
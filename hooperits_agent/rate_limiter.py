@@ -0,0 +1,365 @@
+# hooperits_agent/rate_limiter.py
+"""
+Limitación de tasa por modelo y reintentos ante throttling de Gemini.
+
+Cada modelo tiene dos cubetas de tokens (peticiones por minuto y tokens por
+minuto, declaradas en `model_tiers.json`) y un límite de concurrencia que se
+ajusta con AIMD: crece de forma aditiva con cada respuesta correcta y se
+reduce a la mitad ante un 429/503. Las llamadas limitadas se reintentan con
+backoff exponencial con jitter, respetando el `retry-after` que indique la API.
+"""
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+logger = logging.getLogger("hooperits_agent.rate_limiter")
+
+T = TypeVar("T")
+
+# Espera entre comprobaciones cuando el límite de concurrencia está lleno
+_POLL_INTERVAL = 0.01
+THROTTLING_STATUS_CODES = (429, 503)
+_THROTTLING_CLASS_NAMES = ("ResourceExhausted", "TooManyRequests", "ServiceUnavailable")
+_STATUS_IN_MESSAGE = re.compile(r"\b(429|503)\b")
+# "Please retry in 27.5s" (mensaje de la API) o "retry_delay { seconds: 27 }" (RetryInfo)
+_RETRY_IN_MESSAGE = re.compile(r"retry in (\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+_RETRY_DELAY_FIELD = re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE)
+
+
+class TokenBucket:
+    """Cubeta de tokens que se rellena a `rate_per_minute` hasta `capacity`."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Inicializa la cubeta llena.
+
+        Args:
+            rate_per_minute: Tokens que se reponen por minuto
+            capacity: Ráfaga máxima (por defecto, un minuto de tasa)
+            clock: Reloj monótono en segundos (inyectable en tests)
+        """
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Segundos hasta que haya `amount` tokens (0 si ya los hay). No consume."""
+        self._refill()
+        # Una petición mayor que la ráfaga nunca cabría: se limita a la capacidad
+        missing = min(amount, self.capacity) - self._tokens
+        return missing / self.rate_per_second if missing > 0 else 0.0
+
+    def consume(self, amount: float) -> None:
+        """Descuenta `amount` tokens (puede dejar la cubeta en negativo)."""
+        self._refill()
+        self._tokens -= min(amount, self.capacity)
+
+
+class ModelRateLimiter:
+    """Límites RPM/TPM y concurrencia adaptativa (AIMD) de un modelo."""
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 max_concurrency: int = 32, min_concurrency: int = 1,
+                 decrease_cooldown: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Inicializa el limitador.
+
+        Args:
+            rpm: Peticiones por minuto (None = sin límite)
+            tpm: Tokens de prompt por minuto (None = sin límite)
+            max_concurrency: Techo (y valor inicial) del límite de concurrencia
+            min_concurrency: Suelo del límite de concurrencia
+            decrease_cooldown: Segundos durante los que varios 429 seguidos
+                cuentan como una sola señal (evita colapsar a 1 por una ráfaga)
+            clock: Reloj monótono en segundos
+        """
+        self.requests = TokenBucket(rpm, clock=clock) if rpm else None
+        self.tokens = TokenBucket(tpm, clock=clock) if tpm else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.concurrency_limit = float(self.max_concurrency)
+        self.decrease_cooldown = decrease_cooldown
+        self._clock = clock
+        self._last_decrease = float("-inf")
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Ocupa un cupo si es posible; si no, devuelve los segundos a esperar."""
+        with self._lock:
+            if self._in_flight >= int(self.concurrency_limit):
+                return _POLL_INTERVAL
+            wait = 0.0
+            if self.requests is not None:
+                wait = max(wait, self.requests.wait_time(1))
+            if self.tokens is not None and tokens > 0:
+                wait = max(wait, self.tokens.wait_time(tokens))
+            if wait > 0:
+                return wait
+            if self.requests is not None:
+                self.requests.consume(1)
+            if self.tokens is not None and tokens > 0:
+                self.tokens.consume(tokens)
+            self._in_flight += 1
+            return 0.0
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Bloquea hasta poder enviar una petición de `tokens` tokens de prompt."""
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0) -> None:
+        """Versión asíncrona de `acquire`."""
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self, throttled: bool = False) -> None:
+        """
+        Libera el cupo y ajusta la concurrencia según el resultado.
+
+        Args:
+            throttled: True si la API respondió con throttling (429/503)
+        """
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            if throttled:
+                now = self._clock()
+                if now - self._last_decrease >= self.decrease_cooldown:
+                    self._last_decrease = now
+                    self.concurrency_limit = max(float(self.min_concurrency), self.concurrency_limit / 2)
+                    logger.info(f"Throttling: concurrencia reducida a {int(self.concurrency_limit)}")
+            else:
+                # Incremento aditivo: +1 cupo por cada "ventana" completa de éxitos
+                self.concurrency_limit = min(float(self.max_concurrency),
+                                             self.concurrency_limit + 1.0 / self.concurrency_limit)
+
+
+class RetryPolicy:
+    """Backoff exponencial con jitter completo que respeta los `retry-after`."""
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0,
+                 rng: Optional[random.Random] = None):
+        """
+        Inicializa la política.
+
+        Args:
+            max_attempts: Intentos totales (1 = sin reintentos)
+            base_delay: Espera máxima del primer reintento en segundos
+            max_delay: Tope de la espera calculada por backoff
+            rng: Generador aleatorio (inyectable en tests)
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rng = rng or random.Random()
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Espera antes del reintento que sigue al intento `attempt` (desde 1).
+
+        Args:
+            attempt: Número del intento que acaba de fallar
+            retry_after: Espera indicada por la API, si la hay
+
+        Returns:
+            Segundos a esperar; nunca menos que `retry_after`
+        """
+        backoff = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        delay = self._rng.uniform(0, backoff)
+        if retry_after is not None:
+            # El jitter se suma para que los clientes no vuelvan todos a la vez
+            delay = retry_after + self._rng.uniform(0, self.base_delay * 0.1)
+        return delay
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    for attr in ("code", "status_code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return int(value)
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return int(value) if isinstance(value, int) else None
+
+
+def is_throttling_error(exc: BaseException) -> bool:
+    """
+    Indica si una excepción es una señal de throttling (429 o 503) de la API.
+
+    Reconoce las excepciones de `google.api_core` (`ResourceExhausted`,
+    `ServiceUnavailable`...) por su código o su nombre, y como último recurso
+    el código en el mensaje.
+    """
+    code = _status_code(exc)
+    if code is not None:
+        return code in THROTTLING_STATUS_CODES
+    if type(exc).__name__ in _THROTTLING_CLASS_NAMES:
+        return True
+    return bool(_STATUS_IN_MESSAGE.search(str(exc)))
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """
+    Espera sugerida por la API en una excepción de throttling.
+
+    Busca un atributo `retry_after`, la cabecera `Retry-After` de la respuesta
+    HTTP y, en el mensaje, "retry in Ns" o el campo `retry_delay` de RetryInfo.
+
+    Returns:
+        Segundos, o None si la excepción no trae ninguna indicación
+    """
+    value = getattr(exc, "retry_after", None)
+    if isinstance(value, (int, float)):
+        return float(value)
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if headers is not None:
+        try:
+            header = headers.get("Retry-After") or headers.get("retry-after")
+            if header is not None:
+                return float(header)
+        except (TypeError, ValueError, AttributeError):
+            pass
+    text = " ".join([str(exc)] + [str(detail) for detail in getattr(exc, "details", None) or []])
+    for pattern in (_RETRY_IN_MESSAGE, _RETRY_DELAY_FIELD):
+        match = pattern.search(text)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def _retry_delay(exc: Exception, attempt: int, policy: RetryPolicy) -> Optional[float]:
+    """Espera antes de reintentar, o None si la excepción no se debe reintentar."""
+    if not is_throttling_error(exc) or attempt >= policy.max_attempts:
+        return None
+    delay = policy.delay(attempt, retry_after_seconds(exc))
+    logger.warning(f"Throttling de la API ({exc}); reintento {attempt + 1}/{policy.max_attempts} "
+                   f"en {delay:.2f}s")
+    return delay
+
+
+def call_with_retry(fn: Callable[[], T], limiter: Optional[ModelRateLimiter] = None,
+                    policy: Optional[RetryPolicy] = None, tokens: int = 0,
+                    on_retry: Optional[Callable[[int, float, Exception], None]] = None) -> T:
+    """
+    Ejecuta `fn` respetando el limitador y reintentando ante throttling.
+
+    Args:
+        fn: Llamada a la API
+        limiter: Limitador del modelo (None = sin límites)
+        policy: Política de reintentos (por defecto `RetryPolicy()`)
+        tokens: Tokens estimados del prompt, para el límite TPM
+        on_retry: Se llama con (intento fallido, espera, excepción) antes de cada reintento
+
+    Returns:
+        El resultado de `fn`
+
+    Raises:
+        La última excepción si no es de throttling o se agotan los intentos
+    """
+    policy = policy or RetryPolicy()
+    attempt = 1
+    while True:
+        if limiter is not None:
+            limiter.acquire(tokens)
+        try:
+            result = fn()
+        except Exception as e:
+            if limiter is not None:
+                limiter.release(throttled=is_throttling_error(e))
+            delay = _retry_delay(e, attempt, policy)
+            if delay is None:
+                raise
+            if on_retry is not None:
+                on_retry(attempt, delay, e)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        if limiter is not None:
+            limiter.release()
+        return result
+
+
+async def call_with_retry_async(fn: Callable[[], Awaitable[T]],
+                                limiter: Optional[ModelRateLimiter] = None,
+                                policy: Optional[RetryPolicy] = None, tokens: int = 0,
+                                on_retry: Optional[Callable[[int, float, Exception], None]] = None) -> T:
+    """Versión asíncrona de `call_with_retry`; `fn` devuelve una corrutina nueva en cada intento."""
+    policy = policy or RetryPolicy()
+    attempt = 1
+    while True:
+        if limiter is not None:
+            await limiter.acquire_async(tokens)
+        try:
+            result = await fn()
+        except Exception as e:
+            if limiter is not None:
+                limiter.release(throttled=is_throttling_error(e))
+            delay = _retry_delay(e, attempt, policy)
+            if delay is None:
+                raise
+            if on_retry is not None:
+                on_retry(attempt, delay, e)
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        if limiter is not None:
+            limiter.release()
+        return result
+
+
+def parse_rate_limits(model_info: Dict[str, Any], tier: str) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Lee los límites de un modelo en `model_tiers.json`.
+
+    Args:
+        model_info: Entrada del modelo (ya resuelto su `alias_of`)
+        tier: "free" o "paid"
+
+    Returns:
+        Tupla (rpm, tpm); None donde no hay límite declarado
+    """
+    limits = model_info.get("rate_limits")
+    if not isinstance(limits, dict):
+        return None, None
+    tier_limits = limits.get(tier)
+    if not isinstance(tier_limits, dict):
+        return None, None
+    rpm, tpm = tier_limits.get("rpm"), tier_limits.get("tpm")
+    return (rpm if isinstance(rpm, int) and rpm > 0 else None,
+            tpm if isinstance(tpm, int) and tpm > 0 else None)
+
+
+__all__ = [
+    'TokenBucket',
+    'ModelRateLimiter',
+    'RetryPolicy',
+    'is_throttling_error',
+    'retry_after_seconds',
+    'call_with_retry',
+    'call_with_retry_async',
+    'parse_rate_limits',
+    'THROTTLING_STATUS_CODES',
+]
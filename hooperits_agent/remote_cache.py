@@ -0,0 +1,424 @@
+# hooperits_agent/remote_cache.py
+"""
+Backend de caché compartido que habla el protocolo de Redis (RESP).
+
+Permite que varios desarrolladores y trabajos de CI reutilicen las mismas
+respuestas. El cliente es mínimo y no necesita dependencias externas: un pool
+de sockets, comandos en pipeline y TTL nativos del servidor.
+"""
+import logging
+import lzma
+import os
+import queue
+import socket
+import ssl
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Iterator, List, Optional, Sequence, Tuple, Union
+from urllib.parse import unquote, urlparse
+
+from .utils import build_cache_key, compress_text, decompress_text
+
+if TYPE_CHECKING:
+    from .cache import CacheBackend
+
+logger = logging.getLogger("hooperits_agent.remote_cache")
+
+DEFAULT_KEY_PREFIX = "hooperits:cache:"
+
+
+class RedisReplyError(Exception):
+    """El servidor respondió con un error RESP (`-ERR ...`) o una respuesta inesperada."""
+
+
+def encode_command(*args: Union[str, bytes, int, float]) -> bytes:
+    """
+    Serializa un comando como array RESP de bulk strings.
+
+    Args:
+        *args: Nombre del comando y argumentos
+
+    Returns:
+        Bytes listos para enviar por el socket
+    """
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        else:
+            data = str(arg).encode('utf-8')
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+class RedisConnection:
+    """Una conexión TCP (o TLS) al servidor con lectura de respuestas RESP."""
+
+    def __init__(self, host: str, port: int, timeout: float, use_ssl: bool = False):
+        sock = socket.create_connection((host, port), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if use_ssl:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+        self._sock = sock
+        self._reader = sock.makefile('rb')
+
+    def close(self) -> None:
+        try:
+            self._reader.close()
+            self._sock.close()
+        except OSError:
+            pass
+
+    def send(self, payload: bytes) -> None:
+        self._sock.sendall(payload)
+
+    def read_reply(self) -> Any:
+        """Lee una respuesta RESP completa; los errores del servidor se devuelven, no se lanzan."""
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Conexión cerrada por el servidor")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body.decode('utf-8')
+        if prefix == b"-":
+            return RedisReplyError(body.decode('utf-8', errors='replace'))
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Respuesta truncada del servidor")
+            return data[:-2]
+        if prefix == b"*":
+            length = int(body)
+            if length < 0:
+                return None
+            return [self.read_reply() for _ in range(length)]
+        raise RedisReplyError(f"Respuesta RESP desconocida: {line[:20]!r}")
+
+
+class RedisClient:
+    """Cliente RESP con pool de conexiones acotado y ejecución en pipeline."""
+
+    def __init__(self, url: str, pool_size: int = 4, timeout: float = 1.0):
+        """
+        Inicializa el cliente (no abre conexiones hasta el primer comando).
+
+        Args:
+            url: `redis://[:password@]host:port/db` o `rediss://` para TLS
+            pool_size: Máximo de conexiones inactivas retenidas para reutilizar
+            timeout: Tiempo máximo de conexión y de cada lectura, en segundos
+        """
+        parsed = urlparse(url)
+        if parsed.scheme not in ("redis", "rediss"):
+            raise ValueError(f"URL de Redis no soportada: {url}")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.use_ssl = parsed.scheme == "rediss"
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        db_path = parsed.path.lstrip("/")
+        self.db = int(db_path) if db_path else 0
+        self.timeout = timeout
+        self.pool_size = max(1, pool_size)
+        self._idle: "queue.LifoQueue[RedisConnection]" = queue.LifoQueue(maxsize=self.pool_size)
+        self._pid = os.getpid()
+
+    def _connect(self) -> RedisConnection:
+        conn = RedisConnection(self.host, self.port, self.timeout, self.use_ssl)
+        try:
+            setup: List[Tuple[Any, ...]] = []
+            if self.password:
+                setup.append(("AUTH", self.username, self.password) if self.username
+                             else ("AUTH", self.password))
+            if self.db:
+                setup.append(("SELECT", self.db))
+            for reply in self._run(conn, setup):
+                if isinstance(reply, RedisReplyError):
+                    raise reply
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    @contextmanager
+    def _connection(self) -> Iterator[RedisConnection]:
+        """Toma una conexión del pool; si falla algo a mitad, se descarta en vez de devolverla."""
+        if self._pid != os.getpid():
+            # Pool heredado por fork: los sockets pertenecen al proceso padre
+            self._idle = queue.LifoQueue(maxsize=self.pool_size)
+            self._pid = os.getpid()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @staticmethod
+    def _run(conn: RedisConnection, commands: Sequence[Tuple]) -> List[Any]:
+        if not commands:
+            return []
+        conn.send(b"".join(encode_command(*command) for command in commands))
+        return [conn.read_reply() for _ in commands]
+
+    def pipeline(self, commands: Sequence[Tuple]) -> List[Any]:
+        """
+        Envía varios comandos en una sola escritura y lee todas las respuestas.
+
+        Args:
+            commands: Tuplas (comando, *argumentos)
+
+        Returns:
+            Una respuesta por comando; los errores del servidor aparecen como
+            instancias de `RedisReplyError` en su posición
+        """
+        with self._connection() as conn:
+            return self._run(conn, commands)
+
+    def execute(self, *command) -> Any:
+        """Ejecuta un comando y lanza `RedisReplyError` si el servidor responde con error."""
+        reply = self.pipeline([command])[0]
+        if isinstance(reply, RedisReplyError):
+            raise reply
+        return reply
+
+    def close(self) -> None:
+        """Cierra las conexiones inactivas del pool."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class RedisCache:
+    """
+    Caché de respuestas en un servidor Redis compartido.
+
+    Cada respuesta se guarda como un string con TTL igual a
+    `expiration_seconds`, así que la expiración la resuelve el servidor.
+    El valor lleva delante el nombre de su códec (`zlib\\n<datos>`).
+    """
+
+    # Claves por lote al recorrer con SCAN / borrar en `clear`
+    _SCAN_BATCH = 500
+
+    def __init__(self, url: str, expiration_seconds: int = 3600, pool_size: int = 4,
+                 timeout: float = 1.0, key_prefix: str = DEFAULT_KEY_PREFIX,
+                 compression: str = "zlib"):
+        """
+        Inicializa la caché remota.
+
+        Args:
+            url: URL del servidor (`redis://host:6379/0`)
+            expiration_seconds: TTL de cada entrada en segundos
+            pool_size: Conexiones reutilizables en el pool
+            timeout: Tiempo máximo por operación de red, en segundos
+            key_prefix: Prefijo de las claves, para compartir el servidor con otros usos
+            compression: Códec para las respuestas nuevas ("raw", "zlib" o "lzma")
+        """
+        self.client = RedisClient(url, pool_size=pool_size, timeout=timeout)
+        self.expiration_seconds = expiration_seconds
+        self.key_prefix = key_prefix
+        self.compression = compression
+
+    def _redis_key(self, prompt: str, model: str) -> str:
+        return self.key_prefix + build_cache_key(prompt, model)
+
+    def _encode(self, response: str) -> bytes:
+        if self.compression == "raw":
+            return b"raw\n" + response.encode('utf-8')
+        return self.compression.encode('ascii') + b"\n" + compress_text(response, self.compression)
+
+    @staticmethod
+    def _decode(value: Optional[bytes]) -> Optional[str]:
+        if value is None:
+            return None
+        codec, _, payload = value.partition(b"\n")
+        try:
+            if codec == b"raw":
+                return payload.decode('utf-8')
+            return decompress_text(payload, codec.decode('ascii'))
+        except (ValueError, LookupError, zlib.error, lzma.LZMAError) as e:
+            logger.warning(f"Entrada de caché remota ilegible, se ignora: {e}")
+            return None
+
+    def ping(self) -> bool:
+        """Comprueba que el servidor responde."""
+        return bool(self.client.execute("PING") == "PONG")
+
+    def get(self, prompt: str, model: str) -> Optional[str]:
+        """
+        Obtiene una respuesta del caché si existe (el servidor descarta las expiradas).
+
+        Args:
+            prompt: El prompt original
+            model: El modelo usado
+
+        Returns:
+            La respuesta cacheada o None si no existe/expiró
+        """
+        return self._decode(self.client.execute("GET", self._redis_key(prompt, model)))
+
+    def get_many(self, requests: Sequence[Tuple[str, str]]) -> List[Optional[str]]:
+        """
+        Busca varias respuestas en un único viaje de ida y vuelta (pipeline de GET).
+
+        Args:
+            requests: Pares (prompt, modelo)
+
+        Returns:
+            Las respuestas en el mismo orden (None para los fallos)
+        """
+        replies = self.client.pipeline(
+            [("GET", self._redis_key(prompt, model)) for prompt, model in requests]
+        )
+        results = []
+        for reply in replies:
+            if isinstance(reply, RedisReplyError):
+                raise reply
+            results.append(self._decode(reply))
+        return results
+
+    def set(self, prompt: str, model: str, response: str,
+            prompt_tokens: int = 0, response_tokens: int = 0):
+        """
+        Guarda una respuesta con TTL `expiration_seconds`.
+
+        Args:
+            prompt: El prompt original
+            model: El modelo usado
+            response: La respuesta a cachear
+            prompt_tokens: No se usa (compatibilidad con los backends locales)
+            response_tokens: No se usa (compatibilidad con los backends locales)
+        """
+        self.client.execute("SET", self._redis_key(prompt, model), self._encode(response),
+                            "EX", max(1, int(self.expiration_seconds)))
+
+    def clear(self):
+        """Borra todas las claves con el prefijo de esta caché."""
+        cursor = "0"
+        while True:
+            cursor, keys = self.client.execute(
+                "SCAN", cursor, "MATCH", self.key_prefix + "*", "COUNT", self._SCAN_BATCH)
+            cursor = cursor.decode('ascii') if isinstance(cursor, bytes) else str(cursor)
+            if keys:
+                self.client.execute("DEL", *keys)
+            if cursor == "0":
+                return
+
+    def cleanup_expired(self):
+        """No hace nada: el servidor expira las claves por TTL."""
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class FallbackCache:
+    """
+    Usa una caché primaria (remota) y recurre a una local si la primaria no responde.
+
+    Tras un fallo de red la primaria se deja de consultar durante
+    `retry_interval` segundos, para no pagar un timeout en cada operación.
+    Los fallos de la primaria también se buscan en la local.
+    """
+
+    def __init__(self, primary: "RedisCache", fallback: "CacheBackend", retry_interval: float = 30.0):
+        """
+        Inicializa la caché con respaldo.
+
+        Args:
+            primary: Caché preferida (p. ej. `RedisCache`)
+            fallback: Caché local usada cuando la primaria no está disponible
+            retry_interval: Segundos sin reintentar la primaria tras un fallo
+        """
+        self.primary = primary
+        self.fallback = fallback
+        self.retry_interval = retry_interval
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def expiration_seconds(self) -> int:
+        return self.fallback.expiration_seconds
+
+    def _primary_available(self) -> bool:
+        return time.time() >= self._down_until
+
+    def _mark_down(self, error: Exception) -> None:
+        with self._lock:
+            already_down = not self._primary_available()
+            self._down_until = time.time() + self.retry_interval
+        if not already_down:
+            logger.warning(f"Caché compartida no disponible ({error}); se usa la caché local "
+                           f"durante {self.retry_interval:.0f}s")
+
+    def get(self, prompt: str, model: str) -> Optional[str]:
+        """Busca en la primaria y, si falla o no la tiene, en la local."""
+        if self._primary_available():
+            try:
+                response = self.primary.get(prompt, model)
+                if response is not None:
+                    return response
+            except (OSError, RedisReplyError) as e:
+                self._mark_down(e)
+        return self.fallback.get(prompt, model)
+
+    def get_many(self, requests: Sequence[Tuple[str, str]]) -> List[Optional[str]]:
+        """Como `get` para varios pares (prompt, modelo), con un solo viaje a la primaria."""
+        results: List[Optional[str]] = [None] * len(requests)
+        if self._primary_available():
+            try:
+                results = self.primary.get_many(requests)
+            except (OSError, RedisReplyError) as e:
+                self._mark_down(e)
+        return [response if response is not None else self.fallback.get(prompt, model)
+                for response, (prompt, model) in zip(results, requests)]
+
+    def set(self, prompt: str, model: str, response: str,
+            prompt_tokens: int = 0, response_tokens: int = 0):
+        """Escribe en la primaria; si no está disponible, en la local."""
+        if self._primary_available():
+            try:
+                self.primary.set(prompt, model, response,
+                                 prompt_tokens=prompt_tokens, response_tokens=response_tokens)
+                return
+            except (OSError, RedisReplyError) as e:
+                self._mark_down(e)
+        self.fallback.set(prompt, model, response,
+                          prompt_tokens=prompt_tokens, response_tokens=response_tokens)
+
+    def clear(self):
+        """Limpia ambas cachés (la primaria solo si está disponible)."""
+        if self._primary_available():
+            try:
+                self.primary.clear()
+            except (OSError, RedisReplyError) as e:
+                self._mark_down(e)
+        self.fallback.clear()
+
+    def cleanup_expired(self):
+        self.fallback.cleanup_expired()
+
+
+__all__ = [
+    'RedisClient',
+    'RedisCache',
+    'RedisReplyError',
+    'FallbackCache',
+    'encode_command',
+    'DEFAULT_KEY_PREFIX',
+]
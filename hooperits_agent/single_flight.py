@@ -0,0 +1,253 @@
+# hooperits_agent/single_flight.py
+"""
+Coalescencia de peticiones idénticas en curso ("single-flight").
+
+Cuando varias consultas con la misma clave de caché coinciden en el tiempo,
+solo la primera llama a la API; las demás esperan y reciben su resultado:
+
+- Entre hilos del mismo proceso, mediante un registro de llamadas en curso.
+- Entre procesos de la misma máquina, mediante un archivo de bloqueo por clave:
+  quien lo encuentra ocupado espera a que se libere y vuelve a consultar la
+  caché compartida, donde el proceso líder dejó la respuesta.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+    import msvcrt
+
+logger = logging.getLogger("hooperits_agent.single_flight")
+
+T = TypeVar("T")
+
+# Intervalo de sondeo del bloqueo de otro proceso
+_LOCK_POLL_INTERVAL = 0.05
+
+
+class _Call:
+    """Llamada en curso de un hilo líder."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.shared = False
+        self.error: Optional[BaseException] = None
+
+
+class _KeyLock:
+    """Bloqueo entre procesos no bloqueante sobre un archivo por clave."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        """Intenta tomar el bloqueo; False si otro proceso lo tiene."""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        if fcntl is not None:
+            # El líder anterior borra el archivo al terminar: si el que abrimos ya
+            # no es el del directorio, el bloqueo no protege nada
+            try:
+                same_file = os.fstat(fd).st_ino == os.stat(self.path).st_ino
+            except FileNotFoundError:
+                same_file = False
+            if not same_file:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+                return False
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                # Se borra antes de soltarlo para no dejar un archivo por cada prompt
+                try:
+                    os.unlink(self.path)
+                except FileNotFoundError:
+                    pass
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class SingleFlight:
+    """Registro de peticiones en curso por clave, entre hilos y entre procesos."""
+
+    def __init__(self, lock_dir: Optional[Path] = None, timeout: float = 600.0):
+        """
+        Inicializa el registro.
+
+        Args:
+            lock_dir: Directorio de los archivos de bloqueo entre procesos
+                (None = solo coalescencia dentro del proceso)
+            timeout: Segundos máximos que un seguidor espera al líder antes de
+                hacer su propia llamada
+        """
+        self.lock_dir = lock_dir
+        if lock_dir is not None:
+            lock_dir.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[Tuple[int, str], "asyncio.Future"] = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key: str) -> Optional[_KeyLock]:
+        return _KeyLock(self.lock_dir / f"{key}.lock") if self.lock_dir is not None else None
+
+    def _try_lock(self, lock: Optional[_KeyLock]) -> bool:
+        if lock is None:
+            return True
+        try:
+            return lock.try_acquire()
+        except OSError as e:
+            # Sin bloqueo entre procesos se sigue funcionando, solo sin coalescer
+            logger.warning(f"No se pudo usar el bloqueo single-flight {lock.path}: {e}")
+            return True
+
+    def _run_exclusive(self, key: str, fn: Callable[[], T],
+                       recheck: Optional[Callable[[], Optional[T]]]) -> Tuple[T, bool]:
+        lock = self._key_lock(key)
+        if not self._try_lock(lock):
+            logger.info(f"Otro proceso ya consulta la clave {key[:12]}; esperando su resultado")
+            deadline = time.monotonic() + self.timeout
+            while not self._try_lock(lock):
+                if time.monotonic() >= deadline:
+                    logger.warning(f"Tiempo de espera agotado para la clave {key[:12]}; se consulta sin coalescer")
+                    return fn(), False
+                time.sleep(_LOCK_POLL_INTERVAL)
+            if recheck is not None:
+                value = recheck()
+                if value is not None:
+                    if lock is not None:
+                        lock.release()
+                    return value, True
+        try:
+            return fn(), False
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def do(self, key: str, fn: Callable[[], T],
+           recheck: Optional[Callable[[], Optional[T]]] = None) -> Tuple[T, bool]:
+        """
+        Ejecuta `fn` una sola vez por clave entre las llamadas simultáneas.
+
+        Args:
+            key: Clave de la petición (la clave de caché de prompt y modelo)
+            fn: Petición real; su resultado se comparte con los seguidores
+            recheck: Consulta la caché compartida tras esperar a otro proceso;
+                si devuelve algo distinto de None, se usa en lugar de llamar a `fn`
+
+        Returns:
+            Tupla (resultado, True si vino de la petición de otro hilo o proceso)
+
+        Raises:
+            La excepción de `fn`, también en los hilos que esperaban su resultado
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        assert call is not None
+        if not leader:
+            if not call.done.wait(self.timeout):
+                logger.warning(f"Tiempo de espera agotado para la clave {key[:12]}; se consulta sin coalescer")
+                return fn(), False
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result, call.shared = self._run_exclusive(key, fn, recheck)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, call.shared
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[T]],
+                       recheck: Optional[Callable[[], Awaitable[Optional[T]]]] = None) -> Tuple[T, bool]:
+        """
+        Versión asíncrona de `do` para tareas de un mismo bucle de eventos.
+
+        La espera por otro proceso se hace sondeando el bloqueo sin bloquear el bucle.
+        """
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        pending = self._async_calls.get(call_key)
+        if pending is not None:
+            try:
+                result, _ = await asyncio.wait_for(asyncio.shield(pending), self.timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Tiempo de espera agotado para la clave {key[:12]}; se consulta sin coalescer")
+                return await fn(), False
+            return result, True
+
+        future = loop.create_future()
+        self._async_calls[call_key] = future
+        try:
+            outcome = await self._run_exclusive_async(key, fn, recheck)
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita el aviso de "excepción nunca recuperada" si nadie esperaba
+            future.exception()
+            raise
+        else:
+            future.set_result(outcome)
+        finally:
+            del self._async_calls[call_key]
+        return outcome
+
+    async def _run_exclusive_async(self, key: str, fn: Callable[[], Awaitable[T]],
+                                   recheck: Optional[Callable[[], Awaitable[Optional[T]]]]) -> Tuple[T, bool]:
+        lock = self._key_lock(key)
+        if not self._try_lock(lock):
+            logger.info(f"Otro proceso ya consulta la clave {key[:12]}; esperando su resultado")
+            deadline = time.monotonic() + self.timeout
+            while not self._try_lock(lock):
+                if time.monotonic() >= deadline:
+                    logger.warning(f"Tiempo de espera agotado para la clave {key[:12]}; se consulta sin coalescer")
+                    return await fn(), False
+                await asyncio.sleep(_LOCK_POLL_INTERVAL)
+            if recheck is not None:
+                value = await recheck()
+                if value is not None:
+                    if lock is not None:
+                        lock.release()
+                    return value, True
+        try:
+            return await fn(), False
+        finally:
+            if lock is not None:
+                lock.release()
+
+
+__all__ = [
+    'SingleFlight',
+]
@@ -1,8 +1,9 @@
 # hooperits_agent/state_manager.py
 import json
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
 from .config import REPOS_BASE_PATH # Necesitamos la ruta base para validación
+from .utils import file_lock, atomic_write_json
 
 # Definir la ubicación del archivo de estado
 # ~/.config/hooperits_agent_cli/state.json
@@ -27,15 +28,32 @@ def _load_state() -> Dict[str, Any]:
     return {}
 
 def _save_state(state_data: Dict[str, Any]) -> None:
-    """Guarda el estado en el archivo JSON."""
+    """Guarda el estado en el archivo JSON (bloqueo entre procesos + reemplazo atómico)."""
     try:
-        with open(STATE_FILE_PATH, 'w') as f:
-            json.dump(state_data, f, indent=2)
+        with file_lock(STATE_FILE_PATH):
+            atomic_write_json(STATE_FILE_PATH, state_data, indent=2)
     except Exception as e:
         # Aquí podrías usar `rich.print` si la consola está disponible
         # o simplemente imprimir un error estándar.
         print(f"Error crítico al guardar el estado en {STATE_FILE_PATH}: {e}")
 
+def _update_state(mutate: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """
+    Lee, modifica y guarda el estado bajo un mismo bloqueo.
+
+    Evita que dos invocaciones concurrentes se pisen cambios (lectura-modificación-escritura).
+    `mutate` recibe el estado actual y lo modifica in situ.
+    """
+    try:
+        with file_lock(STATE_FILE_PATH):
+            state = _load_state()
+            mutate(state)
+            atomic_write_json(STATE_FILE_PATH, state, indent=2)
+            return state
+    except Exception as e:
+        print(f"Error crítico al guardar el estado en {STATE_FILE_PATH}: {e}")
+        return _load_state()
+
 
 def set_active_repo(repo_name: str) -> bool:
     """Establece el repositorio activo. Verifica si el repositorio existe localmente."""
@@ -46,10 +64,10 @@ def set_active_repo(repo_name: str) -> bool:
         # git_ops.py se encarga de la validez del repo al listar.
         return False # Repositorio no encontrado en la ubicación esperada
 
-    state = _load_state()
-    state["active_repo"] = repo_name
-    state["repos_base_path"] = str(REPOS_BASE_PATH.resolve()) # Guardar ruta absoluta
-    _save_state(state)
+    def _activate(state: Dict[str, Any]) -> None:
+        state["active_repo"] = repo_name
+        state["repos_base_path"] = str(REPOS_BASE_PATH.resolve()) # Guardar ruta absoluta
+    _update_state(_activate)
     return True
 
 def get_active_repo_name() -> Optional[str]:
@@ -69,8 +87,5 @@ def get_active_repo_path() -> Optional[Path]:
 
 def clear_active_repo() -> None:
     """Limpia la selección del repositorio activo."""
-    state = _load_state()
-    if "active_repo" in state:
-        del state["active_repo"]
     # Opcionalmente, podrías querer mantener repos_base_path si existe
-    _save_state(state)
+    _update_state(lambda state: state.pop("active_repo", None))
@@ -0,0 +1,202 @@
+# hooperits_agent/token_counts.py
+"""
+Memoización persistente de los conteos de tokens (`count_tokens`) de Gemini.
+
+El conteo previo a una llamada de pago es un viaje de red completo. Como el
+resultado solo depende del modelo y del texto, se guarda por (modelo, hash del
+texto) y, para prompts compuestos, por fragmento (p. ej. un archivo del
+proyecto), de modo que solo se cuentan en remoto los fragmentos nuevos.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("hooperits_agent.token_counts")
+
+TOKEN_COUNTS_FILENAME = "token_counts.sqlite3"
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class TokenCountCache:
+    """Conteos de tokens por (modelo, hash del texto) en SQLite, acotados por LRU."""
+
+    def __init__(self, cache_dir: Path, max_entries: int = 20000):
+        """
+        Inicializa la memoria de conteos.
+
+        Args:
+            cache_dir: Directorio donde guardar la base de datos
+            max_entries: Máximo de conteos retenidos (0 = sin límite)
+        """
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = cache_dir / TOKEN_COUNTS_FILENAME
+        self.max_entries = max_entries
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is not None and self._conn_pid != os.getpid():
+            self._conn = None
+        if self._conn is None:
+            conn = sqlite3.connect(
+                str(self.db_path), timeout=30, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_counts ("
+                "model TEXT NOT NULL, text_hash TEXT NOT NULL, tokens INTEGER NOT NULL, "
+                "last_used REAL NOT NULL, PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_token_counts_last_used ON token_counts (last_used)"
+            )
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[int]]:
+        """
+        Busca los conteos memorizados de varios textos.
+
+        Args:
+            model: Nombre del modelo
+            texts: Textos a buscar
+
+        Returns:
+            Un conteo por texto, o None si no está memorizado
+        """
+        hashes = [_text_hash(text) for text in texts]
+        try:
+            with self._lock:
+                conn = self._connection()
+                found: Dict[str, int] = {}
+                # Límite de variables por sentencia de SQLite antiguos: 999
+                for start in range(0, len(hashes), 500):
+                    chunk = hashes[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    found.update(conn.execute(
+                        f"SELECT text_hash, tokens FROM token_counts "
+                        f"WHERE model = ? AND text_hash IN ({placeholders})",
+                        [model, *chunk],
+                    ).fetchall())
+                if found:
+                    conn.executemany(
+                        "UPDATE token_counts SET last_used = ? WHERE model = ? AND text_hash = ?",
+                        [(time.time(), model, text_hash) for text_hash in found],
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"No se pudo leer la memoria de conteos de tokens: {e}")
+            return [None] * len(texts)
+        return [found.get(text_hash) for text_hash in hashes]
+
+    def get(self, model: str, text: str) -> Optional[int]:
+        """Conteo memorizado de un texto, o None."""
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model: str, counts: Sequence[Tuple[str, int]]) -> None:
+        """
+        Memoriza conteos de tokens.
+
+        Args:
+            model: Nombre del modelo
+            counts: Pares (texto, tokens)
+        """
+        if not counts:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO token_counts (model, text_hash, tokens, last_used) "
+                        "VALUES (?, ?, ?, ?)",
+                        [(model, _text_hash(text), int(tokens), now) for text, tokens in counts],
+                    )
+                    if self.max_entries:
+                        total = conn.execute("SELECT COUNT(*) FROM token_counts").fetchone()[0]
+                        if total > self.max_entries:
+                            conn.execute(
+                                "DELETE FROM token_counts WHERE (model, text_hash) IN ("
+                                "SELECT model, text_hash FROM token_counts ORDER BY last_used LIMIT ?)",
+                                (total - self.max_entries,),
+                            )
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            logger.warning(f"No se pudo escribir en la memoria de conteos de tokens: {e}")
+
+    def put(self, model: str, text: str, tokens: int) -> None:
+        """Memoriza el conteo de un texto."""
+        self.put_many(model, [(text, tokens)])
+
+
+def count_tokens_cached(count_fn: Callable[[str], int], model: str, prompt: str,
+                        segments: Optional[Sequence[str]] = None,
+                        memo: Optional[TokenCountCache] = None,
+                        max_workers: int = 8) -> Tuple[int, int]:
+    """
+    Cuenta los tokens de un prompt reutilizando conteos memorizados.
+
+    Si se indican `segments` (fragmentos cuya concatenación es el prompt), el
+    total es la suma de los conteos por fragmento y solo se cuentan en remoto
+    los que no estaban memorizados, en paralelo. La suma puede diferir en
+    unos pocos tokens del conteo del prompt completo (límites entre
+    fragmentos), suficiente para una estimación previa de costo.
+
+    Args:
+        count_fn: Función que cuenta los tokens de un texto (llamada remota)
+        model: Nombre del modelo (forma parte de la clave)
+        prompt: Prompt completo
+        segments: Fragmentos del prompt, p. ej. uno por archivo
+        memo: Memoria persistente; sin ella siempre se cuenta en remoto
+        max_workers: Conteos remotos simultáneos para los fragmentos nuevos
+
+    Returns:
+        Tupla (tokens, llamadas remotas realizadas)
+    """
+    if memo is not None:
+        memorized = memo.get(model, prompt)
+        if memorized is not None:
+            return memorized, 0
+
+    texts = list(segments) if segments else [prompt]
+    memorized_counts: List[Optional[int]] = (memo.get_many(model, texts) if memo is not None
+                                             else [None] * len(texts))
+    missing = [i for i, count in enumerate(memorized_counts) if count is None]
+    fresh: Dict[int, int] = {}
+    if len(missing) == 1:
+        fresh[missing[0]] = count_fn(texts[missing[0]])
+    elif missing:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as pool:
+            fresh.update(zip(missing, pool.map(count_fn, [texts[i] for i in missing])))
+    counts: List[int] = [fresh[i] if count is None else count for i, count in enumerate(memorized_counts)]
+
+    total = sum(counts)
+    if memo is not None:
+        new_counts = [(texts[i], counts[i]) for i in missing]
+        if segments:
+            new_counts.append((prompt, total))
+        memo.put_many(model, new_counts)
+    return total, len(missing)
+
+
+__all__ = [
+    'TokenCountCache',
+    'count_tokens_cached',
+    'TOKEN_COUNTS_FILENAME',
+]
@@ -0,0 +1,216 @@
+# hooperits_agent/token_estimator.py
+"""
+Estimador local de tokens calibrado con el uso real.
+
+Aprende, por modelo y por tipo de contenido (código, prosa, JS minificado),
+la relación tokens/carácter a partir de `usage_metadata.prompt_token_count`
+de llamadas anteriores. Con suficientes muestras ofrece una estimación con
+cota de error que permite saltarse el `count_tokens` remoto cuando el tramo
+de precio ya está decidido (p. ej. muy por debajo de 128k tokens).
+"""
+import json
+import logging
+import math
+import re
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from .utils import atomic_write_json, file_lock
+
+logger = logging.getLogger("hooperits_agent.token_estimator")
+
+TOKEN_CALIBRATION_FILENAME = "token_calibration.json"
+
+CONTENT_TYPES = ("code", "prose", "minified")
+
+# Relación tokens/carácter de partida, antes de tener muestras propias
+_PRIOR_RATIOS = {"code": 0.30, "prose": 0.25, "minified": 0.40}
+# Cota relativa mientras no hay calibración suficiente
+_PRIOR_RELATIVE_ERROR = 0.5
+
+_SYMBOL_CHARS = "{}()[];=<>"
+_TIER_KEY_PATTERN = re.compile(r"_(?:le|gt)_(\d+)k$")
+
+
+class TokenEstimate(NamedTuple):
+    """Estimación de tokens con su intervalo y si está calibrada."""
+    tokens: int
+    lower: int
+    upper: int
+    calibrated: bool
+
+
+def classify_content(text: str, sample_chars: int = 20000) -> str:
+    """
+    Clasifica un texto como "code", "prose" o "minified" con heurísticas baratas.
+
+    Args:
+        text: Texto a clasificar
+        sample_chars: Caracteres examinados como máximo
+
+    Returns:
+        Uno de `CONTENT_TYPES`
+    """
+    sample = text[:sample_chars]
+    if not sample:
+        return "prose"
+    symbols = sum(sample.count(char) for char in _SYMBOL_CHARS) / len(sample)
+    avg_line_length = len(sample) / (sample.count("\n") + 1)
+    if avg_line_length > 250 and symbols > 0.03:
+        return "minified"
+    return "code" if symbols > 0.03 else "prose"
+
+
+def tier_thresholds(paid_tier_info: Optional[Dict[str, Any]]) -> List[int]:
+    """
+    Umbrales de tamaño de prompt (en tokens) que cambian el precio de un modelo.
+
+    Args:
+        paid_tier_info: Sección `paid_tier` de `model_tiers.json`
+
+    Returns:
+        Umbrales ordenados, p. ej. [128000] para claves `*_le_128k` / `*_gt_128k`
+    """
+    if not isinstance(paid_tier_info, dict):
+        return []
+    thresholds = set()
+    for key in paid_tier_info:
+        match = _TIER_KEY_PATTERN.search(key)
+        if match:
+            thresholds.add(int(match.group(1)) * 1000)
+    return sorted(thresholds)
+
+
+class TokenEstimator:
+    """Relación tokens/carácter por (modelo, tipo de contenido), persistida en JSON."""
+
+    # Con más muestras que esto, las nuevas pesan 1/WINDOW (se adapta a cambios del tokenizador)
+    WINDOW = 200
+    # Desviaciones típicas que abarca la cota de error
+    Z_SCORE = 3.0
+
+    def __init__(self, cache_dir: Path, min_samples: int = 5):
+        """
+        Inicializa el estimador.
+
+        Args:
+            cache_dir: Directorio donde persistir la calibración
+            min_samples: Muestras necesarias para considerar calibrado un par (modelo, tipo)
+        """
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = cache_dir / TOKEN_CALIBRATION_FILENAME
+        self.min_samples = min_samples
+        self._calibration: Optional[Dict[str, Dict[str, Dict[str, float]]]] = None
+
+    def _load(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except FileNotFoundError:
+            return {}
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Calibración de tokens ilegible, se reinicia: {e}")
+            return {}
+
+    @property
+    def calibration(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        if self._calibration is None:
+            self._calibration = self._load()
+        return self._calibration
+
+    def _bucket(self, model: str, content_type: str) -> Optional[Dict[str, float]]:
+        return self.calibration.get(model, {}).get(content_type)
+
+    def estimate(self, model: str, segments: Sequence[str]) -> TokenEstimate:
+        """
+        Estima los tokens de un prompt (uno o varios fragmentos).
+
+        Cada fragmento se clasifica por separado y las cotas se suman, así que el
+        intervalo del total es conservador.
+
+        Args:
+            model: Nombre del modelo
+            segments: Fragmentos del prompt (un solo elemento para un prompt simple)
+
+        Returns:
+            `TokenEstimate` con el valor central, el intervalo y si todos los
+            tipos de contenido usados estaban calibrados
+        """
+        tokens = lower = upper = 0.0
+        calibrated = True
+        for segment in segments:
+            chars = len(segment)
+            if not chars:
+                continue
+            content_type = classify_content(segment)
+            bucket = self._bucket(model, content_type)
+            if bucket and bucket["n"] >= self.min_samples:
+                ratio = bucket["mean"]
+                # Corrección de muestra pequeña sobre la varianza ponderada
+                n = min(bucket["n"], self.WINDOW)
+                spread = self.Z_SCORE * math.sqrt(bucket["var"] * n / max(n - 1, 1))
+                # Margen mínimo por la parte fija del conteo (formato, tokens especiales)
+                spread = max(spread, ratio * 0.02)
+            else:
+                ratio = bucket["mean"] if bucket else _PRIOR_RATIOS[content_type]
+                spread = ratio * _PRIOR_RELATIVE_ERROR
+                calibrated = False
+            tokens += chars * ratio
+            lower += chars * max(ratio - spread, 0.0)
+            upper += chars * (ratio + spread)
+        return TokenEstimate(round(tokens), math.floor(lower), math.ceil(upper), calibrated)
+
+    def is_decisive(self, estimate: TokenEstimate, thresholds: Sequence[int]) -> bool:
+        """
+        Indica si la estimación basta para saber el tramo de precio sin contar en remoto.
+
+        Args:
+            estimate: Resultado de `estimate`
+            thresholds: Umbrales de `tier_thresholds`
+
+        Returns:
+            True si la estimación está calibrada y ningún umbral cae dentro de su intervalo
+        """
+        if not estimate.calibrated:
+            return False
+        return not any(estimate.lower <= threshold < estimate.upper for threshold in thresholds)
+
+    def observe(self, model: str, prompt: str, prompt_tokens: int) -> None:
+        """
+        Incorpora el conteo real de una llamada a la calibración.
+
+        Args:
+            model: Nombre del modelo
+            prompt: Prompt enviado
+            prompt_tokens: `usage_metadata.prompt_token_count` de la respuesta
+        """
+        if not prompt or prompt_tokens <= 0:
+            return
+        content_type = classify_content(prompt)
+        ratio = prompt_tokens / len(prompt)
+        try:
+            with file_lock(self.path):
+                calibration = self._load()
+                bucket = calibration.setdefault(model, {}).setdefault(
+                    content_type, {"n": 0, "mean": 0.0, "var": 0.0})
+                bucket["n"] += 1
+                # Media y varianza con ponderación exponencial (1/n hasta llenar la ventana)
+                alpha = 1.0 / min(bucket["n"], self.WINDOW)
+                delta = ratio - bucket["mean"]
+                bucket["mean"] += alpha * delta
+                bucket["var"] = (1 - alpha) * (bucket["var"] + alpha * delta * delta)
+                atomic_write_json(self.path, calibration, indent=2)
+                self._calibration = calibration
+        except (OSError, TimeoutError) as e:
+            logger.warning(f"No se pudo guardar la calibración de tokens: {e}")
+
+
+__all__ = [
+    'TokenEstimator',
+    'TokenEstimate',
+    'classify_content',
+    'tier_thresholds',
+    'CONTENT_TYPES',
+    'TOKEN_CALIBRATION_FILENAME',
+]
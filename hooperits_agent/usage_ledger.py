@@ -0,0 +1,320 @@
+# hooperits_agent/usage_ledger.py
+"""
+Registro local de uso de Gemini: una fila por consulta, solo anexando.
+
+Cada fila ocupa 36 bytes (nueve enteros sin signo de 32 bits): instante,
+modelo, repositorio, comando, banderas (acierto de caché, error), tokens del
+prompt, tokens de la respuesta, latencia en milisegundos y costo en
+millonésimas de dólar. Los textos (modelo, repositorio, comando) se guardan
+una sola vez en un archivo de cadenas y las filas llevan su índice.
+
+Al ser todas las columnas del mismo tipo, el archivo se carga en un único
+`array('I')` y cada columna es un corte con paso (`datos[i::9]`), sin
+desempaquetar fila a fila: agregar un millón de filas cuesta poco más que
+recorrerlas una vez.
+"""
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from datetime import date
+from itertools import compress
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .utils import file_lock
+
+logger = logging.getLogger("hooperits_agent.usage_ledger")
+
+USAGE_LEDGER_FILENAME = "usage.ledger"
+USAGE_STRINGS_FILENAME = "usage_strings.jsonl"
+
+# Cabecera del archivo: identifica el formato (y su versión) de las filas
+_MAGIC = b"HUSAGE01"
+RECORD_FIELDS = (
+    "timestamp", "model", "repo", "command", "flags",
+    "prompt_tokens", "response_tokens", "latency_ms", "cost_micro_usd",
+)
+_RECORD = struct.Struct("<%dI" % len(RECORD_FIELDS))
+_UINT32_MAX = 0xFFFFFFFF
+
+FLAG_CACHE_HIT = 1
+FLAG_ERROR = 2
+
+GROUP_BY_FIELDS = ("day", "model", "repo", "command")
+
+
+def _clamp(value: float) -> int:
+    return max(0, min(_UINT32_MAX, int(round(value))))
+
+
+class UsageLedger:
+    """Archivo de filas de tamaño fijo con su tabla de cadenas."""
+
+    def __init__(self, cache_dir: Path):
+        """
+        Inicializa el registro.
+
+        Args:
+            cache_dir: Directorio donde guardar el registro
+        """
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = cache_dir / USAGE_LEDGER_FILENAME
+        self.strings_path = cache_dir / USAGE_STRINGS_FILENAME
+        self._ids: Dict[str, int] = {}
+        self._strings_offset = 0
+        self._header_ready = False
+        self._lock = threading.Lock()
+
+    def _load_new_strings(self) -> None:
+        """Incorpora las cadenas añadidas al archivo (por este u otros procesos)."""
+        try:
+            with open(self.strings_path, 'rb') as f:
+                f.seek(self._strings_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # Solo líneas completas: otra escritura podría estar a medias
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            self._ids.setdefault(json.loads(line), len(self._ids))
+        self._strings_offset += len(complete)
+
+    def _intern(self, value: str) -> int:
+        """Índice de `value` en la tabla de cadenas, añadiéndola si no está."""
+        string_id = self._ids.get(value)
+        if string_id is not None:
+            return string_id
+        with file_lock(self.strings_path):
+            self._load_new_strings()
+            if value not in self._ids:
+                with open(self.strings_path, 'ab') as f:
+                    f.write(json.dumps(value, ensure_ascii=False).encode('utf-8') + b"\n")
+                self._load_new_strings()
+        return self._ids[value]
+
+    def strings(self) -> List[str]:
+        """Tabla de cadenas, en orden de índice."""
+        with self._lock:
+            self._load_new_strings()
+            return sorted(self._ids, key=self._ids.__getitem__)
+
+    def _ensure_header(self) -> None:
+        """Crea el archivo con su cabecera (una vez por proceso, bajo bloqueo)."""
+        if self._header_ready:
+            return
+        with file_lock(self.path):
+            try:
+                size = self.path.stat().st_size
+            except FileNotFoundError:
+                size = 0
+            if size == 0:
+                with open(self.path, 'ab') as f:
+                    f.write(_MAGIC)
+            else:
+                with open(self.path, 'rb') as f:
+                    if f.read(len(_MAGIC)) != _MAGIC:
+                        raise ValueError(f"{self.path} no es un registro de uso compatible")
+        self._header_ready = True
+
+    def append(self, model: str, prompt_tokens: int = 0, response_tokens: int = 0,
+               latency_seconds: float = 0.0, cache_hit: bool = False, error: bool = False,
+               cost_usd: Optional[float] = None, command: str = "", repo: str = "",
+               timestamp: Optional[float] = None) -> None:
+        """
+        Añade una consulta al registro.
+
+        Args:
+            model: Modelo consultado
+            prompt_tokens: Tokens del prompt (0 si se sirvió de caché)
+            response_tokens: Tokens de la respuesta
+            latency_seconds: Tiempo hasta tener la respuesta completa
+            cache_hit: La respuesta salió de la caché (o de una consulta idéntica en curso)
+            error: La consulta no obtuvo respuesta utilizable
+            cost_usd: Costo estimado (None o 0 si es gratuita)
+            command: Comando del CLI que hizo la consulta
+            repo: Repositorio activo
+            timestamp: Instante de la consulta (por defecto, ahora)
+        """
+        flags = (FLAG_CACHE_HIT if cache_hit else 0) | (FLAG_ERROR if error else 0)
+        with self._lock:
+            self._ensure_header()
+            record = _RECORD.pack(
+                _clamp(time.time() if timestamp is None else timestamp),
+                self._intern(model or ""), self._intern(repo or ""), self._intern(command or ""),
+                flags, _clamp(prompt_tokens), _clamp(response_tokens),
+                _clamp(latency_seconds * 1000), _clamp((cost_usd or 0.0) * 1_000_000),
+            )
+            # Una sola escritura en modo O_APPEND: las filas de varios procesos no se mezclan
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, record)
+            finally:
+                os.close(fd)
+
+    def append_many(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        Añade muchas filas con una sola escritura (importaciones, pruebas de rendimiento).
+
+        Args:
+            rows: Diccionarios con los argumentos de `append`
+
+        Returns:
+            Filas añadidas
+        """
+        buffer = bytearray()
+        count = 0
+        with self._lock:
+            self._ensure_header()
+            for row in rows:
+                flags = (FLAG_CACHE_HIT if row.get("cache_hit") else 0) | (FLAG_ERROR if row.get("error") else 0)
+                buffer += _RECORD.pack(
+                    _clamp(row.get("timestamp") or time.time()),
+                    self._intern(row.get("model") or ""), self._intern(row.get("repo") or ""),
+                    self._intern(row.get("command") or ""), flags,
+                    _clamp(row.get("prompt_tokens", 0)), _clamp(row.get("response_tokens", 0)),
+                    _clamp(row.get("latency_seconds", 0.0) * 1000),
+                    _clamp((row.get("cost_usd") or 0.0) * 1_000_000),
+                )
+                count += 1
+            with open(self.path, 'ab') as f:
+                f.write(buffer)
+        return count
+
+    def read_columns(self) -> Dict[str, array]:
+        """
+        Carga el registro por columnas.
+
+        Returns:
+            Un `array('I')` por campo de `RECORD_FIELDS` (vacíos si no hay registro).
+            Una fila final incompleta (escritura interrumpida) se descarta
+        """
+        try:
+            data = self.path.read_bytes()
+        except FileNotFoundError:
+            data = b""
+        if data and not data.startswith(_MAGIC):
+            raise ValueError(f"{self.path} no es un registro de uso compatible")
+        body = memoryview(data)[len(_MAGIC):] if data else memoryview(b"")
+        rows = len(body) // _RECORD.size
+        values = array('I')
+        values.frombytes(body[:rows * _RECORD.size])
+        if sys.byteorder == "big":
+            values.byteswap()
+        width = len(RECORD_FIELDS)
+        return {name: values[index::width] for index, name in enumerate(RECORD_FIELDS)}
+
+
+def _percentile(sorted_values: Sequence[int], fraction: float) -> int:
+    """Percentil por rango más cercano de una lista ya ordenada (0 si está vacía)."""
+    if not sorted_values:
+        return 0
+    rank = max(1, -(-len(sorted_values) * fraction // 1))  # techo(n * fracción)
+    return sorted_values[int(rank) - 1]
+
+
+def _local_days(timestamps: Sequence[int]) -> List[str]:
+    """Día local (AAAA-MM-DD) de cada instante, convirtiendo una vez por hora distinta."""
+    day_by_hour: Dict[int, str] = {}
+    days = []
+    for timestamp in timestamps:
+        hour = timestamp // 3600
+        day = day_by_hour.get(hour)
+        if day is None:
+            day = day_by_hour[hour] = date.fromtimestamp(hour * 3600).isoformat()
+        days.append(day)
+    return days
+
+
+def summarize_usage(columns: Dict[str, array], strings: Sequence[str],
+                    group_by: Sequence[str] = ("day", "model", "repo"),
+                    since: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Agrega el registro por grupos.
+
+    Los percentiles de latencia y de tokens por llamada se calculan solo sobre
+    las consultas que llegaron a la API (sin aciertos de caché ni errores).
+
+    Args:
+        columns: Resultado de `UsageLedger.read_columns`
+        strings: Resultado de `UsageLedger.strings`
+        group_by: Campos de `GROUP_BY_FIELDS` por los que agrupar
+        since: Si se indica, solo filas a partir de ese instante (epoch)
+
+    Returns:
+        Una fila por grupo, ordenadas por clave, con `calls`, `cache_hits`,
+        `errors`, `prompt_tokens`, `response_tokens`, `cost_usd`,
+        `latency_p50_ms`, `latency_p95_ms`, `tokens_p50` y `tokens_p95`
+    """
+    unknown = [field for field in group_by if field not in GROUP_BY_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos de agrupación no válidos: {', '.join(unknown)}")
+
+    if since is not None:
+        # Las filas van en orden de llegada, pero el reloj puede retroceder (NTP,
+        # procesos simultáneos): se filtra fila a fila en lugar de buscar un corte
+        mask = [timestamp >= since for timestamp in columns["timestamp"]]
+        if not all(mask):
+            columns = {name: array(values.typecode, compress(values, mask)) for name, values in columns.items()}
+    timestamps = columns["timestamp"]
+    key_columns: List[Sequence[Any]] = []
+    for field in group_by:
+        if field == "day":
+            key_columns.append(_local_days(timestamps))
+        else:
+            key_columns.append(columns[field])
+    keys: Iterable[Tuple] = zip(*key_columns) if key_columns else (() for _ in range(len(timestamps)))
+
+    groups: Dict[Tuple, List[Any]] = {}
+    for key, flags, prompt_tokens, response_tokens, latency_ms, cost in zip(
+            keys, columns["flags"], columns["prompt_tokens"], columns["response_tokens"],
+            columns["latency_ms"], columns["cost_micro_usd"]):
+        group = groups.get(key)
+        if group is None:
+            # calls, cache_hits, errors, prompt, response, cost, latencias, tokens por llamada
+            group = groups[key] = [0, 0, 0, 0, 0, 0, [], []]
+        group[0] += 1
+        group[3] += prompt_tokens
+        group[4] += response_tokens
+        group[5] += cost
+        if flags & FLAG_CACHE_HIT:
+            group[1] += 1
+        elif flags & FLAG_ERROR:
+            group[2] += 1
+        else:
+            group[6].append(latency_ms)
+            group[7].append(prompt_tokens + response_tokens)
+
+    summary = []
+    for key in sorted(groups, key=lambda k: tuple(
+            strings[part] if field != "day" else part for field, part in zip(group_by, k))):
+        calls, hits, errors, prompt_tokens, response_tokens, cost, latencies, tokens = groups[key]
+        latencies.sort()
+        tokens.sort()
+        row: Dict[str, Any] = {
+            field: part if field == "day" else strings[part] for field, part in zip(group_by, key)
+        }
+        row.update(
+            calls=calls, cache_hits=hits, errors=errors,
+            prompt_tokens=prompt_tokens, response_tokens=response_tokens, cost_usd=cost / 1_000_000,
+            latency_p50_ms=_percentile(latencies, 0.5), latency_p95_ms=_percentile(latencies, 0.95),
+            tokens_p50=_percentile(tokens, 0.5), tokens_p95=_percentile(tokens, 0.95),
+        )
+        summary.append(row)
+    return summary
+
+
+__all__ = [
+    'UsageLedger',
+    'summarize_usage',
+    'RECORD_FIELDS',
+    'GROUP_BY_FIELDS',
+    'FLAG_CACHE_HIT',
+    'FLAG_ERROR',
+    'USAGE_LEDGER_FILENAME',
+    'USAGE_STRINGS_FILENAME',
+]
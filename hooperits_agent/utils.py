@@ -3,15 +3,26 @@ Utilidades comunes para HOOPERITS AI CODE AGENT.
 """
 import os
 import json
+import base64
 import logging
 import hashlib
+import lzma
+import tempfile
+import zlib
+from contextlib import contextmanager
 from pathlib import Path
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List, Union
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Union, Iterator
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn
 import time
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+    import msvcrt
+
 console = Console()
 
 # Configuración de logging
@@ -48,27 +59,193 @@ def setup_logging(log_level: str = "INFO", log_file: Optional[str] = None) -> lo
     
     return logger
 
+# Escrituras seguras entre procesos
+@contextmanager
+def file_lock(path: Union[str, Path], timeout: float = 30.0) -> Iterator[None]:
+    """
+    Bloqueo exclusivo entre procesos sobre `path`, usando el archivo auxiliar `<path>.lock`.
+    
+    Args:
+        path: Archivo a proteger
+        timeout: Segundos máximos de espera por el bloqueo
+        
+    Raises:
+        TimeoutError: Si no se obtiene el bloqueo a tiempo
+    """
+    lock_path = f"{path}.lock"
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"No se pudo bloquear {path} en {timeout}s")
+                time.sleep(0.005)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    finally:
+        os.close(fd)
+
+def atomic_write_bytes(path: Union[str, Path], data: bytes) -> None:
+    """
+    Escribe un archivo de forma atómica: temporal en el mismo directorio + `os.replace`.
+    
+    Un lector concurrente ve el contenido anterior completo o el nuevo completo,
+    nunca un archivo a medio escribir.
+    
+    Args:
+        path: Archivo destino
+        data: Contenido
+    """
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def atomic_write_text(path: Union[str, Path], text: str, encoding: str = 'utf-8') -> None:
+    """
+    Versión de texto de `atomic_write_bytes`.
+    
+    Args:
+        path: Archivo destino
+        text: Contenido
+        encoding: Codificación del texto
+    """
+    atomic_write_bytes(path, text.encode(encoding))
+
+def atomic_write_json(path: Union[str, Path], data: Any, indent: Optional[int] = 2) -> None:
+    """
+    Serializa `data` como JSON y lo escribe con `atomic_write_text`.
+    
+    Args:
+        path: Archivo destino
+        data: Datos serializables
+        indent: Indentación (None para JSON compacto)
+    """
+    atomic_write_text(path, json.dumps(data, indent=indent, ensure_ascii=False))
+
+# Compresión de entradas de caché
+CACHE_CODECS = ("raw", "zlib", "lzma")
+
+def compress_text(text: str, codec: str = "raw") -> bytes:
+    """
+    Codifica un texto en UTF-8 y lo comprime con el códec indicado.
+    
+    Args:
+        text: Texto a comprimir
+        codec: "raw" (sin compresión), "zlib" o "lzma"
+        
+    Returns:
+        Bytes comprimidos
+    """
+    data = text.encode('utf-8')
+    if codec == "zlib":
+        return zlib.compress(data, 6)
+    if codec == "lzma":
+        return lzma.compress(data, preset=6)
+    if codec == "raw":
+        return data
+    raise ValueError(f"Códec de caché desconocido: {codec}")
+
+def decompress_text(data: bytes, codec: str = "raw") -> str:
+    """
+    Operación inversa de `compress_text`.
+    
+    Args:
+        data: Bytes comprimidos
+        codec: Códec con el que se comprimieron
+        
+    Returns:
+        Texto original
+    """
+    if codec == "zlib":
+        data = zlib.decompress(data)
+    elif codec == "lzma":
+        data = lzma.decompress(data)
+    elif codec != "raw":
+        raise ValueError(f"Códec de caché desconocido: {codec}")
+    return data.decode('utf-8')
+
 # Sistema de caché simple
+def build_cache_key(prompt: str, model: str) -> str:
+    """
+    Genera la clave de caché para un prompt y modelo.
+    
+    Todos los backends de caché comparten esta clave, de modo que una misma
+    consulta se resuelve igual sin importar dónde esté almacenada.
+    
+    Args:
+        prompt: El prompt original
+        model: El modelo usado
+        
+    Returns:
+        Hash SHA-256 en hexadecimal
+    """
+    content = f"{model}:{prompt}"
+    return hashlib.sha256(content.encode()).hexdigest()
+
 class SimpleCache:
     """Sistema de caché simple basado en archivos JSON."""
     
-    def __init__(self, cache_dir: Path = None, expiration_seconds: int = 3600):
+    def __init__(self, cache_dir: Path = None, expiration_seconds: int = 3600,
+                 compression: str = "raw", pretty: bool = True):
         """
         Inicializa el sistema de caché.
         
         Args:
             cache_dir: Directorio para almacenar caché
             expiration_seconds: Tiempo de expiración en segundos
+            compression: Códec para las respuestas nuevas ("raw", "zlib" o "lzma")
+            pretty: Guardar el JSON indentado (más legible, más grande)
         """
         self.cache_dir = cache_dir or Path.home() / ".hooperits_cache"
         self.cache_dir.mkdir(parents=True, exist_ok=True)
         self.expiration_seconds = expiration_seconds
+        self.compression = compression
+        self.indent = 2 if pretty else None
         self.cache_file = self.cache_dir / "gemini_responses.json"
         
     def _get_cache_key(self, prompt: str, model: str) -> str:
         """Genera una clave única para el prompt y modelo."""
-        content = f"{model}:{prompt}"
-        return hashlib.sha256(content.encode()).hexdigest()
+        return build_cache_key(prompt, model)
+    
+    @staticmethod
+    def entry_expires_at(entry: Dict[str, Any]) -> float:
+        """Expiración como epoch; las entradas antiguas solo tienen la fecha ISO."""
+        if 'expires_at' in entry:
+            return float(entry['expires_at'])
+        return datetime.fromisoformat(entry['expiration']).timestamp()
+    
+    @staticmethod
+    def decode_response(entry: Dict[str, Any]) -> str:
+        """Devuelve la respuesta de una entrada; las entradas sin 'codec' están en claro."""
+        codec = entry.get('codec', 'raw')
+        if codec == 'raw':
+            response: str = entry['response']
+            return response
+        return decompress_text(base64.b64decode(entry['response']), codec)
     
     def get(self, prompt: str, model: str) -> Optional[str]:
         """
@@ -95,15 +272,15 @@ class SimpleCache:
             return None
             
         entry = cache_data[key]
-        expiration = datetime.fromisoformat(entry['expiration'])
         
-        if datetime.now() > expiration:
+        if time.time() > self.entry_expires_at(entry):
             # Entrada expirada
             return None
             
-        return entry['response']
+        return self.decode_response(entry)
     
-    def set(self, prompt: str, model: str, response: str):
+    def set(self, prompt: str, model: str, response: str,
+            prompt_tokens: int = 0, response_tokens: int = 0):
         """
         Guarda una respuesta en el caché.
         
@@ -111,54 +288,76 @@ class SimpleCache:
             prompt: El prompt original
             model: El modelo usado
             response: La respuesta a cachear
+            prompt_tokens: Tokens de entrada que costó la respuesta
+            response_tokens: Tokens de salida que costó la respuesta
         """
-        cache_data = {}
-        if self.cache_file.exists():
-            try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
-            except (json.JSONDecodeError, IOError):
-                pass
-        
         key = self._get_cache_key(prompt, model)
-        expiration = datetime.now() + timedelta(seconds=self.expiration_seconds)
+        now = time.time()
+        expires_at = now + self.expiration_seconds
         
-        cache_data[key] = {
-            'response': response,
-            'expiration': expiration.isoformat(),
-            'model': model,
-            'created': datetime.now().isoformat()
-        }
+        stored_response = response
+        if self.compression != 'raw':
+            stored_response = base64.b64encode(compress_text(response, self.compression)).decode('ascii')
         
-        with open(self.cache_file, 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f, indent=2, ensure_ascii=False)
+        with file_lock(self.cache_file):
+            cache_data = self._load_for_update()
+            cache_data[key] = {
+                'response': stored_response,
+                'codec': self.compression,
+                'expires_at': expires_at,
+                'expiration': datetime.fromtimestamp(expires_at).isoformat(),
+                'model': model,
+                'created': datetime.fromtimestamp(now).isoformat(),
+                'prompt_tokens': prompt_tokens,
+                'response_tokens': response_tokens
+            }
+            atomic_write_json(self.cache_file, cache_data, indent=self.indent)
+    
+    def _load_for_update(self) -> Dict[str, Any]:
+        """
+        Lee la caché antes de modificarla (debe llamarse con el bloqueo tomado).
+        
+        Un archivo ilegible se aparta como `*.corrupt` en lugar de sobrescribirse,
+        para no perder en silencio las respuestas que contenía.
+        """
+        if not self.cache_file.exists():
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data: Dict[str, Any] = json.load(f)
+            return data
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            corrupt_path = self.cache_file.with_name(self.cache_file.name + ".corrupt")
+            os.replace(self.cache_file, corrupt_path)
+            logging.getLogger("hooperits_agent").warning(
+                f"Caché JSON ilegible; se apartó como {corrupt_path}")
+            return {}
     
     def clear(self):
         """Limpia todo el caché."""
-        if self.cache_file.exists():
-            self.cache_file.unlink()
+        with file_lock(self.cache_file):
+            if self.cache_file.exists():
+                self.cache_file.unlink()
             
     def cleanup_expired(self):
         """Elimina entradas expiradas del caché."""
         if not self.cache_file.exists():
             return
             
-        try:
-            with open(self.cache_file, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return
-            
-        now = datetime.now()
-        cleaned_data = {}
-        
-        for key, entry in cache_data.items():
-            expiration = datetime.fromisoformat(entry['expiration'])
-            if now <= expiration:
-                cleaned_data[key] = entry
+        with file_lock(self.cache_file):
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    cache_data = json.load(f)
+            except (json.JSONDecodeError, IOError):
+                return
                 
-        with open(self.cache_file, 'w', encoding='utf-8') as f:
-            json.dump(cleaned_data, f, indent=2, ensure_ascii=False)
+            now = time.time()
+            cleaned_data = {
+                key: entry for key, entry in cache_data.items()
+                if now <= self.entry_expires_at(entry)
+            }
+                    
+            atomic_write_json(self.cache_file, cleaned_data, indent=self.indent)
 
 # Funciones de validación
 def validate_repo_name(name: str) -> bool:
@@ -213,6 +412,21 @@ def format_file_size(size_bytes: int) -> str:
         size_bytes /= 1024.0
     return f"{size_bytes:.1f} PB"
 
+def format_duration(seconds: float) -> str:
+    """
+    Formatea una duración en segundos a formato legible.
+    
+    Args:
+        seconds: Duración en segundos
+        
+    Returns:
+        Cadena formateada en la unidad mayor que cabe (ej: "45 s", "12 min", "3 h", "2 d")
+    """
+    for unit, size in (('d', 86400), ('h', 3600), ('min', 60)):
+        if seconds >= size:
+            return f"{int(seconds // size)} {unit}"
+    return f"{int(seconds)} s"
+
 def truncate_text(text: str, max_length: int = 100, suffix: str = "...") -> str:
     """
     Trunca texto a una longitud máxima.
@@ -336,10 +550,19 @@ def format_cost(cost: float, currency: str = "USD") -> str:
 # Exportar todas las funciones y clases públicas
 __all__ = [
     'setup_logging',
+    'file_lock',
+    'atomic_write_bytes',
+    'atomic_write_text',
+    'atomic_write_json',
+    'CACHE_CODECS',
+    'compress_text',
+    'decompress_text',
+    'build_cache_key',
     'SimpleCache',
     'validate_repo_name',
     'validate_file_path',
     'format_file_size',
+    'format_duration',
     'truncate_text',
     'show_progress',
     'count_tokens_estimate',
@@ -112,4 +112,39 @@ def reset_singletons():
     import hooperits_agent.gemini_ops as gemini_ops
     gemini_ops._genai_model_instance = None
     gemini_ops._selected_model_name = None
-    gemini_ops._model_tier_info_cache = None 
\ No newline at end of file
+    gemini_ops._model_tier_info_cache = None 
+
+@pytest.fixture(autouse=True)
+def isolated_usage_ledger(monkeypatch):
+    """
+    Evita que las pruebas anoten consultas en el registro de uso del proyecto.
+    """
+    monkeypatch.setattr("hooperits_agent.gemini_ops.usage_ledger", None)
+
+
+@pytest.fixture(autouse=True)
+def isolated_encoding_cache(monkeypatch):
+    """
+    Evita que las pruebas guarden codificaciones en la memoria del proyecto.
+    """
+    monkeypatch.setattr("hooperits_agent.project_analyzer.encoding_cache", None)
+
+
+@pytest.fixture(autouse=True)
+def isolated_gemini_caches(monkeypatch, tmp_path_factory):
+    """
+    Evita que las pruebas lean o escriban las cachés del proyecto: la caché de
+    respuestas (vacía, en un directorio temporal), los conteos de tokens, la
+    calibración del estimador, los bloqueos de single-flight y el catálogo de modelos.
+    """
+    import hooperits_agent.gemini_ops as gemini_ops
+    from hooperits_agent.cache import SQLiteCache
+    from hooperits_agent.model_catalog import ModelCatalog
+    from hooperits_agent.single_flight import SingleFlight
+
+    cache_dir = tmp_path_factory.mktemp("cache")
+    monkeypatch.setattr(gemini_ops, "cache", SQLiteCache(cache_dir, expiration_seconds=3600))
+    monkeypatch.setattr(gemini_ops, "token_count_cache", None)
+    monkeypatch.setattr(gemini_ops, "token_estimator", None)
+    monkeypatch.setattr(gemini_ops, "single_flight", SingleFlight(cache_dir / "inflight"))
+    monkeypatch.setattr(gemini_ops, "model_catalog", ModelCatalog(cache_dir, ttl_seconds=3600))
@@ -0,0 +1,106 @@
+"""
+Tests unitarios para el envío asíncrono y el comando `batch` (con un modelo falso).
+"""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from hooperits_agent import batch_ops, gemini_ops
+
+MODEL = "models/fake-model"
+LATENCY = 0.05
+
+
+class _FakeAsyncModel:
+    """Modelo con `generate_content_async` que registra cuántas llamadas hay a la vez."""
+
+    def __init__(self):
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate_content_async(self, prompt):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(LATENCY)
+            if "falla" in prompt:
+                raise RuntimeError("503 Service Unavailable")
+            return SimpleNamespace(
+                text=f"respuesta a {prompt}", prompt_feedback=None, candidates=[],
+                usage_metadata=SimpleNamespace(prompt_token_count=10, candidates_token_count=4),
+            )
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch, temp_dir):
+    model = _FakeAsyncModel()
+    monkeypatch.setattr(gemini_ops, "_initialize_and_get_gemini_model_instance", lambda: model)
+    monkeypatch.setattr(gemini_ops, "_selected_model_name", MODEL)
+    return model
+
+
+class TestLoadBatchPrompts:
+    """Tests para `load_batch_prompts`."""
+
+    def test_reads_ids_and_defaults_to_line_number(self, temp_dir):
+        path = temp_dir / "prompts.jsonl"
+        path.write_text('{"id": "a", "prompt": "uno"}\n\n{"prompt": "dos"}\n', encoding="utf-8")
+        assert batch_ops.load_batch_prompts(path) == [
+            {"id": "a", "prompt": "uno"}, {"id": 3, "prompt": "dos"}]
+
+    def test_rejects_lines_without_prompt(self, temp_dir):
+        path = temp_dir / "prompts.jsonl"
+        path.write_text('{"id": "a"}\n', encoding="utf-8")
+        with pytest.raises(ValueError, match="Línea 1"):
+            batch_ops.load_batch_prompts(path)
+
+
+class TestRunBatch:
+    """Tests para `run_batch`."""
+
+    def test_concurrency_is_bounded_and_scales(self, fake_gemini, temp_dir):
+        items = [{"id": i, "prompt": f"prompt {i}"} for i in range(40)]
+        start = time.perf_counter()
+        summary = asyncio.run(batch_ops.run_batch(items, temp_dir / "out.ndjson", concurrency=10))
+        elapsed = time.perf_counter() - start
+
+        assert summary["ok"] == 40
+        assert fake_gemini.max_in_flight == 10
+        # 40 prompts / 10 simultáneos = 4 rondas, no 40 llamadas en serie
+        assert elapsed < 40 * LATENCY / 2
+
+    def test_results_are_written_as_ndjson(self, fake_gemini, temp_dir):
+        items = [{"id": "ok", "prompt": "hola"}, {"id": "bad", "prompt": "esto falla"}]
+        output = temp_dir / "out.ndjson"
+        summary = asyncio.run(batch_ops.run_batch(items, output, concurrency=2))
+
+        records = {r["id"]: r for r in map(json.loads, output.read_text(encoding="utf-8").splitlines())}
+        assert summary["ok"] == 1 and summary["errors"] == 1
+        assert records["ok"]["text"] == "respuesta a hola"
+        assert records["ok"]["prompt_tokens"] == 10 and records["ok"]["response_tokens"] == 4
+        assert "503" in records["bad"]["error"] and "text" not in records["bad"]
+
+    def test_second_run_is_served_from_cache(self, fake_gemini, temp_dir):
+        items = [{"id": i, "prompt": f"prompt {i}"} for i in range(5)]
+        asyncio.run(batch_ops.run_batch(items, temp_dir / "a.ndjson", concurrency=5))
+        summary = asyncio.run(batch_ops.run_batch(items, temp_dir / "b.ndjson", concurrency=5))
+
+        assert summary["cached"] == 5
+        assert fake_gemini.calls == 5
+
+    def test_model_is_initialized_once_per_batch(self, fake_gemini, temp_dir, monkeypatch):
+        calls = []
+        monkeypatch.setattr(gemini_ops, "_initialize_and_get_gemini_model_instance",
+                            lambda: calls.append(1) or fake_gemini)
+        items = [{"id": i, "prompt": f"prompt {i}"} for i in range(6)]
+        summary = asyncio.run(batch_ops.run_batch(items, temp_dir / "out.ndjson", concurrency=3))
+
+        assert summary["ok"] == 6
+        assert len(calls) == 1
@@ -0,0 +1,496 @@
+"""
+Tests unitarios para el módulo cache.
+"""
+import json
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from hooperits_agent.cache import (
+    _SCHEMA_MIGRATIONS,
+    CACHE_DB_FILENAME,
+    LEGACY_CACHE_FILENAME,
+    CacheBundleError,
+    MemoryCache,
+    SQLiteCache,
+    TieredCache,
+    create_cache,
+    export_bundle,
+    import_bundle,
+)
+from hooperits_agent.utils import SimpleCache, build_cache_key
+
+
+class TestSQLiteCache:
+    """Tests para el backend SQLite."""
+
+    def test_cache_basic_operations(self, temp_dir):
+        """Test operaciones básicas del caché."""
+        cache = SQLiteCache(temp_dir, expiration_seconds=10)
+
+        cache.set("test prompt", "model-1", "test response")
+        assert cache.get("test prompt", "model-1") == "test response"
+        assert cache.get("different prompt", "model-1") is None
+        assert cache.get("test prompt", "model-2") is None
+
+    def test_cache_overwrite(self, temp_dir):
+        """Una segunda escritura de la misma clave reemplaza la anterior."""
+        cache = SQLiteCache(temp_dir, expiration_seconds=10)
+
+        cache.set("prompt", "model", "v1")
+        cache.set("prompt", "model", "v2")
+        assert cache.get("prompt", "model") == "v2"
+
+    def test_cache_persists_between_instances(self, temp_dir):
+        """Test que las entradas sobreviven a una nueva instancia."""
+        SQLiteCache(temp_dir, expiration_seconds=10).set("prompt", "model", "response")
+        assert SQLiteCache(temp_dir, expiration_seconds=10).get("prompt", "model") == "response"
+
+    def test_cache_expiration(self, temp_dir):
+        """Test expiración del caché."""
+        cache = SQLiteCache(temp_dir, expiration_seconds=0)
+
+        cache.set("test prompt", "model-1", "test response")
+        assert cache.get("test prompt", "model-1") is None
+
+    def test_cache_clear(self, temp_dir):
+        """Test limpieza del caché."""
+        cache = SQLiteCache(temp_dir, expiration_seconds=3600)
+
+        cache.set("prompt1", "model", "response1")
+        cache.set("prompt2", "model", "response2")
+        cache.clear()
+
+        assert cache.get("prompt1", "model") is None
+        assert cache.get("prompt2", "model") is None
+
+    def test_cache_cleanup_expired(self, temp_dir):
+        """Test limpieza de entradas expiradas."""
+        expired = SQLiteCache(temp_dir, expiration_seconds=-3600)
+        expired.set("old prompt", "model", "old response")
+        cache = SQLiteCache(temp_dir, expiration_seconds=3600)
+        cache.set("new prompt", "model", "new response")
+
+        cache.cleanup_expired()
+
+        rows = cache._connection().execute("SELECT key FROM entries").fetchall()
+        assert [r[0] for r in rows] == [build_cache_key("new prompt", "model")]
+
+    def test_migrate_from_legacy_json(self, temp_dir):
+        """Las entradas vigentes del JSON antiguo se importan al abrir la caché."""
+        legacy = SimpleCache(temp_dir, expiration_seconds=3600)
+        legacy.set("prompt", "model", "legacy response")
+
+        now = datetime.now()
+        legacy_file = temp_dir / LEGACY_CACHE_FILENAME
+        data = json.loads(legacy_file.read_text(encoding='utf-8'))
+        data["expired_key"] = {
+            "response": "expired response",
+            "expiration": (now - timedelta(hours=1)).isoformat(),
+            "model": "model",
+            "created": (now - timedelta(hours=2)).isoformat(),
+        }
+        legacy_file.write_text(json.dumps(data), encoding='utf-8')
+
+        cache = SQLiteCache(temp_dir, expiration_seconds=3600)
+
+        assert cache.get("prompt", "model") == "legacy response"
+        assert not legacy_file.exists()
+        assert (temp_dir / (LEGACY_CACHE_FILENAME + ".migrated")).exists()
+        count = cache._connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        assert count == 1
+
+
+class TestCreateCache:
+    """Tests para la selección de backend."""
+
+    def test_create_cache_backends(self, temp_dir):
+        assert isinstance(create_cache("sqlite", temp_dir, 10), SQLiteCache)
+        assert isinstance(create_cache("json", temp_dir, 10), SimpleCache)
+        assert isinstance(create_cache("unknown", Path(temp_dir), 10), SQLiteCache)
+        tiered = create_cache("sqlite", temp_dir, 10, memory_max_entries=8, memory_max_bytes=1024)
+        assert isinstance(tiered, TieredCache)
+
+
+class TestSQLiteCacheEviction:
+    """Tests para los límites LRU y las estadísticas."""
+
+    def test_entry_budget_evicts_least_recently_used(self, temp_dir):
+        cache = SQLiteCache(temp_dir, expiration_seconds=3600, max_entries=2)
+
+        cache.set("a", "model", "response a")
+        cache.set("b", "model", "response b")
+        assert cache.get("a", "model") == "response a"  # "b" pasa a ser el menos usado
+        cache.set("c", "model", "response c")
+
+        assert cache.get("a", "model") == "response a"
+        assert cache.get("b", "model") is None
+        assert cache.get("c", "model") == "response c"
+        assert cache.stats()["entries"] == 2
+
+    def test_byte_budget(self, temp_dir):
+        cache = SQLiteCache(temp_dir, expiration_seconds=3600, max_bytes=25, compression="raw")
+
+        cache.set("a", "model", "x" * 10)
+        cache.set("b", "model", "y" * 10)
+        cache.set("c", "model", "z" * 10)
+        cache.set("too big", "model", "w" * 26)
+
+        stats = cache.stats()
+        assert stats["bytes"] == 20
+        assert cache.get("a", "model") is None
+        assert cache.get("too big", "model") is None
+
+    def test_stats_track_hits_and_savings(self, temp_dir):
+        cache = SQLiteCache(temp_dir, expiration_seconds=3600)
+
+        cache.set("prompt", "model", "respuesta", prompt_tokens=100, response_tokens=40)
+        cache.get("prompt", "model")
+        cache.get("prompt", "model")
+        cache.get("missing", "model")
+
+        (model_stats,) = cache.stats()["models"]
+        assert model_stats["hits"] == 2
+        assert model_stats["misses"] == 1
+        assert model_stats["bytes_saved"] == 2 * len("respuesta")
+        assert model_stats["prompt_tokens_saved"] == 200
+        assert model_stats["response_tokens_saved"] == 80
+
+    def test_lookups_do_not_write_until_flushed(self, temp_dir):
+        cache = SQLiteCache(temp_dir, expiration_seconds=3600)
+        cache.set("prompt", "model", "respuesta")
+        observer = sqlite3.connect(str(temp_dir / CACHE_DB_FILENAME))
+        version = observer.execute("PRAGMA data_version").fetchone()[0]
+
+        cache.get("prompt", "model")
+        cache.get("missing", "model")
+        assert observer.execute("PRAGMA data_version").fetchone()[0] == version
+        assert observer.execute("SELECT COUNT(*) FROM cache_stats").fetchone()[0] == 0
+
+        cache.flush()
+        assert observer.execute("SELECT hits, misses FROM cache_stats").fetchone() == (1, 1)
+        observer.close()
+
+    def test_totals_survive_overwrite(self, temp_dir):
+        cache = SQLiteCache(temp_dir, expiration_seconds=3600, compression="raw")
+
+        cache.set("prompt", "model", "abc")
+        cache.set("prompt", "model", "abcdef")
+
+        stats = cache.stats()
+        assert stats["entries"] == 1
+        assert stats["bytes"] == 6
+
+
+class TestTieredCache:
+    """Tests para el nivel en memoria delante de SQLite."""
+
+    def _tiered(self, temp_dir, generation_check_interval=0.0, **memory_kwargs):
+        memory_kwargs.setdefault("max_entries", 16)
+        memory_kwargs.setdefault("max_bytes", 1024 * 1024)
+        return TieredCache(SQLiteCache(temp_dir, expiration_seconds=3600),
+                           MemoryCache(**memory_kwargs), generation_check_interval=generation_check_interval)
+
+    def test_repeated_get_is_served_from_memory(self, temp_dir, mocker):
+        cache = self._tiered(temp_dir)
+        cache.set("prompt", "model", "response")
+        spy = mocker.spy(cache.backend, "get_entry")
+
+        assert cache.get("prompt", "model") == "response"
+        assert cache.get("prompt", "model") == "response"
+        assert spy.call_count == 0
+
+    def test_memory_hits_are_counted_in_stats(self, temp_dir):
+        cache = self._tiered(temp_dir)
+        cache.set("prompt", "model", "response", prompt_tokens=10, response_tokens=5)
+        cache.get("prompt", "model")
+        cache.get("prompt", "model")
+
+        stats = cache.stats()
+        assert stats["models"][0]["hits"] == 2
+        assert stats["models"][0]["prompt_tokens_saved"] == 20
+        assert stats["memory_entries"] == 1
+
+    def test_write_from_other_process_invalidates_memory(self, temp_dir):
+        cache = self._tiered(temp_dir)
+        cache.set("prompt", "model", "old")
+        assert cache.get("prompt", "model") == "old"
+
+        # Otra conexión simula otro proceso escribiendo en el backend
+        SQLiteCache(temp_dir, expiration_seconds=3600).set("prompt", "model", "new")
+
+        assert cache.get("prompt", "model") == "new"
+
+    def test_reads_from_other_process_keep_memory(self, temp_dir, mocker):
+        cache = self._tiered(temp_dir)
+        cache.set("prompt", "model", "response")
+        assert cache.get("prompt", "model") == "response"
+
+        # Las lecturas ajenas (y el volcado de sus estadísticas) no cambian el contenido
+        other = SQLiteCache(temp_dir, expiration_seconds=3600)
+        other.get("prompt", "model")
+        other.get("missing", "model")
+        other.flush()
+
+        spy = mocker.spy(cache.backend, "get_entry")
+        assert cache.get("prompt", "model") == "response"
+        assert spy.call_count == 0
+
+    def test_memory_hits_reread_generation_only_after_other_commits(self, temp_dir, mocker):
+        cache = self._tiered(temp_dir)
+        cache.set("prompt", "model", "response")
+        assert cache.get("prompt", "model") == "response"
+        spy = mocker.spy(SQLiteCache, "_read_generation")
+
+        for _ in range(5):
+            assert cache.get("prompt", "model") == "response"
+        assert spy.call_count == 0
+
+        SQLiteCache(temp_dir, expiration_seconds=3600).set("other", "model", "x")
+        reads_by_writer = spy.call_count
+        assert cache.get("prompt", "model") == "response"
+        assert cache.get("prompt", "model") == "response"
+        assert spy.call_count == reads_by_writer + 1
+
+    def test_memory_hits_check_generation_at_most_once_per_interval(self, temp_dir, mocker):
+        cache = self._tiered(temp_dir, generation_check_interval=60.0)
+        cache.set("prompt", "model", "old")
+        spy = mocker.spy(cache.backend, "generation")
+
+        SQLiteCache(temp_dir, expiration_seconds=3600).set("prompt", "model", "new")
+        # Dentro del intervalo se sirve la memoria sin consultar SQLite
+        assert cache.get("prompt", "model") == "old"
+        assert spy.call_count == 0
+
+        cache._generation_checked_at -= 60.0
+        assert cache.get("prompt", "model") == "new"
+        assert spy.call_count == 1
+
+    def test_clear_empties_both_tiers(self, temp_dir):
+        cache = self._tiered(temp_dir)
+        cache.set("prompt", "model", "response")
+        cache.clear()
+
+        assert cache.get("prompt", "model") is None
+        assert len(cache.memory) == 0
+
+
+class TestMemoryCache:
+    """Tests para el LRU en memoria."""
+
+    def _entry(self, key, response="r", expires_in=3600):
+        import time
+        return {"key": key, "model": "model", "response": response,
+                "expires_at": time.time() + expires_in, "size_bytes": len(response),
+                "prompt_tokens": 0, "response_tokens": 0}
+
+    def test_lru_bounds(self):
+        memory = MemoryCache(max_entries=2, max_bytes=1024)
+        memory.put(self._entry("a"))
+        memory.put(self._entry("b"))
+        memory.get("a")
+        memory.put(self._entry("c"))
+
+        assert memory.get("b") is None
+        assert memory.get("a") is not None
+        assert len(memory) == 2
+
+    def test_byte_bound_and_expiration(self):
+        memory = MemoryCache(max_entries=10, max_bytes=10)
+        memory.put(self._entry("a", "x" * 6))
+        memory.put(self._entry("b", "y" * 6))
+        memory.put(self._entry("expired", expires_in=-1))
+
+        assert memory.get("a") is None
+        assert memory.get("b") is not None
+        assert memory.get("expired") is None
+
+
+class TestCompression:
+    """Tests para la compresión por entrada."""
+
+    RESPONSE = "## Propósito Principal\n" + "Análisis de arquitectura. " * 200
+
+    def test_sqlite_codecs_round_trip(self, temp_dir):
+        for codec in ("raw", "zlib", "lzma"):
+            cache = SQLiteCache(temp_dir / codec, expiration_seconds=3600, compression=codec)
+            cache.set("prompt", "model", self.RESPONSE)
+            assert cache.get("prompt", "model") == self.RESPONSE
+
+    def test_sqlite_reads_entries_written_with_other_codec(self, temp_dir):
+        SQLiteCache(temp_dir, expiration_seconds=3600, compression="raw").set("a", "m", "plain")
+        SQLiteCache(temp_dir, expiration_seconds=3600, compression="lzma").set("b", "m", "packed")
+
+        cache = SQLiteCache(temp_dir, expiration_seconds=3600, compression="zlib")
+        assert cache.get("a", "m") == "plain"
+        assert cache.get("b", "m") == "packed"
+
+    def test_compressed_size_counts_towards_budget(self, temp_dir):
+        cache = SQLiteCache(temp_dir, expiration_seconds=3600, compression="zlib")
+        cache.set("prompt", "model", self.RESPONSE)
+        assert 0 < cache.stats()["bytes"] < len(self.RESPONSE.encode("utf-8")) // 4
+
+    def test_json_backend_compression_and_compact_output(self, temp_dir):
+        legacy = SimpleCache(temp_dir, expiration_seconds=3600)
+        legacy.set("old", "model", "old response")
+
+        cache = SimpleCache(temp_dir, expiration_seconds=3600, compression="zlib", pretty=False)
+        cache.set("new", "model", self.RESPONSE)
+
+        assert cache.get("old", "model") == "old response"
+        assert cache.get("new", "model") == self.RESPONSE
+        raw_file = (temp_dir / LEGACY_CACHE_FILENAME).read_text(encoding="utf-8")
+        assert "\n" not in raw_file
+        assert "Análisis de arquitectura" not in raw_file
+
+    def test_migration_decodes_compressed_json_entries(self, temp_dir):
+        SimpleCache(temp_dir, 3600, compression="lzma").set("prompt", "model", self.RESPONSE)
+        assert SQLiteCache(temp_dir, 3600).get("prompt", "model") == self.RESPONSE
+
+
+class TestIncrementalExpiry:
+    """Tests para la expiración por índice."""
+
+    def _expired_rows(self, cache):
+        import time
+        return cache._connection().execute(
+            "SELECT COUNT(*) FROM entries WHERE expires_at < ?", (time.time(),)
+        ).fetchone()[0]
+
+    def _insert_expired(self, cache, count):
+        import time
+        past = time.time() - 60
+        with cache._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO entries (key, model, response, created_at, expires_at, size_bytes) "
+                "VALUES (?, 'model', 'old', ?, ?, 3)",
+                [(f"old {i}", past - 60, past) for i in range(count)],
+            )
+
+    def test_set_purges_a_bounded_batch(self, temp_dir):
+        cache = SQLiteCache(temp_dir, expiration_seconds=3600)
+        self._insert_expired(cache, SQLiteCache._PURGE_BATCH * 2 + 5)
+
+        cache.set("fresh 1", "model", "new")
+        assert self._expired_rows(cache) == SQLiteCache._PURGE_BATCH + 5
+        cache.set("fresh 2", "model", "new")
+        assert self._expired_rows(cache) == 5
+        cache.set("fresh 3", "model", "new")
+        assert self._expired_rows(cache) == 0
+        assert cache.stats()["entries"] == 3
+
+    def test_cleanup_expired_removes_everything_expired(self, temp_dir):
+        cache = SQLiteCache(temp_dir, expiration_seconds=3600)
+        self._insert_expired(cache, 5000)
+        cache.set("keep", "model", "new")
+        cache.cleanup_expired()
+
+        assert self._expired_rows(cache) == 0
+        assert cache.get("keep", "model") == "new"
+
+    def test_upgrade_from_iso_schema(self, temp_dir):
+        """Una base v3 (fechas ISO) se convierte a epoch al abrirla."""
+        conn = sqlite3.connect(str(temp_dir / CACHE_DB_FILENAME))
+        for version, migrate in enumerate(_SCHEMA_MIGRATIONS[:3], start=1):
+            migrate(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+        now = datetime.now()
+        for prompt, expiration in (("live", now + timedelta(hours=1)),
+                                   ("dead", now - timedelta(hours=1))):
+            conn.execute(
+                "INSERT INTO entries (key, model, response, created, expiration, size_bytes) "
+                "VALUES (?, 'model', ?, ?, ?, 4)",
+                (build_cache_key(prompt, "model"), prompt, now.isoformat(), expiration.isoformat()),
+            )
+        conn.commit()
+        conn.close()
+
+        cache = SQLiteCache(temp_dir, expiration_seconds=3600)
+        assert cache.get("live", "model") == "live"
+        assert cache.get("dead", "model") is None
+        assert cache.stats()["entries"] == 2
+
+
+class TestCacheBundles:
+    """Tests para los paquetes portables (export/import)."""
+
+    def test_roundtrip_into_empty_cache(self, temp_dir):
+        source = SQLiteCache(temp_dir / "a", expiration_seconds=3600)
+        source.set("prompt 1", "model-a", "respuesta uno", prompt_tokens=10, response_tokens=5)
+        source.set("prompt 2", "model-b", "respuesta dos")
+        bundle = temp_dir / "cache.bundle"
+
+        assert export_bundle(source, bundle) == 2
+
+        target = SQLiteCache(temp_dir / "b", expiration_seconds=3600)
+        assert import_bundle(target, bundle) == (2, 0)
+        assert target.get("prompt 1", "model-a") == "respuesta uno"
+        assert target.get("prompt 2", "model-b") == "respuesta dos"
+
+    def test_export_filters_by_model_and_age(self, temp_dir):
+        import time
+
+        cache = SQLiteCache(temp_dir, expiration_seconds=3600)
+        cache.set("p1", "model-a", "r1")
+        cache.set("p2", "model-b", "r2")
+        with cache._transaction() as conn:
+            conn.execute("UPDATE entries SET created_at = ? WHERE key = ?",
+                         (time.time() - 7200, build_cache_key("p1", "model-a")))
+
+        assert export_bundle(cache, temp_dir / "b.bundle", model="model-b") == 1
+        assert export_bundle(cache, temp_dir / "recent.bundle", max_age_seconds=3600) == 1
+        assert export_bundle(cache, temp_dir / "all.bundle") == 2
+
+    def test_merge_keeps_newest_expiration(self, temp_dir):
+        old = SQLiteCache(temp_dir / "old", expiration_seconds=600)
+        old.set("shared", "model", "antigua")
+        export_bundle(old, temp_dir / "old.bundle")
+
+        target = SQLiteCache(temp_dir / "target", expiration_seconds=3600)
+        target.set("shared", "model", "reciente")
+        assert import_bundle(target, temp_dir / "old.bundle") == (0, 1)
+        assert target.get("shared", "model") == "reciente"
+
+        newer = SQLiteCache(temp_dir / "newer", expiration_seconds=7200)
+        newer.set("shared", "model", "la más nueva")
+        export_bundle(newer, temp_dir / "newer.bundle")
+        assert import_bundle(target, temp_dir / "newer.bundle") == (1, 0)
+        assert target.get("shared", "model") == "la más nueva"
+
+    def test_corrupted_bundle_is_rejected(self, temp_dir):
+        source = SQLiteCache(temp_dir / "a", expiration_seconds=3600)
+        source.set("prompt", "model", "respuesta " * 100)
+        bundle = temp_dir / "cache.bundle"
+        export_bundle(source, bundle)
+        data = bytearray(bundle.read_bytes())
+        data[-10] ^= 0xFF
+        bundle.write_bytes(bytes(data))
+
+        target = SQLiteCache(temp_dir / "b", expiration_seconds=3600)
+        with pytest.raises(CacheBundleError, match="suma de verificación"):
+            import_bundle(target, bundle)
+        assert target.stats()["entries"] == 0
+
+    def test_unknown_version_and_foreign_files_are_rejected(self, temp_dir):
+        source = SQLiteCache(temp_dir / "a", expiration_seconds=3600)
+        bundle = temp_dir / "cache.bundle"
+        export_bundle(source, bundle)
+        bundle.write_bytes(bundle.read_bytes().replace(b'"format_version": 1', b'"format_version": 99'))
+        with pytest.raises(CacheBundleError, match="versión"):
+            import_bundle(source, bundle)
+
+        (temp_dir / "other.json").write_text("{}")
+        with pytest.raises(CacheBundleError):
+            import_bundle(source, temp_dir / "other.json")
+
+    def test_import_invalidates_memory_tier(self, temp_dir):
+        source = SQLiteCache(temp_dir / "a", expiration_seconds=7200)
+        source.set("prompt", "model", "importada")
+        export_bundle(source, temp_dir / "cache.bundle")
+
+        tiered = TieredCache(SQLiteCache(temp_dir / "b", expiration_seconds=3600), MemoryCache())
+        tiered.set("prompt", "model", "local")
+        assert import_bundle(tiered, temp_dir / "cache.bundle") == (1, 0)
+        assert tiered.get("prompt", "model") == "importada"
@@ -0,0 +1,73 @@
+"""
+Tests de estrés: varios procesos escribiendo a la vez en la caché y el estado.
+"""
+import json
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from hooperits_agent.cache import SQLiteCache
+from hooperits_agent.utils import SimpleCache
+
+WORKERS = 24
+WRITES_PER_WORKER = 20
+
+
+def _executor():
+    return ProcessPoolExecutor(max_workers=WORKERS)
+
+
+def _hammer_json_cache(cache_dir: str, worker: int) -> int:
+    cache = SimpleCache(Path(cache_dir), expiration_seconds=3600)
+    for i in range(WRITES_PER_WORKER):
+        cache.set(f"prompt-{worker}-{i}", "model", f"response-{worker}-{i}")
+        # Las lecturas concurrentes nunca deben ver un archivo a medio escribir
+        assert cache.get(f"prompt-{worker}-{i}", "model") == f"response-{worker}-{i}"
+    return worker
+
+
+def _hammer_sqlite_cache(cache_dir: str, worker: int) -> int:
+    cache = SQLiteCache(Path(cache_dir), expiration_seconds=3600)
+    for i in range(WRITES_PER_WORKER):
+        cache.set(f"prompt-{worker}-{i}", "model", f"response-{worker}-{i}" * 50)
+        assert cache.get(f"prompt-{worker}-{i}", "model") == f"response-{worker}-{i}" * 50
+    # Los procesos del pool no ejecutan `atexit`: las estadísticas pendientes se vuelcan a mano
+    cache.flush()
+    return worker
+
+
+def _hammer_state(state_file: str, worker: int) -> int:
+    from hooperits_agent import state_manager
+
+    state_manager.STATE_FILE_PATH = Path(state_file)
+    for _ in range(WRITES_PER_WORKER):
+        state_manager._update_state(lambda state: state.update(counter=state.get("counter", 0) + 1))
+    return worker
+
+
+class TestConcurrentWriters:
+    """Muchos procesos escribiendo a la vez no deben perder ni corromper datos."""
+
+    def test_json_cache_survives_concurrent_writers(self, temp_dir):
+        with _executor() as pool:
+            list(pool.map(_hammer_json_cache, [str(temp_dir)] * WORKERS, range(WORKERS)))
+
+        with open(temp_dir / "gemini_responses.json", encoding="utf-8") as f:
+            data = json.load(f)
+        assert len(data) == WORKERS * WRITES_PER_WORKER
+        assert not (temp_dir / "gemini_responses.json.corrupt").exists()
+
+    def test_sqlite_cache_survives_concurrent_writers(self, temp_dir):
+        with _executor() as pool:
+            list(pool.map(_hammer_sqlite_cache, [str(temp_dir)] * WORKERS, range(WORKERS)))
+
+        stats = SQLiteCache(temp_dir, expiration_seconds=3600).stats()
+        assert stats["entries"] == WORKERS * WRITES_PER_WORKER
+        assert stats["models"][0]["hits"] == WORKERS * WRITES_PER_WORKER
+
+    def test_state_updates_are_not_lost(self, temp_dir):
+        state_file = temp_dir / "state.json"
+        with _executor() as pool:
+            list(pool.map(_hammer_state, [str(state_file)] * WORKERS, range(WORKERS)))
+
+        data = json.loads(state_file.read_text())
+        assert data["counter"] == WORKERS * WRITES_PER_WORKER
@@ -0,0 +1,107 @@
+"""
+Tests unitarios para el demonio opcional y el cliente ligero.
+"""
+import os
+import re
+import socket
+from pathlib import Path
+
+import pytest
+
+from hooperits_agent import daemon
+from hooperits_agent.client import forward_to_daemon
+
+pytestmark = pytest.mark.skipif(not daemon.daemon_supported(), reason="requiere sockets Unix y fork")
+
+
+@pytest.fixture
+def socket_path(tmp_path_factory, monkeypatch):
+    # Ruta corta: los sockets Unix admiten ~100 caracteres
+    directory = tmp_path_factory.mktemp("d")
+    # El demonio y los procesos que bifurca heredan el entorno: cachés y log dentro del test
+    monkeypatch.setenv("CACHE_DIR", str(directory / "cache"))
+    monkeypatch.setenv("LOG_FILE", str(directory / "hooperits_agent.log"))
+    path = directory / "agent.sock"
+    yield str(path)
+    daemon.stop(str(path))
+
+
+class TestMessages:
+    """Tests para el protocolo de mensajes del socket."""
+
+    def test_roundtrip_with_descriptors(self, temp_dir):
+        left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        with left, right, open(temp_dir / "f.txt", "w") as f:
+            daemon.send_message(left, {"op": "run", "argv": ["chat", "¿qué hace?"]}, fds=[f.fileno()])
+            daemon.send_message(left, {"op": "ping"})
+            reader = daemon.MessageReader(right)
+
+            message, fds = reader.read()
+            assert message == {"op": "run", "argv": ["chat", "¿qué hace?"]}
+            assert len(fds) == 1
+            with os.fdopen(fds[0], "w") as received:
+                received.write("escrito por el otro extremo")
+            assert reader.read() == ({"op": "ping"}, [])
+        assert (temp_dir / "f.txt").read_text() == "escrito por el otro extremo"
+
+
+class TestFingerprint:
+    """Tests para la huella de configuración que comparan cliente y demonio."""
+
+    def test_covers_every_setting(self):
+        sources = "".join(path.read_text(encoding="utf-8") for path in Path(daemon.__file__).parent.glob("*.py"))
+        assert set(re.findall(r'os\.getenv\("([A-Z_]+)"', sources)) <= set(daemon.FINGERPRINT_ENV)
+
+    def test_changes_with_settings_only(self, monkeypatch):
+        install = daemon.install_fingerprint()
+        before = daemon.environment_fingerprint(install)
+        monkeypatch.setenv("TERM", "otro-terminal")
+        assert daemon.environment_fingerprint(install) == before
+        monkeypatch.setenv("CACHE_BACKEND", "json")
+        assert daemon.environment_fingerprint(install) != before
+
+
+class TestClientFallback:
+    """Sin demonio, el cliente deja que el comando se ejecute en el proceso."""
+
+    def test_no_socket(self, socket_path):
+        assert forward_to_daemon(["repo", "list"], socket_path) is None
+        assert daemon.ping(socket_path) is None
+
+    def test_stale_socket_file(self, socket_path):
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(socket_path)
+        stale.close()  # el archivo queda, pero nadie escucha
+        assert forward_to_daemon(["repo", "list"], socket_path) is None
+
+
+class TestDaemon:
+    """El demonio ejecuta los comandos con la terminal del cliente."""
+
+    def test_forwards_commands_and_exit_codes(self, socket_path, temp_dir, capfd):
+        log_path = Path(socket_path).parent / "daemon.log"
+        pid = daemon.start_background(socket_path, log_path=log_path)
+        assert daemon.ping(socket_path)["pid"] == pid
+        capfd.readouterr()
+
+        missing = temp_dir / "no-existe.jsonl"
+        assert forward_to_daemon(["batch", str(missing)], socket_path) == 1
+        out = capfd.readouterr().out
+        assert "no existe" in out
+
+        assert forward_to_daemon(["--help"], socket_path) == 0
+        assert "analyze-project" in capfd.readouterr().out
+        assert daemon.ping(socket_path)["requests"] >= 3
+
+        assert daemon.stop(socket_path)
+        assert not os.path.exists(socket_path)
+        assert forward_to_daemon(["repo", "list"], socket_path) is None
+        assert log_path.exists()
+        assert (Path(socket_path).parent / "cache").is_dir()
+
+    def test_other_configuration_runs_in_process(self, socket_path, monkeypatch):
+        daemon.start_background(socket_path, log_path=Path(socket_path).parent / "daemon.log")
+        monkeypatch.setenv("ENABLE_GEMINI_CACHE", "false" if os.getenv("ENABLE_GEMINI_CACHE") == "true" else "true")
+        assert forward_to_daemon(["--help"], socket_path) is None
+        # Una variable distinta en una llamada no detiene al demonio
+        assert daemon.ping(socket_path) is not None
@@ -0,0 +1,188 @@
+"""
+Tests unitarios para el índice incremental de archivos.
+"""
+import os
+import shutil
+
+import pytest
+
+from hooperits_agent import project_analyzer
+from hooperits_agent.file_index import FileIndex, file_index_path
+from hooperits_agent.project_analyzer import get_project_files_for_analysis, refresh_file_index
+
+
+def _write(root, relative, content="contenido\n"):
+    path = root / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+    return path
+
+
+def _bump_mtime(path, ns=10**9):
+    """Adelanta el mtime: en sistemas de archivos con poca resolución un cambio podría no notarse."""
+    stat_result = os.stat(path)
+    os.utime(path, ns=(stat_result.st_atime_ns, stat_result.st_mtime_ns + ns))
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repos" / "demo"
+    for relative in ("README.md", "src/app.py", "src/lib/util.py", "node_modules/pkg/index.js",
+                     "public/logo.png", "public/index.html"):
+        _write(root, relative)
+    return root
+
+
+@pytest.fixture
+def index(repo):
+    file_index = FileIndex(repo)
+    yield file_index
+    file_index.close()
+
+
+def _paths(file_index, sub_path=""):
+    return [item["path_str"]
+            for item in file_index.candidates(sub_path, max_size=project_analyzer.MAX_FILE_SIZE_BYTES)]
+
+
+class TestFileIndex:
+    """Tests para FileIndex."""
+
+    def test_index_lives_next_to_the_repo(self, repo, index):
+        assert index.path == file_index_path(repo) == repo.parent / ".demo.index.sqlite3"
+        refresh_file_index(index)
+        assert index.path.exists()
+
+    def test_build_matches_walker(self, repo, index):
+        assert not index.is_built()
+        stats = refresh_file_index(index)
+        assert index.is_built()
+        walked = sorted(project_analyzer._scan_candidate_files(repo, repo),
+                        key=lambda x: (x["priority"], x["size"], x["path_str"]))
+        assert _paths(index) == [item["path_str"] for item in walked]
+        assert stats["files"] == stats["files_added"] == len(walked)
+
+    def test_unchanged_tree_rescans_nothing(self, index):
+        refresh_file_index(index)
+        stats = refresh_file_index(index)
+        assert stats["dirs_rescanned"] == 0
+        assert stats["dirs_checked"] == 4  # raíz, src, src/lib, public
+
+    def test_incremental_add_remove_and_new_subtree(self, repo, index):
+        refresh_file_index(index)
+        _write(repo, "src/new.py")
+        (repo / "src" / "app.py").unlink()
+        _write(repo, "backend/api/routes.py")
+        shutil.rmtree(repo / "src" / "lib")
+        for directory in (repo / "src", repo):
+            _bump_mtime(directory)
+
+        stats = refresh_file_index(index)
+        assert stats["dirs_rescanned"] == 2
+        assert (stats["files_added"], stats["files_removed"]) == (2, 2)
+        assert set(_paths(index)) == {"README.md", "src/new.py", "backend/api/routes.py", "public/index.html"}
+
+    def test_removed_root_clears_the_index(self, repo, index):
+        refresh_file_index(index)
+        shutil.rmtree(repo)
+        refresh_file_index(index)
+        assert _paths(index) == []
+
+    def test_candidates_of_sub_path_in_priority_order(self, repo, index):
+        _write(repo, "src/lib/big.py", "x = 1\n" * 50)
+        _write(repo, "srcx/other.py")
+        refresh_file_index(index)
+        assert _paths(index, "src") == ["src/app.py", "src/lib/util.py", "src/lib/big.py"]
+        assert _paths(index, "src/lib/") == ["src/lib/util.py", "src/lib/big.py"]
+
+    def test_candidates_are_paginated(self, repo, index, monkeypatch):
+        monkeypatch.setattr("hooperits_agent.file_index._PAGE_SIZE", 2)
+        for i in range(5):
+            _write(repo, f"src/m{i}.py")
+        refresh_file_index(index)
+        assert len(_paths(index)) == len(set(_paths(index))) == 9
+
+    def test_metadata_survives_rescan_only_if_file_unchanged(self, repo, index):
+        refresh_file_index(index)
+        index.record_reads([{"path_str": path, "size": item["size"], "mtime_ns": item["mtime_ns"],
+                             "encoding": "utf-8", "content_hash": "h", "tokens": 7}
+                            for path, item in ((i["path_str"], i) for i in index.candidates())])
+        _write(repo, "src/app.py", "cambiado y más largo\n")
+        _write(repo, "src/other.py")
+        _bump_mtime(repo / "src")
+        refresh_file_index(index)
+        by_path = {item["path_str"]: item for item in index.candidates()}
+        assert by_path["README.md"]["tokens"] == 7
+        assert by_path["src/app.py"]["tokens"] is None
+        assert by_path["src/app.py"]["encoding"] is None
+        assert by_path["src/other.py"]["tokens"] is None
+
+    def test_record_reads_drops_excluded_files(self, index):
+        refresh_file_index(index)
+        readme = next(item for item in index.candidates() if item["path_str"] == "README.md")
+        index.record_reads([dict(readme, excluded=True)])
+        assert "README.md" not in _paths(index)
+
+    def test_stats(self, index):
+        refresh_file_index(index)
+        stats = index.stats()
+        assert stats["files"] == 4
+        assert stats["built_at"] is not None
+        assert stats["size_bytes"] > 0
+
+
+class TestAnalyzerWithIndex:
+    """Tests para `get_project_files_for_analysis` con índice."""
+
+    def test_same_selection_as_walker_and_records_reads(self, repo, index):
+        without_index = get_project_files_for_analysis(repo, repo)
+        with_index = get_project_files_for_analysis(repo, repo, file_index=index)
+        assert with_index == without_index
+        readme = next(item for item in index.candidates() if item["path_str"] == "README.md")
+        assert readme["encoding"] == "utf-8"
+        assert readme["content_hash"] is not None
+        assert readme["tokens"] > 0
+
+    def test_second_run_does_not_walk_the_tree(self, repo, index, monkeypatch):
+        get_project_files_for_analysis(repo, repo, file_index=index)
+        monkeypatch.setattr(project_analyzer, "_scan_candidate_files",
+                            lambda *args: pytest.fail("no debería recorrer el árbol"))
+        monkeypatch.setattr(project_analyzer, "_scan_directory",
+                            lambda *args: pytest.fail("ningún directorio cambió"))
+        selected = get_project_files_for_analysis(repo / "src", repo, file_index=index)
+        assert [item["path"] for item in selected] == ["src/app.py", "src/lib/util.py"]
+
+    def test_in_place_edit_is_read_fresh(self, repo, index):
+        get_project_files_for_analysis(repo, repo, file_index=index)
+        _write(repo, "src/app.py", "print('editado')\n")
+        _bump_mtime(repo / "src" / "app.py")
+        selected = get_project_files_for_analysis(repo / "src", repo, file_index=index)
+        assert selected[0] == {"path": "src/app.py", "content": "print('editado')\n"}
+        app = next(item for item in index.candidates() if item["path_str"] == "src/app.py")
+        assert app["size"] == len("print('editado')\n")
+
+    def test_file_emptied_in_place_is_no_longer_a_candidate(self, repo, index):
+        get_project_files_for_analysis(repo, repo, file_index=index)
+        (repo / "README.md").write_text("")
+        get_project_files_for_analysis(repo, repo, file_index=index)
+        assert "README.md" not in _paths(index)
+
+    def test_sub_path_inside_excluded_dir_selects_nothing(self, repo, index):
+        assert get_project_files_for_analysis(repo / "node_modules", repo, file_index=index) == []
+
+    def test_file_created_empty_and_filled_in_place_is_selected(self, repo, index):
+        refresh_file_index(index)
+        _write(repo, "src/new.py", "")
+        _bump_mtime(repo / "src")
+        refresh_file_index(index)
+        assert "src/new.py" not in _paths(index)
+
+        _write(repo, "src/new.py", "print('nuevo')\n")
+        _bump_mtime(repo / "src" / "new.py")
+        stats = refresh_file_index(index)
+        assert stats["dirs_rescanned"] == 0
+        assert stats["files_rechecked"] == 1
+        walked = {item["path_str"] for item in project_analyzer._scan_candidate_files(repo, repo)}
+        assert set(_paths(index)) == walked
+        selected = get_project_files_for_analysis(repo / "src", repo, file_index=index)
+        assert {"path": "src/new.py", "content": "print('nuevo')\n"} in selected
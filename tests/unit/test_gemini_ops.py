@@ -0,0 +1,102 @@
+"""
+Tests unitarios para el envío de prompts de gemini_ops (con un modelo falso).
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from hooperits_agent import gemini_ops
+
+MODEL = "models/fake-model"
+
+
+class _Chunk:
+    def __init__(self, text):
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            # Como el SDK: un fragmento sin partes de texto no tiene `.text`
+            raise ValueError("sin partes de texto")
+        return self._text
+
+
+class _FakeResponse:
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.prompt_feedback = None
+        self.usage_metadata = SimpleNamespace(prompt_token_count=12, candidates_token_count=7,
+                                              total_token_count=19)
+        self.candidates = []
+
+    def __iter__(self):
+        return iter([_Chunk(text) for text in self._chunks])
+
+    @property
+    def text(self):
+        return "".join(text for text in self._chunks if text)
+
+
+class _FakeModel:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.calls = []
+
+    def generate_content(self, prompt, stream=False):
+        self.calls.append(stream)
+        return _FakeResponse(self.chunks)
+
+
+class _RecordingRenderer:
+    def __init__(self):
+        self.updates = []
+        self.closed = False
+
+    def update(self, chunk):
+        self.updates.append(chunk)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch, temp_dir):
+    model = _FakeModel(["## Propósito", None, "\nUn CLI ", "de análisis."])
+    monkeypatch.setattr(gemini_ops, "_initialize_and_get_gemini_model_instance", lambda: model)
+    monkeypatch.setattr(gemini_ops, "_selected_model_name", MODEL)
+    return model
+
+
+class TestStreaming:
+    """Tests para el modo streaming de `send_prompt_to_gemini`."""
+
+    def test_stream_renders_chunks_and_caches_assembled_text(self, fake_gemini):
+        renderer = _RecordingRenderer()
+        text = gemini_ops.send_prompt_to_gemini("prompt", confirm_paid_model_use=False,
+                                                stream_renderer=renderer)
+
+        assert text == "## Propósito\nUn CLI de análisis."
+        assert renderer.updates == ["## Propósito", "\nUn CLI ", "de análisis."]
+        assert renderer.closed
+        assert fake_gemini.calls == [True]
+        assert gemini_ops.cache.get("prompt", MODEL) == text
+        stats = gemini_ops.cache.stats()["models"][0]
+        assert stats["hits"] == 1
+
+    def test_cached_response_skips_renderer(self, fake_gemini):
+        gemini_ops.send_prompt_to_gemini("prompt", confirm_paid_model_use=False)
+        renderer = _RecordingRenderer()
+
+        text = gemini_ops.send_prompt_to_gemini("prompt", confirm_paid_model_use=False,
+                                                stream_renderer=renderer)
+
+        assert text == "## Propósito\nUn CLI de análisis."
+        assert renderer.updates == []
+        assert fake_gemini.calls == [False]
+
+    def test_stream_and_blocking_paths_cache_the_same_text(self, fake_gemini):
+        streamed = gemini_ops.send_prompt_to_gemini("a", confirm_paid_model_use=False,
+                                                    stream_renderer=_RecordingRenderer())
+        blocking = gemini_ops.send_prompt_to_gemini("b", confirm_paid_model_use=False)
+        assert streamed == blocking
@@ -0,0 +1,116 @@
+"""
+Tests unitarios para el catálogo de modelos persistido en disco.
+"""
+import json
+import time
+
+import pytest
+
+from hooperits_agent import gemini_ops
+from hooperits_agent.model_catalog import ModelCatalog
+
+FLASH = {"name": "models/gemini-1.5-flash-latest", "display_name": "Gemini 1.5 Flash"}
+PRO = {"name": "models/gemini-2.5-pro-preview-05-06", "display_name": "Gemini 2.5 Pro"}
+
+
+class _FakeListModels:
+    """Sustituto de la consulta a `list_models()` que cuenta las llamadas."""
+
+    def __init__(self, *models):
+        self.models = list(models)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return list(self.models)
+
+
+class TestModelCatalog:
+    """Tests para ModelCatalog."""
+
+    def test_fresh_catalog_does_not_hit_api(self, temp_dir):
+        fetch = _FakeListModels(FLASH)
+        catalog = ModelCatalog(temp_dir, ttl_seconds=3600)
+        assert catalog.get(fetch) == [FLASH]
+        # Otro proceso (otra instancia) lee el catálogo del disco
+        assert ModelCatalog(temp_dir, ttl_seconds=3600).get(fetch) == [FLASH]
+        assert fetch.calls == 1
+
+    def test_refresh_forces_api_call(self, temp_dir):
+        fetch = _FakeListModels(FLASH)
+        catalog = ModelCatalog(temp_dir, ttl_seconds=3600)
+        catalog.get(fetch)
+        fetch.models.append(PRO)
+        assert catalog.get(fetch, refresh=True) == [FLASH, PRO]
+        assert fetch.calls == 2
+
+    def test_stale_catalog_is_served_and_refreshed_in_background(self, temp_dir):
+        catalog = ModelCatalog(temp_dir, ttl_seconds=3600)
+        catalog.refresh(_FakeListModels(FLASH))
+        data = json.loads(catalog.path.read_text(encoding="utf-8"))
+        data["fetched_at"] = time.time() - 7200
+        catalog.path.write_text(json.dumps(data), encoding="utf-8")
+
+        fetch = _FakeListModels(FLASH, PRO)
+        assert catalog.get(fetch) == [FLASH]  # sin esperar a la red
+        catalog.wait_for_refresh(timeout=5)
+        assert fetch.calls == 1
+        assert catalog.get(fetch) == [FLASH, PRO]
+        assert catalog.is_fresh(catalog.load())
+
+    def test_background_refresh_errors_keep_old_catalog(self, temp_dir):
+        catalog = ModelCatalog(temp_dir, ttl_seconds=0)
+        catalog.refresh(_FakeListModels(FLASH))
+
+        def failing_fetch():
+            raise ConnectionError("sin red")
+
+        assert catalog.get(failing_fetch) == [FLASH]
+        catalog.wait_for_refresh(timeout=5)
+        assert catalog.load()["models"] == [FLASH]
+
+    @pytest.mark.parametrize("content", ["{no es json", '{"format_version": 99, "fetched_at": 0, "models": []}'])
+    def test_unusable_file_is_refetched(self, temp_dir, content):
+        catalog = ModelCatalog(temp_dir, ttl_seconds=3600)
+        catalog.path.write_text(content, encoding="utf-8")
+        fetch = _FakeListModels(FLASH)
+        assert catalog.get(fetch) == [FLASH]
+        assert fetch.calls == 1
+
+    def test_empty_api_response_is_not_persisted(self, temp_dir):
+        catalog = ModelCatalog(temp_dir, ttl_seconds=3600)
+        assert catalog.get(_FakeListModels()) == []
+        assert catalog.load() is None
+
+
+class TestGeminiOpsCatalog:
+    """La selección de modelos usa el catálogo en disco."""
+
+    @pytest.fixture
+    def fetch(self, monkeypatch, temp_dir):
+        fetch = _FakeListModels(PRO, FLASH)
+        monkeypatch.setattr(gemini_ops, "API_KEY", "clave-de-prueba")
+        monkeypatch.setattr(gemini_ops, "model_catalog", ModelCatalog(temp_dir, ttl_seconds=3600))
+        monkeypatch.setattr(gemini_ops, "_fetch_api_models", fetch)
+        return fetch
+
+    def test_models_are_merged_with_tiers_and_sorted(self, fetch):
+        models = gemini_ops.get_available_gemini_models()
+        assert [m["name"] for m in models] == [FLASH["name"], PRO["name"]]
+        assert models[0]["tier"].startswith("free")
+        assert models[1]["pricing_details"]["tier"] == models[1]["tier"]
+
+    def test_select_validation_uses_catalog(self, fetch, monkeypatch):
+        gemini_ops.get_available_gemini_models()
+        # Nuevo proceso: el catálogo en disco basta, sin consultar la API
+        monkeypatch.setattr(gemini_ops.model_catalog, "fetched_this_process", False)
+        assert gemini_ops.is_model_available(FLASH["name"])
+        assert fetch.calls == 1
+
+    def test_unknown_model_triggers_one_refresh(self, fetch, monkeypatch):
+        gemini_ops.get_available_gemini_models()
+        monkeypatch.setattr(gemini_ops.model_catalog, "fetched_this_process", False)
+        fetch.models.append({"name": "models/gemini-recien-publicado", "display_name": "Nuevo"})
+        assert gemini_ops.is_model_available("models/gemini-recien-publicado")
+        assert not gemini_ops.is_model_available("models/no-existe")
+        assert fetch.calls == 2
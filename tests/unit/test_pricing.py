@@ -0,0 +1,108 @@
+"""
+Tests unitarios para el motor de precios compilado.
+"""
+import json
+import random
+import time
+from pathlib import Path
+
+import pytest
+
+from hooperits_agent import gemini_ops
+from hooperits_agent.pricing import PricingTable, compile_model_pricing
+
+TIERS = json.loads((Path(__file__).parents[2] / "model_tiers.json").read_text(encoding="utf-8"))
+FLASH = "models/gemini-1.5-flash-latest"
+PRO_25 = "models/gemini-2.5-pro-preview-05-06"
+
+
+@pytest.fixture(scope="module")
+def table():
+    return PricingTable(TIERS)
+
+
+class TestCompileModelPricing:
+    """Tests para `compile_model_pricing`."""
+
+    def test_threshold_tier_applies_to_output_too(self, table):
+        # 1.5 Flash: ≤128k 0.075/0.30, >128k 0.15/0.60 USD por 1M
+        assert table.cost(FLASH, 100_000, 1_000_000) == pytest.approx(0.0075 + 0.30)
+        assert table.cost(FLASH, 200_000, 1_000_000) == pytest.approx(0.03 + 0.60)
+
+    def test_threshold_is_inclusive(self, table):
+        pricing = table.get(FLASH)
+        assert pricing.tier_index(128_000) == 0
+        assert pricing.tier_index(128_001) == 1
+
+    def test_flat_and_no_thought_rates(self, table):
+        assert table.cost("models/gemini-2.0-flash", 1_000_000, 1_000_000) == pytest.approx(0.10 + 0.40)
+        assert table.cost("models/gemini-2.5-flash-preview-04-17", 1_000_000, 1_000_000) == pytest.approx(0.15 + 0.60)
+
+    def test_models_without_token_prices(self, table):
+        assert table.get("models/gemma-3-1b-it") is None
+        assert table.cost("models/no-existe", 10, 10) is None
+        assert compile_model_pricing("m", {"image_generation_usd_per_image": 0.039}) is None
+
+    def test_multiple_thresholds(self):
+        pricing = compile_model_pricing("m", {
+            "input_per_1M_tokens_usd_le_128k": 1.0,
+            "input_per_1M_tokens_usd_le_200k": 2.0,
+            "input_per_1M_tokens_usd_gt_200k": 3.0,
+            "output_per_1M_tokens_usd": 10.0,
+        })
+        assert pricing.thresholds == (128_000, 200_000)
+        assert [pricing.cost(tokens, 0) * 1e6 / tokens for tokens in (1_000, 150_000, 300_000)] == \
+            pytest.approx([1.0, 2.0, 3.0])
+        assert pricing.cost(300_000, 1_000_000) == pytest.approx(0.9 + 10.0)
+
+
+class TestAliases:
+    """Los alias tarifican como su modelo real."""
+
+    @pytest.mark.parametrize("alias, target", [
+        ("models/gemini-1.5-flash", FLASH),
+        ("models/gemini-1.5-flash-002", FLASH),
+        ("models/gemini-2.5-pro-exp-03-25", PRO_25),
+        ("models/gemini-2.0-flash-thinking-exp", "models/gemini-2.5-flash-preview-04-17"),
+    ])
+    def test_alias_resolution(self, table, alias, target):
+        assert table.resolve(alias) == target
+        assert table.cost(alias, 150_000, 2_000) == table.cost(target, 150_000, 2_000)
+        assert table.thresholds(alias) == table.thresholds(target)
+
+    def test_alias_cycle_does_not_loop(self):
+        cyclic = PricingTable({"a": {"alias_of": "b"}, "b": {"alias_of": "a"}})
+        assert cyclic.cost("a", 1, 1) is None
+
+    def test_gemini_ops_delegates_to_table(self):
+        assert gemini_ops._calculate_cost_for_call("models/gemini-1.5-pro", 100_000, 0) == pytest.approx(0.125)
+        assert gemini_ops._calculate_cost_for_call("models/gemma-3-1b-it", 1_000, 1_000) is None
+        assert gemini_ops._calculate_cost_for_call(FLASH, 0, 0) is None
+
+
+class TestCostMany:
+    """Tarificación de muchas llamadas a la vez."""
+
+    def test_matches_single_call_pricing(self, table):
+        rng = random.Random(7)
+        models = [rng.choice([FLASH, PRO_25, "models/gemini-1.5-flash", "models/gemma-3-1b-it"])
+                  for _ in range(2_000)]
+        inputs = [rng.randint(0, 400_000) for _ in models]
+        outputs = [rng.randint(0, 8_000) for _ in models]
+
+        costs = table.cost_many(models, inputs, outputs)
+        assert costs == [table.cost(m, i, o) for m, i, o in zip(models, inputs, outputs)]
+        assert table.cost_many(FLASH, inputs, outputs) == [table.cost(FLASH, i, o) for i, o in zip(inputs, outputs)]
+
+    def test_length_mismatch(self, table):
+        with pytest.raises(ValueError):
+            table.cost_many([FLASH], [1, 2], [1, 2])
+
+    def test_large_log_is_fast(self, table):
+        rows = 300_000
+        models = [FLASH, PRO_25, "models/gemini-2.0-flash"] * (rows // 3)
+        tokens = list(range(rows))
+        started = time.perf_counter()
+        costs = table.cost_many(models, tokens, tokens)
+        assert len(costs) == rows
+        assert time.perf_counter() - started < 2.0
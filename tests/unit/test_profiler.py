@@ -0,0 +1,93 @@
+"""
+Tests unitarios para el perfilador por fases.
+"""
+import json
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+from hooperits_agent.profiler import Profiler
+
+
+@pytest.fixture
+def profiler():
+    profiler = Profiler()
+    yield profiler
+    profiler.stop()
+
+
+class TestProfiler:
+    """Tests para Profiler."""
+
+    def test_disabled_records_nothing(self):
+        profiler = Profiler()
+        with profiler.span("escaneo de archivos"):
+            pass
+        assert profiler.summary() == []
+
+    def test_nested_spans_split_self_time(self, profiler):
+        profiler.start(trace_memory=False)
+        with profiler.span("generación"):
+            time.sleep(0.05)
+            with profiler.span("renderizado"):
+                time.sleep(0.05)
+        with profiler.span("renderizado"):
+            time.sleep(0.01)
+        profiler.stop()
+
+        rows = {row["name"]: row for row in profiler.summary()}
+        assert rows["renderizado"]["calls"] == 2
+        assert rows["generación"]["total_s"] >= 0.1
+        assert rows["generación"]["self_s"] == pytest.approx(
+            rows["generación"]["total_s"] - 0.05, abs=0.02)
+        assert rows["renderizado"]["self_s"] == pytest.approx(rows["renderizado"]["total_s"])
+        assert profiler.unattributed_seconds() < profiler.wall_seconds
+
+    def test_threads_have_independent_stacks(self, profiler):
+        profiler.start(trace_memory=False)
+
+        def worker():
+            with profiler.span("lectura de archivos"):
+                time.sleep(0.02)
+
+        with profiler.span("selección de archivos"):
+            threads = [threading.Thread(target=worker) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        profiler.stop()
+
+        rows = {row["name"]: row for row in profiler.summary()}
+        assert rows["lectura de archivos"]["calls"] == 3
+        # Los spans de otros hilos no descuentan tiempo propio al del hilo principal
+        assert rows["selección de archivos"]["self_s"] == pytest.approx(
+            rows["selección de archivos"]["total_s"])
+
+    def test_peak_memory(self, profiler):
+        was_tracing = tracemalloc.is_tracing()
+        profiler.start()
+        data = [bytearray(1024) for _ in range(2048)]
+        del data
+        profiler.stop()
+        assert profiler.peak_memory_bytes >= 2 * 1024 * 1024
+        assert tracemalloc.is_tracing() == was_tracing
+
+    def test_chrome_trace(self, profiler, temp_dir):
+        profiler.start(trace_memory=False)
+        with profiler.span("conteo de tokens"):
+            pass
+        with profiler.span("generación", category="gemini"):
+            pass
+        profiler.stop()
+        path = temp_dir / "trace.json"
+        profiler.write_chrome_trace(path, metadata={"command": "analyze-project"})
+
+        trace = json.loads(path.read_text(encoding="utf-8"))
+        complete = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+        assert [event["name"] for event in complete] == ["conteo de tokens", "generación"]
+        assert complete[1]["cat"] == "gemini"
+        assert all(event["ts"] >= 0 and event["dur"] >= 0 for event in complete)
+        assert trace["otherData"]["command"] == "analyze-project"
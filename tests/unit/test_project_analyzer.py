@@ -0,0 +1,295 @@
+"""
+Tests unitarios para la selección de archivos del analizador de proyectos.
+"""
+import codecs
+import os
+import time
+
+import pytest
+
+from hooperits_agent import project_analyzer
+from hooperits_agent.encoding_cache import EncodingCache
+from hooperits_agent.project_analyzer import (
+    BINARY_ENCODING,
+    _detect_encoding_from_bytes,
+    _git_candidate_files,
+    _scan_candidate_files,
+    get_project_files_for_analysis,
+)
+
+
+def _write(root, relative, content="contenido\n"):
+    path = root / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def repo(tmp_path):
+    for relative in ("README.md", "src/pages/Home.tsx", "src/utils.py", "backend/api.py",
+                     "node_modules/react/index.js", ".git/config", "dist/bundle.js",
+                     "src/vendor.min.js", "public/logo.png", "public/index.html",
+                     "public/mockServiceWorker.js", "public/data.json", ".secret", ".env"):
+        _write(tmp_path, relative)
+    (tmp_path / "empty.py").touch()
+    return tmp_path
+
+
+class TestScanCandidateFiles:
+    """Tests para el recorrido con poda de directorios."""
+
+    def test_prunes_excluded_dirs_and_filters_files(self, repo):
+        found = {item["path_str"] for item in _scan_candidate_files(repo, repo)}
+        assert found == {"README.md", "src/pages/Home.tsx", "src/utils.py", "backend/api.py",
+                         "public/index.html", ".env"}
+
+    def test_does_not_descend_into_excluded_dirs(self, repo, monkeypatch):
+        scanned = []
+        real_scandir = os.scandir
+
+        def recording_scandir(path):
+            scanned.append(os.path.relpath(path, repo))
+            return real_scandir(path)
+
+        monkeypatch.setattr(project_analyzer.os, "scandir", recording_scandir)
+        list(_scan_candidate_files(repo, repo))
+        assert not any(part in ("node_modules", ".git", "dist")
+                       for path in scanned for part in path.split(os.sep))
+
+    def test_sub_path_keeps_paths_relative_to_repo_root(self, repo):
+        found = list(_scan_candidate_files(repo / "src", repo))
+        assert {item["path_str"] for item in found} == {"src/pages/Home.tsx", "src/utils.py"}
+        home = next(item for item in found if item["path_str"] == "src/pages/Home.tsx")
+        assert home["priority"] == 1  # tsx (3) con el impulso de src/pages/
+        assert home["size"] == len("contenido\n")
+
+    def test_scan_inside_excluded_dir_finds_nothing(self, repo):
+        assert list(_scan_candidate_files(repo / "node_modules", repo)) == []
+
+    @pytest.mark.skipif(not hasattr(os, "symlink"), reason="sin enlaces simbólicos")
+    def test_does_not_follow_directory_symlinks(self, repo):
+        try:
+            os.symlink(repo, repo / "src" / "loop", target_is_directory=True)
+        except OSError:
+            pytest.skip("no se pueden crear enlaces simbólicos")
+        paths = [item["path_str"] for item in _scan_candidate_files(repo, repo)]
+        assert len(paths) == len(set(paths))
+        assert not any(path.startswith("src/loop/") for path in paths)
+
+    def test_selection_order_is_deterministic(self, tmp_path):
+        for name in ("b.py", "a.py", "c.py"):
+            _write(tmp_path, name, "x = 1\n")
+        selected = get_project_files_for_analysis(tmp_path, tmp_path)
+        assert [item["path"] for item in selected] == ["a.py", "b.py", "c.py"]
+
+
+class TestParallelReading:
+    """Tests para la lectura en paralelo de los candidatos."""
+
+    def test_each_file_is_opened_once(self, tmp_path, monkeypatch):
+        for i in range(5):
+            _write(tmp_path, f"m{i}.py", f"valor = {i}\n")
+        opened = []
+        real_open = open
+
+        def counting_open(file, *args, **kwargs):
+            opened.append(str(file))
+            return real_open(file, *args, **kwargs)
+
+        monkeypatch.setattr(project_analyzer, "open", counting_open, raising=False)
+        get_project_files_for_analysis(tmp_path, tmp_path)
+        assert sorted(opened) == sorted(str(tmp_path / f"m{i}.py") for i in range(5))
+
+    def test_order_is_priority_order_despite_out_of_order_reads(self, tmp_path, monkeypatch):
+        names = [f"m{i}.py" for i in range(8)]
+        for name in names:
+            _write(tmp_path, name, "x = 1\n")
+        real_read = project_analyzer._read_candidate
+
+        def slow_first_reads(file_info):
+            # Las primeras lecturas terminan las últimas
+            time.sleep(0.02 * (8 - int(file_info["path_str"][1])))
+            return real_read(file_info)
+
+        monkeypatch.setattr(project_analyzer, "_read_candidate", slow_first_reads)
+        selected = get_project_files_for_analysis(tmp_path, tmp_path)
+        assert [item["path"] for item in selected] == names
+
+    def test_stops_reading_once_limits_are_reached(self, tmp_path, monkeypatch):
+        for i in range(60):
+            _write(tmp_path, f"m{i:02}.py", "x = 1\n")
+        read = []
+        real_read = project_analyzer._read_candidate
+
+        def recording_read(file_info):
+            read.append(file_info["path_str"])
+            return real_read(file_info)
+
+        monkeypatch.setattr(project_analyzer, "_read_candidate", recording_read)
+        selected = get_project_files_for_analysis(tmp_path, tmp_path)
+        assert len(selected) == project_analyzer.MAX_FILES_TO_CONSIDER_FOR_PROMPT
+        assert len(read) <= (project_analyzer.MAX_FILES_TO_CONSIDER_FOR_PROMPT + 1
+                             + project_analyzer.FILE_READ_LOOKAHEAD)
+
+    def test_decodes_detected_encoding_and_normalizes_newlines(self, tmp_path):
+        text = "# Configuración del módulo de facturación y envíos\r\n" * 40
+        (tmp_path / "utf16.py").write_bytes(text.encode("utf-16"))
+        selected = get_project_files_for_analysis(tmp_path, tmp_path)
+        assert selected[0]["content"] == text.replace("\r\n", "\n")
+
+
+class TestEncodingDetection:
+    """Tests para la detección rápida de codificación y su memoria."""
+
+    def test_fast_paths(self):
+        assert _detect_encoding_from_bytes(b"") == "utf-8"
+        assert _detect_encoding_from_bytes("año = 1\n".encode("utf-8")) == "utf-8"
+        assert _detect_encoding_from_bytes(codecs.BOM_UTF8 + b"x = 1\n") == "utf-8-sig"
+        assert _detect_encoding_from_bytes("x = 1\n".encode("utf-16")) == "utf-16"
+        assert _detect_encoding_from_bytes("x = 1\n".encode("utf-32")) == "utf-32"
+        assert _detect_encoding_from_bytes(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR") == BINARY_ENCODING
+
+    def test_truncated_multibyte_char_is_still_utf8(self):
+        raw = "ñ".encode("utf-8") * 10
+        assert _detect_encoding_from_bytes(raw[:-1], complete=False) == "utf-8"
+
+    def test_chardet_only_when_utf8_fails(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(project_analyzer.chardet, "detect",
+                            lambda data: calls.append(data) or {"encoding": "ISO-8859-1", "confidence": 0.9})
+        assert _detect_encoding_from_bytes(b"plain ascii\n") == "utf-8"
+        assert calls == []
+        assert _detect_encoding_from_bytes("año".encode("latin-1")) == "ISO-8859-1"
+        assert len(calls) == 1
+
+    def test_binary_files_without_binary_extension_are_skipped(self, tmp_path):
+        (tmp_path / "datos.txt").write_bytes(b"\x00\x01\x02" * 100)
+        _write(tmp_path, "main.py", "x = 1\n")
+        assert [item["path"] for item in get_project_files_for_analysis(tmp_path, tmp_path)] == ["main.py"]
+
+    def test_cache_avoids_resniffing_unchanged_files(self, tmp_path, monkeypatch):
+        cache = EncodingCache(tmp_path / "cache")
+        monkeypatch.setattr(project_analyzer, "encoding_cache", cache)
+        repo = tmp_path / "repo"
+        _write(repo, "main.py", "x = 1\n")
+        (repo / "blob.txt").write_bytes(b"\x00" * 50)
+
+        sniffed = []
+        real_detect = project_analyzer._detect_encoding_from_bytes
+
+        def recording_detect(raw_data, complete=True):
+            sniffed.append(raw_data)
+            return real_detect(raw_data, complete)
+
+        monkeypatch.setattr(project_analyzer, "_detect_encoding_from_bytes", recording_detect)
+        get_project_files_for_analysis(repo, repo)
+        assert len(sniffed) == 2
+        get_project_files_for_analysis(repo, repo)
+        assert len(sniffed) == 2
+
+        # Un archivo modificado se vuelve a analizar
+        _write(repo, "main.py", "x = 'modificado'\n")
+        selected = get_project_files_for_analysis(repo, repo)
+        assert len(sniffed) == 3
+        assert selected[0]["content"] == "x = 'modificado'\n"
+
+
+class TestEncodingCache:
+    """Tests para EncodingCache."""
+
+    def test_key_includes_size_and_mtime(self, tmp_path):
+        cache = EncodingCache(tmp_path)
+        cache.put(("/repo/a.py", 10, 1000), "utf-8")
+        assert cache.get(("/repo/a.py", 10, 1000)) is None  # pendiente hasta flush
+        cache.flush()
+        assert cache.get(("/repo/a.py", 10, 1000)) == "utf-8"
+        assert cache.get(("/repo/a.py", 11, 1000)) is None
+        assert cache.get(("/repo/a.py", 10, 2000)) is None
+        assert EncodingCache(tmp_path).get(("/repo/a.py", 10, 1000)) == "utf-8"
+
+    def test_max_entries_evicts_oldest(self, tmp_path):
+        cache = EncodingCache(tmp_path, max_entries=2)
+        for i in range(3):
+            cache.put((f"/repo/{i}.py", 1, 1), "utf-8")
+            cache.flush()
+            time.sleep(0.01)
+        assert cache.get(("/repo/0.py", 1, 1)) is None
+        assert cache.get(("/repo/2.py", 1, 1)) == "utf-8"
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    import git
+
+    root = tmp_path / "repo"
+    for relative in ("README.md", "src/app.py", "src/lib/util.py", "coverage/report.js", ".next/server.js",
+                     "node_modules/pkg/index.js", "public/logo.png", "public/index.html", "gone.py"):
+        _write(root, relative)
+    _write(root, ".gitignore", "coverage/\n.next/\n*.generated.py\n")
+    repo = git.Repo.init(root)
+    # Con la CLI de git el índice guarda tamaño y mtime (`repo.index.add` los deja a cero)
+    repo.git.add("README.md", "src/app.py", "src/lib/util.py", "node_modules/pkg/index.js",
+                 "public/logo.png", "public/index.html", "gone.py", ".gitignore")
+    repo.git.execute(["git", "-c", "user.name=test", "-c", "user.email=test@example.com",
+                      "commit", "-q", "-m", "inicial"])
+    (root / "gone.py").unlink()
+    _write(root, "src/untracked.py")
+    _write(root, "src/schema.generated.py")
+    return root
+
+
+class TestGitEnumeration:
+    """Tests para la enumeración de candidatos con git."""
+
+    def test_honors_gitignore_and_analyzer_filters(self, git_repo):
+        found = {item["path_str"] for item in _git_candidate_files(git_repo, git_repo)}
+        assert found == {"README.md", "src/app.py", "src/lib/util.py", "public/index.html", ".gitignore",
+                         "gone.py", "src/untracked.py"}
+
+    def test_sizes_come_from_the_git_index(self, git_repo):
+        by_path = {item["path_str"]: item for item in _git_candidate_files(git_repo, git_repo)}
+        assert by_path["src/app.py"]["size"] == len("contenido\n")
+        assert by_path["src/app.py"]["path_obj"] == git_repo / "src" / "app.py"
+
+    def test_entries_without_stat_data_are_checked_on_disk(self, sample_git_repo):
+        by_path = {item["path_str"]: item for item in _git_candidate_files(sample_git_repo, sample_git_repo)}
+        assert by_path["main.py"]["size"] == len("print('Hello, World!')\n")
+
+    def test_tracked_symlinks_are_skipped(self, git_repo):
+        import git
+
+        (git_repo / "link.py").symlink_to("src/app.py")
+        git.Repo(git_repo).git.add("link.py")
+        found = {item["path_str"] for item in _git_candidate_files(git_repo, git_repo)}
+        assert "link.py" not in found and "src/app.py" in found
+
+    def test_sub_path(self, git_repo):
+        found = {item["path_str"] for item in _git_candidate_files(git_repo / "src", git_repo)}
+        assert found == {"src/app.py", "src/lib/util.py", "src/untracked.py"}
+        assert _git_candidate_files(git_repo / "node_modules", git_repo) == []
+
+    def test_does_not_walk_the_tree(self, git_repo, monkeypatch):
+        monkeypatch.setattr(project_analyzer.os, "scandir", lambda path: pytest.fail("no debería recorrer"))
+        assert _git_candidate_files(git_repo, git_repo)
+
+    def test_not_a_git_repo_falls_back(self, repo):
+        assert _git_candidate_files(repo, repo) is None
+        with_git = get_project_files_for_analysis(repo, repo, use_git=True)
+        assert with_git == get_project_files_for_analysis(repo, repo)
+
+    def test_git_failure_falls_back_to_walker(self, git_repo, monkeypatch):
+        import git
+
+        def failing(*args):
+            raise git.GitCommandNotFound("git", "no instalado")
+
+        monkeypatch.setattr(project_analyzer.git_ops, "iter_tracked_files", failing)
+        selected = get_project_files_for_analysis(git_repo, git_repo, use_git=True)
+        assert "coverage/report.js" in [item["path"] for item in selected]
+
+    def test_analysis_skips_deleted_tracked_files(self, git_repo):
+        selected = [item["path"] for item in get_project_files_for_analysis(git_repo, git_repo, use_git=True)]
+        assert "gone.py" not in selected
+        assert ".next/server.js" not in selected and "coverage/report.js" not in selected
+        assert "src/untracked.py" in selected
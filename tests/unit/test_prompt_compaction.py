@@ -0,0 +1,128 @@
+"""
+Tests unitarios para la compactación de prompts.
+"""
+import ast
+
+from hooperits_agent.project_analyzer import get_project_files_for_analysis
+from hooperits_agent.prompt_compaction import compact_source, detect_language
+
+PYTHON_SOURCE = '''#!/usr/bin/env python
+# Copyright (c) 2024 Ejemplo S.A.
+# Licensed under the MIT License.
+
+"""Docstring del módulo."""
+import os
+
+
+def saludar(nombre):
+    """Devuelve un saludo."""
+    # comentario de línea
+    return f"hola {nombre}"  # comentario en línea
+
+
+
+DATOS = "%s"
+''' % ("x" * 500)
+
+
+class TestCompactSource:
+    """Tests para compact_source."""
+
+    def test_detect_language(self):
+        assert detect_language("src/app.py") == "python"
+        assert detect_language("src/App.TSX") == "c"
+        assert detect_language("styles/main.scss") == "css"
+        assert detect_language("Dockerfile") == "hash"
+        assert detect_language("index.html") == "markup"
+        assert detect_language("README.md") == "text"
+
+    def test_python_keeps_code_and_strips_license_and_whitespace(self):
+        result = compact_source(PYTHON_SOURCE, "mod.py")
+        assert result.startswith("#!/usr/bin/env python\n")
+        assert "Copyright" not in result and "MIT" not in result
+        assert "import os\n" in result
+        assert "\n\n\n" not in result
+        assert "# comentario de línea" in result  # sin drop_comments se conservan
+        assert '"""Devuelve un saludo."""' in result
+        assert "…(+" in result and "x" * 300 not in result
+
+    def test_python_drop_comments_and_docstrings(self):
+        result = compact_source(PYTHON_SOURCE, "mod.py", drop_comments=True, max_literal=0)
+        assert "comentario" not in result
+        assert "Docstring" not in result and "saludo." not in result
+        assert 'return f"hola {nombre}"' in result
+        assert "x" * 500 in result
+        ast.parse(result)  # sigue siendo Python válido
+
+    def test_python_docstring_only_body_stays_valid(self):
+        source = 'class Error(Exception):\n    """Error propio."""\n\n\nx = 1\n'
+        result = compact_source(source, "e.py", drop_comments=True)
+        assert result == "class Error(Exception):\n    ...\n\nx = 1"
+        ast.parse(result)
+
+    def test_python_fstrings_are_not_shortened(self):
+        source = 'x = f"{' + " + ".join(["valor"] * 30) + '}"\n'
+        assert compact_source(source, "f.py", max_literal=50) == source.strip()
+
+    def test_python_with_syntax_error_falls_back_to_lines(self):
+        result = compact_source('def f(:\n    # nota\n    return """sin cerrar\n', "roto.py", drop_comments=True)
+        assert "# nota" not in result
+        assert "def f(:" in result
+
+    def test_c_like_comments_respect_strings(self):
+        source = ('/* SPDX-License-Identifier: Apache-2.0 */\n'
+                  'const url = "http://example.com/*no*/"; // comentario\n'
+                  '/* bloque\n   de varias líneas */\nlet b = 1;\n')
+        kept = compact_source(source, "a.ts")
+        assert "SPDX" not in kept
+        assert "// comentario" in kept
+        dropped = compact_source(source, "a.ts", drop_comments=True)
+        assert 'const url = "http://example.com/*no*/";' in dropped
+        assert "comentario" not in dropped and "bloque" not in dropped
+        assert "let b = 1;" in dropped
+
+    def test_license_only_stripped_when_it_is_a_license(self):
+        source = "# Configuración del servicio\nkey: value\n"
+        assert compact_source(source, "config.yml") == source.strip()
+
+    def test_comments_about_licences_are_not_licence_headers(self):
+        docstring = '"""Validación de licencias de usuario (license keys)."""\nimport os\n'
+        assert compact_source(docstring, "lic.py") == docstring.strip()
+        comment = "# Calcula el costo de la licencia por asiento\nPRICE = 10\n"
+        assert compact_source(comment, "precio.py") == comment.strip()
+        block = "/* Comprueba la licence del usuario antes de exportar */\nexport const ok = true;\n"
+        assert compact_source(block, "licencia.ts") == block.strip()
+
+    def test_one_line_license_docstring_keeps_following_code(self):
+        source = ('"""Utils. Copyright 2024 ACME."""\nimport os\n\ndef important():\n    return os.getcwd()\n'
+                  '\ndef other():\n    """Doc."""\n    return 1\n')
+        result = compact_source(source, "m.py")
+        assert "Copyright" not in result
+        assert result.startswith("import os")
+        assert "def important():" in result and 'def other():\n    """Doc."""' in result
+
+    def test_long_data_lines_are_truncated(self):
+        result = compact_source("[" + ",".join(["1"] * 1000) + "]\n", "data.json", max_literal=200)
+        assert len(result) < 500
+        assert "línea recortada" in result
+
+
+class TestAnalyzerCompaction:
+    """Tests de la compactación en la selección de archivos."""
+
+    def test_reports_tokens_and_fits_more_content(self, tmp_path):
+        body = "# Copyright Ejemplo\n# License: MIT\n" + "\n".join(
+            f"valor_{i} = {i}    # comentario bastante largo número {i}\n\n" for i in range(400))
+        (tmp_path / "main.py").write_text(body, encoding="utf-8")
+
+        raw = get_project_files_for_analysis(tmp_path, tmp_path)
+        compacted = get_project_files_for_analysis(tmp_path, tmp_path, compact=True, drop_comments=True,
+                                                   token_counter=len)
+
+        assert "compaction" not in raw[0]
+        item = compacted[0]
+        assert item["compaction"]["before"] == len(body)
+        assert item["compaction"]["after"] < item["compaction"]["before"]
+        assert "Copyright" not in item["content"]
+        # Lo ahorrado deja sitio para más código dentro del mismo límite por archivo
+        assert item["content"].count("valor_") > raw[0]["content"].count("valor_")
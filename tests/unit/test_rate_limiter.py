@@ -0,0 +1,247 @@
+"""
+Tests unitarios para el limitador de tasa y los reintentos ante throttling.
+"""
+import asyncio
+import random
+from types import SimpleNamespace
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from hooperits_agent import batch_ops, gemini_ops
+from hooperits_agent.rate_limiter import (
+    ModelRateLimiter,
+    RetryPolicy,
+    TokenBucket,
+    call_with_retry,
+    is_throttling_error,
+    parse_rate_limits,
+    retry_after_seconds,
+)
+
+MODEL = "models/fake-model"
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _response(text):
+    return SimpleNamespace(
+        text=text, prompt_feedback=None, candidates=[],
+        usage_metadata=SimpleNamespace(prompt_token_count=5, candidates_token_count=3,
+                                       total_token_count=8),
+    )
+
+
+class _ThrottlingEndpoint:
+    """
+    Endpoint falso con cuota de llamadas simultáneas: las que la superan
+    reciben un 429 con `retry in ...`, como la API de Gemini.
+    """
+
+    def __init__(self, capacity, retry_after=0.02, fail_first=0):
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.fail_first = fail_first
+        self.calls = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _admit(self):
+        self.calls += 1
+        if self.calls <= self.fail_first or self.in_flight >= self.capacity:
+            self.throttled += 1
+            raise google_exceptions.ResourceExhausted(
+                f"Quota exceeded. Please retry in {self.retry_after}s")
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def generate_content(self, prompt, stream=False):
+        self._admit()
+        self.in_flight -= 1
+        return _response(f"respuesta a {prompt}")
+
+    async def generate_content_async(self, prompt):
+        self._admit()
+        try:
+            await asyncio.sleep(0.02)
+            return _response(f"respuesta a {prompt}")
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def fast_retries(monkeypatch, temp_dir):
+    monkeypatch.setattr(gemini_ops, "_selected_model_name", MODEL)
+    monkeypatch.setattr(gemini_ops, "retry_policy", RetryPolicy(8, base_delay=0.01, max_delay=0.1))
+    limiter = ModelRateLimiter(max_concurrency=12, decrease_cooldown=0.0)
+    monkeypatch.setattr(gemini_ops, "_rate_limiters", {MODEL: limiter})
+    return limiter
+
+
+class TestTokenBucket:
+    """Tests para `TokenBucket`."""
+
+    def test_refills_at_configured_rate(self):
+        clock = _FakeClock()
+        bucket = TokenBucket(60, clock=clock)
+        bucket.consume(60)
+        assert bucket.wait_time(1) == pytest.approx(1.0)
+        clock.now += 0.5
+        assert bucket.wait_time(1) == pytest.approx(0.5)
+        clock.now += 0.5
+        assert bucket.wait_time(1) == 0.0
+
+    def test_requests_larger_than_capacity_are_clamped(self):
+        bucket = TokenBucket(1000, clock=_FakeClock())
+        assert bucket.wait_time(5000) == 0.0
+
+
+class TestModelRateLimiter:
+    """Tests para `ModelRateLimiter`."""
+
+    def test_rpm_and_tpm_limits(self):
+        clock = _FakeClock()
+        limiter = ModelRateLimiter(rpm=2, tpm=1000, clock=clock)
+        assert limiter._try_acquire(600) == 0.0
+        # El TPM restante (400) no alcanza para 500 tokens: faltan 100 → 6s a 1000/min
+        assert limiter._try_acquire(500) == pytest.approx(6.0)
+        assert limiter._try_acquire(100) == 0.0
+        # Sin peticiones disponibles (rpm=2) hay que esperar a que se repongan
+        assert limiter._try_acquire(0) == pytest.approx(30.0)
+        assert limiter.in_flight == 2
+
+    def test_aimd_concurrency(self):
+        clock = _FakeClock()
+        limiter = ModelRateLimiter(max_concurrency=16, decrease_cooldown=1.0, clock=clock)
+        limiter.release(throttled=True)
+        assert limiter.concurrency_limit == 8
+        # Varios 429 dentro del mismo intervalo cuentan como una sola señal
+        limiter.release(throttled=True)
+        assert limiter.concurrency_limit == 8
+        clock.now += 1.0
+        limiter.release(throttled=True)
+        assert limiter.concurrency_limit == 4
+
+        for _ in range(4):
+            limiter.release()
+        assert 4.9 < limiter.concurrency_limit < 5.1
+
+    def test_concurrency_never_drops_below_minimum(self):
+        limiter = ModelRateLimiter(max_concurrency=4, decrease_cooldown=0.0)
+        for _ in range(10):
+            limiter.release(throttled=True)
+        assert limiter.concurrency_limit == 1
+
+
+class TestRetryPolicy:
+    """Tests para `RetryPolicy`."""
+
+    def test_backoff_is_jittered_and_capped(self):
+        policy = RetryPolicy(base_delay=1.0, max_delay=8.0, rng=random.Random(3))
+        for attempt in range(1, 8):
+            delays = [policy.delay(attempt) for _ in range(50)]
+            assert all(0 <= d <= min(8.0, 2 ** (attempt - 1)) for d in delays)
+            assert len(set(delays)) > 1
+
+    def test_retry_after_is_a_floor(self):
+        policy = RetryPolicy(base_delay=1.0, rng=random.Random(3))
+        assert 30.0 <= policy.delay(1, retry_after=30.0) <= 30.1
+
+
+class TestThrottlingSignals:
+    """Tests para `is_throttling_error` y `retry_after_seconds`."""
+
+    def test_recognizes_api_errors(self):
+        assert is_throttling_error(google_exceptions.ResourceExhausted("quota"))
+        assert is_throttling_error(google_exceptions.ServiceUnavailable("overloaded"))
+        assert is_throttling_error(RuntimeError("429 Too Many Requests"))
+        assert not is_throttling_error(google_exceptions.InvalidArgument("bad prompt"))
+        assert not is_throttling_error(ValueError("sin texto"))
+
+    def test_retry_after_sources(self):
+        assert retry_after_seconds(RuntimeError("Please retry in 27.5s.")) == 27.5
+        assert retry_after_seconds(RuntimeError("429 retry_delay {\n  seconds: 12\n}")) == 12.0
+        with_header = RuntimeError("429")
+        with_header.response = SimpleNamespace(headers={"Retry-After": "7"})
+        assert retry_after_seconds(with_header) == 7.0
+        assert retry_after_seconds(RuntimeError("429")) is None
+
+
+class TestCallWithRetry:
+    """Tests para `call_with_retry` contra el endpoint falso."""
+
+    def test_retries_throttling_honoring_retry_after(self):
+        endpoint = _ThrottlingEndpoint(capacity=1, retry_after=0.02, fail_first=2)
+        waits = []
+        response = call_with_retry(
+            lambda: endpoint.generate_content("hola"), limiter=ModelRateLimiter(),
+            policy=RetryPolicy(base_delay=0.01),
+            on_retry=lambda attempt, delay, error: waits.append(delay),
+        )
+        assert response.text == "respuesta a hola"
+        assert endpoint.calls == 3
+        assert len(waits) == 2 and all(w >= 0.02 for w in waits)
+
+    def test_gives_up_after_max_attempts(self):
+        endpoint = _ThrottlingEndpoint(capacity=1, retry_after=0.0, fail_first=10)
+        with pytest.raises(google_exceptions.ResourceExhausted):
+            call_with_retry(lambda: endpoint.generate_content("hola"),
+                            policy=RetryPolicy(max_attempts=3, base_delay=0.0))
+        assert endpoint.calls == 3
+
+    def test_other_errors_are_not_retried(self):
+        calls = []
+
+        def fail():
+            calls.append(1)
+            raise google_exceptions.InvalidArgument("bad prompt")
+
+        with pytest.raises(google_exceptions.InvalidArgument):
+            call_with_retry(fail, policy=RetryPolicy(base_delay=0.0))
+        assert len(calls) == 1
+
+
+class TestParseRateLimits:
+    """Tests para `parse_rate_limits`."""
+
+    def test_reads_tier_limits(self):
+        info = {"rate_limits": {"free": {"rpm": 15, "tpm": 1000000}, "paid": {"rpm": 2000}}}
+        assert parse_rate_limits(info, "free") == (15, 1000000)
+        assert parse_rate_limits(info, "paid") == (2000, None)
+        assert parse_rate_limits({}, "free") == (None, None)
+
+    def test_aliases_resolve_to_main_model_limits(self):
+        limits = parse_rate_limits(gemini_ops._resolve_model_tier_info("models/gemini-1.5-flash"), "free")
+        assert limits == (15, 1000000)
+
+
+class TestGeminiOpsIntegration:
+    """`send_prompt_to_gemini` y el lote asíncrono ante un endpoint que limita."""
+
+    def test_sync_prompt_is_retried(self, fast_retries, monkeypatch):
+        endpoint = _ThrottlingEndpoint(capacity=1, retry_after=0.01, fail_first=2)
+        monkeypatch.setattr(gemini_ops, "_initialize_and_get_gemini_model_instance", lambda: endpoint)
+        text = gemini_ops.send_prompt_to_gemini("hola", confirm_paid_model_use=False)
+        assert text == "respuesta a hola"
+        assert endpoint.calls == 3
+
+    def test_batch_adapts_concurrency_and_completes(self, fast_retries, monkeypatch, temp_dir):
+        endpoint = _ThrottlingEndpoint(capacity=3, retry_after=0.02)
+        monkeypatch.setattr(gemini_ops, "_initialize_and_get_gemini_model_instance", lambda: endpoint)
+        items = [{"id": i, "prompt": f"prompt {i}"} for i in range(30)]
+
+        summary = asyncio.run(batch_ops.run_batch(items, temp_dir / "out.ndjson", concurrency=12))
+
+        assert summary["ok"] == 30 and summary["errors"] == 0
+        assert endpoint.throttled > 0
+        assert endpoint.max_in_flight <= 3
+        # La concurrencia bajó desde el techo inicial (12) por los 429
+        assert fast_retries.concurrency_limit < 12
+        assert fast_retries.in_flight == 0
@@ -0,0 +1,208 @@
+"""
+Tests unitarios para el backend de caché compartido (protocolo Redis).
+
+Se ejecutan contra un servidor RESP mínimo en el mismo proceso.
+"""
+import fnmatch
+import socket
+import socketserver
+import threading
+import time
+
+import pytest
+
+from hooperits_agent.cache import SQLiteCache, create_cache
+from hooperits_agent.remote_cache import (
+    FallbackCache,
+    RedisCache,
+    RedisClient,
+    RedisReplyError,
+    encode_command,
+)
+
+
+class _FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Implementa el subconjunto de comandos que usa `RedisCache`."""
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        authenticated = server.password is None
+        while True:
+            command = self._read_command()
+            if command is None:
+                return
+            name = command[0].upper()
+            with server.lock:
+                server.commands.append(name)
+                if name != b"AUTH" and not authenticated:
+                    reply = b"-NOAUTH Authentication required.\r\n"
+                elif name == b"AUTH":
+                    authenticated = command[-1].decode() == server.password
+                    reply = b"+OK\r\n" if authenticated else b"-WRONGPASS invalid password\r\n"
+                else:
+                    reply = self._dispatch(name, command[1:])
+            self.wfile.write(reply)
+
+    def _read_command(self):
+        header = self.rfile.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _dispatch(self, name, args):
+        store = self.server.store
+        now = time.time()
+        for key in [k for k, (_, expires_at) in store.items() if expires_at and expires_at < now]:
+            del store[key]
+        if name == b"PING":
+            return b"+PONG\r\n"
+        if name == b"SELECT":
+            return b"+OK\r\n"
+        if name == b"GET":
+            value = store.get(args[0])
+            return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value[0]), value[0])
+        if name == b"SET":
+            ttl = float(args[3]) if len(args) > 3 and args[2].upper() == b"EX" else None
+            store[args[0]] = (args[1], now + ttl if ttl else None)
+            return b"+OK\r\n"
+        if name == b"DEL":
+            return b":%d\r\n" % sum(store.pop(key, None) is not None for key in args)
+        if name == b"SCAN":
+            pattern = args[args.index(b"MATCH") + 1].decode()
+            keys = [key for key in store if fnmatch.fnmatchcase(key.decode(), pattern)]
+            return b"*2\r\n$1\r\n0\r\n" + encode_command(*keys)
+        return b"-ERR unknown command '%s'\r\n" % name
+
+
+class _FakeRedisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password=None):
+        super().__init__(("127.0.0.1", 0), _FakeRedisHandler)
+        self.password = password
+        self.store = {}
+        self.commands = []
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}{host}:{port}/0"
+
+
+@pytest.fixture
+def redis_server():
+    server = _FakeRedisServer()
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _unused_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestRedisCache:
+    """Tests para `RedisCache` contra el servidor en proceso."""
+
+    def test_set_and_get(self, redis_server):
+        cache = RedisCache(redis_server.url, expiration_seconds=3600)
+        cache.set("prompt", "model", "respuesta " * 50)
+        assert cache.get("prompt", "model") == "respuesta " * 50
+        assert cache.get("otro", "model") is None
+
+    def test_ttl_maps_to_expiration_seconds(self, redis_server):
+        cache = RedisCache(redis_server.url, expiration_seconds=120)
+        cache.set("prompt", "model", "respuesta")
+        (_, expires_at), = redis_server.store.values()
+        assert 118 <= expires_at - time.time() <= 120
+
+    def test_get_many_is_pipelined_on_one_connection(self, redis_server):
+        cache = RedisCache(redis_server.url, expiration_seconds=3600, compression="raw")
+        for i in range(5):
+            cache.set(f"p{i}", "model", f"r{i}")
+
+        results = cache.get_many([(f"p{i}", "model") for i in range(7)])
+
+        assert results == ["r0", "r1", "r2", "r3", "r4", None, None]
+        assert redis_server.commands.count(b"GET") == 7
+        # El pool reutiliza la misma conexión para todas las operaciones
+        assert redis_server.connections == 1
+
+    def test_clear_only_removes_prefixed_keys(self, redis_server):
+        redis_server.store[b"other:key"] = (b"x", None)
+        cache = RedisCache(redis_server.url, expiration_seconds=3600)
+        cache.set("a", "model", "1")
+        cache.set("b", "model", "2")
+        cache.clear()
+        assert list(redis_server.store) == [b"other:key"]
+
+    def test_password_is_sent_with_auth(self):
+        server = _FakeRedisServer(password="s3creta")
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        try:
+            cache = RedisCache(server.url, expiration_seconds=3600)
+            cache.set("prompt", "model", "respuesta")
+            assert cache.get("prompt", "model") == "respuesta"
+            assert server.commands[0] == b"AUTH"
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_server_errors_raise(self, redis_server):
+        client = RedisClient(redis_server.url)
+        with pytest.raises(RedisReplyError, match="unknown command"):
+            client.execute("FLUSHALL")
+        # La conexión sigue siendo válida tras un error del servidor
+        assert client.execute("PING") == "PONG"
+
+
+class TestFallbackCache:
+    """Tests para el respaldo en la caché local."""
+
+    def test_unreachable_server_falls_back_to_local(self, temp_dir):
+        remote = RedisCache(f"redis://127.0.0.1:{_unused_port()}/0", expiration_seconds=3600,
+                            timeout=0.2)
+        cache = FallbackCache(remote, SQLiteCache(temp_dir, expiration_seconds=3600))
+
+        cache.set("prompt", "model", "respuesta")
+        assert cache.get("prompt", "model") == "respuesta"
+        assert cache.get_many([("prompt", "model")]) == ["respuesta"]
+        assert cache._down_until > time.time()
+
+    def test_remote_miss_checks_local(self, redis_server, temp_dir):
+        local = SQLiteCache(temp_dir, expiration_seconds=3600)
+        local.set("offline", "model", "escrita sin red")
+        cache = FallbackCache(RedisCache(redis_server.url, expiration_seconds=3600), local)
+
+        cache.set("online", "model", "compartida")
+        assert cache.get("online", "model") == "compartida"
+        assert cache.get("offline", "model") == "escrita sin red"
+        assert local.get("online", "model") is None
+
+
+class TestCreateRedisCache:
+    """Selección del backend desde la configuración."""
+
+    def test_redis_backend_wraps_local_cache(self, redis_server, temp_dir):
+        cache = create_cache("redis", temp_dir, 3600, redis_url=redis_server.url)
+        assert isinstance(cache, FallbackCache)
+        assert isinstance(cache.primary, RedisCache)
+        cache.set("prompt", "model", "respuesta")
+        assert cache.get("prompt", "model") == "respuesta"
+
+    def test_missing_url_uses_local_cache(self, temp_dir):
+        cache = create_cache("redis", temp_dir, 3600)
+        assert isinstance(cache, SQLiteCache)
@@ -0,0 +1,145 @@
+"""
+Tests unitarios para la coalescencia de peticiones idénticas (single-flight).
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from hooperits_agent import batch_ops, gemini_ops
+from hooperits_agent.cache import SQLiteCache
+from hooperits_agent.single_flight import SingleFlight
+from hooperits_agent.utils import build_cache_key
+
+MODEL = "models/fake-model"
+PROCESSES = 6
+
+
+def _ask_from_process(cache_dir: str, start_at: float) -> str:
+    """Un proceso "shard de CI": consulta la caché y, si falla, hace la llamada coalescida."""
+    cache = SQLiteCache(Path(cache_dir), expiration_seconds=3600)
+    flight = SingleFlight(Path(cache_dir) / "inflight")
+    time.sleep(max(0.0, start_at - time.time()))
+
+    def call():
+        with open(Path(cache_dir) / "calls.log", "a", encoding="utf-8") as f:
+            f.write("llamada\n")
+        time.sleep(0.5)
+        cache.set("prompt", MODEL, "respuesta")
+        return "respuesta"
+
+    cached = cache.get("prompt", MODEL)
+    if cached is not None:
+        return cached
+    result, _ = flight.do(build_cache_key("prompt", MODEL), call,
+                          recheck=lambda: cache.get("prompt", MODEL))
+    return result
+
+
+class TestSingleFlightThreads:
+    """Coalescencia entre hilos de un mismo proceso."""
+
+    def test_identical_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+        barrier = threading.Barrier(8)
+
+        def call():
+            calls.append(1)
+            time.sleep(0.2)
+            return "respuesta"
+
+        def worker(_):
+            barrier.wait()
+            return flight.do("clave", call)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(worker, range(8)))
+
+        assert len(calls) == 1
+        assert all(result == "respuesta" for result, _ in results)
+        assert sum(shared for _, shared in results) == 7
+
+    def test_different_keys_are_not_coalesced(self):
+        flight = SingleFlight()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda i: flight.do(f"clave-{i}", lambda: i), range(4)))
+        assert results == [(i, False) for i in range(4)]
+
+    def test_leader_error_reaches_followers(self):
+        flight = SingleFlight()
+        barrier = threading.Barrier(3)
+
+        def call():
+            time.sleep(0.2)
+            raise RuntimeError("503 Service Unavailable")
+
+        def worker(_):
+            barrier.wait()
+            with pytest.raises(RuntimeError, match="503"):
+                flight.do("clave", call)
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            list(pool.map(worker, range(3)))
+        # El registro queda limpio: la siguiente llamada vuelve a ejecutar
+        assert flight.do("clave", lambda: "ok") == ("ok", False)
+
+
+class TestSingleFlightProcesses:
+    """Coalescencia entre procesos mediante archivos de bloqueo y la caché compartida."""
+
+    def test_concurrent_processes_make_one_call(self, temp_dir):
+        start_at = time.time() + 1.0
+        with ProcessPoolExecutor(max_workers=PROCESSES) as pool:
+            results = list(pool.map(_ask_from_process, [str(temp_dir)] * PROCESSES,
+                                    [start_at] * PROCESSES))
+
+        assert results == ["respuesta"] * PROCESSES
+        assert (temp_dir / "calls.log").read_text(encoding="utf-8").count("llamada") == 1
+        # No quedan archivos de bloqueo por prompt
+        assert list((temp_dir / "inflight").iterdir()) == []
+
+
+class TestSingleFlightAsync:
+    """Coalescencia entre tareas de un bucle de eventos."""
+
+    def test_identical_tasks_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "respuesta"
+
+        async def main():
+            return await asyncio.gather(*(flight.do_async("clave", call) for _ in range(10)))
+
+        results = asyncio.run(main())
+        assert len(calls) == 1
+        assert [shared for _, shared in results].count(False) == 1
+
+    def test_batch_with_duplicate_prompts_calls_once_per_prompt(self, monkeypatch, temp_dir):
+        calls = []
+
+        class _Model:
+            async def generate_content_async(self, prompt):
+                calls.append(prompt)
+                await asyncio.sleep(0.05)
+                return SimpleNamespace(
+                    text=f"respuesta a {prompt}", prompt_feedback=None, candidates=[],
+                    usage_metadata=SimpleNamespace(prompt_token_count=10, candidates_token_count=4))
+
+        monkeypatch.setattr(gemini_ops, "_initialize_and_get_gemini_model_instance", lambda: _Model())
+        monkeypatch.setattr(gemini_ops, "_selected_model_name", MODEL)
+        monkeypatch.setattr(gemini_ops, "single_flight", SingleFlight(temp_dir / "inflight"))
+        items = [{"id": i, "prompt": f"prompt {i % 3}"} for i in range(12)]
+
+        summary = asyncio.run(batch_ops.run_batch(items, temp_dir / "out.ndjson", concurrency=12))
+
+        assert sorted(calls) == ["prompt 0", "prompt 1", "prompt 2"]
+        assert summary["ok"] == 12 and summary["cached"] == 9
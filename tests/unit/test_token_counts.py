@@ -0,0 +1,70 @@
+"""
+Tests unitarios para la memoria de conteos de tokens.
+"""
+from hooperits_agent.token_counts import TokenCountCache, count_tokens_cached
+
+
+class _CountingFn:
+    """`count_tokens` falso: un token por palabra, registrando cada llamada."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, text):
+        self.calls.append(text)
+        return len(text.split())
+
+
+class TestTokenCountCache:
+    """Tests para `TokenCountCache`."""
+
+    def test_put_and_get_are_keyed_by_model(self, temp_dir):
+        memo = TokenCountCache(temp_dir)
+        memo.put("model-a", "hola mundo", 2)
+        assert memo.get("model-a", "hola mundo") == 2
+        assert memo.get("model-b", "hola mundo") is None
+        assert memo.get_many("model-a", ["hola mundo", "otro"]) == [2, None]
+
+    def test_persists_across_instances(self, temp_dir):
+        TokenCountCache(temp_dir).put("model", "texto", 7)
+        assert TokenCountCache(temp_dir).get("model", "texto") == 7
+
+    def test_evicts_least_recently_used(self, temp_dir):
+        memo = TokenCountCache(temp_dir, max_entries=2)
+        memo.put("model", "uno", 1)
+        memo.put("model", "dos", 2)
+        memo.get("model", "uno")
+        memo.put("model", "tres", 3)
+        assert memo.get_many("model", ["uno", "dos", "tres"]) == [1, None, 3]
+
+
+class TestCountTokensCached:
+    """Tests para `count_tokens_cached`."""
+
+    def test_repeat_prompt_needs_no_remote_call(self, temp_dir):
+        memo = TokenCountCache(temp_dir)
+        count_fn = _CountingFn()
+        assert count_tokens_cached(count_fn, "model", "a b c", memo=memo) == (3, 1)
+        assert count_tokens_cached(count_fn, "model", "a b c", memo=memo) == (3, 0)
+        assert len(count_fn.calls) == 1
+
+    def test_segments_are_counted_once_and_summed(self, temp_dir):
+        memo = TokenCountCache(temp_dir)
+        count_fn = _CountingFn()
+        header, file_a, file_b, file_c = "analiza esto ", "uno dos ", "tres ", "cuatro cinco seis "
+
+        tokens, remote = count_tokens_cached(count_fn, "model", header + file_a + file_b,
+                                             segments=[header, file_a, file_b], memo=memo)
+        assert (tokens, remote) == (5, 3)
+
+        # Otro prompt que reutiliza la cabecera y un archivo: solo se cuenta el nuevo
+        count_fn.calls.clear()
+        tokens, remote = count_tokens_cached(count_fn, "model", header + file_a + file_c,
+                                             segments=[header, file_a, file_c], memo=memo)
+        assert (tokens, remote) == (7, 1)
+        assert count_fn.calls == [file_c]
+
+    def test_without_memo_always_counts_remotely(self):
+        count_fn = _CountingFn()
+        assert count_tokens_cached(count_fn, "model", "a b") == (2, 1)
+        assert count_tokens_cached(count_fn, "model", "a b") == (2, 1)
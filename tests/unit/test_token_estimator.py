@@ -0,0 +1,85 @@
+"""
+Tests unitarios para el estimador local de tokens.
+"""
+import json
+import random
+from pathlib import Path
+
+from hooperits_agent.token_estimator import (
+    TokenEstimator,
+    classify_content,
+    tier_thresholds,
+)
+
+CODE = "def f(x):\n    return {'a': [x, (x + 1)]}\n" * 50
+PROSE = "El proyecto organiza los servicios en módulos pequeños y documentados.\n" * 50
+MINIFIED = "function a(b){return b.map(function(c){return{d:c[0],e:(c[1]||0)}})};" * 80
+
+
+class TestClassifyContent:
+    """Tests para `classify_content`."""
+
+    def test_detects_each_type(self):
+        assert classify_content(CODE) == "code"
+        assert classify_content(PROSE) == "prose"
+        assert classify_content(MINIFIED) == "minified"
+        assert classify_content("") == "prose"
+
+
+class TestTierThresholds:
+    """Tests para `tier_thresholds`."""
+
+    def test_reads_thresholds_from_model_tiers(self):
+        tiers = json.loads((Path(__file__).parents[2] / "model_tiers.json").read_text(encoding="utf-8"))
+        flash = tiers["models/gemini-1.5-flash-latest"]["paid_tier"]
+        assert tier_thresholds(flash) == [128000]
+
+    def test_flat_pricing_has_no_thresholds(self):
+        assert tier_thresholds({"input_per_1M_tokens_usd": 0.1}) == []
+        assert tier_thresholds(None) == []
+
+
+class TestTokenEstimator:
+    """Tests para `TokenEstimator`."""
+
+    def _calibrate(self, estimator, model, text, ratio, samples, jitter=0.0):
+        rng = random.Random(7)
+        for _ in range(samples):
+            tokens = int(len(text) * ratio * (1 + rng.uniform(-jitter, jitter)))
+            estimator.observe(model, text, tokens)
+
+    def test_uncalibrated_estimate_is_not_decisive(self, temp_dir):
+        estimator = TokenEstimator(temp_dir, min_samples=3)
+        estimate = estimator.estimate("model", [CODE])
+        assert not estimate.calibrated
+        assert estimate.lower < estimate.tokens < estimate.upper
+        assert not estimator.is_decisive(estimate, [128000])
+
+    def test_calibration_converges_with_error_bound(self, temp_dir):
+        estimator = TokenEstimator(temp_dir, min_samples=3)
+        self._calibrate(estimator, "model", CODE, ratio=0.42, samples=20, jitter=0.02)
+
+        estimate = estimator.estimate("model", [CODE])
+        assert estimate.calibrated
+        assert abs(estimate.tokens - len(CODE) * 0.42) / (len(CODE) * 0.42) < 0.02
+        assert estimate.lower <= len(CODE) * 0.42 <= estimate.upper
+        # Otro modelo u otro tipo de contenido no heredan la calibración
+        assert not estimator.estimate("other", [CODE]).calibrated
+        assert not estimator.estimate("model", [PROSE]).calibrated
+
+    def test_decisive_only_when_far_from_thresholds(self, temp_dir):
+        estimator = TokenEstimator(temp_dir, min_samples=3)
+        self._calibrate(estimator, "model", CODE, ratio=0.3, samples=10, jitter=0.01)
+
+        small = estimator.estimate("model", [CODE])
+        assert estimator.is_decisive(small, [128000])
+        assert estimator.is_decisive(small, [])
+
+        near_threshold = estimator.estimate("model", [CODE * int(128000 / (len(CODE) * 0.3))])
+        assert near_threshold.lower <= 128000 < near_threshold.upper
+        assert not estimator.is_decisive(near_threshold, [128000])
+
+    def test_calibration_persists(self, temp_dir):
+        estimator = TokenEstimator(temp_dir, min_samples=2)
+        self._calibrate(estimator, "model", PROSE, ratio=0.25, samples=3)
+        assert TokenEstimator(temp_dir, min_samples=2).estimate("model", [PROSE]).calibrated
@@ -0,0 +1,147 @@
+"""
+Tests unitarios para el registro local de uso.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from hooperits_agent import batch_ops, gemini_ops
+from hooperits_agent.usage_ledger import _RECORD, UsageLedger, summarize_usage
+
+MODEL = "models/fake-model"
+DAY = time.mktime((2026, 10, 15, 12, 0, 0, 0, 0, -1))
+
+
+class TestUsageLedger:
+    """Tests para UsageLedger."""
+
+    def test_roundtrip(self, temp_dir):
+        ledger = UsageLedger(temp_dir)
+        ledger.append(MODEL, prompt_tokens=1200, response_tokens=300, latency_seconds=1.25,
+                      cost_usd=0.000123, command="chat", repo="mi-repo", timestamp=DAY)
+        ledger.append(MODEL, latency_seconds=0.002, cache_hit=True, command="chat", repo="mi-repo",
+                      timestamp=DAY + 1)
+
+        columns = ledger.read_columns()
+        strings = ledger.strings()
+        assert list(columns["prompt_tokens"]) == [1200, 0]
+        assert list(columns["latency_ms"]) == [1250, 2]
+        assert list(columns["cost_micro_usd"]) == [123, 0]
+        assert list(columns["flags"]) == [0, 1]
+        assert [strings[i] for i in columns["repo"]] == ["mi-repo", "mi-repo"]
+
+    def test_processes_share_string_table(self, temp_dir):
+        # Dos instancias simulan dos procesos que añaden cadenas intercaladas
+        first, second = UsageLedger(temp_dir), UsageLedger(temp_dir)
+        first.append("modelo-a", repo="r1", command="chat")
+        second.append("modelo-b", repo="r1", command="batch")
+        first.append("modelo-b", repo="r2", command="chat")
+
+        columns = UsageLedger(temp_dir).read_columns()
+        strings = UsageLedger(temp_dir).strings()
+        assert [strings[i] for i in columns["model"]] == ["modelo-a", "modelo-b", "modelo-b"]
+        assert [strings[i] for i in columns["repo"]] == ["r1", "r1", "r2"]
+        assert len(strings) == len(set(strings))
+
+    def test_partial_trailing_record_is_ignored(self, temp_dir):
+        ledger = UsageLedger(temp_dir)
+        ledger.append(MODEL, prompt_tokens=5)
+        with open(ledger.path, "ab") as f:
+            f.write(b"\x01\x02\x03")  # escritura interrumpida
+        assert list(ledger.read_columns()["prompt_tokens"]) == [5]
+
+    def test_foreign_file_is_rejected(self, temp_dir):
+        ledger = UsageLedger(temp_dir)
+        ledger.path.write_bytes(b"otro formato")
+        with pytest.raises(ValueError):
+            ledger.read_columns()
+
+
+class TestSummarizeUsage:
+    """Tests para summarize_usage."""
+
+    @pytest.fixture
+    def ledger(self, temp_dir):
+        ledger = UsageLedger(temp_dir)
+        rows = []
+        for i in range(1, 101):
+            rows.append({"timestamp": DAY + i, "model": "a", "repo": "r1", "command": "chat",
+                         "prompt_tokens": i * 10, "response_tokens": i, "latency_seconds": i / 100,
+                         "cost_usd": 0.001})
+        rows.append({"timestamp": DAY + 200, "model": "a", "repo": "r1", "cache_hit": True})
+        rows.append({"timestamp": DAY + 300, "model": "a", "repo": "r1", "error": True, "latency_seconds": 60})
+        rows.append({"timestamp": DAY + 86400, "model": "b", "repo": "r2", "prompt_tokens": 7,
+                     "latency_seconds": 0.5})
+        ledger.append_many(rows)
+        return ledger
+
+    def test_groups_and_percentiles(self, ledger):
+        summary = summarize_usage(ledger.read_columns(), ledger.strings())
+        assert [(row["day"], row["model"], row["repo"]) for row in summary] == [
+            ("2026-10-15", "a", "r1"), ("2026-10-16", "b", "r2")]
+        first = summary[0]
+        assert (first["calls"], first["cache_hits"], first["errors"]) == (102, 1, 1)
+        assert first["prompt_tokens"] == sum(i * 10 for i in range(1, 101))
+        assert first["cost_usd"] == pytest.approx(0.1)
+        # Percentiles sin el acierto de caché ni el error de 60 s
+        assert (first["latency_p50_ms"], first["latency_p95_ms"]) == (500, 950)
+        assert (first["tokens_p50"], first["tokens_p95"]) == (550, 1045)
+
+    def test_group_by_and_since(self, ledger):
+        columns, strings = ledger.read_columns(), ledger.strings()
+        by_repo = summarize_usage(columns, strings, ["repo"], since=DAY + 250)
+        assert [(row["repo"], row["calls"]) for row in by_repo] == [("r1", 1), ("r2", 1)]
+        with pytest.raises(ValueError):
+            summarize_usage(columns, strings, ["semana"])
+
+    def test_since_with_clock_going_back(self, temp_dir):
+        ledger = UsageLedger(temp_dir)
+        ledger.append_many([{"timestamp": DAY + 100, "model": "a"}, {"timestamp": DAY, "model": "a"},
+                            {"timestamp": DAY + 200, "model": "b"}])
+        summary = summarize_usage(ledger.read_columns(), ledger.strings(), ["model"], since=DAY + 50)
+        assert [(row["model"], row["calls"]) for row in summary] == [("a", 1), ("b", 1)]
+
+    def test_million_rows(self, temp_dir):
+        ledger = UsageLedger(temp_dir)
+        ledger.append_many({"timestamp": DAY + i * 3600, "model": f"m{i % 4}", "repo": "r",
+                            "prompt_tokens": i, "latency_seconds": i / 1000} for i in range(100))
+        data = ledger.path.read_bytes()
+        header, body = data[:-100 * _RECORD.size], data[-100 * _RECORD.size:]
+        ledger.path.write_bytes(header + body * 10_000)
+
+        started = time.perf_counter()
+        summary = summarize_usage(ledger.read_columns(), ledger.strings(), ["model"])
+        elapsed = time.perf_counter() - started
+        assert sum(row["calls"] for row in summary) == 1_000_000
+        assert elapsed < 10
+
+
+class TestGeminiOpsRecording:
+    """Las consultas quedan anotadas en el registro."""
+
+    def test_batch_records_calls_and_cache_hits(self, monkeypatch, temp_dir):
+        class _Model:
+            async def generate_content_async(self, prompt):
+                return SimpleNamespace(
+                    text=f"respuesta a {prompt}", prompt_feedback=None, candidates=[],
+                    usage_metadata=SimpleNamespace(prompt_token_count=10, candidates_token_count=4))
+
+        ledger = UsageLedger(temp_dir / "usage")
+        monkeypatch.setattr(gemini_ops, "_initialize_and_get_gemini_model_instance", lambda: _Model())
+        monkeypatch.setattr(gemini_ops, "_selected_model_name", MODEL)
+        monkeypatch.setattr(gemini_ops, "single_flight", None)
+        monkeypatch.setattr(gemini_ops, "usage_ledger", ledger)
+        monkeypatch.setattr(gemini_ops, "usage_command", "batch")
+        items = [{"id": i, "prompt": f"prompt {i}"} for i in range(2)]
+
+        asyncio.run(batch_ops.run_batch(items, temp_dir / "out.ndjson", concurrency=2))
+        # Segunda pasada: las dos respuestas salen de la caché
+        asyncio.run(batch_ops.run_batch(items, temp_dir / "out2.ndjson", concurrency=2))
+
+        summary = summarize_usage(ledger.read_columns(), ledger.strings(), ["model", "command"])
+        assert len(summary) == 1
+        row = summary[0]
+        assert (row["model"], row["command"]) == (MODEL, "batch")
+        assert (row["calls"], row["cache_hits"], row["prompt_tokens"]) == (4, 2, 20)
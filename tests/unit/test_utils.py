@@ -11,11 +11,14 @@ from hooperits_agent.utils import (
     validate_repo_name,
     validate_file_path,
     format_file_size,
+    format_duration,
     truncate_text,
     count_tokens_estimate,
     sanitize_filename,
     format_cost,
     SimpleCache,
+    atomic_write_json,
+    file_lock,
 )
 
 
@@ -68,6 +71,14 @@ class TestFormatting:
         assert format_file_size(1048576) == "1.0 MB"
         assert format_file_size(1073741824) == "1.0 GB"
         assert format_file_size(1099511627776) == "1.0 TB"
+
+    def test_format_duration(self):
+        """Test formateo de duraciones."""
+        assert format_duration(0) == "0 s"
+        assert format_duration(59.9) == "59 s"
+        assert format_duration(60) == "1 min"
+        assert format_duration(3 * 3600 + 59) == "3 h"
+        assert format_duration(2 * 86400) == "2 d"
     
     def test_truncate_text(self):
         """Test truncado de texto."""
@@ -187,4 +198,40 @@ class TestSimpleCache:
                 cleaned_data = json.load(f)
             
             assert "expired_key" not in cleaned_data
-            assert "valid_key" in cleaned_data 
\ No newline at end of file
+            assert "valid_key" in cleaned_data 
+    
+    def test_cache_corrupt_file_is_set_aside(self):
+        """Un archivo corrupto se aparta en lugar de descartarse en silencio."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_dir = Path(tmpdir)
+            (cache_dir / "gemini_responses.json").write_text("{ corrupto", encoding='utf-8')
+            
+            cache = SimpleCache(cache_dir, expiration_seconds=3600)
+            cache.set("prompt", "model", "response")
+            
+            assert cache.get("prompt", "model") == "response"
+            assert (cache_dir / "gemini_responses.json.corrupt").read_text(encoding='utf-8') == "{ corrupto"
+
+
+class TestSafeWrites:
+    """Tests para el bloqueo y la escritura atómica."""
+    
+    def test_atomic_write_json_replaces_content(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            target = Path(tmpdir) / "data.json"
+            atomic_write_json(target, {"a": 1})
+            atomic_write_json(target, {"b": 2}, indent=None)
+            
+            assert json.loads(target.read_text()) == {"b": 2}
+            # No quedan temporales en el directorio
+            assert sorted(p.name for p in Path(tmpdir).iterdir()) == ["data.json"]
+    
+    def test_file_lock_times_out_when_held(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            target = Path(tmpdir) / "data.json"
+            with file_lock(target):
+                with pytest.raises(TimeoutError):
+                    with file_lock(target, timeout=0.05):
+                        pass
+            with file_lock(target, timeout=0.05):
+                pass